@@ -24,9 +24,11 @@ CPIPMain.py -- Preprocess the file or the files in a directory.
 
     (CPIP36) $ python src/cpip/CPIPMain.py --help
     usage: CPIPMain.py [-h] [-c] [-d DUMP] [-g GLOB] [--heap] [-j JOBS] [-k]
-                       [-l LOGLEVEL] [-o OUTPUT] [-p] [-r] [-t] [-G]
-                       [-S PREDEFINES] [-C] [-D DEFINES] [-P PREINC] [-I INCUSR]
-                       [-J INCSYS]
+                       [-l LOGLEVEL] [-o OUTPUT] [--outputs OUTPUTS] [-p] [-r]
+                       [-t] [--token-cache TOKEN_CACHE]
+                       [--tu-page-lines TU_PAGE_LINES] [--tu-page-includes]
+                       [-G] [-S PREDEFINES] [-C] [-D DEFINES] [-P PREINC]
+                       [-I INCUSR] [-J INCSYS]
                        path
 
     CPIPMain.py - Preprocess the file or the files in a directory.
@@ -60,11 +62,29 @@ CPIPMain.py -- Preprocess the file or the files in a directory.
                             critical=50) [default: 30]
       -o OUTPUT, --output OUTPUT
                             Output directory. [default: out]
+      --outputs OUTPUTS     Comma separated list of outputs to generate,
+                            additive. Can be: tu - The translation unit as HTML.
+                            itu - Each source file as HTML. macros - The macro
+                            history. svg - The include graph as SVG. text - The
+                            include graph as text. ccg - The conditional
+                            compilation graph. index - The index pages. all -
+                            Everything. [default: []] i.e. all.
       -p                    Ignore pragma statements. [default: False]
       -r, --recursive       Recursively process directories. [default: False]
       -t, --dot             Write an DOT include dependency table and execute DOT
                             on it to create a SVG file (for includes and macro
                             dependencies). [default: False]
+      --token-cache TOKEN_CACHE
+                            Directory to cache the tokens of each source file
+                            for the ITU HTML between processes and runs.
+                            [default: None] i.e. in-memory only.
+      --tu-page-lines TU_PAGE_LINES
+                            Write the translation unit HTML as pages of this
+                            many lines with an index page. Zero means a single
+                            page. [default: 0]
+      --tu-page-includes    Write the translation unit HTML as pages, starting
+                            a new page on entering or leaving each file
+                            included by the ITU. [default: False]
       -G                    Support GCC extensions. Currently only #include_next.
                             [default: False]
       -S PREDEFINES, --predefine PREDEFINES
@@ -145,9 +165,16 @@ from cpip import Tu2Html
 from cpip.core import CppCond
 from cpip.core import CppDiagnostic
 from cpip.core import FileIncludeGraph
+from cpip.core import FileIncludeStack
 from cpip.core import IncludeHandler
+from cpip.core import ItuToTokens
+from cpip.core import MacroEnv
+from cpip.core import MacroProfiler
+from cpip.core import MacroRefStore
 from cpip.core import PpLexer
+from cpip.core import PpTokenCount
 from cpip.core import PragmaHandler
+from cpip.core import SourceBuffer
 from cpip.util import CommonPrefix
 from cpip.util import Cpp
 from cpip.util import DirWalk
@@ -171,10 +198,101 @@ MainJobSpec = collections.namedtuple('MainJobSpec',
         'helpMap',          # map of {opt_name : (value, help), ...}. See retOptionMap().
         'includeDOT',       # boolean, whether to try to use DOT to create a dependency SVG.
         'cmdLine',          # Invocation: ' '.join(sys.argv)
-        'gccExtensions'     # Support GCC extensions to the language
+        'gccExtensions',    # Support GCC extensions to the language
+        'outputPlan',       # OutputPlan, which outputs to generate. See retOutputPlan().
+        'tuPageLines',      # Integer, if > 0 write the TU HTML as pages of this many lines.
+        'tuPageIncludes',   # boolean, write the TU HTML as pages split at ITU #include's.
+        'tokenCacheDir',    # Directory for the ITU token cache or None for in-memory only.
+        'macroRefPolicy',   # MacroRefStore.RefPolicy, which macro references to record.
+        'predefLoader',     # MacroEnv.PredefinedMacroLoader, shared by every TU of the job.
+        'macroProfile',     # boolean, whether to profile macro expansion.
+        'timeTrace',        # boolean, whether to write a trace of the time taken by each file.
     ]
 )
 
+#: Outputs that can be selected with ``--outputs`` as ``{name : description, ...}``
+OUTPUT_NAMES = collections.OrderedDict(
+    (
+        ('tu',      'The translation unit as HTML.'),
+        ('itu',     'Each source file as HTML.'),
+        ('macros',  'The macro history.'),
+        ('svg',     'The include graph as SVG.'),
+        ('text',    'The include graph as text.'),
+        ('ccg',     'The conditional compilation graph.'),
+        ('index',   'The index pages.'),
+    )
+)
+#: Selects every output
+OUTPUT_ALL = 'all'
+
+# POD class that says which outputs are to be generated, each field is a
+# boolean with the same name as the keys of OUTPUT_NAMES.
+OutputPlan = collections.namedtuple('OutputPlan', list(OUTPUT_NAMES.keys()))
+
+def retOutputPlan(theOutputs):
+    """Returns an :py:class:`OutputPlan` from a list of output names.
+    Each name can itself be a comma separated list of names from
+    ``OUTPUT_NAMES`` or ``OUTPUT_ALL``. An empty list means all outputs.
+    
+    May raise a ``ValueError`` for an unknown name.
+
+    :param theOutputs: Output names.
+    :type theOutputs: ``list([str])``
+    
+    :returns: :py:class:`OutputPlan` -- The outputs to generate.
+    """
+    myNameS = set()
+    for anOutput in theOutputs:
+        for aName in anOutput.split(','):
+            aName = aName.strip().lower()
+            if aName == OUTPUT_ALL:
+                myNameS |= set(OUTPUT_NAMES.keys())
+            elif aName in OUTPUT_NAMES:
+                myNameS.add(aName)
+            elif aName != '':
+                raise ValueError(
+                    'Unknown output "%s", must be one of: %s' \
+                        % (aName, ', '.join(list(OUTPUT_NAMES.keys()) + [OUTPUT_ALL]))
+                )
+    if len(myNameS) == 0:
+        myNameS = set(OUTPUT_NAMES.keys())
+    return OutputPlan(*[k in myNameS for k in OUTPUT_NAMES.keys()])
+
+def _lexerTracksMacroRefs(theJobSpec):
+    """Returns True if the lexer needs to record the location of every macro
+    reference. This is only required for the macro history or a dump of the
+    macro environment.
+
+    :param theJobSpec: Job specification.
+    :type theJobSpec: :py:class:`MainJobSpec`
+
+    :returns: ``bool`` -- True if macro reference locations are needed.
+    """
+    return theJobSpec.outputPlan.macros or 'M' in theJobSpec.dumpList
+
+#: Per process cache of ITU tokens, see _retItuTokenCache()
+_ITU_TOKEN_CACHE = None
+
+def _retItuTokenCache(theJobSpec):
+    """Returns the per process ITU token cache creating it if necessary.
+    This means that a source file included by many translation units is only
+    tokenised once for its ITU HTML by each process, or once per run if there
+    is a cache directory. The lexer adds the tokens of the files that it
+    processes so those are not tokenised for their ITU HTML at all.
+
+    :param theJobSpec: Job specification.
+    :type theJobSpec: :py:class:`MainJobSpec`
+
+    :returns: :py:class:`cpip.core.ItuToTokens.ItuTokenCache` -- The cache.
+    """
+    global _ITU_TOKEN_CACHE
+    if _ITU_TOKEN_CACHE is None:
+        _ITU_TOKEN_CACHE = ItuToTokens.ItuTokenCache(
+            theJobSpec.tokenCacheDir,
+            encodingPolicy=theJobSpec.incHandler.encodingPolicy,
+        )
+    return _ITU_TOKEN_CACHE
+
 ###################### Static introductory text. #########################
 INCLUDE_GRAPH_INTRO = [
     """This is the relationships of the #include'd files
@@ -370,7 +488,7 @@ def writeMacroDependencyGraphAsDot(theOutDir, theItu, theLexer):
     return result
 
 
-def retFileCountMap(theLexer):
+def retFileCountMap(theLexer, theEncodingPolicy=None):
     """Visits the Lexers file include graph and returns a dict of::
     
         {file_name : (inclusion_count, line_count, bytes_count).
@@ -379,6 +497,9 @@ def retFileCountMap(theLexer):
 
     :param theLexer: The Lexer
     :type theLexer: :py:class:`cpip.core.PpLexer.PpLexer`
+
+    :param theEncodingPolicy: The policy the files were decoded with, None for the default.
+    :type theEncodingPolicy: ``NoneType``, :py:data:`cpip.core.SourceBuffer.EncodingPolicy`
     
     :returns: ``dict({str : tuple([int, int, int])})`` --
         The file count map.
@@ -393,13 +514,29 @@ def retFileCountMap(theLexer):
         count_bytes = 0
         if file_name != PpLexer.UNNAMED_FILE_NAME:
             # Count the SLOC, bytes
-            with open(file_name) as fobj:
+            with SourceBuffer.openSource(file_name, theEncodingPolicy) as fobj:
                 for line in fobj:
                     count_lines += 1
                     count_bytes += len(line)
         ret_map[file_name] = (inc_count, count_lines, count_bytes)
     return ret_map
 
+def retFileCountTotals(theFileCountMap):
+    """Returns the totals from a file count map as returned by
+    :py:func:`retFileCountMap`.
+
+    :param theFileCountMap: ``{file_name : (inclusion_count, line_count, bytes_count), ...}``
+    :type theFileCountMap: ``dict({str : tuple([int, int, int])})``
+
+    :returns: ``tuple([int, int, int])`` -- (total_files, total_lines, total_bytes) as integers.
+    """
+    total_files = total_lines = total_bytes = 0
+    for f, l, b in theFileCountMap.values():
+        total_files += f
+        total_lines += f * l
+        total_bytes += f * b
+    return total_files, total_lines, total_bytes
+
 def _dumpCondCompGraph(theLexer):
     print()
     print(' Conditional Compilation Graph '.center(75, '-'))
@@ -445,26 +582,34 @@ def _dumpMacroEnv(theLexer):
     print()
 
 
-def _hasMacroDependencies(theLexer):
-    """Returns True if there are dependencies between macros."""
-    myMacEnv = theLexer.macroEnvironment
-    for aPpDef in myMacEnv.genMacros():
+def _genMacroDependencies(theMacEnv):
+    """Yields distinct ``(identifier, identifier)`` pairs, in sorted order,
+    where a referenced macro depends on a currently defined macro."""
+    myPairS = set()
+    for aPpDef in theMacEnv.genMacrosOutOfScope():
         if aPpDef.isReferenced:
             for aRtok in aPpDef.replacementTokens:
-                if aRtok.isIdentifier() and myMacEnv.hasMacro(aRtok.t):
-                    return True
+                if aRtok.isIdentifier() and theMacEnv.hasMacro(aRtok.t):
+                    myPairS.add((aPpDef.identifier, aRtok.t))
+    for aPpDef in theMacEnv.genMacrosInScope():
+        if aPpDef.isReferenced:
+            for anId in theMacEnv.macroDependencies(aPpDef.identifier):
+                myPairS.add((aPpDef.identifier, anId))
+    yield from sorted(myPairS)
+
+
+def _hasMacroDependencies(theLexer):
+    """Returns True if there are dependencies between macros."""
+    for aPair in _genMacroDependencies(theLexer.macroEnvironment):
+        return True
     return False
 
 
 def _macroDependenciesAsDot(theLexer):
     """Returns a string suitable for invoking DOT on."""
     ret = ['digraph MacroDependencyDot {']
-    myMacEnv = theLexer.macroEnvironment
-    for aPpDef in myMacEnv.genMacros():
-        if aPpDef.isReferenced:
-            for aRtok in aPpDef.replacementTokens:
-                if aRtok.isIdentifier() and myMacEnv.hasMacro(aRtok.t):
-                    ret.append('"%s" -> "%s";' % (aPpDef.identifier, aRtok.t))
+    for aPair in _genMacroDependencies(theLexer.macroEnvironment):
+        ret.append('"%s" -> "%s";' % aPair)
     ret.append('}')
     ret.append('')
     return '\n'.join(ret)
@@ -571,7 +716,63 @@ def macroDepencdencyFileNameDotSVG(theItu):
     """
     return os.path.basename(theItu) + '.macros.dot.svg'
 
-def writeIncludeGraphAsText(theOutDir, theItu, theLexer):
+def macroProfileFileName(theItu):
+    """Returns the path to the macro expansion profile JSON file.
+
+    :param theItu: Path to the ITU.
+    :type theItu: ``str``
+
+    :returns: ``str`` -- path.
+    """
+    return os.path.basename(theItu) + '.macro_profile.json'
+
+def writeMacroProfileAsJson(theOutDir, theItu, theProfiler):
+    """Writes out the macro expansion profile as JSON.
+
+    :param theOutDir: Output directory.
+    :type theOutDir: ``str``
+
+    :param theItu: Path to the ITU.
+    :type theItu: ``str``
+
+    :param theProfiler: The profiler.
+    :type theProfiler: :py:class:`cpip.core.MacroProfiler.MacroProfiler`
+
+    :returns: ``NoneType``
+    """
+    with open(os.path.join(theOutDir, macroProfileFileName(theItu)), 'w') as myF:
+        theProfiler.writeJson(myF)
+
+def includeTraceFileName(theItu):
+    """Returns the path to the Chrome trace event JSON file of the time
+    taken by each included file.
+
+    :param theItu: Path to the ITU.
+    :type theItu: ``str``
+
+    :returns: ``str`` -- path.
+    """
+    return os.path.basename(theItu) + '.trace.json'
+
+def writeIncludeTraceAsJson(theOutDir, theItu, theLexer):
+    """Writes out the time and token counts of each included file as Chrome
+    trace event JSON that can be viewed with Perfetto or ``chrome://tracing``.
+
+    :param theOutDir: Output directory.
+    :type theOutDir: ``str``
+
+    :param theItu: Path to the ITU.
+    :type theItu: ``str``
+
+    :param theLexer: The lexer.
+    :type theLexer: :py:class:`cpip.core.PpLexer.PpLexer`
+
+    :returns: ``NoneType``
+    """
+    with open(os.path.join(theOutDir, includeTraceFileName(theItu)), 'w') as myF:
+        FileIncludeStack.writeTraceEvents(myF, theLexer.includeEvents)
+
+def writeIncludeGraphAsText(theOutDir, theItu, theLexer, incIndexLink=True):
     """Writes out the include graph as plain text.
     
     :param theOutDir: Output directory.
@@ -583,6 +784,10 @@ def writeIncludeGraphAsText(theOutDir, theItu, theLexer):
     :param theLexer: The lexer.
     :type theLexer: :py:class:`cpip.core.PpLexer.PpLexer`
     
+    :param incIndexLink: If True write links back to the TU index page, this
+        should be False if the index is not generated.
+    :type incIndexLink: ``bool``
+    
     :returns: ``NoneType``
     """
     def _linkToIndex(theS, theItu):
@@ -596,6 +801,8 @@ def writeIncludeGraphAsText(theOutDir, theItu, theLexer):
         
         :returns: ``NoneType``
         """
+        if not incIndexLink:
+            return
         with XmlWrite.Element(theS, 'p'):
             theS.characters('Return to ')
             with XmlWrite.Element(theS, 'a', {'href' : tuIndexFileName(theItu)}):
@@ -643,8 +850,33 @@ def _writeParagraphWithBreaks(theS, theParas):
         with XmlWrite.Element(theS, 'p'):
             theS.characters(p)
             
+def _writeLinkIfGenerated(theS, isGenerated, theHref, theText):
+    """Writes a link if the target has been generated, otherwise just the text
+    marked as not generated.
+    
+    :param theS: HTML stream.
+    :type theS: ``cpip.util.XmlWrite.XhtmlStream``
+    
+    :param isGenerated: True if the target of the link has been written.
+    :type isGenerated: ``bool``
+    
+    :param theHref: The link.
+    :type theHref: ``str``
+    
+    :param theText: The link text.
+    :type theText: ``str``
+    
+    :returns: ``NoneType``
+    """
+    if isGenerated:
+        with XmlWrite.Element(theS, 'a', {'href' : theHref, }):
+            theS.characters(theText)
+    else:
+        theS.characters('%s (not generated)' % theText)
+
 def writeTuIndexHtml(theOutDir, theTuPath, theLexer, theFileCountMap,
-                     theTokenCntr, hasIncDot, macroHistoryIndexName, hasMacroDependencyGraphDot):
+                     theTokenCntr, hasIncDot, macroHistoryIndexName, hasMacroDependencyGraphDot,
+                     outputPlan=None):
     """Write the index.html for a single TU.
 
     :param theOutDir: The output directory to write to.
@@ -673,12 +905,15 @@ def writeTuIndexHtml(theOutDir, theTuPath, theLexer, theFileCountMap,
     :param hasMacroDependencyGraphDot: bool to emit graphviz .dot files of macro dependencies.
     :type hasMacroDependencyGraphDot: ``bool``
 
+    :param outputPlan: The outputs that have been generated, None means all of them.
+    :type outputPlan: ``NoneType, OutputPlan``
+
     :returns: ``tuple([int, int, int])`` -- (total_files, total_lines, total_bytes) as integers.
     
     :raises: ``StopIteration``
     """
-    # Return values
-    total_files = total_lines = total_bytes = 0
+    if outputPlan is None:
+        outputPlan = retOutputPlan([])
     with XmlWrite.XhtmlStream(
             os.path.join(theOutDir, tuIndexFileName(theTuPath)),
             mustIndent=INDENT_ML,
@@ -710,11 +945,13 @@ pre-processing of this file.""")
             _writeParagraphWithBreaks(myS, SOURCE_CODE_INTRO)
             with XmlWrite.Element(myS, 'h3'):  # 'p'):
                 myS.characters('The ')
-                with XmlWrite.Element(myS, 'a', {'href' : HtmlUtils.retHtmlFileName(theTuPath), }):
-                    myS.characters('source file')
+                _writeLinkIfGenerated(myS, outputPlan.itu,
+                                      HtmlUtils.retHtmlFileName(theTuPath),
+                                      'source file')
                 myS.characters(' and ')
-                with XmlWrite.Element(myS, 'a', {'href' : tuFileName(theTuPath), }):
-                    myS.characters('as a translation unit')
+                _writeLinkIfGenerated(myS, outputPlan.tu,
+                                      tuFileName(theTuPath),
+                                      'as a translation unit')
             # ##
             # Include graph
             # ##
@@ -723,16 +960,18 @@ pre-processing of this file.""")
             _writeParagraphWithBreaks(myS, INCLUDE_GRAPH_INTRO)
             with XmlWrite.Element(myS, 'h3'):  # 'p'):
                 myS.characters('A ')
-                with XmlWrite.Element(myS, 'a', {'href' : includeGraphFileNameSVG(theTuPath), }):
-                    myS.characters('visual #include tree in SVG')
+                _writeLinkIfGenerated(myS, outputPlan.svg,
+                                      includeGraphFileNameSVG(theTuPath),
+                                      'visual #include tree in SVG')
                 # If we have successfully written a .dot file then link to it
                 if hasIncDot:
                     myS.characters(', ')
                     with XmlWrite.Element(myS, 'a', {'href' : includeGraphFileNameDotSVG(theTuPath), }):
                         myS.characters('Dot dependency [SVG]')
                 myS.characters(' or ')
-                with XmlWrite.Element(myS, 'a', {'href' : includeGraphFileNameText(theTuPath), }):
-                    myS.characters('as Text')
+                _writeLinkIfGenerated(myS, outputPlan.text,
+                                      includeGraphFileNameText(theTuPath),
+                                      'as Text')
             # ##
             # Conditional compilation
             # ##
@@ -741,8 +980,9 @@ pre-processing of this file.""")
             _writeParagraphWithBreaks(myS, CONDITIONAL_COMPILATION_INTRO)
             with XmlWrite.Element(myS, 'h3'):  # 'p'):
                 myS.characters('The ')
-                with XmlWrite.Element(myS, 'a', {'href' : includeGraphFileNameCcg(theTuPath), }):
-                    myS.characters('conditional compilation graph')
+                _writeLinkIfGenerated(myS, outputPlan.ccg,
+                                      includeGraphFileNameCcg(theTuPath),
+                                      'conditional compilation graph')
             # ##
             # Macro history
             # ##
@@ -751,8 +991,9 @@ pre-processing of this file.""")
             _writeParagraphWithBreaks(myS, MACROS_INTRO)
             with XmlWrite.Element(myS, 'h3'):
                 myS.characters('The ')
-                with XmlWrite.Element(myS, 'a', {'href' : macroHistoryIndexName, }):
-                    myS.characters('Macro Environment')
+                _writeLinkIfGenerated(myS, outputPlan.macros,
+                                      macroHistoryIndexName,
+                                      'Macro Environment')
                 if hasMacroDependencyGraphDot:
                     myS.characters(', ')
                     with XmlWrite.Element(myS, 'a', {'href' : macroDepencdencyFileNameDotSVG(theTuPath), }):
@@ -808,8 +1049,10 @@ pre-processing of this file.""")
                             # Where file_data was, initially, the count of
                             # inclusions of that file. Later versions had (count
                             # of inclusions, SLOC count, byte count)
+                            # href is None if the ITU HTML is not generated.
                             (
-                                HtmlUtils.retHtmlFileName(myItuFile),
+                                HtmlUtils.retHtmlFileName(myItuFile) \
+                                    if outputPlan.itu else None,
                                 os.path.basename(myItuFile),
                                 theFileCountMap[myItuFile]
                             ),
@@ -829,10 +1072,7 @@ pre-processing of this file.""")
                 myS.characters(
                     'Total number of unique files: %d' % len(theFileCountMap)
                 )
-            for f, l, b in theFileCountMap.values():
-                total_files += f
-                total_lines += f * l
-                total_bytes += f * b
+            total_files, total_lines, total_bytes = retFileCountTotals(theFileCountMap)
             with XmlWrite.Element(myS, 'p'):
                 myS.characters(
                     'Total number of files processed: {:,d}'.format(total_files)
@@ -909,7 +1149,8 @@ def _tdCallback(theS, attrs, _k, href_nav_text_file_data):
     :param _k: <insert documentation for argument>
     :type _k: ``list([str])``
     
-    :param href_nav_text_file_data: <insert documentation for argument>
+    :param href_nav_text_file_data: The href, None if there is no page to link
+        to, the navigation text and the file data.
     :type href_nav_text_file_data: ``tuple([str, str, tuple([int, int, int])])``
     
     :returns: ``NoneType``
@@ -917,9 +1158,13 @@ def _tdCallback(theS, attrs, _k, href_nav_text_file_data):
     attrs['class'] = 'filetable'
     href, navText, file_data = href_nav_text_file_data
     with XmlWrite.Element(theS, 'td', attrs):
-        with XmlWrite.Element(theS, 'a', {'href' : href}):
-            # Write the nav text
+        if href is None:
+            # No HTML for this file so just write the nav text
             theS.characters(navText)
+        else:
+            with XmlWrite.Element(theS, 'a', {'href' : href}):
+                # Write the nav text
+                theS.characters(navText)
     td_attrs = {
         'width' : "36px",
         'class' : 'filetable',
@@ -1306,7 +1551,8 @@ def preprocessDirToOutput(inDir, outDir, jobSpec, globMatch, recursive, numJobs)
         # Write the linking HTML from the title and file paths.
 #         print('results', results)
     finally:
-        _writeDirectoryIndexHTML(inDir, outDir, results, jobSpec, time_start)
+        if jobSpec.outputPlan.index:
+            _writeDirectoryIndexHTML(inDir, outDir, results, jobSpec, time_start)
 
 def preprocessFileToOutputNoExcept(ituPath, *args, **kwargs):
     """Preprocess a single file and catch all ExceptionCpip
@@ -1341,7 +1587,11 @@ def preprocessFileToOutput(ituPath, outDir, jobSpec):
             os.makedirs(outDir)
         except OSError:
             pass
-    myItuToHtmlFileSet = set()
+    TokenCss.writeCssToDir(outDir)
+    myPlan = jobSpec.outputPlan
+    # Path back to the TU index from the other pages, None if not generated
+    myTuIndexPath = tuIndexFileName(ituPath) if myPlan.index else None
+    myProfiler = MacroProfiler.MacroProfiler() if jobSpec.macroProfile else None
     # Create the lexer.
     myLexer = PpLexer.PpLexer(
                     ituPath,
@@ -1350,24 +1600,54 @@ def preprocessFileToOutput(ituPath, outDir, jobSpec):
                     diagnostic=jobSpec.diagnostic,
                     pragmaHandler=jobSpec.pragmaHandler,
                     stdPredefMacros=jobSpec.preDefMacros,
-                    gccExtensions=jobSpec.gccExtensions
+                    gccExtensions=jobSpec.gccExtensions,
+                    trackMacroRefs=_lexerTracksMacroRefs(jobSpec),
+                    macroRefPolicy=jobSpec.macroRefPolicy,
+                    predefLoader=jobSpec.predefLoader,
+                    macroProfiler=myProfiler,
+                    ituTokenCache=_retItuTokenCache(jobSpec) if myPlan.itu else None,
                     )
-    myDestFile = os.path.join(outDir, tuFileName(ituPath))
-    logging.info('TU in HTML:')
-    logging.info('  %s', myDestFile)
-    myTokCntr, mySetItuLines = Tu2Html.processTuToHtml(
-                            myLexer,
-                            myDestFile,
-                            ituPath,
-                            jobSpec.conditionalLevel,
-                            tuIndexFileName(ituPath),  # Path back to the index
-                            incItuAnchors=True,
-                        )
+    if myPlan.tu:
+        myDestFile = os.path.join(outDir, tuFileName(ituPath))
+        logging.info('TU in HTML:')
+        logging.info('  %s', myDestFile)
+        if jobSpec.tuPageLines > 0 or jobSpec.tuPageIncludes:
+            # mySetItuLines is a map of {line : page_name, ...}
+            myTokCntr, mySetItuLines, myTuIndexer = Tu2Html.processTuToHtmlPaged(
+                                    myLexer,
+                                    myDestFile,
+                                    ituPath,
+                                    jobSpec.conditionalLevel,
+                                    myTuIndexPath,
+                                    incItuAnchors=True,
+                                    incItuLinks=myPlan.itu,
+                                    linesPerPage=jobSpec.tuPageLines,
+                                    splitAtIncludes=jobSpec.tuPageIncludes,
+                                )
+            logging.info('  %s', myTuIndexer)
+        else:
+            myTokCntr, mySetItuLines = Tu2Html.processTuToHtml(
+                                    myLexer,
+                                    myDestFile,
+                                    ituPath,
+                                    jobSpec.conditionalLevel,
+                                    myTuIndexPath,
+                                    incItuAnchors=True,
+                                    incItuLinks=myPlan.itu,
+                                )
+    else:
+        myTokCntr, mySetItuLines = _processTuWithoutHtml(myLexer,
+                                                         jobSpec.conditionalLevel)
     logging.info('preprocessFileToOutput(): Processing TU done.')
-    myFileCountMap = retFileCountMap(myLexer)
-    # Write out the HTML for each source file
-    for aSrc in sorted(myFileCountMap.keys()):
-        myItuToHtmlFileSet.add(aSrc)
+    if myPlan.index or 'F' in jobSpec.dumpList:
+        myFileCountMap = retFileCountMap(myLexer, jobSpec.incHandler.encodingPolicy)
+        myItuToHtmlFileSet = set(myFileCountMap.keys())
+    else:
+        # Avoid re-reading every file just to count lines and bytes
+        myFileCountMap = {}
+        myFileNameVis = FileIncludeGraph.FigVisitorFileSet()
+        myLexer.fileIncludeGraphRoot.acceptVisitor(myFileNameVis)
+        myItuToHtmlFileSet = set(myFileNameVis.fileNameMap.keys())
     # Now output state
     # Conditional compilation graph
     if 'C' in jobSpec.dumpList:
@@ -1386,36 +1666,56 @@ def preprocessFileToOutput(ituPath, outDir, jobSpec):
         _dumpMacroEnv(myLexer)
     if 'R' in jobSpec.dumpList:
         _dumpMacroEnvDot(myLexer)
+    # Time trace of each file
+    if jobSpec.timeTrace:
+        logging.info('Include time trace to:')
+        logging.info('  %s', os.path.join(outDir, includeTraceFileName(ituPath)))
+        writeIncludeTraceAsJson(outDir, ituPath, myLexer)
+    # Macro expansion profile
+    if myProfiler is not None:
+        logging.info('Macro expansion profile to:')
+        logging.info('  %s', os.path.join(outDir, macroProfileFileName(ituPath)))
+        writeMacroProfileAsJson(outDir, ituPath, myProfiler)
     # Macro environment and history
-#     outPath = os.path.join(outDir, macroHistoryFileName(ituPath))
-    logging.info('Macro history to:')
-    logging.info('  %s', outDir)
-    myMacroRefMap, macroHistoryIndexName = MacroHistoryHtml.processMacroHistoryToHtml(
-            myLexer,
-            outDir,
-            ituPath,
-            tuIndexFileName(ituPath),
-        )
+    if myPlan.macros:
+        logging.info('Macro history to:')
+        logging.info('  %s', outDir)
+        myMacroRefMap, macroHistoryIndexName = MacroHistoryHtml.processMacroHistoryToHtml(
+                myLexer,
+                outDir,
+                ituPath,
+                myTuIndexPath,
+                incItuLinks=myPlan.itu,
+            )
+    else:
+        myMacroRefMap, macroHistoryIndexName = None, None
     # Write Include graph in SVG
-    outPath = os.path.join(outDir, includeGraphFileNameSVG(ituPath))
-    logging.info('Include graph (SVG) to:')
-    logging.info('  %s', outPath)
-    IncGraphSVGBase.processIncGraphToSvg(
-            myLexer,
-            outPath,
-            IncGraphSVG.SVGTreeNodeMain,
-            'left',
-            '+',
-        )
+    if myPlan.svg:
+        outPath = os.path.join(outDir, includeGraphFileNameSVG(ituPath))
+        logging.info('Include graph (SVG) to:')
+        logging.info('  %s', outPath)
+        IncGraphSVGBase.processIncGraphToSvg(
+                myLexer,
+                outPath,
+                IncGraphSVG.SVGTreeNodeMainTime if jobSpec.timeTrace \
+                    else IncGraphSVG.SVGTreeNodeMain,
+                'left',
+                '+',
+            )
     # Write Include graph in Text
-    logging.info('Writing include graph (TEXT) to:')
-    logging.info('  %s', outPath)
-    writeIncludeGraphAsText(outDir, ituPath, myLexer)
+    if myPlan.text:
+        outPath = os.path.join(outDir, includeGraphFileNameText(ituPath))
+        logging.info('Writing include graph (TEXT) to:')
+        logging.info('  %s', outPath)
+        writeIncludeGraphAsText(outDir, ituPath, myLexer,
+                                incIndexLink=myPlan.index)
     # Include graph as a dot file
     if jobSpec.includeDOT:
+        outPath = os.path.join(outDir, includeGraphFileNameDotSVG(ituPath))
         logging.info('Writing include graph (DOT) to:')
         logging.info('  %s', outPath)
         hasIncGraphDot = writeIncludeGraphAsDot(outDir, ituPath, myLexer)
+        outPath = os.path.join(outDir, macroDepencdencyFileNameDotSVG(ituPath))
         logging.info('Writing macro dependency graph (DOT) to:')
         logging.info('  %s', outPath)
         hasMacroDependencyGraphDot = writeMacroDependencyGraphAsDot(outDir, ituPath, myLexer)
@@ -1423,51 +1723,84 @@ def preprocessFileToOutput(ituPath, outDir, jobSpec):
         hasIncGraphDot = False
         hasMacroDependencyGraphDot = False
     # Write Conditional compilation graph in HTML
-    outPath = os.path.join(outDir, includeGraphFileNameCcg(ituPath))
-    logging.info('Conditional compilation graph in HTML:')
-    logging.info('  %s', outPath)
-    CppCondGraphToHtml.processCppCondGrphToHtml(
-            myLexer,
-            outPath,
-            'Conditional Compilation Graph',
-            tuIndexFileName(ituPath),
-        )
+    if myPlan.ccg:
+        outPath = os.path.join(outDir, includeGraphFileNameCcg(ituPath))
+        logging.info('Conditional compilation graph in HTML:')
+        logging.info('  %s', outPath)
+        CppCondGraphToHtml.processCppCondGrphToHtml(
+                myLexer,
+                outPath,
+                'Conditional Compilation Graph',
+                myTuIndexPath,
+                incItuLinks=myPlan.itu,
+            )
     # This is an index for the TU
-    total_files, total_lines, total_bytes = writeTuIndexHtml(
-        outDir, ituPath, myLexer, myFileCountMap, myTokCntr,
-        hasIncGraphDot, macroHistoryIndexName, hasMacroDependencyGraphDot,
-    )
+    if myPlan.index:
+        total_files, total_lines, total_bytes = writeTuIndexHtml(
+            outDir, ituPath, myLexer, myFileCountMap, myTokCntr,
+            hasIncGraphDot, macroHistoryIndexName, hasMacroDependencyGraphDot,
+            outputPlan=myPlan,
+        )
+    else:
+        total_files, total_lines, total_bytes = retFileCountTotals(myFileCountMap)
     logging.info('Done: %s', ituPath)
     # Write ITU HTML i.e. HTMLise the original files
-    # Create a CppCondGraphVisitorConditionalLines
-    myCcgvcl = CppCond.CppCondGraphVisitorConditionalLines()
-    myLexer.condCompGraph.visit(myCcgvcl)
-    for aSrc in sorted(myItuToHtmlFileSet):
-        try:
-            # Could be 'Unnamed Pre-include'
-            if aSrc != PpLexer.UNNAMED_FILE_NAME:
-                logging.info('ITU in HTML: .../%s', os.path.basename(aSrc))
-                ItuToHtml.ItuToHtml(
-                    aSrc,
-                    outDir,
-                    keepGoing=jobSpec.keepGoing,
-                    macroRefMap=myMacroRefMap,
-                    cppCondMap=myCcgvcl,
-                    ituToTuLineSet=mySetItuLines if aSrc == ituPath else None,
-                )
-        except ItuToHtml.ExceptionItuToHTML as err:
-            logging.error('Can not write ITU "%s" to HTML: %s', aSrc, str(err))
-    indexPath = writeIndexHtml(
-        [ituPath, ], outDir, jobSpec,
-        time_start, total_files, total_lines, total_bytes)
+    if myPlan.itu:
+        # Create a CppCondGraphVisitorConditionalLines
+        myCcgvcl = CppCond.CppCondGraphVisitorConditionalLines()
+        myLexer.condCompGraph.visit(myCcgvcl)
+        for aSrc in sorted(myItuToHtmlFileSet):
+            try:
+                # Could be 'Unnamed Pre-include'
+                if aSrc != PpLexer.UNNAMED_FILE_NAME:
+                    logging.info('ITU in HTML: .../%s', os.path.basename(aSrc))
+                    ItuToHtml.ItuToHtml(
+                        aSrc,
+                        outDir,
+                        keepGoing=jobSpec.keepGoing,
+                        macroRefMap=myMacroRefMap,
+                        cppCondMap=myCcgvcl,
+                        ituToTuLineSet=mySetItuLines if aSrc == ituPath else None,
+                        tokenCache=_retItuTokenCache(jobSpec),
+                        encodingPolicy=jobSpec.incHandler.encodingPolicy,
+                    )
+            except ItuToHtml.ExceptionItuToHTML as err:
+                logging.error('Can not write ITU "%s" to HTML: %s', aSrc, str(err))
+    if myPlan.index:
+        indexPath = writeIndexHtml(
+            [ituPath, ], outDir, jobSpec,
+            time_start, total_files, total_lines, total_bytes)
+        myTuIndexFileName = tuIndexFileName(ituPath)
+    else:
+        indexPath = myTuIndexFileName = None
     logging.info('preprocessFileToOutput(): %s DONE' % ituPath)
     # Return the path to the ITU and to the index.html path for consolidation
     # by the caller - to be used in multiprocessing.
     return PpProcessResult(
-        ituPath, indexPath, tuIndexFileName(ituPath),
+        ituPath, indexPath, myTuIndexFileName,
         total_files, total_lines, total_bytes
     )
 
+def _processTuWithoutHtml(theLexer, theCondLevel):
+    """Runs the lexer over the translation unit without writing any HTML.
+    This is used when the translation unit HTML is not in the output plan but
+    other outputs need the results of pre-processing.
+
+    :param theLexer: The lexer.
+    :type theLexer: :py:class:`cpip.core.PpLexer.PpLexer`
+
+    :param theCondLevel: The Conditional level to pass to ``theLexer.ppTokens()``
+    :type theCondLevel: ``int``
+
+    :returns: ``tuple([cpip.core.PpTokenCount.PpTokenCount, set([])])``
+        -- The token count and an empty set of ITU line numbers as there are
+        no anchors in the translation unit HTML to link to.
+    """
+    myTokCntr = PpTokenCount.PpTokenCount()
+    for t in theLexer.ppTokens(incWs=True, minWs=True, condLevel=theCondLevel):
+        myTokCntr.inc(t, isUnCond=t.isUnCond, num=1)
+    return myTokCntr, set()
+
 def main():
     """Processes command line to preprocess a file or a directory.
     
@@ -1526,6 +1859,11 @@ directories. Zero uses number of native CPUs [%d].
                          dest="output",
                          default="out",
                          help="Output directory. [default: %(default)s]")
+    parser.add_argument("--outputs", action="append", dest="outputs", default=[],
+                      help="Comma separated list of outputs to generate, additive. Can be:\n" \
+                        + '\n'.join(['%s - %s' % (k, v) for k, v in OUTPUT_NAMES.items()]) \
+                        + '\n%s - Everything.' % OUTPUT_ALL \
+                        + "\n[default: %(default)s] i.e. all.")
     parser.add_argument("-p", action="store_true", dest="ignore_pragma", default=False,
                       help="Ignore pragma statements. [default: %(default)s]")
     parser.add_argument("-r", "--recursive", action="store_true", dest="recursive",
@@ -1535,6 +1873,35 @@ directories. Zero uses number of native CPUs [%d].
                          default=False,
                       help="""Write an DOT include dependency table and execute DOT
 on it to create a SVG file (for includes and macro dependencies). [default: %(default)s]""")
+    parser.add_argument("--token-cache", type=str, dest="token_cache", default=None,
+                      help="""Directory to cache the tokens of each source file
+for the ITU HTML between processes and runs. [default: %(default)s] i.e. in-memory only.""")
+    parser.add_argument("--tu-page-lines", type=int, dest="tu_page_lines", default=0,
+                      help="""Write the translation unit HTML as pages of this
+many lines with an index page. Zero means a single page. [default: %(default)s]""")
+    parser.add_argument("--tu-page-includes", action="store_true",
+                        dest="tu_page_includes", default=False,
+                      help="""Write the translation unit HTML as pages, starting
+a new page on entering or leaving each file included by the ITU. [default: %(default)s]""")
+    parser.add_argument("--macro-refs-max", type=int, dest="macro_refs_max", default=0,
+                      help="""Maximum number of references recorded for each
+macro in the macro history, zero for no limit. [default: %(default)s]""")
+    parser.add_argument("--macro-refs-sample", type=int, dest="macro_refs_sample", default=1,
+                      help="""Record every Nth reference to each macro in the
+macro history. [default: %(default)s] i.e. all of them.""")
+    parser.add_argument("--macro-refs-unique-lines", action="store_true",
+                        dest="macro_refs_unique_lines", default=False,
+                      help="""Record only the first reference to each macro on
+any line in the macro history. [default: %(default)s]""")
+    parser.add_argument("--macro-profile", action="store_true",
+                        dest="macro_profile", default=False,
+                      help="""Profile the expansion of each macro, written as
+JSON and as a table in the macro history. [default: %(default)s]""")
+    parser.add_argument("--time-trace", action="store_true",
+                        dest="time_trace", default=False,
+                      help="""Write the time and tokens of each included file as
+a Chrome trace event JSON file and add a time histogram to the include graph
+SVG. [default: %(default)s]""")
     parser.add_argument("-G", action="store_true", dest="gcc_extensions",
                          default=False,
                       help="""Support GCC extensions. Currently only #include_next. [default: %(default)s]""")
@@ -1542,6 +1909,18 @@ on it to create a SVG file (for includes and macro dependencies). [default: %(de
     Cpp.addStandardArguments(parser)
     args = parser.parse_args()
     args.output = os.path.abspath(args.output)
+    try:
+        myOutputPlan = retOutputPlan(args.outputs)
+    except ValueError as err:
+        parser.error(str(err))
+    try:
+        myMacroRefPolicy = MacroRefStore.retRefPolicy(
+            args.macro_refs_unique_lines,
+            args.macro_refs_max,
+            args.macro_refs_sample,
+        )
+    except MacroRefStore.ExceptionMacroRefStore as err:
+        parser.error(str(err))
     # print(' ARGS '.center(75, '-'))
     # print(args)
     # print(' END: ARGS '.center(75, '-'))
@@ -1576,6 +1955,7 @@ on it to create a SVG file (for includes and macro dependencies). [default: %(de
     myIncH = IncludeHandler.CppIncludeStdOs(
                     theUsrDirs=args.incUsr or [],
                     theSysDirs=args.incSys or [],
+                    theEncodingPolicy=Cpp.encodingPolicy(args),
     )
     preDefMacros = {}
     if args.predefines:
@@ -1601,12 +1981,21 @@ on it to create a SVG file (for includes and macro dependencies). [default: %(de
         includeDOT=args.include_dot,
         cmdLine=' '.join(sys.argv),
         gccExtensions=args.gcc_extensions,
+        outputPlan=myOutputPlan,
+        tuPageLines=args.tu_page_lines,
+        tuPageIncludes=args.tu_page_includes,
+        tokenCacheDir=args.token_cache,
+        macroRefPolicy=myMacroRefPolicy,
+        predefLoader=MacroEnv.PredefinedMacroLoader(),
+        macroProfile=args.macro_profile,
+        timeTrace=args.time_trace,
     )
     if os.path.isfile(inPath):
         time_start = time.time()
         result = preprocessFileToOutput(inPath, args.output, jobSpec)
-        # TODO: Fix this *result[-3:] hack.
-        writeIndexHtml([inPath], args.output, jobSpec, time_start, *result[-3:])
+        if myOutputPlan.index:
+            # TODO: Fix this *result[-3:] hack.
+            writeIndexHtml([inPath], args.output, jobSpec, time_start, *result[-3:])
     elif os.path.isdir(inPath):
         preprocessDirToOutput(
             inPath,
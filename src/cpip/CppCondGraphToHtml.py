@@ -38,11 +38,14 @@ def linkToIndex(theS, theIdxPath):
     :param theS: The HTML stream.
     :type theS: :py:class:`cpip.util.XmlWrite.XhtmlStream`
 
-    :param theIdxPath: <insert documentation for argument>
-    :type theIdxPath: ``str``
+    :param theIdxPath: Path to the index, if None nothing is written as the
+        index has not been generated.
+    :type theIdxPath: ``NoneType, str``
 
     :returns: ``NoneType``
     """
+    if theIdxPath is None:
+        return
     with XmlWrite.Element(theS, 'p'):
         theS.characters('Return to ')
         with XmlWrite.Element(theS, 'a', {'href' : theIdxPath}):
@@ -51,16 +54,20 @@ def linkToIndex(theS, theIdxPath):
 class CcgVisitorToHtml(CppCond.CppCondGraphVisitorBase):
     """Writing CppCondGraph visitor object."""
     PAD_STR = '  '
-    def __init__(self, theHtmlStream):
+    def __init__(self, theHtmlStream, incItuLinks=True):
         """Constructor with an output XmlWrite.XhtmlStream.
 
         :param theHtmlStream: The HTML stream.
         :type theHtmlStream: :py:class:`cpip.util.XmlWrite.XhtmlStream`
 
+        :param incItuLinks: If True link to the HTML of the source files.
+        :type incItuLinks: ``bool``
+
         :returns: ``NoneType``
         """
         super(CcgVisitorToHtml, self).__init__()
         self._hs = theHtmlStream
+        self._incItuLinks = incItuLinks
         
     def visitPre(self, theCcgNode, theDepth):
         """Pre-traversal call with a CppCondGraphNode and the integer depth in
@@ -85,13 +92,16 @@ class CcgVisitorToHtml(CppCond.CppCondGraphVisitorBase):
                 self._hs.characters(' %s' % theCcgNode.constExpr)
         self._hs.characters(' ')
         self._hs.characters(' /* ')
-        HtmlUtils.writeHtmlFileLink(
-                self._hs,
-                theCcgNode.fileId,
-                theCcgNode.lineNum,
-                os.path.basename(theCcgNode.fileId),
-                theClass=None,
-            )
+        if self._incItuLinks:
+            HtmlUtils.writeHtmlFileLink(
+                    self._hs,
+                    theCcgNode.fileId,
+                    theCcgNode.lineNum,
+                    os.path.basename(theCcgNode.fileId),
+                    theClass=None,
+                )
+        else:
+            self._hs.characters(os.path.basename(theCcgNode.fileId))
         self._hs.characters(' */')
         #with XmlWrite.Element(self._hs, 'span', {'class' : 'file'}):
         #    self._hs.characters(' [%s]' % theCcgNode.fileId)
@@ -115,7 +125,8 @@ class CcgVisitorToHtml(CppCond.CppCondGraphVisitorBase):
 def processCppCondGrphToHtml(theLex,
                              theHtmlPath,
                              theTitle,
-                             theIdxPath):
+                             theIdxPath,
+                             incItuLinks=True):
     """Given the PpLexer write out the Cpp Cond Graph to the HTML file.
 
     :param theLex: The lexer.
@@ -127,8 +138,13 @@ def processCppCondGrphToHtml(theLex,
     :param theTitle: Title.
     :type theTitle: ``str``
 
-    :param theIdxPath: Path to index page for back links.
-    :type theIdxPath: ``str``
+    :param theIdxPath: Path to index page for back links, None if the index
+        is not generated.
+    :type theIdxPath: ``NoneType, str``
+
+    :param incItuLinks: If True link to the HTML of the source files, this
+        should be False if that is not generated.
+    :type incItuLinks: ``bool``
 
     :returns: ``NoneType``
     """
@@ -161,5 +177,5 @@ and red (evaluates as False). Each statement is linked to the source code it cam
 """)
             linkToIndex(myS, theIdxPath)
             with XmlWrite.Element(myS, 'pre'):
-                myVisitor = CcgVisitorToHtml(myS)
+                myVisitor = CcgVisitorToHtml(myS, incItuLinks)
                 theLex.condCompGraph.visit(myVisitor)
@@ -201,6 +201,14 @@ class SVGTreeNodeMain(IncGraphSVGBase.SVGTreeNodeBase):
     HIST_RECT_STROKE_WIDTH = ".5"
     #: Histogram rectangle ID.
     HIST_LEGEND_ID = "HistogramLegend"
+    #: Whether to plot the time histogram below the token histograms.
+    PLOT_TIME_HISTOGRAM = False
+    #: Time histogram colours for the time in me and in my children. The
+    #: widths are the proportion of the time for the whole translation unit.
+    HIST_TIME_COLOURS = (
+        ('self',        'crimson',),
+        ('children',    'gold',),
+    )
     #: The placeholder text for JavaScript rollover
     POPUP_TEXT = ' ? '
     def __init__(self, theFig, theLineNum):
@@ -234,6 +242,11 @@ class SVGTreeNodeMain(IncGraphSVGBase.SVGTreeNodeBase):
             # A PpTokenCount.PpTokenCount() object for this node only.
             self._dataMap['tokenCntr']      = theFig.tokenCounter
             self._dataMap['findLogic']      = theFig.findLogic
+            # Wall time in seconds, None if not recorded
+            self._dataMap['time']           = theFig.time
+            self._dataMap['timeIncChildren']= theFig.timeIncChildren
+        # Wall time of the translation unit, set on finalise of the root
+        self._timeTotal = None
         # A list of tuples of (Coord.Pt, Cooord.Box, attributes) that are to be
         # written last as <rect class="invis" ...
         self._triggerS = []
@@ -290,6 +303,26 @@ class SVGTreeNodeMain(IncGraphSVGBase.SVGTreeNodeBase):
         """
         assert(not self.isRoot)
         return self._dataMap['findLogic']
+
+    @property
+    def time(self):
+        """The wall time in seconds for me only.
+
+        :returns: ``NoneType, float`` -- Time, None if not recorded.
+        """
+        if self.isRoot:
+            return None
+        return self._dataMap['time']
+
+    @property
+    def timeIncChildren(self):
+        """The wall time in seconds for me and my descendents.
+
+        :returns: ``NoneType, float`` -- Time, None if not recorded.
+        """
+        if self.isRoot:
+            return None
+        return self._dataMap['timeIncChildren']
     #========================================
     # End: Accessor methods used by ancestors
     #========================================
@@ -325,6 +358,22 @@ class SVGTreeNodeMain(IncGraphSVGBase.SVGTreeNodeBase):
             if len(self._children) > 0:
                 self._bb.bbSpaceChildren = self.SPACE_PARENT_CHILD
         # Bounding boxes now set up
+        if self.isRoot and self.PLOT_TIME_HISTOGRAM:
+            myTimeS = [c.timeIncChildren for c in self._children]
+            if len(myTimeS) and None not in myTimeS:
+                self._setTimeTotal(sum(myTimeS))
+
+    def _setTimeTotal(self, theTime):
+        """Sets the wall time of the translation unit on me and my descendents.
+
+        :param theTime: Time in seconds.
+        :type theTime: ``float``
+
+        :returns: ``NoneType``
+        """
+        self._timeTotal = theTime
+        for aChild in self._children:
+            aChild._setTimeTotal(theTime)
             
     def writePreamble(self, theS):
         """Write any preamble such as CSS or JavaScript.
@@ -646,6 +695,8 @@ class SVGTreeNodeMain(IncGraphSVGBase.SVGTreeNodeBase):
                 # Shuffle down a bit
                 myHistDl = Coord.newPt(myHistDl, None, self.HIST_DEPTH)
                 self._plotHistogram(theSvg, myHistDl, theTpt, self._tokenCounterChildren)
+        if self._mustPlotTimeHistogram():
+            self._plotTimeHistogram(theSvg, self._timeHistogramPoint(theDl), theTpt)
         # Now the Chevron
         self._plotChevron(theSvg, theDl, theTpt)
         # The filename as display text (no animation)
@@ -693,6 +744,8 @@ class SVGTreeNodeMain(IncGraphSVGBase.SVGTreeNodeBase):
                 # Shuffle down a bit
                 myHistDl = Coord.newPt(myHistDl, None, self.HIST_DEPTH)
                 self._plotTextOverlayHistogram(theSvg, myHistDl, theTpt)
+        if self._mustPlotTimeHistogram():
+            self._plotTextOverlayTimeHistogram(theSvg, theDatumL, theTpt)
         if not self.isRoot:
             self._plotTextOverlayTokenCountTable(theSvg, theDatumL, theTpt)
             self._plotFileNameStackPopup(theSvg, theDatumL, theTpt, idStack)
@@ -983,6 +1036,9 @@ class SVGTreeNodeMain(IncGraphSVGBase.SVGTreeNodeBase):
             if self.__mustPlotChildHistogram():
                 myDatumL = Coord.newPt(myDatumL, None, self.HIST_DEPTH)
                 triggerBoxL = Coord.Box(triggerBoxL.width, triggerBoxL.depth - self.HIST_DEPTH)
+        if self._mustPlotTimeHistogram():
+            myDatumL = Coord.newPt(myDatumL, None, self.HIST_DEPTH)
+            triggerBoxL = Coord.Box(triggerBoxL.width, triggerBoxL.depth - self.HIST_DEPTH)
         myDatumP = theTpt.pt(myDatumL)
         altTextS = self._altTextsForTokenCount()
         self.writeAltTextAndMouseOverRect(
@@ -1140,6 +1196,110 @@ class SVGTreeNodeMain(IncGraphSVGBase.SVGTreeNodeBase):
                 # Increment the datum
                 myHistDl = Coord.newPt(myHistDl, incX=myWidth, incY=None)
 
+    def _mustPlotTimeHistogram(self):
+        """
+        :returns: ``bool`` -- ``True`` if the time histogram should be plotted.
+        """
+        return self.PLOT_TIME_HISTOGRAM \
+            and not self.isRoot \
+            and self._timeTotal is not None \
+            and self._timeTotal > 0.0 \
+            and self.timeIncChildren is not None
+
+    def _timeHistogramPoint(self, theDl):
+        """Returns the logical point of the time histogram which is below
+        any token histograms.
+
+        :param theDl: Logical position.
+        :type theDl: ``cpip.plot.Coord.Pt([cpip.plot.Coord.Dim([float, str]), cpip.plot.Coord.Dim([float, <class 'str'>])])``
+
+        :returns: ``cpip.plot.Coord.Pt([cpip.plot.Coord.Dim([float, str]), cpip.plot.Coord.Dim([float, <class 'str'>])])``
+            -- The point.
+        """
+        retDl = self._bb.plotPointSelf(theDl)
+        if self.__mustPlotSelfHistogram():
+            retDl = Coord.newPt(retDl, None, self.HIST_DEPTH)
+        if self.__mustPlotChildHistogram():
+            retDl = Coord.newPt(retDl, None, self.HIST_DEPTH)
+        return retDl
+
+    def _plotTimeHistogram(self, theSvg, theHistDl, theTpt):
+        """Plots the time histogram. The full width is the time of the
+        translation unit so the bars are the proportion of that spent in me
+        and in my children.
+
+        :param theSvg: SVG stream.
+        :type theSvg: :py:class:`cpip.plot.SVGWriter.SVGWriter`
+
+        :param theHistDl: Position.
+        :type theHistDl: ``cpip.plot.Coord.Pt([cpip.plot.Coord.Dim([float, str]), cpip.plot.Coord.Dim([float, <class 'str'>])])``
+
+        :param theTpt: Transformer of logical to physical points.
+        :type theTpt: :py:class:`cpip.plot.TreePlotTransform.TreePlotTransform`
+
+        :returns: ``NoneType``
+        """
+        myTimeS = (self.time, self.timeIncChildren - self.time)
+        myHistDl = theHistDl
+        for (k, myFill), myTime in zip(self.HIST_TIME_COLOURS, myTimeS):
+            if myTime > 0.0:
+                myWidth = self._bb.width.scale(min(1.0, myTime / self._timeTotal))
+                myBox = Coord.Box(myWidth, self.HIST_DEPTH)
+                with SVGWriter.SVGRect(
+                        theSvg,
+                        theTpt.boxDatumP(myHistDl, myBox),
+                        theTpt.boxP(myBox),
+                        {
+                            'fill'         : myFill,
+                            'stroke'       : self.HIST_RECT_COLOUR_STROKE,
+                            'stroke-width' : self.HIST_RECT_STROKE_WIDTH,
+                        },
+                    ):
+                    pass
+                myHistDl = Coord.newPt(myHistDl, incX=myWidth, incY=None)
+
+    def _plotTextOverlayTimeHistogram(self, theSvg, theDatumL, theTpt):
+        """Plots the pop-up text of the time histogram.
+
+        :param theSvg: SVG stream.
+        :type theSvg: :py:class:`cpip.plot.SVGWriter.SVGWriter`
+
+        :param theDatumL: Position.
+        :type theDatumL: ``cpip.plot.Coord.Pt([cpip.plot.Coord.Dim([float, str]), cpip.plot.Coord.Dim([float, <class 'str'>])])``
+
+        :param theTpt: Transformer of logical to physical points.
+        :type theTpt: :py:class:`cpip.plot.TreePlotTransform.TreePlotTransform`
+
+        :returns: ``NoneType``
+        """
+        myHistDl = self._timeHistogramPoint(theDatumL)
+        myBox = Coord.Box(self._bb.width, self.HIST_DEPTH)
+        myAltDl = Coord.newPt(myHistDl, incX=self._bb.width, incY=None)
+        self.writeAltTextAndMouseOverRect(
+            theSvg,
+            theSvg.id,
+            theTpt.pt(myAltDl),
+            self._altTextsForTime(),
+            theTpt.boxDatumP(myHistDl, myBox),
+            theTpt.boxP(myBox),
+        )
+
+    def _altTextsForTime(self):
+        """Returns a list of strings that are the alternate text for the time
+        histogram.
+
+        :returns: ``list([str])`` -- Alternate text.
+        """
+        retS = []
+        for aName, aTime in (
+                ('Me', self.time),
+                ('Child', self.timeIncChildren - self.time),
+                ('All', self.timeIncChildren),
+            ):
+            retS.append('%5s %10.3f ms %5.1f%%' \
+                        % (aName, aTime * 1000, 100.0 * aTime / self._timeTotal))
+        return retS
+
     def _plotHistogramLegend(self, theSvg, theTpt):
         """Plot a standardised legend. This is plotted as a group within a defs.
 
@@ -1256,6 +1416,8 @@ class SVGTreeNodeMain(IncGraphSVGBase.SVGTreeNodeBase):
             myDl = Coord.newPt(myDl, None, self.HIST_DEPTH)
         if self.__mustPlotChildHistogram():
             myDl = Coord.newPt(myDl, None, self.HIST_DEPTH)
+        if self._mustPlotTimeHistogram():
+            myDl = Coord.newPt(myDl, None, self.HIST_DEPTH)
         # Figure out move to B
         if self._numChildSigTokens == 0:
             # Chevron takes full width
@@ -1357,3 +1519,9 @@ class SVGTreeNodeMain(IncGraphSVGBase.SVGTreeNodeBase):
                         % (theId, theId+self.ALT_ID_SUFFIX),
         }
         self._triggerS.append((theTrigPt, theTrigRect, boxAttrs))
+
+class SVGTreeNodeMainTime(SVGTreeNodeMain):
+    """As :py:class:`SVGTreeNodeMain` but also plots a histogram of the wall
+    time of each file and the files that it includes below the token
+    histograms."""
+    PLOT_TIME_HISTOGRAM = True
@@ -84,6 +84,7 @@ from cpip.core import IncludeHandler
 from cpip.core import CppDiagnostic
 from cpip.core import FileIncludeGraph
 from cpip.core import PragmaHandler
+from cpip.core import SourceBuffer
 
 def retIncludedFileSet(theLexer):
     """Returns a set of included file paths from a lexer."""
@@ -103,7 +104,7 @@ def preProcessForIncludes(theItu, incUsr, incSys, theDefineS, preIncS, keepGoing
     if theDefineS:
         myStr = '\n'.join(['#define '+' '.join(d.split('=')) for d in theDefineS])+'\n'
         myPreIncFiles = [io.StringIO(myStr), ]
-    myPreIncFiles.extend([open(f) for f in preIncS])
+    myPreIncFiles.extend([SourceBuffer.openSource(f) for f in preIncS])
     myDiag = None
     if keepGoing:
         myDiag = CppDiagnostic.PreprocessDiagnosticKeepGoing()
@@ -34,6 +34,7 @@ import cpip
 from cpip import ExceptionCpip
 from cpip.core import ItuToTokens
 from cpip.core import CppDiagnostic
+from cpip.core import SourceBuffer
 from cpip.util import XmlWrite
 from cpip.util import HtmlUtils
 from cpip import TokenCss
@@ -49,7 +50,8 @@ class ItuToHtml(object):
         1 : 'True',
     }
     def __init__(self, theItu, theHtmlDir, keepGoing=False,
-                 macroRefMap=None, cppCondMap=None, ituToTuLineSet=None):
+                 macroRefMap=None, cppCondMap=None, ituToTuLineSet=None,
+                 tokenCache=None, encodingPolicy=None):
         """Takes an input source file and an output directory.
 
         :param theItu: The original source file path (or file like object for the input).
@@ -69,15 +71,31 @@ class ItuToHtml(object):
         :type cppCondMap: :py:class:`cpip.core.CppCond.CppCondGraphVisitorConditionalLines`
 
         :param ituToTuLineSet: Set of integer line numbers which are lines that
-            can be linked to the translation unit representation.
-        :type ituToTuLineSet: ``NoneType, set([int])``
+            can be linked to the translation unit representation. If the
+            translation unit has been written as pages then this is a map of
+            ``{line : page_name, ...}`` of the page that has the line anchor.
+        :type ituToTuLineSet: ``NoneType, set([int]), dict({int : [str]})``
+
+        :param tokenCache: If not None and theItu is a path then the tokens
+            are taken from this cache rather than tokenising the file.
+        :type tokenCache: ``NoneType, cpip.core.ItuToTokens.ItuTokenCache``
+
+        :param encodingPolicy: How to decode theItu if it is a path, None for
+            the default.
+        :type encodingPolicy: ``NoneType``, :py:data:`cpip.core.SourceBuffer.EncodingPolicy`
 
         :returns: ``NoneType``
         """
+        self._tokenCache = None
         try:
             # Assume string or unicode first
             self._fpIn = theItu
-            self._ituFileObj = open(self._fpIn)
+            if tokenCache is not None and isinstance(theItu, str):
+                # The cache reads the file if necessary
+                self._tokenCache = tokenCache
+                self._ituFileObj = None
+            else:
+                self._ituFileObj = SourceBuffer.openSource(self._fpIn, encodingPolicy)
         except TypeError:
             self._fpIn = 'Unknown'
             self._ituFileObj = theItu
@@ -94,6 +112,8 @@ class ItuToHtml(object):
         self._ituToTuLineSet = ituToTuLineSet
         # Start at 0 as this gets incremented before write
         self._lineNum = 0
+        # Run of (text, css_class) waiting to be written with writeSpanRun()
+        self._spanRun = []
         self._convert()
     
     def _convert(self):
@@ -103,11 +123,15 @@ class ItuToHtml(object):
 
         :raises: ``ExceptionItuToHTML`` on failure.
         """
-        # Create reader
+        # Create reader, if there is a token cache this is the tokens.
         myItt = self._initReader()
         # Create writer and iterate
         if self._fOut is None:
             return
+        if self._tokenCache is None:
+            myTokS = myItt.genTokensKeywordPpDirective()
+        else:
+            myTokS = myItt.genTokToktype()
         try:
             with XmlWrite.XhtmlStream(self._fOut, mustIndent=cpip.INDENT_ML) as myS:
                 with XmlWrite.Element(myS, 'head'):
@@ -134,16 +158,19 @@ the macro page.""")
                     with XmlWrite.Element(myS, 'pre'):
                         myS.xmlSpacePreserve()
                         self._incAndWriteLine(myS)
-                        for t, tt in myItt.genTokensKeywordPpDirective():
+                        for t, tt in myTokS:
                             self._handleToken(myS, t, tt)
+                        self._flushSpanRun(myS)
         except (IOError) as err:
-            raise ExceptionItuToHTML('%s line=%d, col=%d' \
-                        % (
-                            str(err),
-                            myItt.fileLocator.lineNum,
-                            myItt.fileLocator.colNum,
+            if self._tokenCache is None:
+                raise ExceptionItuToHTML('%s line=%d, col=%d' \
+                            % (
+                                str(err),
+                                myItt.fileLocator.lineNum,
+                                myItt.fileLocator.colNum,
+                            )
                         )
-                    )
+            raise ExceptionItuToHTML('%s line=%d' % (str(err), self._lineNum))
                     
     def _handleToken(self, theS, t, tt):
         """Handle a token.
@@ -173,13 +200,23 @@ the macro page.""")
                 # we just use the last definition in the list.
                 assert len(self._macroRefMap[t]) > 0
                 href = self._macroRefMap[t][-1][2]
-                with XmlWrite.Element(theS, 'a', {'href' : href}):
-                    with XmlWrite.Element(theS, 'span', {'class' : '%s' % TokenCss.retClass(tt)}):
-                        theS.characters(t)
+                self._flushSpanRun(theS)
+                theS.writeLinkedSpan(t, TokenCss.retClass(tt), href)
             else:
-                with XmlWrite.Element(theS, 'span', {'class' : '%s' % TokenCss.retClass(tt)}):
-                    self._lineNum += t.count('\n')
-                    theS.characters(t)
+                self._lineNum += t.count('\n')
+                self._spanRun.append((t, TokenCss.retClass(tt)))
+
+    def _flushSpanRun(self, theS):
+        """Writes out any pending run of spans.
+
+        :param theS: The HTML stream.
+        :type theS: :py:class:`cpip.util.XmlWrite.XhtmlStream`
+
+        :returns: ``NoneType``
+        """
+        if len(self._spanRun):
+            theS.writeSpanRun(self._spanRun)
+            self._spanRun = []
     
     def _writeTextWithNewlines(self, theS, theText, spanClass):
         """Splits text by newlines and writes it out.
@@ -200,19 +237,12 @@ the macro page.""")
         if len(myL) > 1:
             # Do all up to the last
             for s in myL[:-1]:
-                if spanClass is not None:
-                    with XmlWrite.Element(theS, 'span', {'class' : spanClass}):
-                        theS.characters(s.replace('\t', '    '))
-                else:
-                    theS.characters(s.replace('\t', '    '))
-                theS.characters('\n')
+                self._spanRun.append((s.replace('\t', '    '), spanClass))
+                self._spanRun.append(('\n', None))
+                self._flushSpanRun(theS)
                 self._incAndWriteLine(theS)
         # Now the last
-        if spanClass is not None:
-            with XmlWrite.Element(theS, 'span', {'class' : spanClass}):
-                theS.characters(myL[-1].replace('\t', '    '))
-        else:
-            theS.characters(myL[-1].replace('\t', '    '))
+        self._spanRun.append((myL[-1].replace('\t', '    '), spanClass))
     
     def _incAndWriteLine(self, theS):
         """Write a line.
@@ -235,7 +265,10 @@ the macro page.""")
 #       # Write a link to the TU representation if I am the ITU
         if self._ituToTuLineSet is not None \
         and self._lineNum in self._ituToTuLineSet:
-            myHref = '%s.html#%d' % (os.path.basename(self._fpIn), self._lineNum)
+            if isinstance(self._ituToTuLineSet, dict):
+                myHref = '%s#%d' % (self._ituToTuLineSet[self._lineNum], self._lineNum)
+            else:
+                myHref = '%s.html#%d' % (os.path.basename(self._fpIn), self._lineNum)
         else:
             myHref = None
         HtmlUtils.writeHtmlFileAnchor(
@@ -248,14 +281,22 @@ the macro page.""")
         
     def _initReader(self):
         """Create and return a reader, initialise internals.
+        If there is a token cache then this returns the cached tokens.
 
-        :returns: :py:class:`cpip.core.ItuToTokens.ItuToTokens`
-            -- The file tokeniser.
+        :returns: ``cpip.core.ItuToTokens.ItuToTokens, cpip.core.TokenBuffer.TokenBuffer``
+            -- The file tokeniser or the cached tokens.
         """
         if self._keepGoing:
             myDiagnostic = CppDiagnostic.PreprocessDiagnosticKeepGoing()
         else:
             myDiagnostic = None
+        if self._tokenCache is not None:
+            try:
+                myTokS = self._tokenCache.tokenBuffer(self._fpIn, myDiagnostic)
+            except IOError as err:
+                raise ExceptionItuToHTML(str(err))
+            self._lineNum = 0
+            return myTokS
         try:
             myItt = ItuToTokens.ItuToTokens(
                     theFileObj=self._ituFileObj,
@@ -90,6 +90,7 @@ __rights__  = 'Copyright (c) 2008-2017 Paul Ross'
 import os
 import collections
 
+from cpip.core import MacroRefStore
 from cpip.core import PpLexer
 from cpip.util import XmlWrite
 from cpip.util import HtmlUtils
@@ -130,6 +131,47 @@ TITLE_ANCHOR_LINKTEXT_MACROS_TESTED_WHEN_NOT_DEFINED = (
         'tested'
     )
 
+#: Visible links to the macro expansion profile.
+TITLE_ANCHOR_LINKTEXT_MACROS_PROFILE = (
+        'Macro Expansion Profile',
+        'Macros_Profile',
+        'profile'
+    )
+
+#: Columns of the macro expansion profile table as
+#: ``(attribute, heading, format), ...``
+MACRO_PROFILE_COLUMNS = (
+    ('identifier',      'Macro',                '%s'),
+    ('expansions',      'Expansions',           '%d'),
+    ('cacheHits',       'Memoised',             '%d'),
+    ('cumulativeTime',  'Cumulative (ms)',      '%.3f'),
+    ('selfTime',        'Self (ms)',            '%.3f'),
+    ('tokensIn',        'Tokens In',            '%d'),
+    ('tokensOut',       'Tokens Out',           '%d'),
+    ('amplification',   'Amplification',        '%.2f'),
+    ('maxNesting',      'Max. Nesting',         '%d'),
+)
+
+#: Script that sorts the macro expansion profile table when a heading is
+#: clicked, a second click reverses the order.
+MACRO_PROFILE_SCRIPT = u"""//<![CDATA[
+function sortProfile(theCol) {
+    var myTable = document.getElementById("macro_profile");
+    var myRowS = Array.prototype.slice.call(myTable.rows, 1);
+    var isDescending = myTable.getAttribute("data-sort") != "" + theCol;
+    myRowS.sort(function(a, b) {
+        var x = a.cells[theCol].textContent;
+        var y = b.cells[theCol].textContent;
+        var retVal = theCol == 0 ? x.localeCompare(y) : parseFloat(x) - parseFloat(y);
+        return isDescending ? -retVal : retVal;
+    });
+    myTable.setAttribute("data-sort", isDescending ? "" + theCol : "");
+    for (var i = 0; i < myRowS.length; ++i) {
+        myTable.tBodies[0].appendChild(myRowS[i]);
+    }
+}
+//]]>"""
+
 def _writeTd(theStream, theStr):
     """Write a <td> element and contents."""
     with XmlWrite.Element(theStream, 'td'):
@@ -408,7 +450,8 @@ def _getMacroDependencyTrees(theMacroAdjList, theMacro):
         cpTree = None
     return pcTree, cpTree
 
-def _writeSectionOnMacroHistory(theS, theEnv, theOmitFiles, theHtmlPath, theItu, isReferenced):
+def _writeSectionOnMacroHistory(theS, theEnv, theOmitFiles, theHtmlPath, theItu, isReferenced,
+                                incItuLinks=True):
     """Write the section that says where macros were used with links to the
     file/line/column.
 
@@ -431,6 +474,10 @@ def _writeSectionOnMacroHistory(theS, theEnv, theOmitFiles, theHtmlPath, theItu,
     :param isReferenced: ``True`` if macro was referenced (used).
     :type isReferenced: ``bool``
 
+    :param incItuLinks: If True link to the HTML of the source files, this
+        should be False if that is not generated.
+    :type incItuLinks: ``bool``
+
     :returns: ``dict({str : [str]})`` -- Map of ``{macro_identifier : file_id_link, ...}```
 
     :raises: ``StopIteration``
@@ -455,7 +502,8 @@ def _writeSectionOnMacroHistory(theS, theEnv, theOmitFiles, theHtmlPath, theItu,
                 with XmlWrite.Element(theS, 'h2'):
                     theS.characters('Macros Out-of-scope')
                 doneTitle = True
-            _writeMacroHistory(theS, aMacro, theOmitFiles, declareCount[aMacro.identifier])
+            _writeMacroHistory(theS, aMacro, theOmitFiles, declareCount[aMacro.identifier],
+                               incItuLinks)
             _writeMacroDependencies(theS, theEnv, aMacro, macroAdjList, theItu)
         declareCount[aMacro.identifier] += 1
     if doneTitle:
@@ -470,7 +518,8 @@ def _writeSectionOnMacroHistory(theS, theEnv, theOmitFiles, theHtmlPath, theItu,
                 with XmlWrite.Element(theS, 'h2'):
                     theS.characters('Macros In Scope')
                 doneTitle = True
-            _writeMacroHistory(theS, aMacro, theOmitFiles, declareCount[aMacro.identifier])
+            _writeMacroHistory(theS, aMacro, theOmitFiles, declareCount[aMacro.identifier],
+                               incItuLinks)
             _writeMacroDependencies(theS, theEnv, aMacro, macroAdjList, theItu)
             if aMacro.identifier not in retMap:
                 # Add to the return value
@@ -494,12 +543,12 @@ def _writeSectionOnMacroHistory(theS, theEnv, theOmitFiles, theHtmlPath, theItu,
                 pass
             theS.characters(TITLE_ANCHOR_LINKTEXT_MACROS_TESTED_WHEN_NOT_DEFINED[0])
         for aMacroId in myMacroNotDefS:
-            _writeMacrosTestedButNotDefined(theS, aMacroId, theEnv)
+            _writeMacrosTestedButNotDefined(theS, aMacroId, theEnv, incItuLinks)
         with XmlWrite.Element(theS, 'hr'):
             pass
     return retMap
 
-def _writeMacroHistory(theS, theMacro, theOmitFiles, theIntOccurence):
+def _writeMacroHistory(theS, theMacro, theOmitFiles, theIntOccurence, incItuLinks=True):
     """Writes out the macro history from a PpDefine object.
     theMacro - a PpDefine() object.
     theOmitFiles - a list of pseudo files not to link to e.g. ['Unnamed Pre-include',].
@@ -518,6 +567,9 @@ def _writeMacroHistory(theS, theMacro, theOmitFiles, theIntOccurence):
         link ID.
     :type theIntOccurence: ``int``
 
+    :param incItuLinks: If True link to the HTML of the source files.
+    :type incItuLinks: ``bool``
+
     :returns: ``NoneType``
     """
     anchorName = _retMacroId(theMacro, theIntOccurence)
@@ -539,14 +591,8 @@ def _writeMacroHistory(theS, theMacro, theOmitFiles, theIntOccurence):
             theS.characters('defined @ ')
 #             theS.literal('&nbsp;')
 #             theS.characters('@ ')
-        HtmlUtils.writeHtmlFileLink(
-                theS,
-                theMacro.fileId,
-                theMacro.line,
-                '%s#%d' % (theMacro.fileId, theMacro.line),
-                'file_decl'
-            )
-    _writeMacroReferencesTable(theS, theMacro.refFileLineColS)
+        _writeFileDecl(theS, theMacro.fileId, theMacro.line, incItuLinks)
+    _writeMacroReferencesTable(theS, theMacro.refStore, incItuLinks)
     # If inactive then state where #undef'd
     if not theMacro.isCurrentlyDefined:
         with XmlWrite.Element(theS, 'p'):
@@ -554,15 +600,36 @@ def _writeMacroHistory(theS, theMacro, theOmitFiles, theIntOccurence):
                 theS.characters('undef\'d @ ')
 #                 theS.literal('&nbsp;&nbsp;')
 #                 theS.characters('@ ')
-            HtmlUtils.writeHtmlFileLink(
-                    theS,
-                    theMacro.undefFileId,
-                    theMacro.undefLine,
-                    '%s#%d' % (theMacro.undefFileId, theMacro.undefLine),
-                    'file_decl'
-                )
+            _writeFileDecl(theS, theMacro.undefFileId, theMacro.undefLine,
+                           incItuLinks)
+
+def _writeFileDecl(theS, theFileId, theLineNum, incItuLinks):
+    """Writes the file and line of a declaration, linked to the HTML of the
+    source file if that is generated.
+
+    :param theS: The HTML stream.
+    :type theS: :py:class:`cpip.util.XmlWrite.XhtmlStream`
+
+    :param theFileId: The file ID.
+    :type theFileId: ``str``
 
-def _writeMacrosTestedButNotDefined(theS, theMacroId, theEnv):
+    :param theLineNum: The line number.
+    :type theLineNum: ``int``
+
+    :param incItuLinks: If True link to the HTML of the source file.
+    :type incItuLinks: ``bool``
+
+    :returns: ``NoneType``
+    """
+    myText = '%s#%d' % (theFileId, theLineNum)
+    if incItuLinks:
+        HtmlUtils.writeHtmlFileLink(theS, theFileId, theLineNum, myText,
+                                    'file_decl')
+    else:
+        with XmlWrite.Element(theS, 'span', {'class' : 'file_decl'}):
+            theS.characters(myText)
+
+def _writeMacrosTestedButNotDefined(theS, theMacroId, theEnv, incItuLinks=True):
     """Writes out the macro history for macros tested but not defined.
 
     :param theS: The HTML stream.
@@ -574,6 +641,9 @@ def _writeMacrosTestedButNotDefined(theS, theMacroId, theEnv):
     :param theEnv: Macro environment.
     :type theEnv: :py:class:`cpip.core.MacroEnv.MacroEnv`
 
+    :param incItuLinks: If True link to the HTML of the source files.
+    :type incItuLinks: ``bool``
+
     :returns: ``NoneType``
     """
     anchorName = XmlWrite.nameFromString(_macroIdTestedWhenNotDefined(theMacroId))
@@ -588,9 +658,9 @@ def _writeMacrosTestedButNotDefined(theS, theMacroId, theEnv):
                    len(myRefS),
                 )
             )
-    _writeMacroReferencesTable(theS, myRefS)
+    _writeMacroReferencesTable(theS, myRefS, incItuLinks)
     
-def _writeMacroReferencesTable(theS, theFlcS):
+def _writeMacroReferencesTable(theS, theFlcS, incItuLinks=True):
     """Writes all the references to a file/line/col in a rowspan/colspan HTML
     table with links to the position in the HTML representation of the file
     that references something.
@@ -602,32 +672,58 @@ def _writeMacroReferencesTable(theS, theFlcS):
     :param theS: HTML stream.
     :type theS: :py:class:`cpip.util.XmlWrite.XhtmlStream`
 
-    :param theFlcS: File location.
-    :type theFlcS: ``list([]), list([cpip.core.FileLocation.FileLineCol([str, int, int])])``
+    :param theFlcS: File locations, either a macro reference store or a list.
+    :type theFlcS: :py:class:`cpip.core.MacroRefStore.MacroRefStore`, ``list([]), list([cpip.core.FileLocation.FileLineCol([str, int, int])])``
+
+    :param incItuLinks: If True link to the HTML of the source files,
+        otherwise only the line-col is written.
+    :type incItuLinks: ``bool``
 
     :returns: ``NoneType``
     """
-    myFileLineColS = []
-    # This removes duplicates, it is a list of (fileId, lineNum, colNum).
-    # If an include file is included N times there will be N-1 duplicate entries
-    # for the header guard macro otherwise.
-    hasSeen = []
+    # This removes duplicates. If an include file is included N times there
+    # will be N-1 duplicate entries for the header guard macro otherwise.
+    if isinstance(theFlcS, MacroRefStore.MacroRefStore):
+        myRefS = theFlcS.genUniqueRefs()
+    else:
+        myRefS = _genUniqueRefs(theFlcS)
+    myFileLineColS = [
+        (
+            aFileId,
+            (
+                HtmlUtils.retHtmlFileLink(aFileId, aLineNum) \
+                    if incItuLinks else None,
+                # Navigation text
+                '%d-%d' % (aLineNum, aColNum),
+            ),
+        )
+        for aFileId, aLineNum, aColNum in myRefS
+    ]
+    if len(myFileLineColS) > 0:
+        HtmlUtils.writeFilePathsAsTable('list', theS, myFileLineColS, 'filetable', _tdFilePathCallback)
+    if isinstance(theFlcS, MacroRefStore.MacroRefStore) \
+            and theFlcS.numNotRecorded > 0:
+        with XmlWrite.Element(theS, 'p'):
+            theS.characters(
+                '%d of %d references recorded.' \
+                % (len(theFlcS), theFlcS.numRefs)
+            )
+
+def _genUniqueRefs(theFlcS):
+    """Yields ``(fileId, lineNum, colNum)`` for each distinct file location in
+    the order they are first seen.
+
+    :param theFlcS: File locations.
+    :type theFlcS: ``list([]), list([cpip.core.FileLocation.FileLineCol([str, int, int])])``
+
+    :returns: ``tuple([str, int, int])`` -- Distinct locations.
+    """
+    hasSeen = set()
     for aFlc in theFlcS:
         ident = (aFlc.fileId, aFlc.lineNum, aFlc.colNum)
         if ident not in hasSeen:
-            myFileLineColS.append(
-                (
-                    aFlc.fileId,
-                    (
-                        HtmlUtils.retHtmlFileLink(aFlc.fileId, aFlc.lineNum),
-                        # Navigation text
-                        '%d-%d' % (aFlc.lineNum, aFlc.colNum),
-                    ),
-                )
-            )
-            hasSeen.append(ident)
-    if len(myFileLineColS) > 0:
-        HtmlUtils.writeFilePathsAsTable('list', theS, myFileLineColS, 'filetable', _tdFilePathCallback)
+            hasSeen.add(ident)
+            yield ident
 
 def _writeMacroDependencies(theS, theEnv, theMacro, theMacroAdjList, theItu):
     """Writes out the macro dependencies.
@@ -714,7 +810,7 @@ def _tdFilePathCallback(theS, attrs, k, v):
     :param k: Keys.
     :type k: ``list([str])``
 
-    :param v: Values.
+    :param v: Values, the href is None if there is no page to link to.
     :type v: ``list([tuple([str, str])])``
 
     :returns: ``NoneType``
@@ -725,10 +821,54 @@ def _tdFilePathCallback(theS, attrs, k, v):
         # Get the href/navtext from the value
         for h, n in v:
             theS.characters(' ')
-            with XmlWrite.Element(theS, 'a', {'href' : h}):
-                # Write the nav text
+            if h is None:
                 theS.characters('%s' % n)
+            else:
+                with XmlWrite.Element(theS, 'a', {'href' : h}):
+                    # Write the nav text
+                    theS.characters('%s' % n)
         
+def _writeMacroProfile(theS, theProfiler):
+    """Writes the macro expansion profile as a table that can be sorted by
+    clicking on the column headings.
+
+    :param theS: The HTML stream.
+    :type theS: :py:class:`cpip.util.XmlWrite.XhtmlStream`
+
+    :param theProfiler: The profiler.
+    :type theProfiler: :py:class:`cpip.core.MacroProfiler.MacroProfiler`
+
+    :returns: ``NoneType``
+    """
+    with XmlWrite.Element(theS, 'h1'):
+        with XmlWrite.Element(theS, 'a', {'name' : TITLE_ANCHOR_LINKTEXT_MACROS_PROFILE[1]}):
+            pass
+        theS.characters(TITLE_ANCHOR_LINKTEXT_MACROS_PROFILE[0])
+    with XmlWrite.Element(theS, 'p'):
+        theS.characters(
+            'Deepest nesting of macro expansion: %d. Click on a column heading to sort by it.' \
+            % theProfiler.maxDepth
+        )
+    with XmlWrite.Element(theS, 'script', {'type' : 'text/javascript'}):
+        theS.literal(MACRO_PROFILE_SCRIPT)
+    with XmlWrite.Element(theS, 'table', {
+                                          'id' : 'macro_profile',
+                                          'border' : "4",
+                                          'cellspacing' : "2",
+                                          'cellpadding' : "8",
+                                          }):
+        with XmlWrite.Element(theS, 'tr'):
+            for c, (anAttr, aHeading, aFormat) in enumerate(MACRO_PROFILE_COLUMNS):
+                with XmlWrite.Element(theS, 'th', {'onclick' : 'sortProfile(%d)' % c}):
+                    theS.characters(aHeading)
+        for aProfile in theProfiler.genProfiles('cumulativeTime'):
+            with XmlWrite.Element(theS, 'tr'):
+                for anAttr, aHeading, aFormat in MACRO_PROFILE_COLUMNS:
+                    myValue = getattr(aProfile, anAttr)
+                    if anAttr.endswith('Time'):
+                        myValue *= 1000
+                    _writeTd(theS, aFormat % myValue)
+
 def _writeTocLetterLinks(theS, theSet):
     if len(theSet) > 0:
         letterList = list(theSet)
@@ -920,17 +1060,21 @@ def _linkToIndex(theS, theIdx):
     :param theS: HTML stream.
     :type theS: :py:class:`cpip.util.XmlWrite.XhtmlStream`
 
-    :param theIdx: The index link.
-    :type theIdx: ``str``
+    :param theIdx: The index link, if None nothing is written as the index
+        has not been generated.
+    :type theIdx: ``NoneType, str``
 
     :returns: ``NoneType``
     """
+    if theIdx is None:
+        return
     with XmlWrite.Element(theS, 'p'):
         theS.characters('Return to ')
         with XmlWrite.Element(theS, 'a', {'href' : theIdx}):
             theS.characters('Index')
 
-def processMacroHistoryToHtml(theLex, theHtmlPath, theItu, theIndexPath):
+def processMacroHistoryToHtml(theLex, theHtmlPath, theItu, theIndexPath,
+                              incItuLinks=True):
     """Write out the macro history from the PpLexer as HTML.
     Returns a map of:
     ``{identifier : [(fileId, lineNum, href_name), ...], ...}``
@@ -945,8 +1089,12 @@ def processMacroHistoryToHtml(theLex, theHtmlPath, theItu, theIndexPath):
     :param theItu: Path to the initial translation unit (ITU).
     :type theItu: ``str``
 
-    :param theIndexPath: Path to the index.
-    :type theIndexPath: ``str``
+    :param theIndexPath: Path to the index, None if the index is not generated.
+    :type theIndexPath: ``NoneType, str``
+
+    :param incItuLinks: If True link to the HTML of the source files, this
+        should be False if that is not generated.
+    :type incItuLinks: ``bool``
 
     :returns: ``tuple([dict({str : [list([tuple([<class 'str'>, <class 'int'>, str])]), list([tuple([<class 'str'>, int, str])]), list([tuple([str, int, str])])]}), str])``
         -- Map that links macro names ot file positions.
@@ -979,6 +1127,8 @@ where used and their dependencies. All linked to the source code.""")
             # Write the TOC and get the sorted list all the macros in alphabetical order
             _writeTocMacros(myS, myEnv, isReferenced=True, filePrefix=_macroHistoryRefName(theItu))
             _writeTocMacros(myS, myEnv, isReferenced=False, filePrefix=_macroHistoryNorefName(theItu))
+            if myEnv.profiler is not None and len(myEnv.profiler):
+                _writeMacroProfile(myS, myEnv.profiler)
             # Write back link
             _linkToIndex(myS, theIndexPath)
     # Write the page for referenced macros
@@ -1003,7 +1153,8 @@ where used and their dependencies. All linked to the source code.""")
             _writeTocMacros(myS, myEnv, isReferenced=True, filePrefix=None)
             _writeSectionOnMacroHistory(
                     myS, myEnv, [PpLexer.UNNAMED_FILE_NAME,],
-                    theHtmlPath, theItu, isReferenced=True)
+                    theHtmlPath, theItu, isReferenced=True,
+                    incItuLinks=incItuLinks)
             _linkToIndex(myS, theIndexPath)
     # Write the page for non-referenced macros
     with XmlWrite.XhtmlStream(os.path.join(theHtmlPath, _macroHistoryNorefName(theItu))) as myS:
@@ -1027,7 +1178,8 @@ where used and their dependencies. All linked to the source code.""")
             _writeTocMacros(myS, myEnv, isReferenced=False, filePrefix=None)
             _writeSectionOnMacroHistory(
                     myS, myEnv, [PpLexer.UNNAMED_FILE_NAME,],
-                    theHtmlPath, theItu, isReferenced=False)
+                    theHtmlPath, theItu, isReferenced=False,
+                    incItuLinks=incItuLinks)
             _linkToIndex(myS, theIndexPath)
     retVal = _retMacroIdHrefNames(myEnv, theItu)
 #     print('retVal', retVal)
@@ -32,6 +32,7 @@ __date__    = '2011-07-10'
 __rights__  = 'Copyright (c) 2008-2017 Paul Ross'
 
 import os
+import collections
 import logging
 
 import cpip
@@ -39,6 +40,7 @@ from cpip.core import PpTokenCount
 from cpip.util import XmlWrite
 from cpip.util import HtmlUtils
 from cpip import TokenCss
+from cpip import TuIndexer
 
 #: State changes
 FILE_SHIFT_ACTIONS = ('Starting', 'Holding', 'Back in', 'Ending')
@@ -145,18 +147,376 @@ def linkToIndex(theS, theIdxPath):
     :param theS: HTML stream.
     :type theS: :py:class:`cpip.util.XmlWrite.XhtmlStream`
 
-    :param theIdxPath: Path to the index.
-    :type theIdxPath: ``str``
+    :param theIdxPath: Path to the index, if None nothing is written as the
+        index has not been generated.
+    :type theIdxPath: ``NoneType, str``
 
     :returns: ``NoneType``
     """
+    if theIdxPath is None:
+        return
     with XmlWrite.Element(theS, 'p'):
         theS.characters('Return to ')
         with XmlWrite.Element(theS, 'a', {'href' : theIdxPath}):
             theS.characters('Index')
             
+
+def retPageFileName(theHtmlPath, thePageNum):
+    """Returns the file name of a page of a paged translation unit.
+
+    :param theHtmlPath: The path to the TU HTML file, when paging this is
+        written as the index of the pages.
+    :type theHtmlPath: ``str``
+
+    :param thePageNum: The page number, starting at 1.
+    :type thePageNum: ``int``
+
+    :returns: ``str`` -- The page file name e.g. ``'main.cpp_page_1.html'``.
+    """
+    myRoot = os.path.basename(theHtmlPath)
+    if myRoot.endswith('.html'):
+        myRoot = myRoot[:-len('.html')]
+    return '%s_page_%d.html' % (myRoot, thePageNum)
+
+#: Details of a TU HTML page, the first file and line are None until a line
+#: is written to the page.
+TuPage = collections.namedtuple('TuPage',
+                                'fileName firstFile firstLine lineCount')
+
+class TuHtmlPages(object):
+    """Writes the translation unit HTML either as a single file or, if paging
+    is requested, as a series of page files with an index page. Only one page
+    is open at any time, pages are written as the TU is processed.
+    
+    :param theLex: The lexer.
+    :type theLex: :py:class:`cpip.core.PpLexer.PpLexer`
+
+    :param theHtmlPath: The path to the HTML file to write. When paging
+        this is the index of the pages.
+    :type theHtmlPath: ``str``
+
+    :param theTitle: A string to go into the ``<title>`` element.
+    :type theTitle: ``str``
+
+    :param theIdxPath: Path to link back to the index page, None if the index
+        is not generated.
+    :type theIdxPath: ``NoneType, str``
+
+    :param linesPerPage: If > 0 then start a new page after this many lines.
+    :type linesPerPage: ``int``
+
+    :param splitAtIncludes: If True then start a new page each time the
+        file stack enters or leaves a file included by the ITU.
+    :type splitAtIncludes: ``bool``
+    """
+    def __init__(self, theLex, theHtmlPath, theTitle, theIdxPath,
+                 linesPerPage=0, splitAtIncludes=False):
+        self._lex = theLex
+        self._htmlPath = theHtmlPath
+        self._title = theTitle
+        self._idxPath = theIdxPath
+        self._linesPerPage = linesPerPage
+        self._splitAtIncludes = splitAtIncludes
+        # Maps TU indexes to the page that they are on
+        self._tuIndexer = TuIndexer.TuIndexer(os.path.basename(theHtmlPath))
+        # List of TuPage objects, the last one is the current page
+        self._pageS = []
+        self._stream = None
+
+    @property
+    def htmlPath(self):
+        """The path to the TU HTML file, when paging this is the index of
+        the pages.
+
+        :returns: ``str`` -- The path.
+        """
+        return self._htmlPath
+
+    @property
+    def isPaged(self):
+        """True if the TU is written as multiple pages.
+
+        :returns: ``bool`` -- Paging.
+        """
+        return self._linesPerPage > 0 or self._splitAtIncludes
+
+    @property
+    def splitAtIncludes(self):
+        """True if a new page is started on entering or leaving a file
+        included by the ITU.
+
+        :returns: ``bool`` -- Split at includes.
+        """
+        return self._splitAtIncludes
+
+    @property
+    def stream(self):
+        """The stream for the current page.
+
+        :returns: :py:class:`cpip.util.XmlWrite.XhtmlStream` -- The stream.
+        """
+        return self._stream
+
+    @property
+    def pageName(self):
+        """The file name of the current page.
+
+        :returns: ``str`` -- File name.
+        """
+        return self._pageS[-1].fileName
+
+    @property
+    def pageS(self):
+        """The pages written so far.
+
+        :returns: ``list([cpip.Tu2Html.TuPage])`` -- The pages.
+        """
+        return self._pageS
+
+    @property
+    def tuIndexer(self):
+        """The TU indexer that maps TU indexes to page names.
+
+        :returns: :py:class:`cpip.TuIndexer.TuIndexer` -- The indexer.
+        """
+        return self._tuIndexer
+
+    def isPageFull(self):
+        """Returns True if the current page has reached its line limit.
+
+        :returns: ``bool`` -- Page is full.
+        """
+        return self._linesPerPage > 0 \
+            and self._pageS[-1].lineCount >= self._linesPerPage
+
+    def addLine(self, theFile, theLineNum):
+        """Records that a line has been started on the current page.
+
+        :param theFile: The file that the line is from.
+        :type theFile: ``str``
+
+        :param theLineNum: The line number.
+        :type theLineNum: ``int``
+
+        :returns: ``NoneType``
+        """
+        myPage = self._pageS[-1]
+        if myPage.firstFile is None:
+            myPage = myPage._replace(firstFile=theFile, firstLine=theLineNum)
+        self._pageS[-1] = myPage._replace(lineCount=myPage.lineCount + 1)
+
+    def openPage(self):
+        """Opens the next page and writes the HTML up to and including the
+        opening ``<pre>`` element.
+
+        :returns: :py:class:`cpip.util.XmlWrite.XhtmlStream` -- The stream.
+        """
+        assert self._stream is None
+        if self.isPaged:
+            myPageName = retPageFileName(self._htmlPath, len(self._pageS) + 1)
+            myTitle = '%s [page %d]' % (self._title, len(self._pageS) + 1)
+        else:
+            myPageName = os.path.basename(self._htmlPath)
+            myTitle = self._title
+        self._pageS.append(TuPage(myPageName, None, None, 0))
+        self._stream = XmlWrite.XhtmlStream(
+            os.path.join(os.path.dirname(self._htmlPath), myPageName),
+            mustIndent=cpip.INDENT_ML,
+        )
+        self._stream.__enter__()
+        _writeHead(self._stream, myTitle)
+        self._stream.startElement('body', {})
+        if self.isPaged:
+            # The TU indexer links to this
+            myAnchor = self._tuIndexer.add(self._lex.tuIndex, myPageName)
+            with XmlWrite.Element(self._stream, 'a', {'name' : myAnchor}):
+                pass
+        with XmlWrite.Element(self._stream, 'h1'):
+            self._stream.characters('Translation Unit: %s' % self._lex.tuFileId)
+        with XmlWrite.Element(self._stream, 'p'):
+            self._stream.characters("""An annotated version of the translation unit
+with minimal whitespace. Indentation is according to the depth of the #include stack.
+Line numbers are linked to the original source code.
+""")
+        with XmlWrite.Element(self._stream, 'p'):
+            self._stream.characters("""Highlighted filenames take you forward to the
+next occasion in the include graph of the file being pre-processed, in this case: %s""" % self._lex.tuFileId)
+        linkToIndex(self._stream, self._idxPath)
+        if self.isPaged:
+            # Do not know yet if there is a next page
+            self._writePageLinks(False)
+        self._stream.startElement('pre', {})
+        return self._stream
+
+    def closePage(self, theIntId, isLast):
+        """Closes the ``<pre>`` element and the current page.
+
+        :param theIntId: The next file shift ID that ``_writeFileName()`` will
+            write an anchor for. On a page that is not the last one this
+            anchor is written at the end of the page and links to the next
+            page so that forward links that cross the page boundary work.
+        :type theIntId: ``int``
+
+        :param isLast: True if this is the last page.
+        :type isLast: ``bool``
+
+        :returns: ``NoneType``
+        """
+        myS = self._stream
+        myS.endElement('pre')
+        if self.isPaged:
+            if not isLast and theIntId > 0:
+                with XmlWrite.Element(myS, 'p'):
+                    with XmlWrite.Element(myS, 'a', {'name' : '_%d' % theIntId}):
+                        pass
+                    with XmlWrite.Element(
+                            myS, 'a',
+                            {'href' : '%s#_%d' % (retPageFileName(
+                                self._htmlPath, len(self._pageS) + 1), theIntId)}
+                        ):
+                        myS.characters('Continued on the next page.')
+            self._writePageLinks(not isLast)
+        linkToIndex(myS, self._idxPath)
+        myS.__exit__(None, None, None)
+        self._stream = None
+
+    def nextPage(self, theIntId):
+        """Closes the current page and opens the next one.
+
+        :param theIntId: See :py:meth:`closePage`.
+        :type theIntId: ``int``
+
+        :returns: :py:class:`cpip.util.XmlWrite.XhtmlStream` -- The stream.
+        """
+        self.closePage(theIntId, False)
+        return self.openPage()
+
+    def finalise(self, theIntId):
+        """Closes the last page and, if paged, writes the index of the pages.
+
+        :param theIntId: See :py:meth:`closePage`.
+        :type theIntId: ``int``
+
+        :returns: ``NoneType``
+        """
+        if self._stream is not None:
+            self.closePage(theIntId, True)
+        if self.isPaged:
+            self._writePageIndex()
+
+    def abandon(self):
+        """Closes any open page and, if paged, removes the pages written so
+        far. This is used when processing the TU fails so that a truncated set
+        of pages is not left without its index. A single page TU is left as it
+        is as other pages may link to it.
+
+        :returns: ``NoneType``
+        """
+        if self._stream is not None:
+            self._stream.__exit__(None, None, None)
+            self._stream = None
+        if not self.isPaged:
+            return
+        myDir = os.path.dirname(self._htmlPath)
+        for aPage in self._pageS:
+            myPath = os.path.join(myDir, aPage.fileName)
+            if os.path.exists(myPath):
+                os.remove(myPath)
+
+    def _writePageLinks(self, incNext):
+        """Writes links to the previous and next pages and to the page index.
+
+        :param incNext: If True include a link to the next page.
+        :type incNext: ``bool``
+
+        :returns: ``NoneType``
+        """
+        myS = self._stream
+        myPageNum = len(self._pageS)
+        with XmlWrite.Element(myS, 'p'):
+            myS.characters('Page %d: ' % myPageNum)
+            if myPageNum > 1:
+                with XmlWrite.Element(
+                        myS, 'a',
+                        {'href' : retPageFileName(self._htmlPath, myPageNum - 1)}
+                    ):
+                    myS.characters('Previous')
+                myS.characters(' ')
+            with XmlWrite.Element(
+                    myS, 'a', {'href' : os.path.basename(self._htmlPath)}
+                ):
+                myS.characters('All pages')
+            if incNext:
+                myS.characters(' ')
+                with XmlWrite.Element(
+                        myS, 'a',
+                        {'href' : retPageFileName(self._htmlPath, myPageNum + 1)}
+                    ):
+                    myS.characters('Next')
+
+    def _writePageIndex(self):
+        """Writes the index of the pages to the TU HTML path.
+
+        :returns: ``NoneType``
+        """
+        with XmlWrite.XhtmlStream(self._htmlPath, mustIndent=cpip.INDENT_ML) as myS:
+            _writeHead(myS, self._title)
+            with XmlWrite.Element(myS, 'body'):
+                with XmlWrite.Element(myS, 'h1'):
+                    myS.characters('Translation Unit: %s' % self._lex.tuFileId)
+                with XmlWrite.Element(myS, 'p'):
+                    myS.characters(
+                        'The translation unit is written as %d page(s).' \
+                        % len(self._pageS))
+                linkToIndex(myS, self._idxPath)
+                with XmlWrite.Element(myS, 'table', {'class' : "monospace"}):
+                    with XmlWrite.Element(myS, 'tr'):
+                        for aHead in ('Page', 'First file', 'First line', 'Lines'):
+                            with XmlWrite.Element(myS, 'th', {'class' : "monospace"}):
+                                myS.characters(aHead)
+                    for i, aPage in enumerate(self._pageS):
+                        with XmlWrite.Element(myS, 'tr'):
+                            with XmlWrite.Element(myS, 'td', {'class' : "monospace"}):
+                                with XmlWrite.Element(myS, 'a', {'href' : aPage.fileName}):
+                                    myS.characters('%d' % (i + 1))
+                            with XmlWrite.Element(myS, 'td', {'class' : "monospace"}):
+                                if aPage.firstFile is not None:
+                                    myS.characters(os.path.normpath(aPage.firstFile))
+                            with XmlWrite.Element(myS, 'td', {'class' : "monospace"}):
+                                if aPage.firstLine is not None:
+                                    myS.characters('%d' % aPage.firstLine)
+                            with XmlWrite.Element(myS, 'td', {'class' : "monospace"}):
+                                myS.characters('%d' % aPage.lineCount)
+                linkToIndex(myS, self._idxPath)
+
+def _writeHead(theS, theTitle):
+    """Writes the ``<head>`` element with the CSS link and title.
+
+    :param theS: HTML stream.
+    :type theS: :py:class:`cpip.util.XmlWrite.XhtmlStream`
+
+    :param theTitle: A string to go into the ``<title>`` element.
+    :type theTitle: ``str``
+
+    :returns: ``NoneType``
+    """
+    with XmlWrite.Element(theS, 'head'):
+        with XmlWrite.Element(
+            theS,
+            'link',
+            {
+                'href'  : TokenCss.TT_CSS_FILE,
+                'type'  : "text/css",
+                'rel'   : "stylesheet",
+                }
+            ):
+            pass
+        with XmlWrite.Element(theS, 'title'):
+            theS.characters(theTitle)
+
 def processTuToHtml(theLex, theHtmlPath, theTitle,
-                    theCondLevel, theIdxPath, incItuAnchors=True):
+                    theCondLevel, theIdxPath, incItuAnchors=True,
+                    incItuLinks=True):
     """Processes the PpLexer and writes the tokens to the HTML file.
     
     :param theLex: The lexer.
@@ -171,14 +531,19 @@ def processTuToHtml(theLex, theHtmlPath, theTitle,
     :param theCondLevel: The Conditional level to pass to ``theLex.ppTokens()``
     :type theCondLevel: ``int``
 
-    :param theIdxPath: Path to link back to the index page.
-    :type theIdxPath: ``str``
+    :param theIdxPath: Path to link back to the index page, None if the index
+        is not generated.
+    :type theIdxPath: ``NoneType, str``
 
     :param incItuAnchors: If True will write anchors for lines in the ITU
         that are in this TU. If True then setItuLineNumbers returned is likely
         to be non-empty.
     :type incItuAnchors: ``bool``
 
+    :param incItuLinks: If True the line numbers link to the HTML of the
+        original source, this should be False if that is not generated.
+    :type incItuLinks: ``bool``
+
     :returns: ``tuple([cpip.core.PpTokenCount.PpTokenCount, set([int])])``
         -- Returns a pair of ``(PpTokenCount.PpTokenCount(), set(int))``
         The latter is a set of integer line numbers in the ITU that are in the TU,
@@ -187,6 +552,92 @@ def processTuToHtml(theLex, theHtmlPath, theTitle,
 
     :raises: ``StopIteration``
     """
+    myPages = TuHtmlPages(theLex, theHtmlPath, theTitle, theIdxPath)
+    myTokCntr, myItuLineMap = _processTuTokens(theLex, myPages, theCondLevel,
+                                               incItuAnchors, incItuLinks)
+    return myTokCntr, set(myItuLineMap.keys())
+
+def processTuToHtmlPaged(theLex, theHtmlPath, theTitle,
+                         theCondLevel, theIdxPath, incItuAnchors=True,
+                         linesPerPage=0, splitAtIncludes=False,
+                         incItuLinks=True):
+    """Processes the PpLexer and writes the tokens to a series of HTML pages.
+    theHtmlPath is written as an index of the pages. Each page is written
+    and closed before the next one is started.
+    
+    :param theLex: The lexer.
+    :type theLex: :py:class:`cpip.core.PpLexer.PpLexer`
+
+    :param theHtmlPath: The path to the HTML index of the pages.
+    :type theHtmlPath: ``str``
+
+    :param theTitle: A string to go into the ``<title>`` element.
+    :type theTitle: ``str``
+
+    :param theCondLevel: The Conditional level to pass to ``theLex.ppTokens()``
+    :type theCondLevel: ``int``
+
+    :param theIdxPath: Path to link back to the index page, None if the index
+        is not generated.
+    :type theIdxPath: ``NoneType, str``
+
+    :param incItuAnchors: If True will write anchors for lines in the ITU
+        that are in this TU.
+    :type incItuAnchors: ``bool``
+
+    :param linesPerPage: If > 0 then start a new page after this many lines.
+    :type linesPerPage: ``int``
+
+    :param splitAtIncludes: If True then start a new page each time the
+        file stack enters or leaves a file included by the ITU.
+    :type splitAtIncludes: ``bool``
+
+    :param incItuLinks: If True the line numbers link to the HTML of the
+        original source, this should be False if that is not generated.
+    :type incItuLinks: ``bool``
+
+    :returns: ``tuple([cpip.core.PpTokenCount.PpTokenCount, dict({int : [str]}), cpip.TuIndexer.TuIndexer])``
+        -- Returns ``(PpTokenCount.PpTokenCount(), {line : page_name, ...}, TuIndexer)``
+        The dict maps the integer line numbers in the ITU that are in the TU
+        to the page that has the anchor ``<a name="%d" />`` for that line.
+        The TuIndexer maps TU indexes to page names.
+
+    :raises: ``StopIteration``
+    """
+    myPages = TuHtmlPages(theLex, theHtmlPath, theTitle, theIdxPath,
+                          linesPerPage=linesPerPage,
+                          splitAtIncludes=splitAtIncludes)
+    myTokCntr, myItuLineMap = _processTuTokens(theLex, myPages, theCondLevel,
+                                               incItuAnchors, incItuLinks)
+    return myTokCntr, myItuLineMap, myPages.tuIndexer
+
+def _processTuTokens(theLex, thePages, theCondLevel, incItuAnchors,
+                     incItuLinks=True):
+    """Processes the PpLexer and writes the tokens to the pages.
+
+    :param theLex: The lexer.
+    :type theLex: :py:class:`cpip.core.PpLexer.PpLexer`
+
+    :param thePages: The page writer.
+    :type thePages: :py:class:`TuHtmlPages`
+
+    :param theCondLevel: The Conditional level to pass to ``theLex.ppTokens()``
+    :type theCondLevel: ``int``
+
+    :param incItuAnchors: If True will write anchors for lines in the ITU
+        that are in this TU.
+    :type incItuAnchors: ``bool``
+
+    :param incItuLinks: If True the line numbers link to the HTML of the
+        original source.
+    :type incItuLinks: ``bool``
+
+    :returns: ``tuple([cpip.core.PpTokenCount.PpTokenCount, dict({int : [str]})])``
+        -- The token count and a map of ``{itu_line : page_name, ...}``.
+
+    :raises: ``StopIteration``
+    """
+    theHtmlPath = thePages.htmlPath
     if not os.path.exists(os.path.dirname(theHtmlPath)):
         os.makedirs(os.path.dirname(theHtmlPath))
     LINE_FIELD_WIDTH = 8
@@ -196,96 +647,103 @@ def processTuToHtml(theLex, theHtmlPath, theTitle,
     myTokCntr = PpTokenCount.PpTokenCount()
     # Write CSS
     TokenCss.writeCssToDir(os.path.dirname(theHtmlPath))
-    # Set of active lines of the ITU (only) that made it into the TU
-    setItuLineNumbers = set()
-    # Process the TU
-    with XmlWrite.XhtmlStream(theHtmlPath, mustIndent=cpip.INDENT_ML) as myS:
-        with XmlWrite.Element(myS, 'head'):
-            with XmlWrite.Element(
-                myS,
-                'link',
-                {
-                    'href'  : TokenCss.TT_CSS_FILE,
-                    'type'  : "text/css",
-                    'rel'   : "stylesheet",
-                    }
-                ):
-                pass
-            with XmlWrite.Element(myS, 'title'):
-                myS.characters(theTitle)
-        myIntId = 0
-        with XmlWrite.Element(myS, 'body'):
-            with XmlWrite.Element(myS, 'h1'):
-                myS.characters('Translation Unit: %s' % theLex.tuFileId)
-            with XmlWrite.Element(myS, 'p'):
-                myS.characters("""An annotated version of the translation unit
-with minimal whitespace. Indentation is according to the depth of the #include stack.
-Line numbers are linked to the original source code.
-""")
-            with XmlWrite.Element(myS, 'p'):
-                myS.characters("""Highlighted filenames take you forward to the
-next occasion in the include graph of the file being pre-processed, in this case: %s""" % theLex.tuFileId)
-            linkToIndex(myS, theIdxPath)
-            with XmlWrite.Element(myS, 'pre'):
-                # My copy of the file stack for annotating the output
-                myFileStack = []
-                indentStr = ''
-                colNum = 1
-                for t in theLex.ppTokens(incWs=True, minWs=True, condLevel=theCondLevel):
-                    #print t
-                    logging.debug('Token: %s', str(t))
-                    myTokCntr.inc(t, isUnCond=t.isUnCond, num=1)
-                    if t.isUnCond:
-                        # Adjust the prefix depending on how deep we are in the file stack
-                        myIntId = _adjustFileStack(myS, theLex.fileStack, myFileStack, myIntId)
-                        indentStr = '.' * len(myFileStack)
-                        # Write the token
-                        if t.tt == 'whitespace':
-                            if t.t != '\n' and colNum > LINE_BREAK_LENGTH:
-                                myS.characters(' \\\n')
-                                myS.characters(indentStr)
-                                myS.characters(' ' * (LINE_FIELD_WIDTH + 8))
-                                colNum = 1
-                            else:
-                                # Line break
-                                myS.characters(t.t)
-                                ## NOTE: This is removed as the cost to the
-                                ## browser is enormous.
-                                ## Set a marker
-                                #with XmlWrite.Element(myS,
-                                #                      'a',
-                                #                      {'name' : myTuI.add(theLex.tuIndex)}):
-                                #    pass
-                        else:
-                            if colNum > LINE_BREAK_LENGTH:
-                                # Force a break
-                                myS.characters('\\\n')
-                                myS.characters(indentStr)
-                                myS.characters(' ' * (LINE_FIELD_WIDTH + 8))
-                                colNum = 1
-                            with XmlWrite.Element(myS, 'span',
-                                            {'class' : TokenCss.retClass(t.tt)}):
-                                myS.characters(t.t)
-                                colNum += len(t.t)
-                        if t.t == '\n' and len(myFileStack) != 0:
-                            # Write an ID for the ITU only
-                            if incItuAnchors and len(myFileStack) == 1:
-                                with XmlWrite.Element(myS, 'a',
-                                                {'name' : '%d' % theLex.lineNum}):
-                                    setItuLineNumbers.add(theLex.lineNum)
-                            # Write the line prefix
-                            myS.characters(indentStr)
-                            myS.characters('[')
-                            myS.characters(' ' * \
-                                    (LINE_FIELD_WIDTH - len('%d' % theLex.lineNum)))
-                            HtmlUtils.writeHtmlFileLink(
-                                    myS,
-                                    theLex.fileName,
-                                    theLex.lineNum,
-                                    '%d' % theLex.lineNum,
-                                    theClass=None,
-                                )
-                            myS.characters(']: ')
-                            colNum = 1
-            linkToIndex(myS, theIdxPath)
-    return myTokCntr, setItuLineNumbers
+    # Map of active lines of the ITU (only) that made it into the TU to the
+    # page that they are on.
+    myItuLineMap = {}
+    myIntId = 0
+    myS = thePages.openPage()
+    try:
+        # My copy of the file stack for annotating the output
+        myFileStack = []
+        indentStr = ''
+        colNum = 1
+        # Run of (text, css_class) that is written with
+        # myS.writeSpanRun() before any other write to the stream.
+        mySpanRun = []
+        # Map of {file_name : html_file_name, ...} as the latter needs
+        # a hash of the path.
+        myHtmlFileNameMap = {}
+        for t in theLex.ppTokens(incWs=True, minWs=True, condLevel=theCondLevel):
+            #print t
+            logging.debug('Token: %s', str(t))
+            myTokCntr.inc(t, isUnCond=t.isUnCond, num=1)
+            if t.isUnCond:
+                # Adjust the prefix depending on how deep we are in the file stack
+                myLexStack = theLex.fileStack
+                if myLexStack != myFileStack:
+                    myS.writeSpanRun(mySpanRun)
+                    mySpanRun = []
+                    # Start a new page when entering or leaving a file
+                    # included by the ITU.
+                    if thePages.splitAtIncludes \
+                    and len(myFileStack) > 0 and len(myLexStack) > 0 \
+                    and (len(myFileStack) == 1) != (len(myLexStack) == 1):
+                        myS = thePages.nextPage(myIntId)
+                    myIntId = _adjustFileStack(myS, myLexStack, myFileStack, myIntId)
+                    indentStr = '.' * len(myFileStack)
+                # Write the token
+                if t.tt == 'whitespace':
+                    if t.t != '\n' and colNum > LINE_BREAK_LENGTH:
+                        mySpanRun.append((' \\\n', None))
+                        mySpanRun.append((indentStr, None))
+                        mySpanRun.append((' ' * (LINE_FIELD_WIDTH + 8), None))
+                        colNum = 1
+                    else:
+                        # Line break
+                        mySpanRun.append((t.t, None))
+                        ## NOTE: This is removed as the cost to the
+                        ## browser is enormous.
+                        ## Set a marker
+                        #with XmlWrite.Element(myS,
+                        #                      'a',
+                        #                      {'name' : myTuI.add(theLex.tuIndex)}):
+                        #    pass
+                else:
+                    if colNum > LINE_BREAK_LENGTH:
+                        # Force a break
+                        mySpanRun.append(('\\\n', None))
+                        mySpanRun.append((indentStr, None))
+                        mySpanRun.append((' ' * (LINE_FIELD_WIDTH + 8), None))
+                        colNum = 1
+                    mySpanRun.append((t.t, TokenCss.retClass(t.tt)))
+                    colNum += len(t.t)
+                if t.t == '\n' and len(myFileStack) != 0:
+                    myS.writeSpanRun(mySpanRun)
+                    mySpanRun = []
+                    if thePages.isPageFull():
+                        myS = thePages.nextPage(myIntId)
+                    myLineNum = theLex.lineNum
+                    myFileName = theLex.fileName
+                    thePages.addLine(myFileName, myLineNum)
+                    # Write an ID for the ITU only
+                    if incItuAnchors and len(myFileStack) == 1:
+                        with XmlWrite.Element(myS, 'a',
+                                        {'name' : '%d' % myLineNum}):
+                            myItuLineMap[myLineNum] = thePages.pageName
+                    # Write the line prefix
+                    myS.writeSpanRun(
+                        (
+                            (indentStr, None),
+                            ('[', None),
+                            (' ' * (LINE_FIELD_WIDTH - len('%d' % myLineNum)), None),
+                        )
+                    )
+                    if incItuLinks:
+                        try:
+                            myHtmlFileName = myHtmlFileNameMap[myFileName]
+                        except KeyError:
+                            myHtmlFileName = HtmlUtils.retHtmlFileName(myFileName)
+                            myHtmlFileNameMap[myFileName] = myHtmlFileName
+                        with XmlWrite.Element(myS, 'a',
+                                {'href' : '%s#%d' % (myHtmlFileName, myLineNum)}):
+                            myS.characters('%d' % myLineNum)
+                    else:
+                        myS.characters('%d' % myLineNum)
+                    myS.characters(']: ')
+                    colNum = 1
+        myS.writeSpanRun(mySpanRun)
+    except Exception:
+        thePages.abandon()
+        raise
+    thePages.finalise(myIntId)
+    return myTokCntr, myItuLineMap
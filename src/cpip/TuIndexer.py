@@ -33,11 +33,18 @@ class ExceptionTuIndexer(ExceptionCpip):
     """Exception when handling PpLexer object."""
     pass
 
+#: Prefix of the anchor names of markers. This is distinct from the ``_%d``
+#: anchors of file shifts in the TU HTML.
+ANCHOR_PREFIX = '_tu'
+
 class TuIndexer(object):
-    """Provides a means of indexing into a TU html file."""
+    """Provides a means of indexing into a TU html file. If the TU is written
+    as several pages then each marker can be given the page that it is on."""
     def __init__(self, tuFileName):
         self._tuName = tuFileName
         self._tuMarkerS = []
+        # Parallel list to self._tuMarkerS of the page name of each marker
+        self._tuPageS = []
         
     def __str__(self):
         if len(self._tuMarkerS) == 0:
@@ -45,17 +52,32 @@ class TuIndexer(object):
         return 'TuIndexer for "%s". number of values=%d from %d to %d' % \
             (self._tuName, len(self._tuMarkerS), self._tuMarkerS[0], self._tuMarkerS[-1])
     
-    def add(self, theTuIndex):
-        """Adds an integer index to the list of markers, returns the href name."""
+    def add(self, theTuIndex, thePage=None):
+        """Adds an integer index to the list of markers, returns the href name
+        that the caller must write as an anchor at the marker.
+        thePage is the name of the page that the marker is on, if None it is
+        the TU file name."""
         if len(self._tuMarkerS) > 0 \
         and theTuIndex < self._tuMarkerS[-1]:
             raise ExceptionTuIndexer('Out of sequence: %s' % theTuIndex)
         self._tuMarkerS.append(theTuIndex)
-        return '_%d' % theTuIndex
+        self._tuPageS.append(thePage or self._tuName)
+        return '%s%d' % (ANCHOR_PREFIX, theTuIndex)
         
     def href(self, theTuIndex, isLB):
         """Returns an href string for the TuIndex. If isLB is true returns
         the nearest lower bound, otherwise the nearest upper bound."""
+        myIdx = self._index(theTuIndex, isLB)
+        return '%s#%s%d' % (self._tuPageS[myIdx], ANCHOR_PREFIX, self._tuMarkerS[myIdx])
+
+    def page(self, theTuIndex):
+        """Returns the name of the page that contains the TuIndex i.e. the
+        page of the nearest lower bound marker."""
+        return self._tuPageS[self._index(theTuIndex, True)]
+
+    def _index(self, theTuIndex, isLB):
+        """Returns the index into the markers for the TuIndex. If isLB is true
+        uses the nearest lower bound, otherwise the nearest upper bound."""
         if isLB:
             myIdx = OaS.indexLB(self._tuMarkerS, theTuIndex)
         else:
@@ -64,4 +86,4 @@ class TuIndexer(object):
             raise ExceptionTuIndexer('Over-range index, isLB=%s: %s' % (isLB, theTuIndex))
         if myIdx == -1:
             raise ExceptionTuIndexer('Under-range index, isLB=%s: %s' % (isLB, theTuIndex))
-        return '%s#_%d' % (self._tuName, self._tuMarkerS[myIdx])
+        return myIdx
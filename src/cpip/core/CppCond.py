@@ -528,7 +528,7 @@ class CppCond(object):
 # const_expr - A constant-expression as a string or None
 # None is used for #else and #elif
 StateConstExprFileLine = collections.namedtuple(
-    'StateConstExprLoc',
+    'StateConstExprFileLine',
     'fileId lineNum tuIndex state const_expr',
     )
 
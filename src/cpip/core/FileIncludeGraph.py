@@ -123,7 +123,9 @@ class FileIncludeGraph(object):
     This class builds up a graph (actually a tree) of file includes. The
     insertion order is significant in that it is expected to be the order
     experienced by a translation unit processor.
-    ``addBranch()`` is the way to add to the data structure.
+    ``addChild()`` on the node of the including file is the way to add to the
+    data structure, ``addBranch()`` does the same from the root given the
+    branch of files.
     
     This class does not distinguish between conditional compilation states
     that are True or False. Nor does this class evaluate theCondition in
@@ -188,10 +190,16 @@ class FileIncludeGraph(object):
         # Recursive map of {line : class FileIncludeGraph, ...}
         # line is an integer type.
         self._graph = {}
+        # The largest line in self._graph, None if empty, so the latest child
+        # can be found without max(self._graph.keys())
+        self._maxLine = None
         # A PpTokenCount object inserted by caller after the file has
         # been processed
         # This is set by the PpLexer at the end of the translation unit.
         self._tokCntr = None
+        # Wall time in seconds to process this file including the files that
+        # it includes, set by the PpLexer when it finishes the file.
+        self._time = None
 
     #===========================================================================
     # Section: Attribute getters and setters
@@ -272,6 +280,52 @@ class FileIncludeGraph(object):
                     retToks += myChildTokCount
             return retToks
         
+    @property
+    def timeIncChildren(self):
+        """The wall time in seconds that the PpLexer took to process this
+        file including the files that it includes. Returns None if not
+        initialised.
+
+        :returns: ``NoneType, float`` -- Time in seconds.
+        """
+        return self._time
+
+    @property
+    def time(self):
+        """The wall time in seconds that the PpLexer took to process this
+        file excluding the files that it includes. Returns None if not
+        initialised.
+
+        May raise :py:class:`ExceptionFileIncludeGraph` if the times
+        have been set inconsistently (i.e. the children have not been set).
+
+        :returns: ``NoneType, float`` -- Time in seconds.
+        """
+        if self._time is not None:
+            retTime = self._time
+            for aG in self._graph.values():
+                if aG.timeIncChildren is None:
+                    raise ExceptionFileIncludeGraph(
+                        'I have a time but my child, %s, does not' % aG
+                        )
+                retTime -= aG.timeIncChildren
+            return max(0.0, retTime)
+
+    def setTime(self, theTime):
+        """Sets the wall time for this node including the files that it
+        includes.
+
+        :param theTime: Time in seconds.
+        :type theTime: ``float``
+
+        :returns: ``NoneType``
+        """
+        if self._time is not None:
+            raise ExceptionFileIncludeGraph(
+                'Calling setTime() when time already set.'
+            )
+        self._time = theTime
+
     @property
     def fileName(self):
         """Returns the current file name.
@@ -340,6 +394,17 @@ class FileIncludeGraph(object):
         """Yields each child node as a :py:class:`FileIncludeGraph` object."""
         for aLine in sorted(self._graph.keys()):
             yield self._graph[aLine]
+
+    @property
+    def latestChild(self):
+        """The last inserted child node, a :py:class:`FileIncludeGraph` object,
+        or None if there are no children.
+
+        :returns: ``NoneType``, :py:class:`FileIncludeGraph` -- The child node.
+        """
+        if self._maxLine is None:
+            return None
+        return self._graph[self._maxLine]
     #===========================================================================
     # End: Child node access
     #===========================================================================
@@ -347,8 +412,49 @@ class FileIncludeGraph(object):
     #===========================================================================
     # Section: Branch addition and access 
     #===========================================================================
+    def addChild(self, theLine, theIncFile, theState, theCondition, theLogic):
+        """Adds a child node to this node, that is this file includes another.
+        This takes constant time.
+
+        :param theLine: An integer value of the line number of the #include
+            statement in this file.
+        :type theLine: ``int``
+
+        :param theIncFile: The file that is included.
+        :type theIncFile: ``str``
+
+        :param theState: A boolean that describes the conditional compilation state.
+        :type theState: ``bool``
+
+        :param theCondition: The conditional compilation test e.g. ``'1>0'``
+        :type theCondition: ``str``
+
+        :param theLogic: A string representing how the branch was obtained.
+        :type theLogic: ``list([str])``
+
+        :returns: :py:class:`FileIncludeGraph` -- The new child node.
+
+        :raises: :py:class:`ExceptionFileIncludeGraph` if theLine is a
+            duplicate of an existing line.
+        """
+        if theLine in self._graph:
+            raise ExceptionFileIncludeGraph('FileIncludeGraph.addBranch() dupe line %d in "%s".' \
+                                        % (theLine, self._fileName))
+        assert(self._maxLine is None or theLine > self._maxLine), \
+            'File=%s line=%d maxLine=%d' % (theIncFile, theLine, self._maxLine)
+        retVal = FileIncludeGraph(theIncFile,
+                                  theState,
+                                  theCondition,
+                                  theLogic)
+        self._graph[theLine] = retVal
+        if self._maxLine is None or theLine > self._maxLine:
+            self._maxLine = theLine
+        return retVal
+
     def addBranch(self, theFileS, theLine, theIncFile, theState, theCondition, theLogic):
-        """Adds a branch to the graph.
+        """Adds a branch to the graph. This descends the latest branch so takes
+        time proportional to its length, see :py:meth:`addChild` for adding to
+        a known node.
         
         :param theFileS: A list of files that form the branch.
         :type theFileS: ``list([str])``
@@ -387,27 +493,16 @@ class FileIncludeGraph(object):
             raise ExceptionFileIncludeGraph('FileIncludeGraph.addBranch() was "%s", now "%s".' \
                                         % (self._fileName, theFileS[0]))
         if len(theFileS) == 1:
-            # Base case
-            if theLine in self._graph:
-                # Case 2. above.
-                raise ExceptionFileIncludeGraph('FileIncludeGraph.addBranch() dupe line %d in "%s".' \
-                                            % (theLine, self._fileName))
-            else:
-                assert(len(self._graph) == 0 or theLine > max(self._graph.keys())), \
-                    'File=%s line=%d maxLine=%d' % (theIncFile, theLine, max(self._graph.keys()))
-                self._graph[theLine] = FileIncludeGraph(theIncFile,
-                                                        theState,
-                                                        theCondition,
-                                                        theLogic)
+            # Base case, may raise for case 2. above.
+            self.addChild(theLine, theIncFile, theState, theCondition, theLogic)
         else:
             # Recursive case
             if len(self._graph) == 0:
                 # Case 3. above. an empty graph
                 raise ExceptionFileIncludeGraph('FileIncludeGraph.addBranch() "%s" has no includes.' \
                                             % (self._fileName))
-            myLineNum = max(self._graph.keys())
             # The #include line of current file is the last one
-            self._graph[myLineNum].addBranch(
+            self.latestChild.addBranch(
                                            theFileS[1:],
                                            theLine,
                                            theIncFile,
@@ -449,7 +544,7 @@ class FileIncludeGraph(object):
         if len(self._graph) == 0:
             return self
         else:
-            return self._graph[max(self._graph.keys())].retLatestLeaf()
+            return self.latestChild.retLatestLeaf()
         
     def retLatestNode(self, theBranch):
         """Returns the last inserted node, a :py:class:`FileIncludeGraph` object
@@ -472,7 +567,7 @@ class FileIncludeGraph(object):
         if len(theBranch) == 1:
             return self
         else:
-            return self._graph[max(self._graph.keys())].retLatestNode(theBranch[1:])
+            return self.latestChild.retLatestNode(theBranch[1:])
         
     def retLatestBranch(self):
         """Returns the branch to the last inserted leaf as a list of
@@ -485,9 +580,8 @@ class FileIncludeGraph(object):
         """Recursive call that returns the branch to the last inserted leaf.
         theList is modified in-place."""
         if len(self._graph) > 0:
-            lastLine = max(self._graph.keys())
-            theList.append(self._retFileLine(lastLine))
-            self._graph[lastLine]._retLatestBranch(theList)
+            theList.append(self._retFileLine(self._maxLine))
+            self.latestChild._retLatestBranch(theList)
         else:
             theList.append(self.fileName)
             
@@ -505,7 +599,7 @@ class FileIncludeGraph(object):
         """Recursive call that returns an integer that is the depth of the
         latest branch."""
         if len(self._graph) > 0:
-            return self._graph[max(self._graph.keys())]._retLatestBranchDepth(i+1)
+            return self.latestChild._retLatestBranchDepth(i+1)
         return i+1
     #===========================================================================
     # End: Branch addition and access 
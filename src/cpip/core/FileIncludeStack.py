@@ -20,26 +20,105 @@
 
 """This module represents a stack of file includes as used by the
 :py:class:`.PpLexer.PpLexer`
+
+The stack also times each file, when a file is finished an
+:py:class:`IncludeEvent` is recorded with the wall time and token counts for
+the file alone and including the files that it includes. These events can be
+written with :py:func:`writeTraceEvents` as a Chrome trace event JSON file that
+can be viewed with Perfetto or ``chrome://tracing``.
 """
 __author__  = 'Paul Ross'
 __date__    = '2011-07-10'
 __rights__  = 'Copyright (c) 2008-2017 Paul Ross'
 
+import collections
+import json
 import logging
+import sys
+import time
+
 from cpip import ExceptionCpip
 from cpip.core import PpTokeniser
 from cpip.core import PpTokenCount
 from cpip.core import FileIncludeGraph
+from cpip.core import FilePathTable
 from cpip.util import CommonPrefix
 
 class ExceptionFileIncludeStack(ExceptionCpip):
     """Exception for FileIncludeStack object."""
     pass
 
+#: The record of a file that has been processed, times are in seconds:
+#:
+#: * fileName - The file path.
+#: * depth - The include depth, 1 is the ITU.
+#: * start - Time that the file was started from the start of the first file.
+#: * time - Wall time including the files that it includes.
+#: * timeSelf - Wall time excluding the files that it includes.
+#: * numTokens - Number of tokens in this file alone.
+#: * numTokensIncChildren - Number of tokens including the files that it includes.
+IncludeEvent = collections.namedtuple(
+    'IncludeEvent',
+    'fileName depth start time timeSelf numTokens numTokensIncChildren',
+)
+
+def retTraceEvents(theEventS, thePid=1, theTid=1):
+    """Returns the include events as a Chrome trace event dictionary
+    suitable for JSON. Each file is a complete event in microseconds.
+
+    :param theEventS: The include events.
+    :type theEventS: ``list([cpip.core.FileIncludeStack.IncludeEvent])``
+
+    :param thePid: The process ID to give the events.
+    :type thePid: ``int``
+
+    :param theTid: The thread ID to give the events.
+    :type theTid: ``int``
+
+    :returns: ``dict({str : [str, list([dict({str : [str, int, float, dict({str : [str, int, float]})]})]])})`` -- The trace.
+    """
+    retEventS = []
+    for anEvent in sorted(theEventS, key=lambda e: (e.start, e.depth)):
+        retEventS.append(
+            {
+                'name'  : anEvent.fileName,
+                'cat'   : 'include',
+                'ph'    : 'X',
+                'ts'    : anEvent.start * 1e6,
+                'dur'   : anEvent.time * 1e6,
+                'pid'   : thePid,
+                'tid'   : theTid,
+                'args'  : {
+                    'depth'                 : anEvent.depth,
+                    'selfTime(us)'          : anEvent.timeSelf * 1e6,
+                    'numTokens'             : anEvent.numTokens,
+                    'numTokensIncChildren'  : anEvent.numTokensIncChildren,
+                },
+            }
+        )
+    return {
+        'traceEvents' : retEventS,
+        'displayTimeUnit' : 'ms',
+    }
+
+def writeTraceEvents(theStream, theEventS):
+    """Writes the include events as Chrome trace event JSON.
+
+    :param theStream: The output stream.
+    :type theStream: ``_io.TextIOWrapper``
+
+    :param theEventS: The include events.
+    :type theEventS: ``list([cpip.core.FileIncludeStack.IncludeEvent])``
+
+    :returns: ``NoneType``
+    """
+    json.dump(retTraceEvents(theEventS), theStream, indent=1, sort_keys=True)
+    theStream.write('\n')
+
 class FileInclude(object):
     """Represents a single TU fragment with a PpTokeniser and a token counter.
     """
-    def __init__(self, theFpo, theDiag):
+    def __init__(self, theFpo, theDiag, theChunkSize=0):
         """Constructor.
 
         :param theFpo: A FilePathOrigin object that identifies the file.
@@ -48,6 +127,10 @@ class FileInclude(object):
         :param theDiag: A CppDiagnostic object to give to the PpTokeniser.
         :type theDiag: ``cpip.core.CppDiagnostic.PreprocessDiagnosticStd``
 
+        :param theChunkSize: If non-zero the PpTokeniser streams the file in
+            chunks of this many characters.
+        :type theChunkSize: ``int``
+
         :returns: ``NoneType``
         """
         self.fileName = theFpo.filePath
@@ -56,10 +139,18 @@ class FileInclude(object):
             theFileObj=theFpo.fileObj,
             theFileId=theFpo.filePath,
             theDiagnostic=theDiag,
+            theChunkSize=theChunkSize,
         )
         self.tokenCounter = PpTokenCount.PpTokenCount()
         # Used when the PpLexer is run with annotateLineFile=True to give GCC like annotations.
         self.origin = theFpo.origin
+        # The FileIncludeGraph node of this file, set by the FileIncludeStack
+        self.figNode = None
+        # Timer value when this file was started, set by the FileIncludeStack
+        self.start = None
+        # Time and tokens of the files included by this one
+        self.childTime = 0.0
+        self.childTokens = 0
     
     def tokenCounterAdd(self, theC):
         """Add a token counter to my token counter (used when a macro is
@@ -101,20 +192,60 @@ class FileIncludeStack(object):
         
     *self._figr*
         A :py:class:`cpip.core.FileIncludeGraph.FileIncludeGraphRoot` for the file include graph.
+        Each FileInclude object refers to its node in this graph so that
+        adding an ``#include`` takes constant time.
+
+    *self._filePathTable*
+        A :py:class:`cpip.core.FilePathTable.FilePathTable` that interns the
+        path of every file that is included.
+
+    *self._eventS*
+        A list of :py:class:`IncludeEvent` in the order that the files were
+        finished.
+
+    *self._ituTokenCache*
+        If not None a :py:class:`cpip.core.ItuToTokens.ItuTokenCache` that is
+        given the tokens of each file as it is finished.
     """
-    def __init__(self, theDiagnostic):
+    def __init__(self, theDiagnostic, theChunkSize=0, theFilePathTable=None,
+                 theTimer=time.perf_counter, theItuTokenCache=None):
         """Constructor, takes a CppDiagnostic object to give to the PpTokeniser.
 
         :param theDiagnostic: The diagnostic for emitting messages.
         :type theDiagnostic: :py:class:`cpip.core.CppDiagnostic.PreprocessDiagnosticStd`
 
+        :param theChunkSize: If non-zero each PpTokeniser streams its file in
+            chunks of this many characters.
+        :type theChunkSize: ``int``
+
+        :param theFilePathTable: The table to intern file paths in, if None
+            one is created.
+        :type theFilePathTable: ``NoneType``, :py:class:`cpip.core.FilePathTable.FilePathTable`
+
+        :param theTimer: Function that returns the time in seconds.
+        :type theTimer: ``function``
+
+        :param theItuTokenCache: If not None the tokens of each file, in their
+            original spelling, are added to this as the file is finished so
+            that the file need not be tokenised again for its ITU HTML.
+        :type theItuTokenCache: ``NoneType``, :py:class:`cpip.core.ItuToTokens.ItuTokenCache`
+
         :returns: ``NoneType``
         """
         self._diagnostic = theDiagnostic
+        self._chunkSize = theChunkSize
+        if theFilePathTable is None:
+            theFilePathTable = FilePathTable.FilePathTable()
+        self._filePathTable = theFilePathTable
         # Stack of FileInclude objects
         self._fincS = []
         # Allied to the file stack is the include graph recorder.
         self._figr = FileIncludeGraph.FileIncludeGraphRoot()
+        self._timer = theTimer
+        # Timer value at the start of the first file
+        self._timeOrigin = None
+        self._eventS = []
+        self._ituTokenCache = theItuTokenCache
             
     @property
     def depth(self):
@@ -159,6 +290,20 @@ class FileIncludeStack(object):
         :returns: ``cpip.core.FileIncludeGraph.FileIncludeGraphRoot`` -- The include graph root."""
         return self._figr
     
+    @property
+    def filePathTable(self):
+        """The :py:class:`.FilePathTable.FilePathTable` of included files.
+
+        :returns: ``cpip.core.FilePathTable.FilePathTable`` -- The path table."""
+        return self._filePathTable
+
+    @property
+    def includeEvents(self):
+        """The :py:class:`IncludeEvent` of each file that has been finished.
+
+        :returns: ``list([cpip.core.FileIncludeStack.IncludeEvent])`` -- The events."""
+        return self._eventS
+
     @property
     def fileLineCol(self):
         """Return an instance of FileLineCol from the current physical line column.
@@ -211,46 +356,50 @@ class FileIncludeStack(object):
         logging.debug('FileIncludeStack.includeStart(): %s line=%d', theFpo.filePath, theLineNum)
 #        print 'FileIncludeStack.includeStart(): new file %s included from line=%s' % (theFpo.filePath, str(theLineNum))
         assert(len(self._fincS) == 0 and theLineNum is None or theLineNum == self._fincS[-1].ppt.pLineCol[0])
+        # Share a single path string between every FileLineCol, graph node
+        # etc. that refers to this file.
+        theFpo = theFpo._replace(filePath=self._filePathTable.intern(theFpo.filePath))
+        if isinstance(incLogic, list):
+            incLogic = [sys.intern(s) for s in incLogic]
 #        import traceback
 #        print ''.join(traceback.format_list(traceback.extract_stack()))
-        self._fincS.append(FileInclude(theFpo, self._diagnostic))
+        self._fincS.append(FileInclude(theFpo, self._diagnostic, self._chunkSize))
+        # Only files read from their path, not in-memory ones such as pragmas
+        if self._ituTokenCache is not None \
+        and getattr(theFpo.fileObj, 'name', None) == theFpo.filePath \
+        and self._ituTokenCache.needsTokens(theFpo.filePath):
+            self._fincS[-1].ppt.recordItuTokens()
+        self._fincS[-1].start = self._timer()
+        if self._timeOrigin is None:
+            self._timeOrigin = self._fincS[-1].start
         # Now adjust the file graph, these could (but shouldn't!) raise as:
         # a. self._figr.addGraph just appends so can't raise.
         # b. FileIncludeGraph.__init__(...) just copies data so can't raise.
         # c. self._figr.graph() could raise if there is not a graph there but
         #    previous calls should ensure that.
         #    Thus assert(self._figr.numTrees() > 0)
-        # d. addBranch can raise a ExceptionFileIncludeGraph if:
-        #    0. The branch is zero length.
-        #    1. The branch does not match the existing graph (this just
-        #       immediately checks the first item on the branch but then
-        #       recurses).
-        #    2. theLine is a duplicate of an existing line.
-        #    3. The branch has missing nodes.
+        # d. addChild can raise a ExceptionFileIncludeGraph if theLine is a
+        #    duplicate of an existing line.
         #
         # NOTE: Test is against 1 as we have appended to self._fincS above.
         if self.depth == 1:
             assert(theLineNum is None)
             # Add a new FileIncludeGraph
-            self._figr.addGraph(
-                FileIncludeGraph.FileIncludeGraph(theFpo.filePath, True, '', '',)
+            self._fincS[-1].figNode = FileIncludeGraph.FileIncludeGraph(
+                theFpo.filePath, True, '', '',
             )
+            self._figr.addGraph(self._fincS[-1].figNode)
         else:
             assert(self._figr.numTrees() > 0)
-            # Add a branch to the existing FileIncludeGraph
-            myFileStack = self.fileStack
-#            print(' includeStart(): myFileStack %d:' % theLineNum, [os.path.basename(p)for p in self.fileStack])
-#            self._printFileList(' includeStart(): myFileStack %d:' % theLineNum, self.fileStack)
-#            print('                        As list:', self.fileStack)
-            self._figr.graph.addBranch(
-                        myFileStack[:-1],
+            # Add a child to the node of the including file
+            self._fincS[-1].figNode = self._fincS[-2].figNode.addChild(
                         # And subtract 1 as the "#include ...\\n" has been consumed
                         theLineNum-1,
-                        myFileStack[-1],
+                        theFpo.filePath,
                         isUncond,
                         condStr,
                         incLogic,
-                        ) 
+                        )
         
     def includeFinish(self):
         """End an ``#include`` file, returns the file ID that has been finished.
@@ -259,23 +408,31 @@ class FileIncludeStack(object):
         """
         if self.depth < 1:
             raise ExceptionFileIncludeStack('FileIncludeStack.includeFinish() on zero length stack.')
-#        print('includeFinish(): myFileStack:', [os.path.basename(p)for p in self.fileStack])
-        myFileStack = [fi.fileName for fi in self._fincS]
-#        self._printFileList('includeFinish(): myFileStack:', myFileStack)
-#        import traceback
-#        print ''.join(traceback.format_list(traceback.extract_stack()))
-#        print
-#        print
-#        print 'includeFinish(): self._figr\n', self._figr
         logging.debug('FileIncludeStack.includeFinish(): %s', self._fincS[-1].fileName)
         # Can pop so update the token count of the parent
-        #print 'TRACE: includeFinish() myFileStack', myFileStack
         myFinc = self._fincS.pop()
-        self._figr.graph.retLatestNode(myFileStack).setTokenCounter(myFinc.tokenCounter)
-#            try:
-#                self._figr.graph.retLatestNode(myFileStack).setTokenCounter(myFi.tokenCounter)
-#            except FileIncludeGraph.ExceptionFileIncludeGraph, err:
-#                logging.error('FileIncludeStack.incFinish(): failed with "%s"', str(err))
+        myFinc.figNode.setTokenCounter(myFinc.tokenCounter)
+        myTime = self._timer() - myFinc.start
+        myFinc.figNode.setTime(myTime)
+        if self._ituTokenCache is not None:
+            myItuTokS = myFinc.ppt.retItuTokens()
+            if myItuTokS is not None:
+                self._ituTokenCache.addTokens(myFinc.fileName, myItuTokS)
+        myTokens = myFinc.tokenCounter.totalAll
+        self._eventS.append(
+            IncludeEvent(
+                myFinc.fileName,
+                self.depth + 1,
+                myFinc.start - self._timeOrigin,
+                myTime,
+                max(0.0, myTime - myFinc.childTime),
+                myTokens,
+                myTokens + myFinc.childTokens,
+            )
+        )
+        if self.depth > 0:
+            self._fincS[-1].childTime += myTime
+            self._fincS[-1].childTokens += myTokens + myFinc.childTokens
         if self.depth > 0:
             logging.debug('FileIncludeStack.includeFinish(): passing control back to %s', self._fincS[-1].fileName)
         else:
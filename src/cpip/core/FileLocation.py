@@ -130,7 +130,10 @@ __author__  = 'Paul Ross'
 __date__    = '2011-07-10'
 __rights__  = 'Copyright (c) 2008-2017 Paul Ross'
 
+import array
+import bisect
 import collections
+import itertools
 
 from cpip import ExceptionCpip
 
@@ -155,6 +158,58 @@ FileLineCol = collections.namedtuple(
     FileLine._fields + ('colNum',),
     )
 
+class LineIndex(object):
+    """Holds the offsets of the start of each line in a buffer so that the
+    line and column of any offset in that buffer can be computed on demand
+    by bisection rather than by counting newlines as the buffer is consumed.
+
+    The buffer can be supplied in pieces with :py:meth:`extend` when it is
+    being streamed.
+
+    :param theText: The buffer.
+    :type theText: ``str``
+
+    :returns: ``NoneType``
+    """
+    __slots__ = ('_lineStartS', '_len')
+    def __init__(self, theText):
+        self._lineStartS = array.array('l', [0])
+        self._len = 0
+        self.extend(theText)
+
+    def extend(self, theText):
+        """Appends text to the buffer.
+
+        :param theText: The text.
+        :type theText: ``str``
+
+        :returns: ``NoneType``
+        """
+        myAppend = self._lineStartS.append
+        myFind = theText.find
+        i = myFind('\n')
+        while i != -1:
+            i += 1
+            myAppend(self._len + i)
+            i = myFind('\n', i)
+        self._len += len(theText)
+
+    def __len__(self):
+        """The number of lines."""
+        return len(self._lineStartS)
+
+    def lineCol(self, theOfs):
+        """Returns the line and column of an offset in the buffer. Lines and
+        columns start at START_LINE and START_COLUMN.
+
+        :param theOfs: Offset into the buffer.
+        :type theOfs: ``int``
+
+        :returns: ``tuple([int, int])`` -- Line and column.
+        """
+        i = bisect.bisect_right(self._lineStartS, theOfs) - 1
+        return START_LINE + i, START_COLUMN + theOfs - self._lineStartS[i]
+
 class LogicalPhysicalLineMap(object):
     """Class that can map logical positions (i.e. after text substitution) back
     to the original physical line columns.
@@ -167,9 +222,14 @@ class LogicalPhysicalLineMap(object):
     """
     def __init__(self):
         # This is a map of:
-        # {line_num: [(col, line_increment, col_increment)], ...}
+        # {line_num: (cols, line_increments, col_increments), ...}
+        # Where each value is three parallel arrays ordered by column.
         # Increments are to get from logical to physical number
         self._ir = {}
+        # Cache of cumulative increments, built on demand by pLineCol():
+        # {line_num: (cols, cumulative_line_increments, cumulative_col_increments), ...}
+        # Any entry is removed when the line is changed.
+        self._cumIr = {}
 
     def __str__(self):
         prefix = '    '
@@ -179,41 +239,55 @@ class LogicalPhysicalLineMap(object):
         else:
             for aK in sorted(self._ir.keys()):
                 retList.append('%s:' % aK)
-                for t in self._ir[aK]:
+                for t in zip(*self._ir[aK]):
                     retList.append('%s%s' % (prefix, str(t)))
         return '\n'.join(retList)
 
     def _addToIr(self, theLogicalLine, theLogicalCol, dLine, dColumn):
         """Adds, or updates a record to the internal representation."""
-        addTup = (theLogicalCol, dLine, dColumn)
-        if theLogicalLine not in self._ir:
-            self._ir[theLogicalLine] = [addTup]
+        try:
+            myColS, myDlS, myDcS = self._ir[theLogicalLine]
+        except KeyError:
+            self._ir[theLogicalLine] = (
+                array.array('l', [theLogicalCol]),
+                array.array('l', [dLine]),
+                array.array('l', [dColumn]),
+            )
+            return
+        self._cumIr.pop(theLogicalLine, None)
+        if theLogicalCol > myColS[-1]:
+            # The usual case as substitutions are recorded in order
+            myColS.append(theLogicalCol)
+            myDlS.append(dLine)
+            myDcS.append(dColumn)
+            return
+        i = bisect.bisect_left(myColS, theLogicalCol)
+        if myColS[i] == theLogicalCol:
+            # Update the existing entry
+            myDlS[i] += dLine
+            myDcS[i] += dColumn
         else:
-            # Scan for existing entry and update it
-            for i, tup in enumerate(self._ir[theLogicalLine]):
-                c, dl, dc = tup
-                if c == theLogicalCol:
-                    # Edit and reinsert
-                    dl += dLine
-                    dc += dColumn
-                    self._ir[theLogicalLine][i] = (c, dl, dc)
-                    # Ordered so can break
-                    break
-            else:
-                # No existing entry found so scan for a entry to insert before
-                for i, tup in enumerate(self._ir[theLogicalLine]):
-                    c, dl, dc = tup
-                    if c > theLogicalCol:
-                        self._ir[theLogicalLine].insert(i, addTup)
-                        break
-                else:
-                    # Append as no break
-                    self._ir[theLogicalLine].append(addTup)
+            myColS.insert(i, theLogicalCol)
+            myDlS.insert(i, dLine)
+            myDcS.insert(i, dColumn)
 
     def substString(self, theLogicalLine, theLogicalCol, lenPhysical, lenLogical):
         """Records a string substitution."""
         self._addToIr(theLogicalLine, theLogicalCol, 0, lenPhysical-lenLogical)
 
+    def substStrings(self, theSubstS):
+        """Records many string substitutions in one go. This is the bulk
+        equivalent of calling :py:meth:`substString` for each one.
+
+        :param theSubstS: Substitutions, preferably in line then column order.
+        :type theSubstS: ``iterable([tuple([int, int, int, int])])`` of
+            ``(logical_line, logical_col, len_physical, len_logical)``
+
+        :returns: ``NoneType``
+        """
+        for aLine, aCol, lenPhysical, lenLogical in theSubstS:
+            self._addToIr(aLine, aCol, 0, lenPhysical-lenLogical)
+
     def pLineCol(self, lLine, lCol):
         """Returns the (physical line number, physical column number) from
         a logical line and logical column.
@@ -226,16 +300,20 @@ class LogicalPhysicalLineMap(object):
 
         :returns: ``tuple([int, int])`` -- Physical line and column.
         """
-        pLine = lLine
-        pCol = lCol
-        if lLine in self._ir:
-            for lc, dl, dc in self._ir[lLine]:
-                if lCol >= lc:
-                    pLine += dl
-                    pCol += dc
-                else:
-                    break
-        return pLine, pCol
+        try:
+            myColS, myCumDlS, myCumDcS = self._cumIr[lLine]
+        except KeyError:
+            if lLine not in self._ir:
+                return lLine, lCol
+            myColS, myDlS, myDcS = self._ir[lLine]
+            myCumDlS = array.array('l', itertools.accumulate(myDlS))
+            myCumDcS = array.array('l', itertools.accumulate(myDcS))
+            self._cumIr[lLine] = myColS, myCumDlS, myCumDcS
+        # All entries with a column <= lCol apply
+        i = bisect.bisect_right(myColS, lCol)
+        if i:
+            return lLine + myCumDlS[i-1], lCol + myCumDcS[i-1]
+        return lLine, lCol
 
     def offsetAbsolute(self, theLineCol):
         """Given a pair of integers that represent line/column starting at
@@ -250,7 +328,11 @@ class LogicalPhysicalLineMap(object):
 
 class FileLocation(object):
     """Class that persists the line/column location in a source file.
-    This also handles various passes of the same file for the PpTokeniser."""
+    This also handles various passes of the same file for the PpTokeniser.
+
+    In a phase that has a :py:class:`LineIndex`, see :py:meth:`setLineIndex`,
+    only the offset into the buffer is tracked and the line and column are
+    computed when asked for."""
     def __init__(self, theFileName):
         """Initialise with a file name (actually an ID)
 
@@ -265,6 +347,12 @@ class FileLocation(object):
         self._fileName = theFileName
         self._lineNum = START_LINE
         self._colNum = START_COLUMN
+        # If not None then the line and column are computed from this and
+        # self._ofs, see setLineIndex()
+        self._lineIndex = None
+        self._ofs = 0
+        # Single entry cache of (offset, (line, column))
+        self._lineColCache = (None, None)
         # This is a stack of LogicalPhysicalLineMap objects, one for each
         # phase of processing
         self._logicalPhysMapStack = [LogicalPhysicalLineMap(), ]
@@ -290,8 +378,43 @@ class FileLocation(object):
         assert(len(self._logicalPhysMapStack) > 0)
         self._lineNum = START_LINE
         self._colNum = START_COLUMN
+        self._lineIndex = None
         self._logicalPhysMapStack.append(LogicalPhysicalLineMap())
 
+    def setLineIndex(self, theLineIndex):
+        """Sets a line index for the buffer of the current phase. From now on
+        the caller only needs to set :py:attr:`offset` (or call
+        :py:meth:`update`) and line and column are computed on demand.
+        This lasts until the next phase or until the line or column are
+        changed directly.
+
+        :param theLineIndex: The line index of the buffer.
+        :type theLineIndex: :py:class:`LineIndex`
+
+        :returns: ``NoneType``
+        """
+        self._lineIndex = theLineIndex
+        self._ofs = 0
+
+    def _lineColFromIndex(self):
+        """Returns the line and column from the line index and offset.
+
+        :returns: ``tuple([int, int])`` -- Line and column.
+        """
+        if self._lineColCache[0] != self._ofs:
+            self._lineColCache = (self._ofs, self._lineIndex.lineCol(self._ofs))
+        return self._lineColCache[1]
+
+    def _resolveLineIndex(self):
+        """If there is a line index then fix the line and column from it and
+        discard it. This is done before the line or column are changed directly.
+
+        :returns: ``NoneType``
+        """
+        if self._lineIndex is not None:
+            self._lineNum, self._colNum = self._lineColFromIndex()
+            self._lineIndex = None
+
     def retPredefinedMacro(self, theName):
         """Returns the value of __FILE__ or __LINE__.
         Applies ISO/IEC 14882:1998(E) 16 Predefined macro names [cpp.predefined] note 2
@@ -328,9 +451,12 @@ class FileLocation(object):
         """
         :returns: ``int`` -- Line number.
         """
+        if self._lineIndex is not None:
+            return self._lineColFromIndex()[0]
         return self._lineNum
 
     def setLineNum(self, theNum):
+        self._resolveLineIndex()
         self._lineNum = theNum
 
     lineNum = property(retLineNum, setLineNum)
@@ -339,13 +465,41 @@ class FileLocation(object):
         """
         :returns: ``int`` -- Column number.
         """
+        if self._lineIndex is not None:
+            return self._lineColFromIndex()[1]
         return self._colNum
 
     def setColNum(self, theNum):
+        self._resolveLineIndex()
         self._colNum = theNum
 
     colNum = property(retColNum, setColNum)
 
+    def retOffset(self):
+        """
+        :returns: ``int`` -- Offset in the buffer of the current phase,
+            only meaningful if there is a line index.
+        """
+        return self._ofs
+
+    def setOffset(self, theOfs):
+        self._ofs = theOfs
+
+    offset = property(retOffset, setOffset)
+
+    @property
+    def position(self):
+        """Returns the current position in a form that can be given to
+        :py:meth:`fileLineColAt` later, while still in the same phase.
+        If there is a line index this is cheap as it is just the offset,
+        otherwise it is the :py:class:`FileLineCol`.
+
+        :returns: ``int, cpip.core.FileLocation.FileLineCol`` -- Opaque position.
+        """
+        if self._lineIndex is not None:
+            return self._ofs
+        return self.fileLineCol()
+
     @property
     def fileName(self):
         """
@@ -360,12 +514,14 @@ class FileLocation(object):
         :returns: ``tuple([int, int])`` -- Location.
         """
         assert(len(self._logicalPhysMapStack) > 0)
-        return self.logicalToPhysical(self._lineNum, self._colNum)
+        return self.logicalToPhysical(*self.lineCol)
 
     @property
     def lineCol(self):
         """Returns the current line and column number as a pair."""
         assert(len(self._logicalPhysMapStack) > 0)
+        if self._lineIndex is not None:
+            return self._lineColFromIndex()
         return self._lineNum, self._colNum
 
     @property
@@ -381,6 +537,21 @@ class FileLocation(object):
         """
         pLine, pCol = self.pLineCol
         return FileLineCol(self.fileName, pLine, pCol)
+
+    def fileLineColAt(self, thePosition):
+        """Return an instance of FileLineCol from a position previously
+        obtained from :py:attr:`position`.
+
+        :param thePosition: The position.
+        :type thePosition: ``int, cpip.core.FileLocation.FileLineCol``
+
+        :returns: :py:class:`cpip.core.FileLocation.FileLineCol([str, int, int])`
+            -- File location.
+        """
+        if not isinstance(thePosition, int):
+            return thePosition
+        pLine, pCol = self.logicalToPhysical(*self._lineIndex.lineCol(thePosition))
+        return FileLineCol(self.fileName, pLine, pCol)
     ###############################
     # End: Getters and setters.
     ###############################
@@ -399,6 +570,7 @@ class FileLocation(object):
 
         :returns: ``NoneType``
         """
+        self._resolveLineIndex()
         self._colNum += num
 
     def incLine(self, num=1):
@@ -409,6 +581,7 @@ class FileLocation(object):
 
         :returns: ``NoneType``
         """
+        self._resolveLineIndex()
         self._lineNum += num
         if num:
             self._colNum = START_COLUMN
@@ -421,6 +594,9 @@ class FileLocation(object):
 
         :returns: ``NoneType``
         """
+        if self._lineIndex is not None:
+            self._ofs += len(theString)
+            return
         self.incLine(theString.count('\n'))
         self.incCol(len(theString) - theString.rfind('\n') - 1)
 
@@ -435,6 +611,23 @@ class FileLocation(object):
         This does NOT update the current line or column, use update(...) to do that."""
         self._logicalPhysMapStack[-1].substString(self.lineNum, self.colNum, lenPhysical, lenLogical)
 
+    def substStrings(self, theSubstS, thePhase=-1):
+        """Records many string substitutions in one go at explicit logical
+        locations. This does NOT update the current line or column.
+
+        :param theSubstS: Substitutions in line then column order.
+        :type theSubstS: ``iterable([tuple([int, int, int, int])])`` of
+            ``(logical_line, logical_col, len_physical, len_logical)``
+
+        :param thePhase: Index of the phase in the stack of phases, by default
+            the current phase. This allows a streaming caller to record the
+            substitutions of earlier phases.
+        :type thePhase: ``int``
+
+        :returns: ``NoneType``
+        """
+        self._logicalPhysMapStack[thePhase].substStrings(theSubstS)
+
     def setTrigraph(self):
         """Records that a trigraph has be substituted at the current place."""
         # Note hard coded lengths of trigraph and their substitute
@@ -444,6 +637,7 @@ class FileLocation(object):
     def spliceLine(self, thePhysicalLine):
         """Update the line/column mapping to record a line splice."""
         assert(thePhysicalLine.endswith('\\\n'))
+        self._resolveLineIndex()
         lP = len(thePhysicalLine)-len('\\\n')
         if self._lineSpliceCount == 0:
             self._lineSpliceColInc = lP
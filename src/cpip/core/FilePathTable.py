@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# CPIP is a C/C++ Preprocessor implemented in Python.
+# Copyright (C) 2008-2017 Paul Ross
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Paul Ross: apaulross@gmail.com
+
+"""Interns file paths for a preprocessing run.
+
+The include handler creates a new path string every time a file is found so
+the same path is held many times over by the file include graph, the
+conditional compilation graph, and every :py:class:`cpip.core.FileLocation.FileLineCol`
+of a macro reference. A :py:class:`FilePathTable` gives each path a single
+canonical string, shared by all of these, and a small integer ID for
+structures that pack file locations into arrays.
+
+Example::
+
+    myTable = FilePathTable()
+    myPath = myTable.intern(thePath)
+    myId = myTable.fileId(thePath)
+    assert myTable.path(myId) is myPath
+"""
+
+__author__  = 'Paul Ross'
+__date__    = '2023-07-04'
+__rights__  = 'Copyright (c) 2008-2017 Paul Ross'
+
+from cpip import ExceptionCpip
+
+class ExceptionFilePathTable(ExceptionCpip):
+    """Exception when handling a FilePathTable."""
+    pass
+
+class FilePathTable(object):
+    """A table of file paths each with an integer ID. IDs are allocated
+    from zero in the order that paths are first seen.
+
+    This pickles as the list of paths so structures that hold the IDs can be
+    pickled along with their table.
+    """
+    def __init__(self):
+        # {path : ID, ...}
+        self._idMap = {}
+        # [path, ...] indexed by ID
+        self._pathS = []
+
+    def __len__(self):
+        return len(self._pathS)
+
+    def __contains__(self, thePath):
+        return thePath in self._idMap
+
+    def __iter__(self):
+        """Yields each path in ID order."""
+        return iter(self._pathS)
+
+    def __getstate__(self):
+        return self._pathS
+
+    def __setstate__(self, theState):
+        self._pathS = list(theState)
+        self._idMap = {p : i for i, p in enumerate(self._pathS)}
+
+    def fileId(self, thePath):
+        """Returns the integer ID of the path, adding it if necessary.
+
+        :param thePath: The file path.
+        :type thePath: ``str``
+
+        :returns: ``int`` -- The ID.
+        """
+        try:
+            return self._idMap[thePath]
+        except KeyError:
+            retVal = len(self._pathS)
+            self._idMap[thePath] = retVal
+            self._pathS.append(thePath)
+            return retVal
+
+    def path(self, theId):
+        """Returns the canonical path for the ID.
+
+        :param theId: The ID.
+        :type theId: ``int``
+
+        :returns: ``str`` -- The path.
+
+        :raises: ``ExceptionFilePathTable`` if the ID is unknown.
+        """
+        if theId < 0 or theId >= len(self._pathS):
+            raise ExceptionFilePathTable('Unknown file ID %d' % theId)
+        return self._pathS[theId]
+
+    def intern(self, thePath):
+        """Returns the canonical string for the path, adding it if necessary.
+        None is returned unchanged as some files, pre-includes for example,
+        may not have a path.
+
+        :param thePath: The file path.
+        :type thePath: ``NoneType, str``
+
+        :returns: ``NoneType, str`` -- The canonical path.
+        """
+        if thePath is None:
+            return None
+        return self._pathS[self.fileId(thePath)]
@@ -31,6 +31,7 @@ import io
 #import time
 #import logging
 from cpip import ExceptionCpip
+from cpip.core import SourceBuffer
 
 class ExceptionCppInclude(ExceptionCpip):
     """Simple specialisation of an exception class for the CppInclude."""
@@ -106,6 +107,24 @@ class CppIncludeStd(object):
         # [-1] is the resolution, None if not found
         # The intermediate ones are various tries in order
         self._findLogic = []
+        # If True then files are read as they are tokenised, see the
+        # streamSources property.
+        self._streamSources = False
+
+    @property
+    def streamSources(self):
+        """If True then files that are found may be returned as file objects
+        that are decoded as they are read rather than all at once. The
+        :py:class:`cpip.core.PpLexer.PpLexer` sets this when it tokenises
+        files in chunks.
+
+        :returns: ``bool`` -- The flag.
+        """
+        return self._streamSources
+
+    @streamSources.setter
+    def streamSources(self, theValue):
+        self._streamSources = theValue
 
     def clearHistory(self):
         """Clears the CP stack. This needed if you use this class as a
@@ -408,7 +427,49 @@ class CppIncludeStd(object):
     #################################################
 
 class CppIncludeStdOs(CppIncludeStd):
-    """This implements _searchFile() based on an OS file system call."""
+    """This implements _searchFile() based on an OS file system call.
+    Files are read with :py:func:`cpip.core.SourceBuffer.openSource` or, if
+    :py:attr:`streamSources` is set, with
+    :py:func:`cpip.core.SourceBuffer.openSourceStream`."""
+    def __init__(self, theUsrDirs, theSysDirs, theEncodingPolicy=None):
+        """Constructor.
+
+        :param theUsrDirs: List of search directories for user includes.
+        :type theUsrDirs: ``list([str])``
+
+        :param theSysDirs: List of search directories for system includes.
+        :type theSysDirs: ``list([str])``
+
+        :param theEncodingPolicy: How to decode the files, None for the default.
+        :type theEncodingPolicy: ``NoneType``, :py:data:`cpip.core.SourceBuffer.EncodingPolicy`
+
+        :returns: ``NoneType``
+        """
+        super(CppIncludeStdOs, self).__init__(theUsrDirs, theSysDirs)
+        self._encodingPolicy = theEncodingPolicy or SourceBuffer.DEFAULT_ENCODING_POLICY
+
+    @property
+    def encodingPolicy(self):
+        """The policy for decoding files.
+
+        :returns: :py:data:`cpip.core.SourceBuffer.EncodingPolicy` -- The policy.
+        """
+        return self._encodingPolicy
+
+    def _openSource(self, thePath):
+        """Opens a file according to the encoding policy and
+        :py:attr:`streamSources`.
+
+        :param thePath: File path.
+        :type thePath: ``str``
+
+        :returns: :py:class:`cpip.core.SourceBuffer.SourceBuffer`,
+            :py:class:`cpip.core.SourceBuffer.SourceStream` -- The file.
+        """
+        if self._streamSources:
+            return SourceBuffer.openSourceStream(thePath, self._encodingPolicy)
+        return SourceBuffer.openSource(thePath, self._encodingPolicy)
+
     def _searchFile(self, theCharSeq, theSearchPath):
         """Given an HcharSeq/Qcharseq and a searchpath this tries the
         file system for the file and returns a FilePathOrigin object or None
@@ -420,18 +481,21 @@ class CppIncludeStdOs(CppIncludeStd):
         :param theSearchPath: Search path.
         :type theSearchPath: ``str``
 
-        :returns: ``NoneType,cpip.core.IncludeHandler.FilePathOrigin([_io.TextIOWrapper, str, str, NoneType])`` -- File found or ``None``.
+        :returns: ``NoneType,cpip.core.IncludeHandler.FilePathOrigin([cpip.core.SourceBuffer.SourceBuffer, str, str, NoneType])`` -- File found or ``None``.
 
-        :raises: ``FileNotFoundError``
+        :raises: ``cpip.core.SourceBuffer.ExceptionSourceBuffer`` if the file
+            is found but can not be decoded.
         """
         myPath = os.path.join(theSearchPath, self._fixDirsep(theCharSeq))
         try:
             return FilePathOrigin(
-                open(myPath),
+                self._openSource(myPath),
                 myPath,
                 self._currentPlaceFromFile(myPath),
                 None,
                 )
+        except SourceBuffer.ExceptionSourceBuffer:
+            raise
         except Exception as _err:
             pass
         return None
@@ -443,19 +507,21 @@ class CppIncludeStdOs(CppIncludeStd):
         :param theTuPath: File path.
         :type theTuPath: ``str``
 
-        :returns: ``cpip.core.IncludeHandler.FilePathOrigin([_io.TextIOWrapper, str, str, str])`` -- The file path origin.
+        :returns: ``cpip.core.IncludeHandler.FilePathOrigin([cpip.core.SourceBuffer.SourceBuffer, str, str, str])`` -- The file path origin.
         """
         if len(self._cpStack) != 0:
             raise ExceptionCppInclude('setTu() with CP stack: %s' % self._cpStack)
         retVal = None
         try:
             retVal = FilePathOrigin(
-                open(theTuPath),
+                self._openSource(theTuPath),
                 theTuPath,
                 self._currentPlaceFromFile(theTuPath),
                 'TU',
                 )
             self.cpStackPush(retVal)
+        except SourceBuffer.ExceptionSourceBuffer:
+            raise
         except Exception as _err:
             pass
         return retVal
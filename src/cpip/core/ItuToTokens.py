@@ -25,13 +25,19 @@ __author__  = 'Paul Ross'
 __date__    = '2011-07-10'
 __rights__  = 'Copyright (c) 2008-2017 Paul Ross'
 
+import collections
+import hashlib
 import logging
+import os
+import pickle
 
 from cpip import ExceptionCpip
+from cpip.core import FileLocation
 from cpip.core import PpLexer
 from cpip.core import PpToken
 from cpip.core import PpTokeniser
-from cpip.util import BufGen
+from cpip.core import SourceBuffer
+from cpip.core import TokenBuffer
 from cpip.util import MultiPassString
 
 class ExceptionItuToTokens(ExceptionCpip):
@@ -46,6 +52,36 @@ ITU_TOKEN_TYPES = PpToken.LEX_PPTOKEN_TYPES + [
         'Unknown',
     ]
 
+def genKeywordPpDirective(theTokToktypeS):
+    """Generates ``(token, token_type)`` from a sequence of them changing the
+    type to a keyword or preprocessing-directive if it can do so.
+
+    :param theTokToktypeS: Tokens and their types in their original spelling.
+    :type theTokToktypeS: ``iterable([tuple([str, str])])``
+
+    :returns: ``tuple([str, str])`` -- Token value, token type.
+    """
+    # if/else will be confused so track previous '#'
+    prevNonWs = ''
+    for t, tt in theTokToktypeS:
+        assert(tt in ITU_TOKEN_TYPES), '%s not in %s' % (tt, str(ITU_TOKEN_TYPES))
+        if tt == 'identifier':
+            # This could be a keyword or a pre-processing directive,
+            # if so then change its type
+            if prevNonWs == '#' and t in PpLexer.PREPROCESSING_DIRECTIVES:
+                yield t, 'preprocessing-directive'
+            elif t in PpTokeniser.CHAR_SET_MAP['lex.key']['keywords']:
+                yield t, 'keyword'
+            else:
+                yield t, tt
+        # Special case where new/delete are operators but also keywords
+        elif t in ('new', 'delete') and tt == 'preprocessing-op-or-punc':
+            yield t, 'keyword'
+        else:
+            yield t, tt
+        if tt != 'whitespace':
+            prevNonWs = t
+
 class ItuToTokens(PpTokeniser.PpTokeniser):
     """Tokensises a file like object."""
     def __init__(self, theFileObj=None, theFileId=None, theDiagnostic=None):
@@ -83,28 +119,14 @@ class ItuToTokens(PpTokeniser.PpTokeniser):
         """
         self.translatePhases123()
         self._fileLocator.startNewPhase()
-        # Token text and token type
-        prevNonWs = ''
-        for t, tt in self.multiPassString.genWords():
-            assert(tt in ITU_TOKEN_TYPES), '%s not in %s' % (tt, str(ITU_TOKEN_TYPES))
+        # Words are contiguous slices of the original string so the file
+        # locator only needs to track the offset.
+        self._fileLocator.setLineIndex(
+            FileLocation.LineIndex(self.multiPassString.originalString)
+        )
+        for t, tt in genKeywordPpDirective(self.multiPassString.genWords()):
             logging.debug('genTokensKeywordPpDirective() "%s", "%s"', t, tt)
-            if tt == 'identifier':
-                # This could be a keyword or a pre-processing directive,
-                # if so then change its type
-                # if/else will be confused so track previous '#'
-                if prevNonWs == '#' and t in PpLexer.PREPROCESSING_DIRECTIVES:
-                    yield t, 'preprocessing-directive'
-                elif t in PpTokeniser.CHAR_SET_MAP['lex.key']['keywords']:
-                    yield t, 'keyword'
-                else:
-                    yield t, tt
-            # Special case where new/delete are operators but also keywords
-            elif t in ('new', 'delete') and tt == 'preprocessing-op-or-punc':
-                yield t, 'keyword'
-            else:
-                yield t, tt
-            if tt != 'whitespace':
-                prevNonWs = t
+            yield t, tt
             self._fileLocator.update(t)
 
     def translatePhases123(self):
@@ -122,39 +144,25 @@ class ItuToTokens(PpTokeniser.PpTokeniser):
         so this only does trigraphs.
 
         :returns: ``NoneType``
-
-        :raises: ``IndexError``
         """
         logging.debug('ItuToTokens._translatePhase_1(): start.')
-        # Construct a buffer generator
-        myBg = BufGen.BufGen(self._mps.genChars())
         self._fileLocator.startNewPhase()
-        try:
-            i = 0
-            while 1:
-                # Note: We need to access the array to inch the marker to the
-                # current character
-                if myBg[i] == PpTokeniser.TRIGRAPH_PREFIX:
-                    self._mps.setMarker()
-                    if myBg[i+1] == PpTokeniser.TRIGRAPH_PREFIX \
-                    and myBg[i+2] in PpTokeniser.TRIGRAPH_TABLE:
-                        # Do the trigraph replacement
-                        self._mps.removeSetReplaceClear(
-                                isTerm=True,
-                                theType='trigraph',
-                                theRepl=PpTokeniser.TRIGRAPH_TABLE[myBg[i+2]],
-                            )
-                        i += PpTokeniser.TRIGRAPH_SIZE
-                        self._fileLocator.incCol(PpTokeniser.TRIGRAPH_SIZE)
-                    else:
-                        self._mps.clearMarker()
-                        i += 1
-                        self._fileLocator.update(myBg[i])
-                else:
-                    i += 1
-                    self._fileLocator.update(myBg[i])
-        except IndexError:
-            pass
+        myText, myIdxS = self._mps.currentText()
+        i = myText.find(PpTokeniser.TRIGRAPH_PREFIX * 2)
+        while i != -1:
+            if i + 2 < len(myText) and myText[i+2] in PpTokeniser.TRIGRAPH_TABLE:
+                # Do the trigraph replacement
+                self._mps.replaceWord(
+                    myIdxS[i],
+                    myIdxS[i+2] + 1 - myIdxS[i],
+                    'trigraph',
+                    PpTokeniser.TRIGRAPH_TABLE[myText[i+2]],
+                )
+                i += PpTokeniser.TRIGRAPH_SIZE
+            else:
+                i += 1
+            i = myText.find(PpTokeniser.TRIGRAPH_PREFIX * 2, i)
+        self._fileLocator.update(myText)
         logging.debug('ItuToTokens._translatePhase_1(): end.')
 
     def _translatePhase_2(self):
@@ -162,34 +170,17 @@ class ItuToTokens(PpTokeniser.PpTokeniser):
         Note: We do not (yet) test for accidental UCN creation.
 
         :returns: ``NoneType``
-
-        :raises: ``IndexError``
         """
         logging.debug('ItuToTokens._translatePhase_2(): start.')
-        # Construct a buffer generator
-        myBg = BufGen.BufGen(self._mps.genChars())
         self._fileLocator.startNewPhase()
-        try:
-            i = 0
-            while 1:
-                # Note: We need to access the array to inch the marker to the
-                # current character
-                if myBg[i] == '\\':
-                    self._mps.setMarker()
-                    if myBg[i+1] == '\n':
-                        # Remove the continuation marker
-                        self._mps.removeMarkedWord(isTerm=True)
-                        i += 2
-                        self._fileLocator.incLine()
-                    else:
-                        self._mps.clearMarker()
-                        i += 1
-                        self._fileLocator.update(myBg[i])
-                else:
-                    i += 1
-                    self._fileLocator.update(myBg[i])
-        except IndexError:
-            pass
+        myText, myIdxS = self._mps.currentText()
+        i = myText.find('\\\n')
+        while i != -1:
+            # Remove the continuation marker, this includes anything removed
+            # by an earlier phase such as the rest of a '??/' trigraph.
+            self._mps.removeWord(myIdxS[i], myIdxS[i+1] + 1 - myIdxS[i])
+            i = myText.find('\\\n', i + 2)
+        self._fileLocator.update(myText)
         logging.debug('ItuToTokens._translatePhase_2(): end.')
 
     def _translatePhase_3(self):
@@ -197,55 +188,306 @@ class ItuToTokens(PpTokeniser.PpTokeniser):
         stream into preprocessing tokens.
 
         :returns: ``NoneType``
-
-        :raises: ``IndexError``
         """
         logging.debug('ItuToTokens._translatePhase_3(): start.')
         # Note this is similar to the code in self.genLexPptokenAndSeqWs()
-        ofsIdx = 0
-        myBg = BufGen.BufGen(self._mps.genChars())
+        # The slice functions work directly on the string of the current text.
         self._fileLocator.startNewPhase()
-        try:
-            while 1:
-                # Each pass through the loop we find either:
-                # - Whitespace
-                # - A comment that is converted to whitespace
-                # - A preprocessing token
-                # Reset the token type
-                self._cppTokType = None
-                # Poke the BufGen to inch the marker to the current position
-                myBg[ofsIdx]
-                self._mps.setMarker()
-                sliceLen = self._sliceWhitespace(myBg, ofsIdx) \
-                    or self._sliceLexComment(myBg, ofsIdx) \
-                    or self._sliceLexPptoken(myBg, ofsIdx)
-                if sliceLen > 0:
-                    # Fix comments to replace them by a comment character
-                    if self._cppTokType in PpTokeniser.COMMENT_TYPES:
-                        # Turn the comment into a single whitespace
-                        myIsTerm = self._cppTokType == PpTokeniser.COMMENT_TYPE_C
-                        self._mps.removeSetReplaceClear(
-                                isTerm=myIsTerm,
-                                theType=self._cppTokType,
-                                theRepl=' ')
-                    else:
-                        myIsTerm = self._cppTokType in (
-                                'character-literal',
-                                'string-literal',
-                                'non-whitespace'
-                            )
-                        self._mps.setWordType(self._cppTokType, isTerm=myIsTerm)
-                    ofsIdx += sliceLen
-                else:
-                    break
-        except IndexError:
-            pass
-        # Poke input and report if incomplete
-        try:
-            myBg[ofsIdx]
+        myText, myIdxS = self._mps.currentText()
+        ofsIdx = 0
+        while ofsIdx < len(myText):
+            # Each pass through the loop we find either:
+            # - Whitespace
+            # - A comment that is converted to whitespace
+            # - A preprocessing token
+            # Reset the token type
+            self._cppTokType = None
+            sliceLen = self._sliceWhitespace(myText, ofsIdx) \
+                or self._sliceLexComment(myText, ofsIdx) \
+                or self._sliceLexPptoken(myText, ofsIdx)
+            if sliceLen <= 0:
+                break
+            # A word in the original string covers anything removed by earlier
+            # phases. Terminal words end at their last character, others
+            # extend to the next character.
+            myStart = myIdxS[ofsIdx]
+            if self._cppTokType in PpTokeniser.ITU_TERMINAL_TYPES:
+                myLen = myIdxS[ofsIdx+sliceLen-1] + 1 - myStart
+            else:
+                myLen = myIdxS[ofsIdx+sliceLen] - myStart
+            if self._cppTokType in PpTokeniser.COMMENT_TYPES:
+                # Turn the comment into a single whitespace
+                self._mps.replaceWord(myStart, myLen, self._cppTokType, ' ')
+            else:
+                self._mps.setWord(myStart, myLen, self._cppTokType)
+            ofsIdx += sliceLen
+        # Report if incomplete
+        if ofsIdx < len(myText):
             self._diagnostic.partialTokenStream(
-                'lex.pptoken has unparsed tokens %s' % myBg[ofsIdx:],
+                'lex.pptoken has unparsed tokens %s' % myText[ofsIdx:],
                 self.fileLocator)
-        except IndexError:
-            pass
         logging.debug('ItuToTokens._translatePhase_3(): end.')
+
+class ItuTokenCache(object):
+    """Caches the ``(token, token_type)`` sequence generated by
+    :py:meth:`ItuToTokens.genTokensKeywordPpDirective` for each file so that
+    a file is tokenised at most once however many translation units include it.
+    
+    Entries are keyed by file path and are valid while the file modification
+    time and size, and the encoding policy, are unchanged. Entries are held in memory, least recently
+    used are discarded when there are more than ``maxFiles``. If a cache
+    directory is given then entries are also pickled there so that they can be
+    shared between processes and between runs.
+
+    A :py:class:`cpip.core.PpLexer.PpLexer` given this cache adds the tokens of
+    each file that it processes with :py:meth:`addTokens` so that those files
+    are not tokenised again, only files that the lexer did not process, or
+    whose tokens are not in their original spelling, are tokenised here.
+
+    Tokens are held as a :py:class:`cpip.core.TokenBuffer.TokenBuffer`.
+
+    :param theCacheDir: Directory for the on-disk cache, None for in-memory only.
+    :type theCacheDir: ``NoneType, str``
+
+    :param maxFiles: Maximum number of files held in memory.
+    :type maxFiles: ``int``
+
+    :param encodingPolicy: How to decode the files, None for the default.
+    :type encodingPolicy: ``NoneType``, :py:data:`cpip.core.SourceBuffer.EncodingPolicy`
+
+    :returns: ``NoneType``
+    """
+    #: Version of the pickled content, change this if the token format changes.
+    PICKLE_VERSION = 2
+    def __init__(self, theCacheDir=None, maxFiles=1024, encodingPolicy=None):
+        self._cacheDir = theCacheDir
+        self._encodingPolicy = encodingPolicy or SourceBuffer.DEFAULT_ENCODING_POLICY
+        if self._cacheDir is not None and not os.path.exists(self._cacheDir):
+            try:
+                os.makedirs(self._cacheDir)
+            except OSError:
+                # Another process got there first
+                pass
+        self._maxFiles = maxFiles
+        # {path : (file_version, TokenBuffer), ...} in LRU order
+        self._fileMap = collections.OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def hits(self):
+        """The number of requests that did not need tokenising.
+
+        :returns: ``int`` -- Hit count.
+        """
+        return self._hits
+
+    @property
+    def misses(self):
+        """The number of requests that needed the file to be tokenised.
+
+        :returns: ``int`` -- Miss count.
+        """
+        return self._misses
+
+    def __len__(self):
+        return len(self._fileMap)
+
+    def tokenBuffer(self, theFilePath, theDiagnostic=None):
+        """Returns the tokens for the file as a buffer, tokenising the file if
+        necessary. The buffer is shared so must not be modified.
+
+        :param theFilePath: The path to the file.
+        :type theFilePath: ``str``
+
+        :param theDiagnostic: A diagnostic for processing messages.
+        :type theDiagnostic: ``NoneType, cpip.core.CppDiagnostic.PreprocessDiagnosticKeepGoing``
+
+        :returns: :py:class:`cpip.core.TokenBuffer.TokenBuffer` -- The tokens.
+
+        :raises: ``IOError`` if the file can not be read.
+        """
+        myVersion = self._retVersion(theFilePath)
+        myTokS = self._retCurrent(theFilePath, myVersion)
+        if myTokS is not None:
+            self._hits += 1
+            return myTokS
+        myTokS = self._load(theFilePath, myVersion)
+        if myTokS is None:
+            self._misses += 1
+            with SourceBuffer.openSource(theFilePath, self._encodingPolicy) as myFile:
+                myItt = ItuToTokens(theFileObj=myFile,
+                                    theFileId=theFilePath,
+                                    theDiagnostic=theDiagnostic)
+                myTokS = TokenBuffer.TokenBuffer.fromTokToktypes(
+                    myItt.genTokensKeywordPpDirective()
+                )
+            self._dump(theFilePath, myVersion, myTokS)
+        else:
+            self._hits += 1
+        self._store(theFilePath, myVersion, myTokS)
+        return myTokS
+
+    def needsTokens(self, theFilePath):
+        """Returns True if the tokens of the file are not held in memory, or
+        are out of date, so are worth giving to :py:meth:`addTokens`.
+
+        :param theFilePath: The path to the file.
+        :type theFilePath: ``str``
+
+        :returns: ``bool`` -- True if the tokens are needed.
+        """
+        try:
+            myVersion = self._retVersion(theFilePath)
+        except OSError:
+            return False
+        return self._retCurrent(theFilePath, myVersion) is None
+
+    def addTokens(self, theFilePath, theTokToktypeS):
+        """Adds the tokens of a file that have been collected elsewhere, for
+        example by :py:meth:`cpip.core.PpTokeniser.PpTokeniser.recordItuTokens`
+        when the file was pre-processed. These are the tokens before they are
+        changed to keywords and preprocessing-directives. Nothing is added
+        if the file can not be found.
+
+        :param theFilePath: The path to the file.
+        :type theFilePath: ``str``
+
+        :param theTokToktypeS: The ``(token, token_type)`` in their original spelling.
+        :type theTokToktypeS: ``iterable([tuple([str, str])])``
+
+        :returns: ``NoneType``
+        """
+        try:
+            myVersion = self._retVersion(theFilePath)
+        except OSError:
+            return
+        myTokS = TokenBuffer.TokenBuffer.fromTokToktypes(
+            genKeywordPpDirective(theTokToktypeS)
+        )
+        self._dump(theFilePath, myVersion, myTokS)
+        self._store(theFilePath, myVersion, myTokS)
+
+    def _retVersion(self, theFilePath):
+        """Returns the version of the file that the cached tokens must match.
+
+        :param theFilePath: The path to the file.
+        :type theFilePath: ``str``
+
+        :returns: ``tuple([int, int, tuple([str])])`` -- Modification time, size and encoding policy.
+
+        :raises: ``OSError`` if the file does not exist.
+        """
+        myStat = os.stat(theFilePath)
+        return (myStat.st_mtime_ns, myStat.st_size, tuple(self._encodingPolicy))
+
+    def _retCurrent(self, theFilePath, theVersion):
+        """Returns the tokens held in memory if they match theVersion,
+        otherwise None.
+
+        :param theFilePath: The path to the file.
+        :type theFilePath: ``str``
+
+        :param theVersion: The current version of the file, see :py:meth:`_retVersion`.
+        :type theVersion: ``tuple([int, int, tuple([str])])``
+
+        :returns: ``NoneType, cpip.core.TokenBuffer.TokenBuffer`` -- The tokens.
+        """
+        try:
+            myFileVersion, myTokS = self._fileMap[theFilePath]
+        except KeyError:
+            return None
+        if myFileVersion != theVersion:
+            return None
+        self._fileMap.move_to_end(theFilePath)
+        return myTokS
+
+    def _store(self, theFilePath, theVersion, theTokS):
+        """Holds the tokens in memory discarding the least recently used
+        if there are too many.
+
+        :param theFilePath: The path to the file.
+        :type theFilePath: ``str``
+
+        :param theVersion: The version of the file, see :py:meth:`_retVersion`.
+        :type theVersion: ``tuple([int, int, tuple([str])])``
+
+        :param theTokS: The tokens.
+        :type theTokS: :py:class:`cpip.core.TokenBuffer.TokenBuffer`
+
+        :returns: ``NoneType``
+        """
+        self._fileMap[theFilePath] = (theVersion, theTokS)
+        self._fileMap.move_to_end(theFilePath)
+        while len(self._fileMap) > self._maxFiles:
+            self._fileMap.popitem(last=False)
+
+    def _retPicklePath(self, theFilePath):
+        """Returns the path of the pickle file for the source file path.
+
+        :param theFilePath: The path to the source file.
+        :type theFilePath: ``str``
+
+        :returns: ``str`` -- Path to the pickle file.
+        """
+        myHash = hashlib.md5(os.path.abspath(theFilePath).encode('utf-8')).hexdigest()
+        return os.path.join(self._cacheDir, '%s.pkl' % myHash)
+
+    def _load(self, theFilePath, theVersion):
+        """Returns the tokens from the on-disk cache or None if absent or
+        out of date.
+
+        :param theFilePath: The path to the source file.
+        :type theFilePath: ``str``
+
+        :param theVersion: The current ``(mtime_ns, size)`` of the source file.
+        :type theVersion: ``tuple([int, int])``
+
+        :returns: ``NoneType, cpip.core.TokenBuffer.TokenBuffer`` -- The tokens.
+        """
+        if self._cacheDir is None:
+            return None
+        try:
+            with open(self._retPicklePath(theFilePath), 'rb') as myFile:
+                myPickleVersion, myPath, myVersion, myTokS = pickle.load(myFile)
+        except (IOError, EOFError, ValueError, pickle.UnpicklingError,
+                TokenBuffer.ExceptionTokenBuffer) as err:
+            logging.debug('ItuTokenCache._load(): "%s" %s', theFilePath, err)
+            return None
+        if myPickleVersion != self.PICKLE_VERSION \
+        or myPath != os.path.abspath(theFilePath) \
+        or myVersion != theVersion:
+            return None
+        return myTokS
+
+    def _dump(self, theFilePath, theVersion, theTokS):
+        """Writes the tokens to the on-disk cache, if any.
+
+        :param theFilePath: The path to the source file.
+        :type theFilePath: ``str``
+
+        :param theVersion: The ``(mtime_ns, size)`` of the source file.
+        :type theVersion: ``tuple([int, int])``
+
+        :param theTokS: The tokens.
+        :type theTokS: :py:class:`cpip.core.TokenBuffer.TokenBuffer`
+
+        :returns: ``NoneType``
+        """
+        if self._cacheDir is None:
+            return
+        myPicklePath = self._retPicklePath(theFilePath)
+        # Write then rename so that other processes never see a partial file
+        myTmpPath = '%s.%d' % (myPicklePath, os.getpid())
+        try:
+            with open(myTmpPath, 'wb') as myFile:
+                pickle.dump(
+                    (self.PICKLE_VERSION, os.path.abspath(theFilePath),
+                     theVersion, theTokS),
+                    myFile,
+                    pickle.HIGHEST_PROTOCOL,
+                )
+            os.replace(myTmpPath, myPicklePath)
+        except (IOError, OSError) as err:
+            logging.warning('ItuTokenCache._dump(): Can not write "%s": %s',
+                            myPicklePath, err)
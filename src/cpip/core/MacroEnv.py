@@ -27,16 +27,20 @@ __author__  = 'Paul Ross'
 __date__    = '2011-07-10'
 __rights__  = 'Copyright (c) 2008-2017 Paul Ross'
 
+import collections
+import copy
 import io
 import logging
 import traceback
 
 from cpip import ExceptionCpip
+from cpip.core import FilePathTable
+from cpip.core import MacroRefStore
 from cpip.core import PpDefine
 from cpip.core import PpToken
 from cpip.core import PpTokeniser
 from cpip.core import PpWhitespace
-from cpip.util.ListGen import ListAsGenerator
+from cpip.util.OverlayMap import OverlayMap
 from cpip.util.Tree import DuplexAdjacencyList
 
 class ExceptionMacroEnv(ExceptionCpip):
@@ -67,6 +71,214 @@ class ExceptionMacroIndexError(ExceptionMacroEnv):
 
 KEYWORD_DEFINED = 'defined'
 
+#: Placed in the rescan token queue after a replacement list, when reached the
+#: macro identifier is removed from the hide-set.
+HideSetEnd = collections.namedtuple('HideSetEnd', 'identifier')
+
+class RescanTokenSource(object):
+    """Supplies tokens to a function-like macro that is consuming its
+    preamble and argument list during rescanning. Tokens come from the front
+    of the rescan queue and then, once that is empty, from the generator.
+
+    Any :py:data:`HideSetEnd` markers that are passed over are not acted on
+    but are collected in ``crossed``. The caller puts them back into the queue
+    so that those identifiers stay in the hide-set until the macro that
+    consumed past them has been rescanned.
+
+    A token can be pushed back with ``send()``, as :py:meth:`.PpDefine.PpDefine.consumeFunctionPreamble`
+    does, and it goes back to where it came from.
+
+    :param theQueue: The rescan queue.
+    :type theQueue: ``collections.deque([cpip.core.PpToken.PpToken, HideSetEnd])``
+
+    :param theGen: The generator that continues the queue or None.
+    :type theGen: ``NoneType, generator``
+
+    :returns: ``NoneType``
+    """
+    def __init__(self, theQueue, theGen):
+        self._queue = theQueue
+        self._gen = theGen
+        # True if the last token came from the generator
+        self._fromGen = False
+        # HideSetEnd markers passed over in order
+        self.crossed = []
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        myQueue = self._queue
+        while myQueue:
+            myItem = myQueue.popleft()
+            if myItem.__class__ is HideSetEnd:
+                self.crossed.append(myItem)
+            else:
+                self._fromGen = False
+                return myItem
+        if self._gen is None:
+            raise StopIteration
+        self._fromGen = True
+        try:
+            return next(self._gen)
+        except RuntimeError:
+            # PEP 479, a generator that has let a StopIteration escape
+            raise StopIteration
+
+    def send(self, theTtt):
+        """Pushes back a token so that it is the next one supplied.
+
+        :param theTtt: The token.
+        :type theTtt: :py:class:`cpip.core.PpToken.PpToken`
+
+        :returns: ``NoneType``
+        """
+        if self._fromGen:
+            self._gen.send(theTtt)
+        else:
+            self._queue.appendleft(theTtt)
+
+#: A memoised object-like macro expansion:
+#:
+#: * ``tokens`` - The fully rescanned replacement tokens.
+#: * ``macros`` - The macros replaced, in order, so that their reference counts
+#:   can be updated.
+#: * ``dependencies`` - The identifiers that the expansion depends on, if any
+#:   of these are defined or undefined the entry is removed. The entry can
+#:   only be used if none of these is in the current hide-set.
+ExpansionCacheEntry = collections.namedtuple('ExpansionCacheEntry',
+                                             'tokens macros dependencies')
+
+class ExpansionRecord(object):
+    """Records the expansion of an object-like macro so that it may be
+    memoised once the rescan is complete.
+
+    :param theIdentifier: The macro name.
+    :type theIdentifier: ``str``
+
+    :param theOut: The output token list that the expansion is appended to.
+    :type theOut: ``list([cpip.core.PpToken.PpToken])``
+
+    :param theOutIdx: The length of theOut when the expansion started.
+    :type theOutIdx: ``int``
+
+    :param theLogMacroIdx: The index into the log of macros replaced.
+    :type theLogMacroIdx: ``int``
+
+    :param theLogIdIdx: The index into the log of identifiers seen.
+    :type theLogIdIdx: ``int``
+
+    :returns: ``NoneType``
+    """
+    def __init__(self, theIdentifier, theOut, theOutIdx, theLogMacroIdx, theLogIdIdx):
+        self.identifier = theIdentifier
+        self.out = theOut
+        self.outIdx = theOutIdx
+        self.logMacroIdx = theLogMacroIdx
+        self.logIdIdx = theLogIdIdx
+        # Set False if the expansion can not be memoised
+        self.isCacheable = True
+
+class ArgumentExpansion(object):
+    """A function-like macro invocation that is waiting for its arguments to
+    be fully macro replaced. This holds the state of the rescan that was
+    suspended to do so.
+
+    :param theTtt: The macro name token.
+    :type theTtt: :py:class:`cpip.core.PpToken.PpToken`
+
+    :param theMacro: The macro.
+    :type theMacro: :py:class:`cpip.core.PpDefine.PpDefine`
+
+    :param theArgS: The unexpanded arguments.
+    :type theArgS: ``list([NoneType, list([cpip.core.PpToken.PpToken])])``
+
+    :param theCrossed: Markers passed over when reading the arguments.
+    :type theCrossed: ``list([HideSetEnd])``
+
+    :param theQueue: The suspended rescan queue.
+    :type theQueue: ``collections.deque([cpip.core.PpToken.PpToken, HideSetEnd])``
+
+    :param theOut: The suspended output tokens.
+    :type theOut: ``list([cpip.core.PpToken.PpToken])``
+
+    :param theGen: The suspended generator, or None.
+    :type theGen: ``NoneType, generator``
+
+    :returns: ``NoneType``
+    """
+    def __init__(self, theTtt, theMacro, theArgS, theCrossed, theQueue, theOut, theGen):
+        self.ttt = theTtt
+        self.macro = theMacro
+        self.argS = theArgS
+        self.crossed = theCrossed
+        self.queue = theQueue
+        self.out = theOut
+        self.gen = theGen
+        # The expanded arguments so far
+        self.expandedArgS = []
+
+class PredefinedMacroLoader(object):
+    """Creates the :py:class:`cpip.core.PpDefine.PpDefine` objects for
+    standard predefined macros. Definitions not seen before are tokenised
+    together in a single pass and every definition is cached so that one
+    loader can be shared by all the macro environments of a job.
+
+    The macros returned are shared, callers must use
+    :py:meth:`cpip.core.PpDefine.PpDefine.copy()` before using them.
+    """
+    def __init__(self):
+        # {(identifier, replacement_string_\n_terminated) : PpDefine, ...}
+        self._cache = {}
+
+    def __len__(self):
+        return len(self._cache)
+
+    def retMacros(self, theMacroMap):
+        """Returns the macros for the map in the order of the map.
+
+        :param theMacroMap: Map of ``{identifier : replacement_string_\\n_terminated, ...}``
+        :type theMacroMap: ``dict({str : [str]})``
+
+        :returns: ``list([cpip.core.PpDefine.PpDefine])`` -- The shared macros.
+        """
+        myPairS = list(theMacroMap.items())
+        myMissS = [aPair for aPair in myPairS if aPair not in self._cache]
+        if myMissS:
+            self._load(myMissS)
+        return [self._cache[aPair] for aPair in myPairS]
+
+    def _load(self, thePairS):
+        """Creates the macros and adds them to the cache.
+
+        A definition that might not occupy exactly one line, because it has
+        a line continuation, a comment or more than one newline, is tokenised
+        on its own.
+
+        :param thePairS: The ``(identifier, replacement_string)`` pairs.
+        :type thePairS: ``list([tuple([str, str])])``
+
+        :returns: ``NoneType``
+        """
+        myBlockS = []
+        for aPair in thePairS:
+            myStr = u'%s %s' % aPair
+            if myStr.count('\n') == 1 and myStr.endswith('\n') \
+            and '\\' not in myStr and '/*' not in myStr:
+                myBlockS.append(myStr)
+            else:
+                self._cache[aPair] = PpDefine.PpDefine(
+                    self._retGen(myStr), '', 1)
+                myBlockS.append(None)
+        myGen = self._retGen(u''.join([b for b in myBlockS if b is not None]))
+        for aPair, aStr in zip(thePairS, myBlockS):
+            if aStr is not None:
+                self._cache[aPair] = PpDefine.PpDefine(myGen, '', 1)
+
+    def _retGen(self, theStr):
+        """Returns a token generator for the string."""
+        return PpTokeniser.PpTokeniser(theFileObj=io.StringIO(theStr)).next()
+
 class MacroEnv(object):
     """Represents a set of #define directives that represent a macro processing
     environment. This provides support for #define and #undef directives.
@@ -120,10 +332,15 @@ class MacroEnv(object):
             KEYWORD_DEFINED,
         )
     )
+    # Macros that can change without being #define'd or #undef'd so any
+    # expansion involving them is not memoised.
+    NAMES_NOT_CACHED = frozenset(['__LINE__', '__FILE__'])
     STD_PREDEFINED_NEVER_REDEFINED = set(
             ['__LINE__', '__FILE__', '__DATE__', '__TIME__']
         ) | NAMES_NO_REDEFINITION 
-    def __init__(self, enableTrace=False, stdPredefMacros=None):
+    def __init__(self, enableTrace=False, stdPredefMacros=None,
+                 filePathTable=None, refPolicy=None, predefLoader=None,
+                 profiler=None):
         """Constructor.
 
         A 'reference' is defined as: replacement or if defined.
@@ -148,6 +365,22 @@ class MacroEnv(object):
             identifier has been referenced in the lifetime of me.
         :type stdPredefMacros: ``dict({str : [str]})``
 
+        :param filePathTable: Allocates the file IDs of macro references,
+            if None the environment creates its own.
+        :type filePathTable: ``NoneType``, :py:class:`cpip.core.FilePathTable.FilePathTable`
+
+        :param refPolicy: Controls which macro references are recorded, None
+            records them all.
+        :type refPolicy: ``NoneType``, :py:data:`cpip.core.MacroRefStore.RefPolicy`
+
+        :param predefLoader: Creates the standard predefined macros, share one
+            between environments to reuse the macros. If None the environment
+            creates its own.
+        :type predefLoader: ``NoneType``, :py:class:`PredefinedMacroLoader`
+
+        :param profiler: If present records the cost of expanding each macro.
+        :type profiler: ``NoneType``, :py:class:`cpip.core.MacroProfiler.MacroProfiler`
+
         :returns: ``NoneType``
         """
         # If True makes calls to _debugTokenStream() that may or may not
@@ -158,6 +391,15 @@ class MacroEnv(object):
         # Standard predefined macro map
         # {identifier : replacement_string_\n_terminated, ...}
         self._stdPredefMacros = stdPredefMacros
+        # Shared by the reference stores of every macro
+        if filePathTable is None:
+            filePathTable = FilePathTable.FilePathTable()
+        self._filePathTable = filePathTable
+        self._refPolicy = refPolicy or MacroRefStore.DEFAULT_REF_POLICY
+        if predefLoader is None:
+            predefLoader = PredefinedMacroLoader()
+        self._predefLoader = predefLoader
+        self._profiler = profiler
         # Initialise the dynamic stuff
         self._reset()
         
@@ -170,12 +412,29 @@ class MacroEnv(object):
         # unit. This is a map of:
         # {identifier : class PpDefine, ...}
         # Where identifier is a string.
-        self._defineMap = {}
+        # This is copy-on-write so that the environment can be forked cheaply,
+        # use _retOwnedMacro() to get a macro that is to be changed.
+        self._defineMap = OverlayMap()
         # This is a list of PpDefine objects that have been #undef'd and
         # successfully removed from self._defineMap
         self._undefS = []
-        # A set of macros that have been expanded during macro processing:
+        # Static macro dependencies maintained on #define and #undef.
+        # Every defined macro has an entry of the defined macros that its
+        # replacement list names, in replacement list order:
+        # {identifier : [identifier, ...], ...}
+        self._dependencyMap = OverlayMap()
+        # The defined macros whose replacement list names an identifier, in
+        # order of definition, the identifier need not be defined:
+        # {identifier : {identifier : None, ...}, ...}
+        self._mentionMap = OverlayMap()
+        # The hide-set, macros whose replacement is being rescanned:
         self._expandedSet = set()
+        # Memoised object-like macro expansions:
+        # {identifier : ExpansionCacheEntry, ...}
+        self._expansionCache = {}
+        # Identifiers of memoised expansions that depend on an identifier:
+        # {identifier : set([identifier, ...]), ...}
+        self._expansionDependents = {}
         # Can be set by a caller and will be written once to debug output before
         # any internal call to _debugTokenStream()
         self.debugMarker = None
@@ -196,10 +455,10 @@ class MacroEnv(object):
             # NOTE: set() is used for 2.x compatibility
             self._noDefineIdentifiers |= set(self._stdPredefMacros.keys())
             # Now insert the definitions in the internal representation.
-            for k in self._stdPredefMacros.keys():
-                # We use __setString here to avoid raising an
-                # ExceptionMacroReplacementPredefinedRedefintion
-                self.__setString(u'%s %s' % (k, self._stdPredefMacros[k]))
+            # We use __define here to avoid raising an
+            # ExceptionMacroReplacementPredefinedRedefintion
+            for aDef in self._predefLoader.retMacros(self._stdPredefMacros):
+                self.__define(aDef.copy(self._retRefStore()))
         # This is a map of {identifier : [class FileLineColumn, ...], ...}
         # Where there has been an #ifdef and nothing is defined
         # Then these macros, if present, could alter the outcome
@@ -210,6 +469,53 @@ class MacroEnv(object):
         """Clears the macro environment."""
         self._reset()
 
+    def fork(self):
+        """Returns a new macro environment that starts with the same state as
+        me. Subsequent ``#define``, ``#undef`` and macro references in either
+        environment are not seen by the other.
+
+        The map of macros is copy-on-write so this takes constant time with
+        respect to the number of macros currently defined, a macro is copied
+        when it is first referenced by either environment. The lists of
+        ``#undef``'d macros and ``#ifdef`` references of absent macros are
+        copied.
+
+        This can be used to take a snapshot after processing predefined
+        macros and pre-includes, for example. Any profiler is shared.
+
+        :returns: :py:class:`MacroEnv` -- The new environment.
+        """
+        if self._expandedSet:
+            raise ExceptionMacroEnv('Can not fork during macro expansion.')
+        retVal = copy.copy(self)
+        retVal._defineMap = self._defineMap.fork()
+        retVal._dependencyMap = self._dependencyMap.fork()
+        retVal._mentionMap = self._mentionMap.fork()
+        retVal._undefS = list(self._undefS)
+        retVal._expandedSet = set()
+        retVal._ifDefAbsentMacros = {
+            k : list(v) for k, v in self._ifDefAbsentMacros.items()
+        }
+        # Memoised expansions refer to macros that are now shared
+        for anEnv in (self, retVal):
+            anEnv._expansionCache = {}
+            anEnv._expansionDependents = {}
+        return retVal
+
+    def _retOwnedMacro(self, theIdentifier):
+        """Returns the macro for the identifier, copying it first if it is
+        shared with a forked environment. Use this before changing the macro
+        e.g. by incrementing its reference count.
+
+        :param theIdentifier: Macro name.
+        :type theIdentifier: ``str``
+
+        :returns: :py:class:`cpip.core.PpDefine.PpDefine` -- The macro.
+
+        :raises: ``KeyError`` if the macro is not defined.
+        """
+        return self._defineMap.retOwned(theIdentifier, PpDefine.PpDefine.copy)
+
     ###################
     # Section: Utility.
     ###################
@@ -229,7 +535,8 @@ class MacroEnv(object):
 
         :returns: ``bool`` -- False on failure.
         """
-        return self._expandedSet.issubset(set(self._defineMap.keys()))
+        myDefineMap = self._defineMap
+        return all([anId in myDefineMap for anId in self._expandedSet])
 
     def _debugTokenStream(self, thePrefix, theArg=''):
         """Writes to logging.debug() an interpretation of the token stream
@@ -288,7 +595,8 @@ class MacroEnv(object):
         :returns: ``str`` -- Macro name.
         """
         try:
-            myDef = PpDefine.PpDefine(theGen, theFile, theLine)
+            myDef = PpDefine.PpDefine(theGen, theFile, theLine,
+                                      self._retRefStore())
         except PpDefine.ExceptionCpipDefineInit as err:
             raise ExceptionMacroReplacementInit('{!r:s} File: {:s} line: {:d}'.format(str(err), theFile, theLine))
         # Test if attempting to redefine a predefined or undefineable identifier
@@ -329,8 +637,17 @@ class MacroEnv(object):
         else:
             # It is currently undefined so define it
             self._defineMap[ppD.identifier] = ppD
+            self._invalidateExpansions(ppD.identifier)
+            self._addDependencies(ppD)
         return ppD.identifier
 
+    def _retRefStore(self):
+        """Returns a new, empty, macro reference store.
+
+        :returns: :py:class:`cpip.core.MacroRefStore.MacroRefStore` -- The store.
+        """
+        return MacroRefStore.MacroRefStore(self._filePathTable, self._refPolicy)
+
     def undef(self, theGen, theFile, theLine):
         """Removes a definition from the map and adds the PpDefine to
         self._undefS. It returns None.
@@ -338,7 +655,10 @@ class MacroEnv(object):
         representation."""
         myDef = PpDefine.PpDefine(theGen, '', 1)
         try:
-            myMacro = self._defineMap.pop(myDef.identifier)
+            myMacro = self._retOwnedMacro(myDef.identifier)
+            del self._defineMap[myDef.identifier]
+            self._invalidateExpansions(myDef.identifier)
+            self._removeDependencies(myMacro)
             myMacro.undef(theFile, theLine)
             self._undefS.append(myMacro)
         except KeyError:
@@ -366,7 +686,7 @@ class MacroEnv(object):
             )
         myGen = myCpp.next()
         # Set file to '' and line to 1 as these are builtin macros
-        myDef = PpDefine.PpDefine(myGen, '', 1)
+        myDef = PpDefine.PpDefine(myGen, '', 1, self._retRefStore())
         self.__define(myDef)
     ###################################################################
     # End: Handling #define... and #undef... and specials like __LINE__
@@ -386,7 +706,7 @@ class MacroEnv(object):
         """
         if theTtt.isIdentifier():
             try:
-                self._defineMap[theTtt.t].incRefCount(theFileLineCol)
+                self._retOwnedMacro(theTtt.t).incRefCount(theFileLineCol)
                 return True
             except KeyError:
                 try:
@@ -424,7 +744,7 @@ class MacroEnv(object):
             raise ExceptionMacroEnv(
                 'defined() on non-identifier but: %s' % theTtt)
         try:
-            self._defineMap[theTtt.t].incRefCount(theFileLineCol)
+            self._retOwnedMacro(theTtt.t).incRefCount(theFileLineCol)
             if flagInvert:
                 return PpToken.PpToken('0', 'pp-number')
             return PpToken.PpToken('1', 'pp-number')
@@ -471,12 +791,6 @@ class MacroEnv(object):
         assert(self._assertDefineMapIntegrity())
         return theTtt.canReplace and theTtt.t in self._defineMap
 
-    def _hasExpanded(self, theTtt):
-        """Returns True if theTok represents a macro name that has already
-        been expanded."""
-        assert(self._assertDefineMapIntegrity())
-        return theTtt.t in self._expandedSet
-
     def replace(self, theTtt, theGen, theFileLineCol=None):
         """Given a PpToken this returns the replacement as a list of
         ``[class PpToken, ...]`` that is the result of the substitution of
@@ -499,109 +813,279 @@ class MacroEnv(object):
         return retVal
 
     def _expand(self, theTtt, theGen, theFileLineCol):
-        """Recursive call to expand macro symbols.
-        
+        """Expands a macro symbol and rescans the result.
+
+        This is iterative rather than recursive. Tokens waiting to be rescanned
+        are held in a queue, a replacement list is pushed onto the front
+        followed by a :py:data:`HideSetEnd` marker. While the macro identifier
+        is in the hide-set (``self._expandedSet``) any occurrence of it is
+        marked as not replaceable. theGen is only read when a function-like
+        macro at the end of the queue needs its argument list.
+
+        Arguments that need to be macro replaced are expanded in turn with
+        their own queue whilst the invocation waits on a stack of
+        :py:class:`ArgumentExpansion` objects.
+
         *theFileLineCol*
             Is a :py:class:`.FileLocation.FileLineCol object`.
+
+        :param theTtt: The token.
+        :type theTtt: :py:class:`cpip.core.PpToken.PpToken`
+
+        :param theGen: Token generator.
+        :type theGen: ``generator``
+
+        :param theFileLineCol: File location.
+        :type theFileLineCol: ``cpip.core.FileLocation.FileLineCol([str, int, int])``
+
+        :returns: ``list([cpip.core.PpToken.PpToken])`` -- Replacement tokens.
         """
         if self._enableTrace:
             self._debugTokenStream('_expand("%s")' % theTtt)
-        if not self.mightReplace(theTtt):
-            if self._enableTrace:
-                self._debugTokenStream('_expand("%s") nothing to do' % theTtt)
-            return [theTtt, ]
-        if self._hasExpanded(theTtt):
-            if self._enableTrace:
-                self._debugTokenStream(
-                            '_expand("%s") already expanded' % theTtt)
-            theTtt.canReplace = False
-            return [theTtt, ]
-        if self._enableTrace:
-            self._debugTokenStream('_expand() examining "%s"' % theTtt.t)
-        hasReplaced = False
-        myMacro = self._defineMap[theTtt.t]
-        if myMacro.isObjectTypeMacro:
-            # Object-like macro
-            rTokS = myMacro.replaceObjectStyleMacro()
-            if self._enableTrace:
-                self._debugTokenStream(
-                                '_expand("%s") object replacement' % theTtt,
-                                rTokS)
-            hasReplaced = True
+        # A dictionary is faster if no macro is shared with a fork
+        myDefineMap = self._defineMap.retDict()
+        if myDefineMap is None:
+            myDefineMap = self._defineMap
+            myRetMacro = self._retOwnedMacro
         else:
-            # Function-like macro
-            myPreamble = myMacro.consumeFunctionPreamble(theGen)
-            if self._enableTrace:
-                self._debugTokenStream('_expand() func preamble', myPreamble)
-            if myPreamble is not None:
-                rTokS = [theTtt, ] + myPreamble
-                hasReplaced = False
+            myRetMacro = myDefineMap.__getitem__
+        myExpandedSet = self._expandedSet
+        myProfiler = self._profiler
+        if myProfiler is not None and myProfiler.depth:
+            myProfiler.clearFrames()
+        # Invocations waiting for their arguments to be expanded
+        myArgStack = []
+        # Object-like macro expansions that might be memoised and, whilst
+        # there are any, a log of the macros replaced and identifiers seen
+        myRecS = []
+        myLogMacroS = []
+        myLogIdS = []
+        myQueue = collections.deque((theTtt,))
+        retTokS = []
+        while 1:
+            if not myQueue:
+                if not myArgStack:
+                    break
+                # Finished expanding an argument
+                myInv = myArgStack[-1]
+                myInv.expandedArgS.append(retTokS)
                 if self._enableTrace:
                     self._debugTokenStream(
-                        '_expand("%s") function preamble failed' % theTtt,
-                        rTokS)
-            else:
+                            '_expand("%s") function argument now' % myInv.ttt,
+                            retTokS)
+                if self._startArgumentExpansion(myInv):
+                    myQueue = collections.deque(myInv.argS[len(myInv.expandedArgS)])
+                    retTokS = []
+                    theGen = None
+                    continue
+                myArgStack.pop()
+                myQueue, retTokS, theGen = myInv.queue, myInv.out, myInv.gen
+                rTokS = myInv.macro.replaceArgumentList(myInv.expandedArgS)
+                self._pushReplacement(myQueue, myInv.ttt, myInv.macro, rTokS,
+                                      myInv.crossed, theFileLineCol)
+                continue
+            myTtt = myQueue.popleft()
+            if myTtt.__class__ is HideSetEnd:
+                myExpandedSet.remove(myTtt.identifier)
+                if myProfiler is not None:
+                    myProfiler.finish(myTtt.identifier)
+                if myRecS and myRecS[-1].identifier == myTtt.identifier:
+                    self._finishExpansionRecord(myRecS.pop(), retTokS,
+                                                myLogMacroS, myLogIdS)
+                    if not myRecS:
+                        del myLogMacroS[:]
+                        del myLogIdS[:]
+                continue
+            if myRecS and myTtt.isIdentifier():
+                myLogIdS.append(myTtt.t)
+            if not myTtt.canReplace or myTtt.t not in myDefineMap:
+                retTokS.append(myTtt)
+                continue
+            myMacro = myRetMacro(myTtt.t)
+            if myRecS and (not myMacro.isObjectTypeMacro \
+                           or myTtt.t in self.NAMES_NOT_CACHED):
+                # The expansion may depend on what follows or where it is
+                for aRec in myRecS:
+                    aRec.isCacheable = False
+            if myTtt.t in myExpandedSet:
                 if self._enableTrace:
-                    self._debugTokenStream('_expand() extracting arguments')
-                myArgS = myMacro.retArgumentListTokens(theGen)
+                    self._debugTokenStream(
+                                '_expand("%s") already expanded' % myTtt)
+                myTtt.canReplace = False
+                retTokS.append(myTtt)
+                continue
+            if myMacro.isObjectTypeMacro:
+                myEntry = self._expansionCache.get(myTtt.t)
+                if myEntry is not None \
+                and myExpandedSet.isdisjoint(myEntry.dependencies):
+                    # Memoised expansion, replay the references
+                    if myProfiler is not None:
+                        myProfiler.start(myTtt.t, retTokS)
+                    for aMacro in myEntry.macros:
+                        aMacro.incRefCount(theFileLineCol)
+                    retTokS.extend([aTtt.copy() for aTtt in myEntry.tokens])
+                    if myProfiler is not None:
+                        myProfiler.finishCacheHit(
+                            myTtt.t, [m.identifier for m in myEntry.macros[1:]])
+                    if myRecS:
+                        myLogMacroS.extend(myEntry.macros)
+                        myLogIdS.extend(myEntry.dependencies)
+                    continue
+                rTokS = myMacro.replaceObjectStyleMacro()
                 if self._enableTrace:
-                    self._debugTokenStream('_expand() arguments %s' % myArgS)
-                if myMacro.expandArguments:
-                    # Expand out each argument
-                    myExpandedArgS = []
-                    for argTokS in myArgS:
-                        if self._enableTrace:
-                            self._debugTokenStream(
-                                '_expand("%s") function argument was' \
-                                % theTtt, argTokS)
-                        if argTokS != myMacro.PLACEMARKER:
-                            myGen = next(ListAsGenerator(argTokS, None))
-                            myExpArgTokS = []
-                            while 1:
-                                try:
-                                    myExpArgTokS += self._expand(
-                                                                 next(myGen),
-                                                                 myGen,
-                                                                 theFileLineCol,
-                                                                 )
-                                except StopIteration:
-                                    break
-                            if self._enableTrace:
-                                self._debugTokenStream(
-                                        '_expand("%s") function argument now' \
-                                        % theTtt, myExpArgTokS)
-                            myExpandedArgS.append(myExpArgTokS)
-                        else:
-                            myExpandedArgS.append(myMacro.PLACEMARKER)
-                    rTokS = myMacro.replaceArgumentList(myExpandedArgS)
-                else:
-                    rTokS = myMacro.replaceArgumentList(myArgS)
+                    self._debugTokenStream(
+                                '_expand("%s") object replacement' % myTtt,
+                                rTokS)
+                if myTtt.t not in self.NAMES_NOT_CACHED:
+                    myRecS.append(
+                        ExpansionRecord(myTtt.t, retTokS, len(retTokS),
+                                        len(myLogMacroS), len(myLogIdS))
+                    )
+                if myRecS:
+                    myLogMacroS.append(myMacro)
+                if myProfiler is not None:
+                    myProfiler.start(myTtt.t, retTokS)
+                self._pushReplacement(myQueue, myTtt, myMacro, rTokS, (),
+                                      theFileLineCol)
+                continue
+            # Function-like macro
+            mySource = RescanTokenSource(myQueue, theGen)
+            myPreamble = myMacro.consumeFunctionPreamble(mySource)
+            if myPreamble is not None:
                 if self._enableTrace:
                     self._debugTokenStream(
-                                '_expand("%s") function now' % theTtt, rTokS)
-                hasReplaced = True
-        if hasReplaced:
-            # Increment the reference count for this macro
-            myMacro.incRefCount(theFileLineCol)
-        else:
+                        '_expand("%s") function preamble failed' % myTtt,
+                        myPreamble)
+                retTokS.append(myTtt)
+                retTokS.extend(myPreamble)
+                myQueue.extendleft(reversed(mySource.crossed))
+                continue
+            myArgS = myMacro.retArgumentListTokens(mySource)
+            if myProfiler is not None:
+                myProfiler.start(
+                    myTtt.t, retTokS,
+                    1 + sum([len(anArg) for anArg in myArgS if anArg]))
             if self._enableTrace:
-                self._debugTokenStream(
-                            '_expand("%s") not hasReplaced.' % theTtt, rTokS)
-            return rTokS
-        # Reexamination
-        reexTokS = []
+                self._debugTokenStream('_expand() arguments %s' % myArgS)
+            if myMacro.expandArguments:
+                myInv = ArgumentExpansion(myTtt, myMacro, myArgS,
+                                          mySource.crossed, myQueue, retTokS,
+                                          theGen)
+                if self._startArgumentExpansion(myInv):
+                    myArgStack.append(myInv)
+                    myQueue = collections.deque(myArgS[len(myInv.expandedArgS)])
+                    retTokS = []
+                    theGen = None
+                    continue
+                rTokS = myMacro.replaceArgumentList(myInv.expandedArgS)
+            else:
+                rTokS = myMacro.replaceArgumentList(myArgS)
+            self._pushReplacement(myQueue, myTtt, myMacro, rTokS,
+                                  mySource.crossed, theFileLineCol)
         if self._enableTrace:
-            self._debugTokenStream('_expand("%s") reexamine' % theTtt, rTokS)
-        self._expandedSet.add(theTtt.t)
-        myListAsGen = ListAsGenerator(rTokS, theGen)
-        myGen = next(myListAsGen)
-        while not myListAsGen.listIsEmpty:
-            reexTokS += self._expand(next(myGen), myGen, theFileLineCol)
-        self._expandedSet.remove(theTtt.t)
+            self._debugTokenStream('_expand("%s") reexamined' % theTtt, retTokS)
+        return retTokS
+
+    def _finishExpansionRecord(self, theRec, theTokS, theLogMacroS, theLogIdS):
+        """Called when the rescan of a recorded object-like macro expansion
+        is complete, this adds it to the expansion cache if possible.
+
+        It is not cached if the expansion involved a function-like macro, or a
+        name in :py:attr:`NAMES_NOT_CACHED`, or any identifier that it depends
+        on is in the hide-set of the surrounding rescan.
+
+        :param theRec: The record.
+        :type theRec: :py:class:`ExpansionRecord`
+
+        :param theTokS: The output tokens that the record refers to.
+        :type theTokS: ``list([cpip.core.PpToken.PpToken])``
+
+        :param theLogMacroS: Log of macros replaced.
+        :type theLogMacroS: ``list([cpip.core.PpDefine.PpDefine])``
+
+        :param theLogIdS: Log of identifiers seen.
+        :type theLogIdS: ``list([str])``
+
+        :returns: ``NoneType``
+        """
+        if not theRec.isCacheable or theRec.out is not theTokS:
+            return
+        myDepS = frozenset(theLogIdS[theRec.logIdIdx:]) | {theRec.identifier}
+        if not self._expandedSet.isdisjoint(myDepS):
+            return
+        self._expansionCache[theRec.identifier] = ExpansionCacheEntry(
+            tuple([aTtt.copy() for aTtt in theTokS[theRec.outIdx:]]),
+            tuple(theLogMacroS[theRec.logMacroIdx:]),
+            myDepS,
+        )
+        for anId in myDepS:
+            try:
+                self._expansionDependents[anId].add(theRec.identifier)
+            except KeyError:
+                self._expansionDependents[anId] = {theRec.identifier}
+
+    def _invalidateExpansions(self, theIdentifier):
+        """Removes any memoised expansions that depend on the identifier. This
+        is called when the identifier is defined or undefined.
+
+        :param theIdentifier: Macro name.
+        :type theIdentifier: ``str``
+
+        :returns: ``NoneType``
+        """
+        for anId in self._expansionDependents.pop(theIdentifier, ()):
+            self._expansionCache.pop(anId, None)
+
+    def _startArgumentExpansion(self, theInv):
+        """Skips over any placemarker arguments of a function-like macro
+        invocation and returns True if there is an argument to expand.
+
+        :param theInv: The invocation.
+        :type theInv: :py:class:`ArgumentExpansion`
+
+        :returns: ``bool`` -- True if the next argument needs expanding.
+        """
+        while len(theInv.expandedArgS) < len(theInv.argS):
+            if theInv.argS[len(theInv.expandedArgS)] != theInv.macro.PLACEMARKER:
+                return True
+            theInv.expandedArgS.append(theInv.macro.PLACEMARKER)
+        return False
+
+    def _pushReplacement(self, theQueue, theTtt, theMacro, theTokS, theCrossed,
+                         theFileLineCol):
+        """Records a macro replacement and puts the replacement tokens on the
+        front of the rescan queue with the macro identifier in the hide-set.
+        Any markers passed over when reading arguments follow so that they
+        take effect once the replacement has been rescanned.
+
+        :param theQueue: The rescan queue.
+        :type theQueue: ``collections.deque([cpip.core.PpToken.PpToken, HideSetEnd])``
+
+        :param theTtt: The macro name token.
+        :type theTtt: :py:class:`cpip.core.PpToken.PpToken`
+
+        :param theMacro: The macro.
+        :type theMacro: :py:class:`cpip.core.PpDefine.PpDefine`
+
+        :param theTokS: The replacement tokens.
+        :type theTokS: ``list([cpip.core.PpToken.PpToken])``
+
+        :param theCrossed: Markers passed over when reading the arguments.
+        :type theCrossed: ``list([HideSetEnd]), tuple([])``
+
+        :param theFileLineCol: File location.
+        :type theFileLineCol: ``cpip.core.FileLocation.FileLineCol([str, int, int])``
+
+        :returns: ``NoneType``
+        """
         if self._enableTrace:
-            self._debugTokenStream(
-                            '_expand("%s") reexamined' % theTtt, reexTokS)
-        return reexTokS
+            self._debugTokenStream('_expand("%s") reexamine' % theTtt, theTokS)
+        # Increment the reference count for this macro
+        theMacro.incRefCount(theFileLineCol)
+        self._expandedSet.add(theTtt.t)
+        theQueue.extendleft(reversed(theCrossed))
+        theQueue.appendleft(HideSetEnd(theTtt.t))
+        theQueue.extendleft(reversed(theTokS))
 
     ############################
     # Section: Accessor methods.
@@ -660,6 +1144,15 @@ class MacroEnv(object):
         for aM in self.genMacrosInScope(theIdentifier):
             yield aM
 
+    @property
+    def profiler(self):
+        """The macro expansion profiler, None if expansion is not being
+        profiled.
+
+        :returns: ``NoneType``, :py:class:`cpip.core.MacroProfiler.MacroProfiler` -- The profiler.
+        """
+        return self._profiler
+
     def hasMacro(self, theIdentifier):
         """Returns True if the environment has the macro.
         
@@ -715,8 +1208,9 @@ class MacroEnv(object):
         :returns: :py:class:`cpip.util.Tree.DuplexAdjacencyList` -- The dependencies.
         """
         ret = DuplexAdjacencyList()
+        myDependencyMap = self._dependencyMap
         for macroIdentifier in self.macros():
-            for depMacro in self._staticMacroDependencies(macroIdentifier):
+            for depMacro in myDependencyMap[macroIdentifier]:
                 ret.add(macroIdentifier, depMacro)
         return ret
 
@@ -729,14 +1223,96 @@ class MacroEnv(object):
 
         :returns: ``list([]),list([str])`` -- List of macro names.
         """
-        ret = []
-        macro = self.macro(theIdentifier)
-        for tok in macro.replacementTokens:
-            if tok.tt == 'identifier' \
-            and self.hasMacro(tok.t) \
-            and tok.t not in ret:
-                ret.append(tok.t)
-        return ret
+        return self.macroDependencies(theIdentifier)
+
+    def macroDependencies(self, theIdentifier):
+        """Returns the currently defined macros that the replacement list of a
+        currently defined macro names, in replacement list order.
+        Will raise a :py:class:`ExceptionMacroEnvNoMacroDefined` is undefined.
+
+        :param theIdentifier: Macro name.
+        :type theIdentifier: ``str``
+
+        :returns: ``list([]),list([str])`` -- List of macro names.
+        """
+        try:
+            return self._dependencyMap[theIdentifier][:]
+        except KeyError:
+            raise ExceptionMacroEnvNoMacroDefined(
+                    'Macro %s is not currently defined' % theIdentifier
+                    )
+
+    def macroDependents(self, theIdentifier):
+        """Returns the currently defined macros whose replacement list names
+        the identifier, in order of definition. The identifier need not be
+        defined.
+
+        :param theIdentifier: Macro name.
+        :type theIdentifier: ``str``
+
+        :returns: ``list([]),list([str])`` -- List of macro names.
+        """
+        return list(self._mentionMap.get(theIdentifier, ()))
+
+    def _retIdentifierS(self, theMacro):
+        """Returns the distinct identifiers in the replacement list of the
+        macro in order of first appearance.
+
+        :param theMacro: The macro.
+        :type theMacro: :py:class:`cpip.core.PpDefine.PpDefine`
+
+        :returns: ``list([]),list([str])`` -- List of identifiers.
+        """
+        return list(collections.OrderedDict.fromkeys(
+            [t.t for t in theMacro.replacementTokens if t.tt == 'identifier']
+        ))
+
+    def _addDependencies(self, theMacro):
+        """Updates the dependency maps when a macro is defined. Only the
+        macros that name it are revisited.
+
+        :param theMacro: The macro.
+        :type theMacro: :py:class:`cpip.core.PpDefine.PpDefine`
+
+        :returns: ``NoneType``
+        """
+        myId = theMacro.identifier
+        myIdentifierS = self._retIdentifierS(theMacro)
+        for anId in myIdentifierS:
+            try:
+                self._mentionMap.retOwned(anId, dict)[myId] = None
+            except KeyError:
+                self._mentionMap[anId] = {myId : None}
+        self._dependencyMap[myId] = [
+            anId for anId in myIdentifierS if anId in self._defineMap
+        ]
+        for anId in self._mentionMap.get(myId, ()):
+            if anId != myId:
+                # Rebuild to keep replacement list order
+                self._dependencyMap[anId] = [
+                    i for i in self._retIdentifierS(self._defineMap[anId])
+                        if i in self._defineMap
+                ]
+
+    def _removeDependencies(self, theMacro):
+        """Updates the dependency maps when a macro is undefined.
+
+        :param theMacro: The macro.
+        :type theMacro: :py:class:`cpip.core.PpDefine.PpDefine`
+
+        :returns: ``NoneType``
+        """
+        myId = theMacro.identifier
+        for anId in self._retIdentifierS(theMacro):
+            myMentionS = self._mentionMap.retOwned(anId, dict)
+            del myMentionS[myId]
+            if not myMentionS:
+                del self._mentionMap[anId]
+        del self._dependencyMap[myId]
+        for anId in self._mentionMap.get(myId, ()):
+            self._dependencyMap[anId] = [
+                i for i in self._dependencyMap[anId] if i != myId
+            ]
 
     #---------------------------
     # END: Macro dependencies
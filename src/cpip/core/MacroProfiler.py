@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+# CPIP is a C/C++ Preprocessor implemented in Python.
+# Copyright (C) 2008-2017 Paul Ross
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Paul Ross: apaulross@gmail.com
+
+"""Profiles macro expansion.
+
+A :py:class:`MacroProfiler` is given to a
+:py:class:`cpip.core.MacroEnv.MacroEnv` which tells it when the expansion of
+each macro starts and when the rescan of its replacement is finished. For each
+macro identifier this records:
+
+* The number of expansions and how many of these were memoised.
+* The cumulative time, including the expansion of the macros in the
+  replacement, and the self time that excludes them.
+* The tokens in, the macro name and any arguments, and the tokens out so the
+  token amplification can be found.
+* The deepest nesting of expansions within an expansion of the macro.
+
+Example::
+
+    myProfiler = MacroProfiler()
+    myLexer = PpLexer.PpLexer(..., macroProfiler=myProfiler)
+    for aTok in myLexer.ppTokens():
+        pass
+    for aProfile in myProfiler.genProfiles('selfTime'):
+        print(aProfile.identifier, aProfile.expansions, aProfile.selfTime)
+    myProfiler.writeJson(myStream)
+"""
+
+__author__  = 'Paul Ross'
+__date__    = '2023-08-01'
+__rights__  = 'Copyright (c) 2008-2017 Paul Ross'
+
+import json
+import time
+
+from cpip import ExceptionCpip
+
+class ExceptionMacroProfiler(ExceptionCpip):
+    """Exception when handling a MacroProfiler."""
+    pass
+
+#: Attributes of a :py:class:`MacroProfile` that profiles can be sorted by.
+SORT_KEYS = (
+    'identifier',
+    'expansions',
+    'cacheHits',
+    'cumulativeTime',
+    'selfTime',
+    'tokensIn',
+    'tokensOut',
+    'amplification',
+    'maxNesting',
+)
+
+class MacroProfile(object):
+    """The profile of a macro identifier. Macros that are redefined share a
+    profile.
+
+    :param theIdentifier: Macro name.
+    :type theIdentifier: ``str``
+
+    :returns: ``NoneType``
+    """
+    __slots__ = ('identifier', 'expansions', 'cacheHits', 'cumulativeTime',
+                 'selfTime', 'tokensIn', 'tokensOut', 'maxNesting')
+    def __init__(self, theIdentifier):
+        self.identifier = theIdentifier
+        self.expansions = 0
+        self.cacheHits = 0
+        self.cumulativeTime = 0.0
+        self.selfTime = 0.0
+        self.tokensIn = 0
+        self.tokensOut = 0
+        self.maxNesting = 0
+
+    @property
+    def amplification(self):
+        """The ratio of tokens out to tokens in.
+
+        :returns: ``float`` -- The amplification, zero if no tokens in.
+        """
+        if self.tokensIn == 0:
+            return 0.0
+        return self.tokensOut / float(self.tokensIn)
+
+    def asDict(self):
+        """Returns the profile as a dictionary.
+
+        :returns: ``dict({str : [str, int, float]})`` -- The profile.
+        """
+        return {k : getattr(self, k) for k in SORT_KEYS}
+
+class ProfileFrame(object):
+    """An expansion in progress.
+
+    :param theIdentifier: Macro name.
+    :type theIdentifier: ``str``
+
+    :param theStart: The time the expansion started.
+    :type theStart: ``float``
+
+    :param theOut: The output token list that the expansion is appended to.
+    :type theOut: ``list([cpip.core.PpToken.PpToken])``
+
+    :param theTokensIn: The number of tokens in the invocation.
+    :type theTokensIn: ``int``
+
+    :returns: ``NoneType``
+    """
+    __slots__ = ('identifier', 'start', 'out', 'outIdx', 'tokensIn',
+                 'childTime', 'maxNesting')
+    def __init__(self, theIdentifier, theStart, theOut, theTokensIn):
+        self.identifier = theIdentifier
+        self.start = theStart
+        self.out = theOut
+        self.outIdx = len(theOut)
+        self.tokensIn = theTokensIn
+        # Time spent in nested expansions
+        self.childTime = 0.0
+        # Deepest nesting of expansions within this one
+        self.maxNesting = 0
+
+class MacroProfiler(object):
+    """Accumulates the profiles of macro expansions.
+
+    :param theTimer: Function that returns the time in seconds.
+    :type theTimer: ``function``
+
+    :returns: ``NoneType``
+    """
+    def __init__(self, theTimer=time.perf_counter):
+        self._timer = theTimer
+        # {identifier : MacroProfile, ...}
+        self._profileMap = {}
+        # Stack of ProfileFrame objects
+        self._frameS = []
+        # {identifier : number of frames on the stack, ...} so that the
+        # cumulative time of recursive expansion is only counted once.
+        self._activeMap = {}
+        self._maxDepth = 0
+
+    def __len__(self):
+        return len(self._profileMap)
+
+    def _retProfile(self, theIdentifier):
+        try:
+            return self._profileMap[theIdentifier]
+        except KeyError:
+            retVal = self._profileMap[theIdentifier] = MacroProfile(theIdentifier)
+            return retVal
+
+    @property
+    def maxDepth(self):
+        """The deepest nesting of macro expansions seen.
+
+        :returns: ``int`` -- Depth, 1 is a macro whose replacement has no
+            macros in it.
+        """
+        return self._maxDepth
+
+    @property
+    def depth(self):
+        """The number of expansions currently in progress.
+
+        :returns: ``int`` -- Depth.
+        """
+        return len(self._frameS)
+
+    def clearFrames(self):
+        """Discards any expansions in progress, for example those left by an
+        exception during macro expansion.
+
+        :returns: ``NoneType``
+        """
+        del self._frameS[:]
+        self._activeMap.clear()
+
+    def start(self, theIdentifier, theOut, theTokensIn=1):
+        """Records the start of the expansion of a macro.
+
+        :param theIdentifier: Macro name.
+        :type theIdentifier: ``str``
+
+        :param theOut: The output token list that the fully rescanned
+            replacement is appended to.
+        :type theOut: ``list([cpip.core.PpToken.PpToken])``
+
+        :param theTokensIn: The number of tokens in the invocation.
+        :type theTokensIn: ``int``
+
+        :returns: ``NoneType``
+        """
+        self._frameS.append(
+            ProfileFrame(theIdentifier, self._timer(), theOut, theTokensIn)
+        )
+        self._activeMap[theIdentifier] = self._activeMap.get(theIdentifier, 0) + 1
+        if len(self._frameS) > self._maxDepth:
+            self._maxDepth = len(self._frameS)
+
+    def finish(self, theIdentifier):
+        """Records the end of the rescan of a macro replacement.
+
+        :param theIdentifier: Macro name.
+        :type theIdentifier: ``str``
+
+        :returns: ``NoneType``
+
+        :raises: ``ExceptionMacroProfiler`` if this is not the innermost
+            expansion in progress.
+        """
+        if not self._frameS or self._frameS[-1].identifier != theIdentifier:
+            raise ExceptionMacroProfiler(
+                'finish("%s") is not the innermost expansion' % theIdentifier)
+        myFrame = self._frameS.pop()
+        myElapsed = self._timer() - myFrame.start
+        myProfile = self._retProfile(theIdentifier)
+        myProfile.expansions += 1
+        myProfile.selfTime += myElapsed - myFrame.childTime
+        myProfile.tokensIn += myFrame.tokensIn
+        myProfile.tokensOut += len(myFrame.out) - myFrame.outIdx
+        if myFrame.maxNesting > myProfile.maxNesting:
+            myProfile.maxNesting = myFrame.maxNesting
+        self._activeMap[theIdentifier] -= 1
+        if self._activeMap[theIdentifier] == 0:
+            del self._activeMap[theIdentifier]
+            myProfile.cumulativeTime += myElapsed
+        if self._frameS:
+            myParent = self._frameS[-1]
+            myParent.childTime += myElapsed
+            if myFrame.maxNesting + 1 > myParent.maxNesting:
+                myParent.maxNesting = myFrame.maxNesting + 1
+
+    def finishCacheHit(self, theIdentifier, theIdentifierS):
+        """Records the end of an expansion that was memoised. The other
+        macros whose expansion was replayed are counted but not timed.
+
+        :param theIdentifier: Macro name.
+        :type theIdentifier: ``str``
+
+        :param theIdentifierS: The other macros in the expansion.
+        :type theIdentifierS: ``list([str])``
+
+        :returns: ``NoneType``
+        """
+        self._retProfile(theIdentifier).cacheHits += 1
+        self.finish(theIdentifier)
+        for anId in theIdentifierS:
+            myProfile = self._retProfile(anId)
+            myProfile.expansions += 1
+            myProfile.cacheHits += 1
+
+    def profile(self, theIdentifier):
+        """Returns the profile of a macro.
+
+        :param theIdentifier: Macro name.
+        :type theIdentifier: ``str``
+
+        :returns: :py:class:`MacroProfile` -- The profile.
+
+        :raises: ``KeyError`` if the macro has not been expanded.
+        """
+        return self._profileMap[theIdentifier]
+
+    def genProfiles(self, theSortKey='identifier', isReversed=None):
+        """Yields the profiles sorted by one of :py:data:`SORT_KEYS`. By
+        default identifiers are in ascending order and anything else is in
+        descending order.
+
+        :param theSortKey: The attribute to sort by.
+        :type theSortKey: ``str``
+
+        :param isReversed: Descending order if True, None for the default.
+        :type isReversed: ``NoneType, bool``
+
+        :returns: :py:class:`MacroProfile` -- Yields profiles.
+
+        :raises: ``ExceptionMacroProfiler`` if the sort key is unknown.
+        """
+        if theSortKey not in SORT_KEYS:
+            raise ExceptionMacroProfiler('Unknown sort key "%s"' % theSortKey)
+        if isReversed is None:
+            isReversed = theSortKey != 'identifier'
+        myProfileS = sorted(self._profileMap.values(),
+                            key=lambda p: p.identifier)
+        myProfileS.sort(key=lambda p: getattr(p, theSortKey),
+                        reverse=isReversed)
+        for aProfile in myProfileS:
+            yield aProfile
+
+    def retDict(self, theSortKey='cumulativeTime'):
+        """Returns the profiles as a dictionary suitable for JSON.
+
+        :param theSortKey: The attribute to sort the profiles by.
+        :type theSortKey: ``str``
+
+        :returns: ``dict({str : [int, list([dict({str : [str, int, float]})])]})`` -- The profiles.
+        """
+        return {
+            'maxDepth' : self._maxDepth,
+            'macros' : [p.asDict() for p in self.genProfiles(theSortKey)],
+        }
+
+    def writeJson(self, theStream, theSortKey='cumulativeTime'):
+        """Writes the profiles as JSON.
+
+        :param theStream: The output stream.
+        :type theStream: ``_io.TextIOWrapper``
+
+        :param theSortKey: The attribute to sort the profiles by.
+        :type theSortKey: ``str``
+
+        :returns: ``NoneType``
+        """
+        json.dump(self.retDict(theSortKey), theStream, indent=2, sort_keys=True)
+        theStream.write('\n')
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# CPIP is a C/C++ Preprocessor implemented in Python.
+# Copyright (C) 2008-2017 Paul Ross
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Paul Ross: apaulross@gmail.com
+
+"""Records where a macro is referenced.
+
+A macro such as ``NULL`` can be referenced millions of times in a translation
+unit. Rather than a list of :py:class:`cpip.core.FileLocation.FileLineCol`
+objects a :py:class:`MacroRefStore` packs the file ID, line and column of
+each reference into three ``array`` columns. File IDs come from a
+:py:class:`cpip.core.FilePathTable.FilePathTable` that is usually shared by
+every macro in the run.
+
+What is recorded is controlled by a :py:data:`RefPolicy` which can limit the
+number of references, sample them or record only the first reference on each
+line. Whatever the policy every reference is counted.
+
+Example::
+
+    myStore = MacroRefStore(myFilePathTable, RefPolicy(True, 1000, 1))
+    myStore.add(FileLocation.FileLineCol('spam.h', 12, 4))
+    for aFlc in myStore:
+        print(aFlc.fileId, aFlc.lineNum, aFlc.colNum)
+"""
+
+__author__  = 'Paul Ross'
+__date__    = '2023-07-11'
+__rights__  = 'Copyright (c) 2008-2017 Paul Ross'
+
+import array
+import collections
+
+from cpip import ExceptionCpip
+from cpip.core import FileLocation
+from cpip.core import FilePathTable
+
+class ExceptionMacroRefStore(ExceptionCpip):
+    """Exception when handling a MacroRefStore."""
+    pass
+
+#: A reference policy is:
+#:
+#: * ``uniqueLines`` - If True only the first reference on any file/line is
+#:   recorded.
+#: * ``maxRefs`` - The maximum number of references recorded for each macro,
+#:   zero for no limit.
+#: * ``sampleEvery`` - Record every Nth reference, 1 records them all.
+RefPolicy = collections.namedtuple('RefPolicy', 'uniqueLines maxRefs sampleEvery')
+
+#: The default policy records every reference.
+DEFAULT_REF_POLICY = RefPolicy(False, 0, 1)
+
+#: The type code of the ``array`` columns
+ARRAY_TYPECODE = 'l'
+
+def retRefPolicy(uniqueLines=False, maxRefs=0, sampleEvery=1):
+    """Returns a RefPolicy from, say, command line arguments.
+
+    :param uniqueLines: Record only the first reference on each line.
+    :type uniqueLines: ``bool``
+
+    :param maxRefs: Maximum references recorded per macro, zero for no limit.
+    :type maxRefs: ``int``
+
+    :param sampleEvery: Record every Nth reference.
+    :type sampleEvery: ``int``
+
+    :returns: :py:data:`RefPolicy` -- The policy.
+
+    :raises: ``ExceptionMacroRefStore`` if a value is out of range.
+    """
+    if maxRefs < 0:
+        raise ExceptionMacroRefStore('Maximum references must be >= 0 not %d' % maxRefs)
+    if sampleEvery < 1:
+        raise ExceptionMacroRefStore('Sample interval must be >= 1 not %d' % sampleEvery)
+    return RefPolicy(bool(uniqueLines), maxRefs, sampleEvery)
+
+class MacroRefStore(object):
+    """A compact, append only, store of the places where a macro has been
+    referenced.
+
+    Iterating yields :py:class:`cpip.core.FileLocation.FileLineCol` objects
+    in the order that they were recorded.
+
+    :param theFilePathTable: The table that allocates file IDs, if None the
+        store creates its own.
+    :type theFilePathTable: ``NoneType``, :py:class:`cpip.core.FilePathTable.FilePathTable`
+
+    :param thePolicy: The reference policy, None for the default.
+    :type thePolicy: ``NoneType``, :py:data:`RefPolicy`
+
+    :returns: ``NoneType``
+    """
+    def __init__(self, theFilePathTable=None, thePolicy=None):
+        if theFilePathTable is None:
+            theFilePathTable = FilePathTable.FilePathTable()
+        self._filePathTable = theFilePathTable
+        self._policy = thePolicy or DEFAULT_REF_POLICY
+        self._fileIdS = array.array(ARRAY_TYPECODE)
+        self._lineS = array.array(ARRAY_TYPECODE)
+        self._colS = array.array(ARRAY_TYPECODE)
+        # Number of references offered to add()
+        self._numRefs = 0
+        # {(fileId, line), ...} only used if the policy is uniqueLines
+        self._lineSet = set()
+
+    def __len__(self):
+        """The number of references recorded."""
+        return len(self._lineS)
+
+    def __iter__(self):
+        """Yields each recorded reference as a FileLineCol."""
+        myPath = self._filePathTable.path
+        for aFid, aLine, aCol in zip(self._fileIdS, self._lineS, self._colS):
+            yield FileLocation.FileLineCol(myPath(aFid), aLine, aCol)
+
+    def __getitem__(self, theIdx):
+        return FileLocation.FileLineCol(
+            self._filePathTable.path(self._fileIdS[theIdx]),
+            self._lineS[theIdx],
+            self._colS[theIdx],
+        )
+
+    def __getstate__(self):
+        # The line set can be recreated from the columns
+        retVal = self.__dict__.copy()
+        del retVal['_lineSet']
+        return retVal
+
+    def __setstate__(self, theState):
+        self.__dict__.update(theState)
+        if self._policy.uniqueLines:
+            self._lineSet = set(zip(self._fileIdS, self._lineS))
+        else:
+            self._lineSet = set()
+
+    @property
+    def policy(self):
+        """The reference policy.
+
+        :returns: :py:data:`RefPolicy` -- The policy.
+        """
+        return self._policy
+
+    @property
+    def filePathTable(self):
+        """The table that allocates the file IDs.
+
+        :returns: :py:class:`cpip.core.FilePathTable.FilePathTable` -- The table.
+        """
+        return self._filePathTable
+
+    @property
+    def numRefs(self):
+        """The number of references offered to :py:meth:`add()` whether
+        recorded or not.
+
+        :returns: ``int`` -- Reference count.
+        """
+        return self._numRefs
+
+    @property
+    def numNotRecorded(self):
+        """The number of references that were not recorded because of the
+        policy.
+
+        :returns: ``int`` -- Count of references not recorded.
+        """
+        return self._numRefs - len(self._lineS)
+
+    def copy(self):
+        """Returns a copy of this store that shares my FilePathTable and
+        policy.
+
+        :returns: :py:class:`MacroRefStore` -- The copy.
+        """
+        retVal = MacroRefStore(self._filePathTable, self._policy)
+        retVal._fileIdS = array.array(ARRAY_TYPECODE, self._fileIdS)
+        retVal._lineS = array.array(ARRAY_TYPECODE, self._lineS)
+        retVal._colS = array.array(ARRAY_TYPECODE, self._colS)
+        retVal._numRefs = self._numRefs
+        retVal._lineSet = set(self._lineSet)
+        return retVal
+
+    def add(self, theFileLineCol):
+        """Adds a reference subject to the policy.
+
+        :param theFileLineCol: File location.
+        :type theFileLineCol: ``cpip.core.FileLocation.FileLineCol([str, int, int])``
+
+        :returns: ``bool`` -- True if the reference was recorded.
+        """
+        self._numRefs += 1
+        myPolicy = self._policy
+        if myPolicy.maxRefs and len(self._lineS) >= myPolicy.maxRefs:
+            return False
+        if myPolicy.sampleEvery > 1 and (self._numRefs - 1) % myPolicy.sampleEvery:
+            return False
+        myFid = self._filePathTable.fileId(theFileLineCol.fileId)
+        if myPolicy.uniqueLines:
+            myKey = (myFid, theFileLineCol.lineNum)
+            if myKey in self._lineSet:
+                return False
+            self._lineSet.add(myKey)
+        self._fileIdS.append(myFid)
+        self._lineS.append(theFileLineCol.lineNum)
+        self._colS.append(theFileLineCol.colNum)
+        return True
+
+    def genUniqueRefs(self):
+        """Yields ``(fileId, lineNum, colNum)`` for each distinct recorded
+        reference in the order they were first recorded. The ``fileId`` is the
+        file path.
+
+        :returns: ``tuple([str, int, int])`` -- Distinct references.
+        """
+        mySeen = set()
+        myPath = self._filePathTable.path
+        for aRef in zip(self._fileIdS, self._lineS, self._colS):
+            if aRef not in mySeen:
+                mySeen.add(aRef)
+                yield myPath(aRef[0]), aRef[1], aRef[2]
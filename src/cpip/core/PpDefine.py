@@ -40,6 +40,7 @@ from cpip.core import PpToken
 from cpip.core import PpTokenCount
 from cpip.core import PpWhitespace
 from cpip.core import FileLocation
+from cpip.core import MacroRefStore
 #from ListGen import ListAsGenerator
 
 class ExceptionCpipDefine(ExceptionCpip):
@@ -161,7 +162,7 @@ class PpDefine(object):
     ########################
     # Section: Construction.
     ########################
-    def __init__(self, theTokGen, theFileId, theLine):
+    def __init__(self, theTokGen, theFileId, theLine, theRefStore=None):
         """Takes a preprocess token generator and creates a macro.
         The generator (e.g. a instance of PpTokeniser.next()) can
         generate pp-tokens that appear after the start of the #define directive
@@ -205,6 +206,10 @@ class PpDefine(object):
             in theFile that the ``#define`` statement occurred. This must be >= 1
         :type theLine: ``int``
 
+        :param theRefStore: Where to record the macro references, if None a
+            store with the default policy is created.
+        :type theRefStore: ``NoneType``, :py:class:`cpip.core.MacroRefStore.MacroRefStore`
+
         :returns: ``NoneType``
         """
         if theLine < FileLocation.START_LINE:
@@ -235,9 +240,11 @@ class PpDefine(object):
         self._expandArguments = None
         # Reference count incremented on replacement or testing
         self._refCount = self.INITIAL_REF_COUNT
-        # List of FileLocation.FileLineCol objects where replacement
+        # Compact store of the file/line/column where replacement
         # has happened
-        self._refFileLineColS = []
+        if theRefStore is None:
+            theRefStore = MacroRefStore.MacroRefStore()
+        self._refStore = theRefStore
         # Variadic macro flag
         self._isVariadic = False
         try:
@@ -255,6 +262,7 @@ class PpDefine(object):
                     ExceptionCpipDefineInit(
                         'Missing #define <name> but token type "%s" value "%s" in token stream at %s' \
                                             % (myTtt.tt, myTtt.t, self._fileLine)))
+            myTtt.resolveLineCol()
             self._identifier = myTtt
             myTtt = self._retToken(theTokGen)
             # Next token must be LPAREN for function type macros or
@@ -462,6 +470,8 @@ class PpDefine(object):
             self._replaceTokTypesS[-1].merge(theTtt)
         else:
             theTtt.isReplacement = True
+            # The macro outlives the file so do not keep its line index
+            theTtt.resolveLineCol()
             self._replaceTokTypesS.append(theTtt)
     ####################
     # End: Construction.
@@ -675,7 +685,7 @@ class PpDefine(object):
                 )            
         self._refCount += 1
         if theFileLineCol is not None:
-            self._refFileLineColS.append(theFileLineCol)
+            self._refStore.add(theFileLineCol)
     
     #=============================================
     # Section: Replacement of object style macros.
@@ -1480,11 +1490,20 @@ class PpDefine(object):
     @property
     def refFileLineColS(self):
         """Returns the list of FileLineCol objects where this macro was referenced.
+        This is created from :py:attr:`refStore` on every call.
 
         :returns: ``list([]),list([cpip.core.FileLocation.FileLineCol([str, int, int])])``
             -- Places the macro was referenced.
         """
-        return self._refFileLineColS
+        return list(self._refStore)
+
+    @property
+    def refStore(self):
+        """Returns the store of places where this macro was referenced.
+
+        :returns: :py:class:`cpip.core.MacroRefStore.MacroRefStore` -- The references.
+        """
+        return self._refStore
     #============================
     # End: Read only methods.
     #============================
@@ -1598,6 +1617,24 @@ class PpDefine(object):
                 'Irresponsible line number: %s' % theLineNum
                 )            
         self._undefFileLine = FileLocation.FileLine(theFileId, theLineNum)
+
+    def copy(self, theRefStore=None):
+        """Returns a copy of this macro that has its own reference count,
+        references and ``#undef`` state. The definition itself is shared as
+        it does not change after construction.
+
+        :param theRefStore: The reference store of the copy, if None my
+            references are copied.
+        :type theRefStore: ``NoneType``, :py:class:`cpip.core.MacroRefStore.MacroRefStore`
+
+        :returns: :py:class:`PpDefine` -- The copy.
+        """
+        retVal = copy.copy(self)
+        if theRefStore is None:
+            retVal._refStore = self._refStore.copy()
+        else:
+            retVal._refStore = theRefStore
+        return retVal
     ####################################################
     # End: Accessors and comparison (i.e. redefinition).
     ####################################################
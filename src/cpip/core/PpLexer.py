@@ -40,6 +40,7 @@ from cpip.core import ConstantExpression
 from cpip.core import CppCond
 from cpip.core import CppDiagnostic
 from cpip.core import FileIncludeStack
+from cpip.core import FilePathTable
 from cpip.core import IncludeHandler
 from cpip.core import MacroEnv
 from cpip.core import PpToken
@@ -190,6 +191,12 @@ class PpLexer(object):
                  autoDefineDateTime=True,
                  gccExtensions=False,
                  annotateLineFile=False,
+                 trackMacroRefs=True,
+                 streamChunkSize=0,
+                 macroRefPolicy=None,
+                 predefLoader=None,
+                 macroProfiler=None,
+                 ituTokenCache=None,
                  ):
         """Constructor.
 
@@ -252,14 +259,50 @@ class PpLexer(object):
                 # 1 "/usr/include/sys/cdefs.h" 1 3 4
         :type annotateLineFile: ``bool``
 
+        :param trackMacroRefs: If True then the file, line and column of every
+            macro reference is recorded in the macro environment. If False the
+            reference counts are still maintained but the locations are not,
+            this avoids creating a FileLineCol object for every token when
+            the caller has no use for the macro history.
+        :type trackMacroRefs: ``bool``
+
+        :param streamChunkSize: If non-zero then each file is tokenised in
+            chunks of about this many characters rather than all at once, see
+            :py:meth:`cpip.core.PpTokeniser.PpTokeniser.genLexPptokenStream`.
+            This sets ``streamSources`` on the include handler so that files
+            are also decoded as they are read.
+        :type streamChunkSize: ``int``
+
+        :param macroRefPolicy: Controls which macro reference locations are
+            recorded when trackMacroRefs is True, None records them all.
+        :type macroRefPolicy: ``NoneType``, :py:data:`cpip.core.MacroRefStore.RefPolicy`
+
+        :param predefLoader: Creates the standard predefined macros, this can
+            be shared by all the lexers of a job so that they are only
+            tokenised once.
+        :type predefLoader: ``NoneType``, :py:class:`cpip.core.MacroEnv.PredefinedMacroLoader`
+
+        :param macroProfiler: If present records the cost of expanding each
+            macro.
+        :type macroProfiler: ``NoneType``, :py:class:`cpip.core.MacroProfiler.MacroProfiler`
+
+        :param ituTokenCache: If present the tokens of each file are added to
+            this as the file is processed so that writing the ITU HTML does not
+            need to tokenise the file again.
+        :type ituTokenCache: ``NoneType``, :py:class:`cpip.core.ItuToTokens.ItuTokenCache`
+
         :returns: ``NoneType``
         """
         # Capture constructor arguments
         self._tuFileId = tuFileId
         self._includeHandler = includeHandler
+        if streamChunkSize:
+            # Decode each file as it is tokenised
+            includeHandler.streamSources = True
         self._preIncFiles = preIncFiles or []
         self._gccExtensions = gccExtensions
         self._annotateLineFile = annotateLineFile
+        self._trackMacroRefs = trackMacroRefs
         # Create the class members
         self._diagnostic = diagnostic or CppDiagnostic.PreprocessDiagnosticStd()
         self._pragmaHandler = pragmaHandler
@@ -302,7 +345,15 @@ class PpLexer(object):
             stdPredefMacros['__DATE__'] = dt.strftime("%b") + ' %2d' % dt.day \
                 + dt.strftime(" %Y") + '\n'
             stdPredefMacros['__TIME__'] = dt.strftime("%H:%M:%S") + '\n'
-        self._macroEnv = MacroEnv.MacroEnv(stdPredefMacros=stdPredefMacros)
+        # Interns file paths for this run
+        self._filePathTable = FilePathTable.FilePathTable()
+        self._macroEnv = MacroEnv.MacroEnv(
+            stdPredefMacros=stdPredefMacros,
+            filePathTable=self._filePathTable,
+            refPolicy=macroRefPolicy,
+            predefLoader=predefLoader,
+            profiler=macroProfiler,
+        )
         # Conditional level of compilation
         #0: No conditionally compiled tokens. The fileIncludeGraphRoot will
         #    not have any information about conditionally included files.
@@ -332,7 +383,12 @@ class PpLexer(object):
         # IncludeHandler.FilePathOrigin
         self._tuFpo = None
         # This holds information about the #include'd files.
-        self._fis = FileIncludeStack.FileIncludeStack(self._diagnostic)
+        self._fis = FileIncludeStack.FileIncludeStack(
+            self._diagnostic,
+            streamChunkSize,
+            self._filePathTable,
+            theItuTokenCache=ituTokenCache,
+        )
         # Flag to say whether a generator is in play
         self._isGenerating = False
 
@@ -589,7 +645,7 @@ class PpLexer(object):
         try:
             while 1:
                 # Take the position just before the token
-                myFlc = self.fileLineCol
+                myPos = self._retPosition()
                 try:
                     myTtt = next(theGen)
                 except StopIteration:
@@ -635,7 +691,7 @@ class PpLexer(object):
                             for aTtt in self._macroEnv.replace(
                                             myTtt,
                                             theGen,
-                                            myFlc):
+                                            self._retFileLineColAt(myPos)):
 #                                 # Avoid accidental token pasting with replacement tokens
 #                                 # #define PLUS +
 #                                 # +PLUS
@@ -821,6 +877,17 @@ class PpLexer(object):
         """
         return self._fis.fileIncludeGraphRoot
     
+    @property
+    def includeEvents(self):
+        """Returns the time and token counts of each file that has been
+        finished as a list of :py:class:`cpip.core.FileIncludeStack.IncludeEvent`.
+        These can be written as a Chrome trace with
+        :py:func:`cpip.core.FileIncludeStack.writeTraceEvents`.
+
+        :returns: ``list([cpip.core.FileIncludeStack.IncludeEvent])`` -- The events.
+        """
+        return self._fis.includeEvents
+
     @property
     def condState(self):
         """The conditional state as (boolean,  string)."""
@@ -860,9 +927,40 @@ class PpLexer(object):
         if self._fis.depth > 0:
             return self._fis.fileLineCol
         
+    def _retPosition(self):
+        """Returns the current position in the current file if macro references
+        are being tracked, otherwise None. This is cheap, the position is only
+        turned into a :py:class:`cpip.core.FileLocation.FileLineCol` by
+        :py:meth:`_retFileLineColAt` when it is needed.
+
+        :returns: ``NoneType, int, cpip.core.FileLocation.FileLineCol`` -- Opaque position.
+        """
+        if self._trackMacroRefs and self._fis.depth > 0:
+            return self._fis.ppt.fileLocator.position
+
+    def _retFileLineColAt(self, thePosition):
+        """Returns the FileLineCol from a position from :py:meth:`_retPosition`.
+
+        :param thePosition: The position.
+        :type thePosition: ``NoneType, int, cpip.core.FileLocation.FileLineCol``
+
+        :returns: ``NoneType, cpip.core.FileLocation.FileLineCol`` -- File location.
+        """
+        if thePosition is not None:
+            return self._fis.ppt.fileLocator.fileLineColAt(thePosition)
+
     #=============================================
     # Section: Read-only file location attributes.
     #=============================================
+    @property
+    def filePathTable(self):
+        """Returns the table of file paths seen in this translation unit.
+        Each path is held once and has a small integer ID.
+
+        :returns: :py:class:`cpip.core.FilePathTable.FilePathTable` -- The path table.
+        """
+        return self._filePathTable
+
     @property
     def tuFileId(self):
         """Returns the user supplied ID of the translation unit.
@@ -962,7 +1060,7 @@ class PpLexer(object):
         while 1:
             # Take the position just before we read the token to give it
             # to self._macroEnv.replace(...)
-            myFlc = self.fileLineCol
+            myPos = self._retPosition()
             try:
                 myTtt = next(theGen)
             except StopIteration:
@@ -977,7 +1075,7 @@ class PpLexer(object):
                         for aTtt in self._macroEnv.replace(
                                         myTtt,
                                         theGen,
-                                        myFlc,
+                                        self._retFileLineColAt(myPos),
                                         ):
                             retList.append(aTtt)
                     except ExceptionCpip as err:
@@ -1178,7 +1276,7 @@ class PpLexer(object):
         flagInvert = flagHasSeenDefined = False
         macroReplacedTokS = []
         while 1:
-            myFlc = self.fileLineCol
+            myPos = self._retPosition()
             if len(macroReplacedTokS) > 0:
                 myTtt = macroReplacedTokS.pop(0)
             else:
@@ -1206,7 +1304,7 @@ class PpLexer(object):
                         repTokS.append(self._macroEnv.defined(
                                                 myTtt,
                                                 flagInvert,
-                                                myFlc,
+                                                self._retFileLineColAt(myPos),
                                                 ))
                         flagHasSeenDefined = flagInvert = False
                     elif self._macroEnv.mightReplace(myTtt):
@@ -1214,7 +1312,7 @@ class PpLexer(object):
                         for aTtt in self._macroEnv.replace(
                                         myTtt,
                                         theGen,
-                                        myFlc,
+                                        self._retFileLineColAt(myPos),
                                         ):
                             #print '_retDefinedSubstitution(): replaced: %s' % aTtt
                             self._appendTokenMergingWhitespace(macroReplacedTokS, aTtt)
@@ -1287,7 +1385,7 @@ class PpLexer(object):
                 myEvalToks.append(self._macroEnv.defined(
                                     aTok,
                                     False,
-                                    self.fileLineCol,
+                                    self.fileLineCol if self._trackMacroRefs else None,
                                     )
                 )
             else:
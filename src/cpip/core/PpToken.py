@@ -20,7 +20,6 @@
 
 """Represents a preprocessing Token in C/C++ source code.
 """
-import copy
 import sys
 
 __author__  = 'Paul Ross'
@@ -120,6 +119,13 @@ def __initPptokenMaps():
         NAME_ENUM[LEX_PPTOKEN_TYPES[i]] = i
         ENUM_NAME[i] = LEX_PPTOKEN_TYPES[i]
 __initPptokenMaps()
+#: Token types whose text is interned. Identifiers and punctuators are few
+#: in number but very many tokens share them.
+INTERN_ENUMS = frozenset(
+    (NAME_ENUM['identifier'], NAME_ENUM['preprocessing-op-or-punc'])
+)
+_ENUM_IDENTIFIER = NAME_ENUM['identifier']
+_ENUM_WHITESPACE = NAME_ENUM['whitespace']
 #################################################################
 # End: Global definitions of enumerated preprocessing token types
 #################################################################
@@ -158,7 +164,19 @@ class PpToken(object):
     t is the token (a string) and tt is either an enumerated integer or
     a string. Internally tt is stored as an enumerated integer.
     If the token is an identifier then it is eligible for replacement
-    unless marked otherwise."""
+    unless marked otherwise.
+
+    A large translation unit can keep millions of these alive so this uses
+    ``__slots__`` and the boolean flags are packed into a single integer."""
+    __slots__ = ('_t', '_tt', '_lineNum', '_colNum', '_lineIndex', '_flags')
+    #: Flag bit: this token is eligible for replacement
+    FLAG_CAN_REPLACE = 0x1
+    #: Flag bit: this token is preceded by whitespace
+    FLAG_PREV_WS = 0x2
+    #: Flag bit: this token appeared within a conditionally compiled section
+    FLAG_IS_COND = 0x4
+    #: Flag bit: this token is the result of macro expansion
+    FLAG_IS_REPLACEMENT = 0x8
     #: Representation of a single whitespace
     SINGLE_SPACE = ' '
     #: Operators that are replaced directly by Python equivalents for constant evaluation
@@ -172,7 +190,8 @@ class PpToken(object):
     }
     # See: ISO/IEC 14882 / N3242 :2011(E) 2.14.2 Character literals [lex.ccon], ISO/IEC 9899:2011 6.4.4.4 etc.
     CHARACTER_LITERAL_PREFIXES = {'L', 'u', 'U'}
-    def __init__(self, t, tt, lineNum=0, colNum=0, isReplacement=False):
+    def __init__(self, t, tt, lineNum=0, colNum=0, isReplacement=False,
+                 lineIndex=None, ofs=0):
         """Constructor.
         ``t`` is the token (a string) and tt is either an enumerated integer or
         a string. Internally tt is stored as an enumerated integer.
@@ -194,31 +213,38 @@ class PpToken(object):
         :param isReplacement: Is a token from macro replacement.
         :type isReplacement: ``bool``
 
+        :param lineIndex: If given then ``lineNum`` and ``colNum`` are ignored
+            and are computed from this and ``ofs`` when first needed.
+        :type lineIndex: ``NoneType, cpip.core.FileLocation.LineIndex``
+
+        :param ofs: Offset of the token in the buffer of ``lineIndex``.
+        :type ofs: ``int``
+
         :returns: ``NoneType``
         """
-        self._t = t
-        # self._tt is an enumerated integer
-        if tt in ENUM_NAME:
-            self._tt = tt
-        elif tt in NAME_ENUM:
-            self._tt = NAME_ENUM[tt]
+        self.subst(t, tt)
+        # Lazy position: if self._lineIndex is not None then self._colNum is
+        # the offset in its buffer until resolveLineCol() is called.
+        self._lineIndex = lineIndex
+        if lineIndex is None:
+            self._lineNum = lineNum
+            self._colNum = colNum
         else:
-            raise ExceptionCpipTokenUnknownType(
-                'Unknown token enumeration: %s' % str(tt)
-                )
-        self._lineNum = lineNum
-        self._colNum = colNum
-        # Flag to control whether this token is eligible for expansion
-        # On replacement this can be set
-        self._canReplace = self.isIdentifier()
-        # See: http://gcc.gnu.org/onlinedocs/cppinternals/Token-Spacing.html#Token-Spacing
-        self._prevWs = False
-        # Flag that if True indicates that the token appeared within a section
+            self._lineNum = 0
+            self._colNum = ofs
+        # Flags are bits in self._flags:
+        # FLAG_CAN_REPLACE controls whether this token is eligible for expansion.
+        # On replacement this can be set.
+        #
+        # FLAG_PREV_WS records prior whitespace, see:
+        # http://gcc.gnu.org/onlinedocs/cppinternals/Token-Spacing.html#Token-Spacing
+        #
+        # FLAG_IS_COND if set indicates that the token appeared within a section
         # that was conditionally compiled. This is False on construction and
         # can only be set True.
-        self._isCond = False
-        # Flag that indicates that this token is the result of macro expansion.
-        # This is so the lexer can spot this situation:
+        #
+        # FLAG_IS_REPLACEMENT indicates that this token is the result of macro
+        # expansion. This is so the lexer can spot this situation:
         # #define PLUS +
         # +PLUS+
         # And insert whitespace to make this, correctly:
@@ -228,18 +254,38 @@ class PpToken(object):
         # EMPTY # include <file.h>
         # In the latter case the #include is not recognised even though it is
         # preceeded with whitespace
-        self._isReplacement = isReplacement
+        self._flags = 0
+        if self._tt == _ENUM_IDENTIFIER:
+            self._flags |= self.FLAG_CAN_REPLACE
+        if isReplacement:
+            self._flags |= self.FLAG_IS_REPLACEMENT
         
     def copy(self):
         """Returns a shallow copy of self. This is useful where the same token is
         added to multiple lists and then a merge() operation on one list will
         be seen by the others. To avoid this insert self.copy() in all but one
         of the lists."""
-        return copy.copy(self)
+        ret_val = PpToken.__new__(self.__class__)
+        ret_val._t = self._t
+        ret_val._tt = self._tt
+        ret_val._lineNum = self._lineNum
+        ret_val._colNum = self._colNum
+        ret_val._lineIndex = self._lineIndex
+        ret_val._flags = self._flags
+        return ret_val
+
+    def __getstate__(self):
+        # Pickle the resolved position rather than the line index
+        self.resolveLineCol()
+        return self._t, self._tt, self._lineNum, self._colNum, self._flags
+
+    def __setstate__(self, theState):
+        self._t, self._tt, self._lineNum, self._colNum, self._flags = theState
+        self._lineIndex = None
 
     def subst(self, t, tt):
         """Substitutes token value and type."""
-        self._t = t
+        # self._tt is an enumerated integer
         if tt in ENUM_NAME:
             self._tt = tt
         elif tt in NAME_ENUM:
@@ -248,12 +294,31 @@ class PpToken(object):
             raise ExceptionCpipTokenUnknownType(
                 'Unknown token enumeration: %s' % str(tt)
                 )
+        if self._tt in INTERN_ENUMS:
+            t = sys.intern(t)
+        self._t = t
+
+    def _setFlag(self, theFlag, val):
+        """Sets or clears a flag bit.
+
+        :param theFlag: The flag bit, one of the ``FLAG_...`` values.
+        :type theFlag: ``int``
+
+        :param val: Set the flag if ``True`` else clear it.
+        :type val: ``bool``
+
+        :returns: ``NoneType``
+        """
+        if val:
+            self._flags |= theFlag
+        else:
+            self._flags &= ~theFlag
 
     def __str__(self):
         #return '"%s", %s, %s, %s, %s' \
         #    % (self.t, self.tt, self._canReplace, self._prevWs, self._isCond)
         return 'PpToken(t="%s", tt=%s, line=%s, prev=%s, ?=%s)' \
-            % (self.t.replace('\n', '\\n'), self.tt, self._canReplace, self._prevWs, self._isCond)
+            % (self.t.replace('\n', '\\n'), self.tt, self.canReplace, self.prevWs, self.isCond)
 
     def __lt__(self, other):
         return self.t < other.t or self.tt < other.tt
@@ -284,11 +349,11 @@ class PpToken(object):
 
     def isIdentifier(self):
         """:returns: ``bool`` -- ``True`` if the token type is 'identifier'."""
-        return self._tt == NAME_ENUM['identifier']
+        return self._tt == _ENUM_IDENTIFIER
 
     def isWs(self):
         """:returns: ``bool`` -- ``True`` if the token type is 'whitespace'."""
-        return self._tt == NAME_ENUM['whitespace']
+        return self._tt == _ENUM_WHITESPACE
 
     def replaceNewLine(self):
         """Replace any newline with a single whitespace character in-place.
@@ -478,22 +543,61 @@ class PpToken(object):
         """Returns the token and the token type (as a string) as a tuple."""
         return self._t, ENUM_NAME[self._tt]
 
+    def resolveLineCol(self):
+        """If the position is held lazily as a line index and offset this
+        replaces them with the line and column and releases the line index.
+        Call this on tokens that are retained after their file has been
+        tokenised.
+
+        :returns: ``NoneType``
+        """
+        if self._lineIndex is not None:
+            self._lineNum, self._colNum = self._lineIndex.lineCol(self._colNum)
+            self._lineIndex = None
+
     @property
     def lineNum(self):
         """Returns the line number of the start of the token as an integer."""
+        self.resolveLineCol()
         return self._lineNum
 
     @property
     def colNum(self):
         """Returns the column number of the start of the token as an integer."""
+        self.resolveLineCol()
         return self._colNum
 
+    def getFlags(self):
+        """Gets the packed flags, these are the ``FLAG_...`` bits.
+
+        :returns: ``int`` -- Flags.
+        """
+        return self._flags
+
+    def setFlags(self, val):
+        """Sets the packed flags. This is for bulk transport of tokens, for
+        example :py:class:`cpip.core.TokenBuffer.TokenBuffer`.
+
+        :param val: Flags, the ``FLAG_...`` bits.
+        :type val: ``int``
+
+        :returns: ``NoneType``
+        """
+        self._flags = val
+
+    flags = property(
+        getFlags,
+        setFlags,
+        None,
+        'Packed flags, the FLAG_... bits'
+        )
+
     def getReplace(self):
         """Gets the flag that controls whether this can be replaced.
 
         :returns: ``bool`` -- Flag.
         """
-        return self._canReplace
+        return bool(self._flags & self.FLAG_CAN_REPLACE)
 
     # Read/write methods
     def setReplace(self, val):
@@ -503,13 +607,13 @@ class PpToken(object):
             raise ExceptionCpipTokenIllegalOperation(
                 'setReplace when token type is "%s"' % ENUM_NAME[self._tt]
                 )
-        if val and not self._canReplace:
+        if val and not self._flags & self.FLAG_CAN_REPLACE:
             raise ExceptionCpipTokenReopenForExpansion(
                 'setReplace(True) when canReplace is already False.'
                 )
         #print 'TRACE: PpToken setting %s to state: %s' % (self, val)
         #print ''.join(traceback.format_stack(limit=2))
-        self._canReplace = val
+        self._setFlag(self.FLAG_CAN_REPLACE, val)
 
     canReplace = property(
         getReplace,
@@ -520,11 +624,11 @@ class PpToken(object):
 
     def getPrevWs(self):
         """Gets the flag that records prior whitespace."""
-        return self._prevWs
+        return bool(self._flags & self.FLAG_PREV_WS)
 
     def setPrevWs(self, val):
         """Sets the flag that records prior whitespace."""
-        self._prevWs = val
+        self._setFlag(self.FLAG_PREV_WS, val)
 
     prevWs = property(
         getPrevWs,
@@ -535,7 +639,7 @@ class PpToken(object):
 
     def getIsReplacement(self):
         """Gets the flag that records that this token is the result of macro replacement"""
-        return self._isReplacement
+        return bool(self._flags & self.FLAG_IS_REPLACEMENT)
 
     def setIsReplacement(self, val):
         """Sets the flag that records that this token is the result of macro replacement.
@@ -545,7 +649,7 @@ class PpToken(object):
 
         :returns: ``NoneType``
         """
-        self._isReplacement = val
+        self._setFlag(self.FLAG_IS_REPLACEMENT, val)
 
     isReplacement = property(
         getIsReplacement,
@@ -562,7 +666,7 @@ class PpToken(object):
 
         :returns: ``bool`` -- Flag.
         """
-        return self._isCond
+        return bool(self._flags & self.FLAG_IS_COND)
 
     @property
     def isUnCond(self):
@@ -572,11 +676,11 @@ class PpToken(object):
 
         :returns: ``bool`` -- Flag.
         """
-        return not self._isCond
+        return not self._flags & self.FLAG_IS_COND
 
     def setIsCond(self):
-        """Sets self._isCond to be True.
+        """Sets the isCond flag to be True.
 
         :returns: ``NoneType``
         """
-        self._isCond = True
+        self._flags |= self.FLAG_IS_COND
@@ -111,12 +111,19 @@ _Imaginary
 
 #Removed to stop logging holding up the performance
 #import logging
+import array
+import bisect
+import itertools
+import multiprocessing
+import re
+
 from cpip import ExceptionCpip
 from cpip.core import FileLocation
 from cpip.core import CppDiagnostic
 from cpip.core import PpWhitespace
 from cpip.core import PpToken
-from cpip.util import StrTree, MatrixRep
+from cpip.core import TokenBuffer
+from cpip.util import StrTree
 
 ######################################################################
 # Section: Module level information that is based on ISO/IEC 9899:1999
@@ -363,6 +370,299 @@ CHAR_SET_STR_TREE_MAP = {
         'set' : StrTree.StrTree(CHAR_SET_MAP['lex.bool']['set']),
         },
 }
+def _retOperatorDispatchTable(theOperatorS):
+    """Returns a map of ``{first character : (operator, ...), ...}`` where the
+    operators are longest first so that the first that matches is the longest.
+
+    :param theOperatorS: Operators and punctuators.
+    :type theOperatorS: ``set([str])``
+
+    :returns: ``dict({str : tuple([str])})`` -- The map.
+    """
+    retVal = {}
+    for anOp in sorted(theOperatorS, key=lambda x: (-len(x), x)):
+        retVal.setdefault(anOp[0], []).append(anOp)
+    return {k : tuple(v) for k, v in retVal.items()}
+
+#: Map of ``{first character : (operator, ...), ...}`` with the operators
+#: longest first, see :py:meth:`PpTokeniser._sliceLexOperators`
+OPERATOR_DISPATCH_TABLE = _retOperatorDispatchTable(CHAR_SET_MAP['lex.op']['operators'])
+
+def _retPptokenDispatchTable(theSliceFirstCharS):
+    """Returns a map of ``{first character : (slice method name, ...), ...}``
+    from ``((slice method name, set of first characters), ...)`` preserving
+    the order of the method names.
+
+    :param theSliceFirstCharS: Slice method names and the characters that
+        a match can start with.
+    :type theSliceFirstCharS: ``tuple([tuple([str, set([str])])])``
+
+    :returns: ``dict({str : tuple([str])})`` -- The map.
+    """
+    retVal = {}
+    for aName, aCharS in theSliceFirstCharS:
+        for aChar in aCharS:
+            retVal[aChar] = retVal.get(aChar, ()) + (aName,)
+    return retVal
+
+#: Map of ``{first character : (slice method name, ...), ...}`` of the
+#: functions that :py:meth:`PpTokeniser._sliceLexPptoken` tries in order.
+#: The order is significant, see that method. A character that is not in the
+#: map can only start a 'non-whitespace' token.
+PPTOKEN_DISPATCH_TABLE = _retPptokenDispatchTable(
+    (
+        ('_sliceLexPpnumber', CHAR_SET_MAP['lex.ppnumber']['digit'] | {'.'}),
+        ('_sliceCharacterLiteral', PpToken.PpToken.CHARACTER_LITERAL_PREFIXES | {"'"}),
+        ('_sliceStringLiteral', {'L', '"'}),
+        # A universal-character-name starts with '\\'
+        ('_sliceLexName', CHAR_SET_MAP['lex.name']['part_non_digit'] | {'\\'}),
+        ('_sliceLexOperators', set(OPERATOR_DISPATCH_TABLE.keys())),
+    )
+)
+#: Matches a single character that is not in the source character set
+RE_NOT_LEX_CHARSET = re.compile(
+    '[^%s]' % re.escape(''.join(sorted(CHAR_SET_MAP['lex.charset']['source character set'])))
+)
+#: The start of a trigraph
+TRIGRAPH_START = TRIGRAPH_PREFIX * 2
+#: Default number of characters read at a time when streaming, see
+#: :py:meth:`PpTokeniser.genLexPptokenStream`
+STREAM_CHUNK_SIZE = 1 << 20
+#: Default number of characters in each chunk when tokenising in parallel, see
+#: :py:meth:`PpTokeniser.genLexPptokenParallel`
+PARALLEL_CHUNK_SIZE = 1 << 22
+#: Whitespace characters as a string
+WHITESPACE_CHARS = ''.join(sorted(PpWhitespace.LEX_WHITESPACE))
+#: Matches a newline that is followed by a non-whitespace character, after
+#: translation phase 2 this is a candidate chunk boundary
+RE_CHUNK_BOUNDARY = re.compile(r'\n(?=[^\t\v\f\n ])')
+#: Matches C++ comments, character and string literals on one line or the
+#: start of a C comment. Used to skip newlines in C comments when looking for
+#: chunk boundaries.
+RE_CHUNK_SCAN = re.compile(
+    r'//[^\n]*|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|/\*'
+)
+
+def _genFind(theText, theSub):
+    """Generates the offsets of every occurrence of theSub in theText,
+    overlapping occurrences included."""
+    i = theText.find(theSub)
+    while i >= 0:
+        yield i
+        i = theText.find(theSub, i + 1)
+
+def _isPhase12Identity(theText):
+    """Returns True if translation phases 1 and 2 would not change theText,
+    that is there are no characters outside the source character set, no
+    trigraphs and no line continuations."""
+    return theText.isascii() \
+        and RE_NOT_LEX_CHARSET.search(theText) is None \
+        and TRIGRAPH_START not in theText \
+        and '\\\n' not in theText
+
+def _hasTrigraph(theText):
+    """Returns True if theText contains a trigraph."""
+    for i in _genFind(theText, TRIGRAPH_START):
+        if theText[i+TRIGRAPH_SIZE-1:i+TRIGRAPH_SIZE] in TRIGRAPH_TABLE:
+            return True
+    return False
+
+def _retPhase12Edits(theText):
+    """Returns the changes that translation phases 1 and 2 make to theText,
+    which must not contain trigraphs, in order.
+
+    Each change is ``(logical_offset, original_offset, original_length,
+    logical_length)`` where the logical offset is into the text after phase 2.
+    Changes are:
+
+    * A character outside the source character set that phase 1 expands to a
+      universal-character-name, see :py:meth:`PpTokeniser._convertLinesToLexCharset`.
+    * A line continuation removed by phase 2.
+    * A newline added by phase 2 after a group of spliced lines, there is one
+      for each line continuation so that the number of lines is unchanged,
+      see :py:meth:`PpTokeniser._spliceLineS`.
+
+    :param theText: The source code.
+    :type theText: ``str``
+
+    :returns: ``list([tuple([int, int, int, int])])`` -- The changes.
+    """
+    # (original_offset, order at that offset, original_length, logical_length)
+    myChangeS = []
+    if not theText.isascii():
+        myUcnOrdinals = CHAR_SET_MAP['lex.charset']['ucn ordinals']
+        for aMatch in RE_NOT_LEX_CHARSET.finditer(theText):
+            myOrd = ord(aMatch.group())
+            if myOrd > 0xFFFF:
+                myChangeS.append((aMatch.start(), 1, 1, len('\\U%08X' % myOrd)))
+            elif myOrd not in myUcnOrdinals:
+                myChangeS.append((aMatch.start(), 1, 1, len('\\u%04X' % myOrd)))
+    myContLen = len(PpTokeniser.CONT_STR)
+    mySplices = 0
+    for i in _genFind(theText, PpTokeniser.CONT_STR):
+        if i + myContLen < len(theText):
+            myChangeS.append((i, 1, myContLen, 0))
+            mySplices += 1
+            # End of the next line
+            myEnd = theText.find('\n', i + myContLen) + 1 or len(theText)
+            if myEnd - myContLen >= i + myContLen \
+            and theText.startswith(PpTokeniser.CONT_STR, myEnd - myContLen):
+                # That is spliced too
+                continue
+        else:
+            # Continuation in the last line is not spliced
+            myEnd = len(theText)
+        # Newlines are before any change to the next line
+        myChangeS.extend([(myEnd, 0, 0, 1)] * mySplices)
+        mySplices = 0
+    myChangeS.sort(key=lambda c: c[:2])
+    retVal = []
+    myDelta = 0
+    for anOfs, _order, anOrigLen, aLogLen in myChangeS:
+        retVal.append((anOfs + myDelta, anOfs, anOrigLen, aLogLen))
+        myDelta += aLogLen - anOrigLen
+    return retVal
+
+def _genItuTokens(theText, theTokS):
+    """Generates the ``(token, token_type)`` in their original spelling from
+    the tokens recorded by :py:meth:`PpTokeniser.recordItuTokens`.
+
+    As :py:class:`cpip.core.ItuToTokens.ItuToTokens` does, a token that ends
+    with a literal, a C comment or a single non-whitespace character stops at
+    its last character, other tokens include any line continuation that
+    follows them. Line continuations not in any token are of type ``'Unknown'``.
+
+    :param theText: The source code, this must not contain trigraphs.
+    :type theText: ``str``
+
+    :param theTokS: The ``(offset, length, token_type)`` of each token in the
+        text after translation phase 2.
+    :type theTokS: ``list([tuple([int, int, str])])``
+
+    :returns: ``tuple([str, str])`` -- Token value, token type.
+
+    :raises: ``ExceptionCpipTokeniser`` if the tokens do not fit the text.
+    """
+    myChangeS = _retPhase12Edits(theText)
+    if len(myChangeS) == 0:
+        for anOfs, aLen, aType in theTokS:
+            yield theText[anOfs:anOfs+aLen], aType
+        return
+    myLogOfsS = [c[0] for c in myChangeS]
+    def _retOrig(theOfs, isEnd):
+        # Returns the original offset of the start, or the end if isEnd, of
+        # the character at theOfs after phase 2
+        i = bisect.bisect_right(myLogOfsS, theOfs) - 1
+        if i < 0:
+            return theOfs + isEnd
+        myLogOfs, myOrigOfs, myOrigLen, myLogLen = myChangeS[i]
+        if theOfs < myLogOfs + myLogLen:
+            # Part of the change
+            if theOfs == myLogOfs and not isEnd:
+                return myOrigOfs
+            return myOrigOfs + myOrigLen
+        return myOrigOfs + myOrigLen + theOfs - myLogOfs - myLogLen + isEnd
+    myPrev = 0
+    for anOfs, aLen, aType in theTokS:
+        myStart = _retOrig(anOfs, False)
+        if aType in ITU_TERMINAL_TYPES:
+            myEnd = _retOrig(anOfs + aLen - 1, True)
+        else:
+            myEnd = _retOrig(anOfs + aLen, False)
+        if myStart < myPrev:
+            raise ExceptionCpipTokeniser(
+                'Token at %d overlaps the previous one that ends at %d' % (myStart, myPrev)
+            )
+        if myStart > myPrev:
+            yield theText[myPrev:myStart], 'Unknown'
+        if myEnd > myStart:
+            # Not just part of a change
+            yield theText[myStart:myEnd], aType
+            myPrev = myEnd
+    if myPrev < len(theText):
+        yield theText[myPrev:], 'Unknown'
+
+def _splitLines(theText):
+    """Splits theText into lines as ``readlines()`` does, each line keeps its
+    newline."""
+    retVal = theText.split('\n')
+    myLast = retVal.pop()
+    retVal = [aLine + '\n' for aLine in retVal]
+    if myLast:
+        retVal.append(myLast)
+    return retVal
+
+def _retLineIndexes(theLineS, theOffsetS):
+    """Returns the ascending, unique indexes of the lines that contain the
+    given ascending offsets into ``''.join(theLineS)``.
+
+    This lets a phase of translation search the whole buffer at C speed and
+    then only visit the lines that need work.
+
+    :param theLineS: Source code lines.
+    :type theLineS: ``list([str])``
+
+    :param theOffsetS: Ascending offsets into the joined lines.
+    :type theOffsetS: ``iterable([int])``
+
+    :returns: ``list([int])`` -- Line indexes.
+    """
+    retVal = []
+    myEndS = None
+    for anOfs in theOffsetS:
+        if myEndS is None:
+            myEndS = list(itertools.accumulate(map(len, theLineS)))
+        elif anOfs < myEndS[retVal[-1]]:
+            # Same line as the previous offset
+            continue
+        retVal.append(bisect.bisect_right(myEndS, anOfs))
+    return retVal
+
+def _retChunkBoundaries(theText, theChunkSize):
+    """Returns the ascending offsets where theText, the result of translation
+    phase 2, can be split into chunks of at least theChunkSize characters
+    that can be tokenised independently.
+
+    A boundary immediately follows a newline that is not in a C comment and
+    is followed by a non-whitespace character so a token ends there. This is
+    a cheap scan that does not tokenise, so the caller must check that a
+    boundary is genuine, see :py:meth:`PpTokeniser.genLexPptokenParallel`.
+
+    :param theText: The source code after translation phase 2.
+    :type theText: ``str``
+
+    :param theChunkSize: Minimum number of characters in a chunk.
+    :type theChunkSize: ``int``
+
+    :returns: ``list([int])`` -- Offsets of the boundaries.
+    """
+    retVal = []
+    myMatch = RE_CHUNK_SCAN.search(theText)
+    myTarget = theChunkSize
+    while myTarget < len(theText):
+        myBound = RE_CHUNK_BOUNDARY.search(theText, myTarget)
+        if myBound is None:
+            break
+        myBound = myBound.end()
+        # Skip comments and literals before the boundary
+        while myMatch is not None and myMatch.start() < myBound:
+            myEnd = myMatch.end()
+            if myMatch.group() == '/*':
+                myEnd = theText.find('*/', myEnd)
+                if myEnd < 0:
+                    # Unclosed comment to the end of the text
+                    return retVal
+                myEnd += 2
+                if myEnd > myBound:
+                    # The boundary is in this comment so move it after
+                    myBound = RE_CHUNK_BOUNDARY.search(theText, myEnd - 1)
+                    if myBound is None:
+                        return retVal
+                    myBound = myBound.end()
+            myMatch = RE_CHUNK_SCAN.search(theText, myEnd)
+        retVal.append(myBound)
+        myTarget = myBound + theChunkSize
+    return retVal
 #============================================================
 # End: Derived information that is based on ISO/IEC 9899:1999
 #============================================================
@@ -404,6 +704,52 @@ COMMENT_TYPE_C = 'C comment'
 COMMENT_TYPE_CXX = 'C++ comment'
 #: All comments
 COMMENT_TYPES = (COMMENT_TYPE_C, COMMENT_TYPE_CXX)
+#: Token types that end at their last character in the original source
+#: code rather than including any line continuation that follows
+ITU_TERMINAL_TYPES = (
+    COMMENT_TYPE_C,
+    'character-literal',
+    'string-literal',
+    'non-whitespace',
+)
+#: Token types returned by :py:func:`_lexChunk`, indexed by an integer
+CHUNK_TOKEN_TYPES = tuple(PpToken.LEX_PPTOKEN_TYPES) + COMMENT_TYPES
+
+def _lexChunk(theText):
+    """Tokenises a chunk of text after translation phase 2 in a worker
+    process for :py:meth:`PpTokeniser.genLexPptokenParallel`.
+
+    Tokens are returned compactly as their lengths and the index of their type
+    in :py:data:`CHUNK_TOKEN_TYPES`. Any token that reaches the end of the
+    chunk, or an unclosed C comment, is not included.
+
+    :param theText: The chunk.
+    :type theText: ``str``
+
+    :returns: ``NoneType, tuple([int, array.array([int]), bytearray])`` --
+        Offset in the chunk where tokenising stopped, token lengths and token
+        type indexes. None if tokenising raised.
+    """
+    myTokeniser = PpTokeniser()
+    myFl = myTokeniser.fileLocator
+    myLenS = array.array(TokenBuffer.ARRAY_TYPE)
+    myTypeS = bytearray()
+    myGen = myTokeniser._genLexPptokens(
+        theText, FileLocation.LineIndex(''), isLast=False
+    )
+    myOfs = 0
+    try:
+        while 1:
+            next(myGen)
+            myLenS.append(myFl.offset - myOfs)
+            myTypeS.append(CHUNK_TOKEN_TYPES.index(myTokeniser._cppTokType))
+            myOfs = myFl.offset
+    except StopIteration as err:
+        return err.value, myLenS, myTypeS
+    except Exception:
+        # The caller tokenises this chunk itself and so reports this properly
+        pass
+    return None
 
 ####################
 # Section: Tokeniser
@@ -465,7 +811,8 @@ class PpTokeniser(object):
     PHASES_SUPPORTED = range(0, 4)
     # Line continuation pattern
     CONT_STR = '\\\n'
-    def __init__(self, theFileObj=None, theFileId=None, theDiagnostic=None):
+    def __init__(self, theFileObj=None, theFileId=None, theDiagnostic=None,
+                 theChunkSize=0, theJobs=1):
         """Constructor. Takes an optional file like object.
         If theFileObj has a 'name' attribute then that will be use as the name
         otherwise theFileId will be used as the file name.
@@ -479,12 +826,27 @@ class PpTokeniser(object):
         :param theDiagnostic: An optional diagnostic.
         :type theDiagnostic: :py:class:`cpip.core.CppDiagnostic.PreprocessDiagnosticStd`
 
+        :param theChunkSize: If non-zero then :py:meth:`next` streams the file
+            in chunks of about this many characters, see
+            :py:meth:`genLexPptokenStream`.
+        :type theChunkSize: ``int``
+
+        :param theJobs: If not 1 then :py:meth:`next` tokenises the file with
+            this many processes, zero for the number of CPUs, see
+            :py:meth:`genLexPptokenParallel`.
+        :type theJobs: ``int``
+
         :returns: ``NoneType``
         """
+        self._chunkSize = theChunkSize
+        self._jobs = theJobs
         # Set up whitespace handler
         self._whitespaceHandler = PpWhitespace.PpWhitespace()
         self._file = theFileObj
-        if self._file is not None and hasattr(self._file, 'name'):
+        # If the file's name is the same as theFileId prefer the latter as it
+        # is likely to be an interned string shared with other structures.
+        if self._file is not None and hasattr(self._file, 'name') \
+        and self._file.name != theFileId:
             self._fileName = self._file.name
         else:
             self._fileName = theFileId
@@ -501,6 +863,41 @@ class PpTokeniser(object):
         # Controls whether slice functions do an assert logic check on change
         # of token type, see _sliceLongestMatch functions.
         self._changeOfTokenTypeIsOk = False
+        # The (offset, length, token_type) of each token and the source code
+        # before translation phase 1, None if not recorded, see recordItuTokens()
+        self._ituTokS = None
+        self._ituTextS = []
+        # Set when next() has generated every token
+        self._isExhausted = False
+
+    def recordItuTokens(self):
+        """Records the position and type of each token as :py:meth:`next`
+        generates it so that :py:meth:`retItuTokens` can return the tokens in
+        their original spelling. This must be called before :py:meth:`next`.
+
+        :returns: ``NoneType``
+        """
+        self._ituTokS = []
+        self._ituTextS = []
+
+    def retItuTokens(self):
+        """Returns the tokens recorded by :py:meth:`recordItuTokens` in their
+        original spelling, comments have their own text and type rather than
+        being whitespace. This is the input to
+        :py:func:`cpip.core.ItuToTokens.genKeywordPpDirective`.
+
+        This returns None if the tokens were not recorded, if :py:meth:`next`
+        has not generated every token or if the file has trigraphs.
+
+        :returns: ``NoneType, list([tuple([str, str])])`` -- The tokens.
+        """
+        if not self._isExhausted or self._ituTokS is None:
+            return None
+        try:
+            return list(_genItuTokens(''.join(self._ituTextS), self._ituTokS))
+        except ExceptionCpipTokeniser:
+            # Not as the file was tokenised so the caller must tokenise it
+            return None
 
     @property
     def pLineCol(self):
@@ -571,6 +968,21 @@ class PpTokeniser(object):
         except Exception as err:
             raise ExceptionCpipTokeniser(str(err))
 
+    def _readSource(self):
+        """Reads the whole file as a single string, with a
+        :py:class:`cpip.core.SourceBuffer.SourceBuffer` this is not a copy.
+
+        May raise an ExceptionCpipTokeniser if self has been created with None
+        or the file is unreadable
+
+        :returns: ``str`` -- The source code.
+        """
+        try:
+            self._rewindFile()
+            return self._file.read()
+        except Exception as err:
+            raise ExceptionCpipTokeniser(str(err))
+
     def _convertToLexCharset(self, theLineS):
         """Converts a list of lines expanding non-lex.charset characters to
         universal-character-name and returns a set of lines so encoded.
@@ -593,40 +1005,88 @@ class PpTokeniser(object):
 
         :returns: ``NoneType``
         """
-        myCharSet = CHAR_SET_MAP['lex.charset']['source character set']
+        self._fileLocator.substStrings(self._convertLinesToLexCharset(theLineS))
+        self._fileLocator.incLine(len(theLineS))
+
+    def _convertLinesToLexCharset(self, theLineS, theLineOffset=0):
+        """Does the work of :py:meth:`_convertToLexCharset` on lines that
+        start at the given line offset in the file and returns the
+        substitutions for the file locator.
+
+        :param theLineS: The source code, this is side-effected.
+        :type theLineS: ``list([]), list([str])``
+
+        :param theLineOffset: Number of lines of the file before theLineS.
+        :type theLineOffset: ``int``
+
+        :returns: ``list([tuple([int, int, int, int])])`` -- Substitutions
+            as ``(logical_line, logical_col, len_physical, len_logical)``.
+        """
         # myUcnOrdinals is not 0024 ($), 0040 (@), or 0060 (back tick)
         myUcnOrdinals = CHAR_SET_MAP['lex.charset']['ucn ordinals']
-        myMr = MatrixRep.MatrixRep()
-        l = 0
-        while l < len(theLineS):
+        myLineStart = FileLocation.START_LINE + theLineOffset
+        # Substitutions for the file locator, recorded in bulk
+        mySubstS = []
+        myText = ''.join(theLineS)
+        if myText.isascii() and RE_NOT_LEX_CHARSET.search(myText) is None:
+            # Common case, nothing to do
+            myLineIdxS = []
+        else:
+            myLineIdxS = _retLineIndexes(
+                theLineS,
+                (m.start() for m in RE_NOT_LEX_CHARSET.finditer(myText)),
+            )
+        for l in myLineIdxS:
+            aLine = theLineS[l]
+            myPartS = []
             c = 0
-            for c, aChar in enumerate(theLineS[l]):
-                if aChar not in myCharSet:
-                    myOrd = ord(aChar)
-                    # Expand to a universal-character-name
-                    if myOrd <= 0xFFFF:
-                        # ISO/IEC 9899:1999 (E) 6.4.3-2 Universal character names - Constraints
-                        # TODO: explain if False and?
-                        if False and (myOrd < 0xA0 and myOrd not in myUcnOrdinals) \
-                        or (myOrd >= 0xD800 and myOrd <= 0xD8FF):
-                            raise ExceptionCpipTokeniserUcnConstraint( \
-                                'ISO/IEC 9899:1999 (E) 6.4.3-2 UCN constraint: 0x%x out of range, location=%s file=%s' \
-                                % (myOrd, self._fileLocator.pLineCol, self._fileLocator.fileName)
+            # Characters added to this line so far by expansion, the logical
+            # column is the physical one plus this.
+            k = 0
+            for aMatch in RE_NOT_LEX_CHARSET.finditer(aLine):
+                i = aMatch.start()
+                myOrd = ord(aMatch.group())
+                # Expand to a universal-character-name
+                if myOrd <= 0xFFFF:
+                    # ISO/IEC 9899:1999 (E) 6.4.3-2 Universal character names - Constraints
+                    # TODO: explain if False and?
+                    if False and (myOrd < 0xA0 and myOrd not in myUcnOrdinals) \
+                    or (myOrd >= 0xD800 and myOrd <= 0xD8FF):
+                        raise ExceptionCpipTokeniserUcnConstraint( \
+                            'ISO/IEC 9899:1999 (E) 6.4.3-2 UCN constraint: 0x%x out of range, location=%s file=%s' \
+                            % (
+                                myOrd,
+                                self._fileLocator.logicalToPhysical(
+                                    myLineStart + l,
+                                    FileLocation.START_COLUMN + i,
+                                ),
+                                self._fileLocator.fileName,
                             )
-                        elif myOrd not in myUcnOrdinals:
-                            self._fileLocator.substString(1, 6)
-                            repl = '\\u%04X' % myOrd
-                            #print 'Replacing with %s' % repl
-                            myMr.addLineColRep(l, c, aChar, repl)
+                        )
+                    elif myOrd not in myUcnOrdinals:
+                        repl = '\\u%04X' % myOrd
                     else:
-                        self._fileLocator.substString(1, 8)
-                        repl = '\\U%08X' % myOrd
-                        myMr.addLineColRep(l, c, aChar, repl)
-                self._fileLocator.incCol()
-            self._fileLocator.incLine()
-            l += 1        
-        myMr.sideEffect(theLineS)
-        #print 'TRACE: theLineS', theLineS
+                        continue
+                else:
+                    repl = '\\U%08X' % myOrd
+                # Recorded just after the logical column of the replacement,
+                # as trigraphs are, so that the replacement itself maps to the
+                # physical character.
+                mySubstS.append(
+                    (
+                        myLineStart + l,
+                        FileLocation.START_COLUMN + i + k + len(repl),
+                        1,
+                        len(repl),
+                    )
+                )
+                k += len(repl) - 1
+                myPartS.append(aLine[c:i])
+                myPartS.append(repl)
+                c = i + 1
+            myPartS.append(aLine[c:])
+            theLineS[l] = ''.join(myPartS)
+        return mySubstS
 
     def lexPhases_1(self, theLineS):
         """:title-reference:`ISO/IEC 14882:1998(E) 2.1 Phases of translation [lex.phases] - Phase one`
@@ -692,15 +1152,31 @@ class PpTokeniser(object):
         #print '\nlexPhases_2() was [%d]:' % len(theLineS), theLineS
         # Reset the file locator
         self._fileLocator.startNewPhase()
-        i = 0
-        while i < len(theLineS):
-            if theLineS[i].endswith(self.CONT_STR):
-                i = self._spliceLineS(theLineS, i)
-            else:
-                self._fileLocator.incLine()
-                i += 1
+        self._spliceLines(theLineS)
         #print 'lexPhases_2() now [%d]:' % len(theLineS), theLineS
 
+    def _spliceLines(self, theLineS):
+        """Does the work of :py:meth:`lexPhases_2` on lines that start at the
+        current line of the file locator. The lines must not end part way
+        through a splice group unless they are the end of the file.
+
+        :param theLineS: The source code, this is side-effected.
+        :type theLineS: ``list([]), list([str])``
+
+        :returns: ``NoneType``
+        """
+        # Only lines with a continuation need attention, the others just
+        # advance the line number.
+        mySpliceS = _retLineIndexes(theLineS, _genFind(''.join(theLineS), self.CONT_STR))
+        i = 0
+        for s in mySpliceS:
+            if s < i:
+                # Already spliced as part of a group
+                continue
+            self._fileLocator.incLine(s - i)
+            i = self._spliceLineS(theLineS, s)
+        self._fileLocator.incLine(len(theLineS) - i)
+
     #=============
     # End: Phase 2
     #=============
@@ -724,7 +1200,21 @@ class PpTokeniser(object):
         """
         # Represents the contents of a source file after translation phases 1, 2
         # Always do Phase 0, a psuedo phase
-        myLines = self.lexPhases_0()
+        myText = self._readSource()
+        if self._ituTokS is not None:
+            if not _hasTrigraph(myText):
+                self._ituTextS.append(myText)
+            else:
+                # Tokens can not be mapped to their original spelling
+                self._ituTokS = None
+        if _isPhase12Identity(myText):
+            # Nothing to rewrite so use the text as it is. The file locator
+            # has the same phases as if lexPhases_1() and lexPhases_2() had
+            # been called, one for trigraphs and one for line splicing.
+            self._fileLocator.startNewPhase()
+            self._fileLocator.startNewPhase()
+            return myText
+        myLines = _splitLines(myText)
         self.lexPhases_1(myLines)
         # NOTE: This side-effects the lines
         self.lexPhases_2(myLines)
@@ -749,29 +1239,58 @@ class PpTokeniser(object):
         :returns: ``NoneType``
         """
         self._fileLocator.startNewPhase()
-        myMr = MatrixRep.MatrixRep()
-        # Trigraph replacement
-        for lineNum, aLine in enumerate(theLineS):
-            i = 0
-            while i <= (len(aLine) - TRIGRAPH_SIZE):
-                if aLine[i] == TRIGRAPH_PREFIX \
-                and aLine[i+1] == TRIGRAPH_PREFIX \
-                and aLine[i+2] in TRIGRAPH_TABLE:
-                    # Trigraph replacement
-                    myMr.addLineColRep(
-                                lineNum,
-                                i,
-                                aLine[i:i+TRIGRAPH_SIZE],
-                                TRIGRAPH_TABLE[aLine[i+2]]
-                                )
-                    self._fileLocator.setTrigraph()
-                    i += TRIGRAPH_SIZE
+        self._fileLocator.substStrings(self._translateLinesTrigraphs(theLineS))
+        self._fileLocator.incLine(len(theLineS))
+
+    def _translateLinesTrigraphs(self, theLineS, theLineOffset=0):
+        """Does the work of :py:meth:`_translateTrigraphs` on lines that
+        start at the given line offset in the file and returns the
+        substitutions for the file locator.
+
+        :param theLineS: Source code lines, this is side-effected.
+        :type theLineS: ``list([]), list([str])``
+
+        :param theLineOffset: Number of lines of the file before theLineS.
+        :type theLineOffset: ``int``
+
+        :returns: ``list([tuple([int, int, int, int])])`` -- Substitutions
+            as ``(logical_line, logical_col, len_physical, len_logical)``.
+        """
+        myLineStart = FileLocation.START_LINE + theLineOffset
+        # Substitutions for the file locator, recorded in bulk
+        mySubstS = []
+        # Trigraph replacement, only visiting lines that have a trigraph start
+        for lineNum in _retLineIndexes(theLineS, _genFind(''.join(theLineS), TRIGRAPH_START)):
+            aLine = theLineS[lineNum]
+            i = aLine.find(TRIGRAPH_START)
+            myPartS = []
+            c = 0
+            # Number of trigraphs so far on this line, each one reduces the
+            # logical column by two.
+            k = 0
+            while 0 <= i <= (len(aLine) - TRIGRAPH_SIZE):
+                if aLine[i+2] in TRIGRAPH_TABLE:
+                    # Trigraph replacement, recorded just after the logical
+                    # column of the replacement as setTrigraph() does.
+                    mySubstS.append(
+                        (
+                            myLineStart + lineNum,
+                            FileLocation.START_COLUMN + i - 2 * k + 1,
+                            TRIGRAPH_SIZE,
+                            1,
+                        )
+                    )
+                    myPartS.append(aLine[c:i])
+                    myPartS.append(TRIGRAPH_TABLE[aLine[i+2]])
+                    k += 1
+                    c = i + TRIGRAPH_SIZE
+                    i = aLine.find(TRIGRAPH_START, c)
                 else:
-                    i += 1
-                self._fileLocator.incCol()
-            self._fileLocator.incLine()
-        #print 'TRACE: Trigraph self._fileLocator', self._fileLocator
-        myMr.sideEffect(theLineS)
+                    i = aLine.find(TRIGRAPH_START, i + 1)
+            if k:
+                myPartS.append(aLine[c:])
+                theLineS[lineNum] = ''.join(myPartS)
+        return mySubstS
 
     def substAltToken(self, tok):
         """If a PpToken is a Digraph this alters its value to its alternative.
@@ -844,7 +1363,13 @@ class PpTokeniser(object):
 
         :raises: ``GeneratorExit, StopIteration``
         """
-        for aTokTypeObj in self.genLexPptokenAndSeqWs(self.initLexPhase12()):
+        if self._chunkSize:
+            myGen = self.genLexPptokenStream()
+        elif self._jobs != 1:
+            myGen = self.genLexPptokenParallel()
+        else:
+            myGen = self.genLexPptokenAndSeqWs(self.initLexPhase12())
+        for aTokTypeObj in myGen:
             r = yield aTokTypeObj
             if r is not None:
                 # Caller has invoked send() and that call also returns the next yield.
@@ -857,6 +1382,7 @@ class PpTokeniser(object):
                 yield r
                 # Only one send() between next() calls so we continue
                 # with the iteration...
+        self._isExhausted = True
 
     def genLexPptokenAndSeqWs(self, theCharS):
         """Generates a sequence of PpToken objects. Either:
@@ -891,46 +1417,85 @@ class PpTokeniser(object):
         """
         #print 'TRACE: genLexPptokenAndSeqWs():'
         self._fileLocator.startNewPhase()
+        # Tokens and the file locator only track the offset, line and column
+        # are computed from this if required
+        myLineIndex = FileLocation.LineIndex(theCharS)
+        self._fileLocator.setLineIndex(myLineIndex)
+        yield from self._genLexPptokens(theCharS, myLineIndex)
+
+    def _genLexPptokens(self, theCharS, theLineIndex, theOfs=0, isLast=True):
+        """Does the work of :py:meth:`genLexPptokenAndSeqWs` on theCharS which
+        is at offset theOfs of the buffer indexed by theLineIndex.
+
+        If isLast is False then more text follows theCharS so this stops
+        before any token that might be changed by that text, that is a token
+        that reaches the end of theCharS or an unclosed C comment. The
+        generator returns the offset in theCharS where it stopped.
+
+        :param theCharS: The source code after translation phase 2.
+        :type theCharS: ``str``
+
+        :param theLineIndex: The line index of the whole buffer.
+        :type theLineIndex: :py:class:`cpip.core.FileLocation.LineIndex`
+
+        :param theOfs: Offset of theCharS in the whole buffer.
+        :type theOfs: ``int``
+
+        :param isLast: True if theCharS is the end of the buffer.
+        :type isLast: ``bool``
+
+        :returns: :py:class:`cpip.core.PpToken.PpToken` -- Sequence of tokens.
+        """
         ofsIdx = 0
+        myItuTokS = self._ituTokS
         try:
             while 1:
                 # Each pass through the loop we yield either:
                 # - Whitespace
                 # - A comment that is converted to whitespace
                 # - Something else
-                # Take current position
-                myLine = self._fileLocator.lineNum
-                myCol = self._fileLocator.colNum
                 self._cppTokType = None
+                if not isLast \
+                and theCharS.startswith('/*', ofsIdx) \
+                and theCharS.find('*/', ofsIdx + 2) < 0:
+                    # Comment is closed by text that follows
+                    return ofsIdx
                 sliceLen = self._sliceWhitespace(theCharS, ofsIdx) \
                     or self._sliceLexComment(theCharS, ofsIdx) \
                     or self._sliceLexPptoken(theCharS, ofsIdx)
                 #print 'TRACE: TOK slice=%d index=%d token="%s" type="%s"' \
                 #    % (sliceLen, ofsIdx, theCharS[ofsIdx:ofsIdx+sliceLen], self._cppTokType) 
                 if sliceLen > 0:
+                    if not isLast and ofsIdx + sliceLen >= len(theCharS):
+                        # Token might be extended by text that follows
+                        return ofsIdx
                     assert(self._changeOfTokenTypeIsOk or self._cppTokType is not None), \
                         'genLexPptokenAndSeqWs() sliceLen=%d but token type is None for: "%s"' \
                             % (sliceLen, theCharS[ofsIdx:ofsIdx+sliceLen])
                     # Fix comments to replace them by a comment character
-                    mySlice = theCharS[ofsIdx:ofsIdx+sliceLen]
-                    self._fileLocator.update(mySlice)
-                    ofsIdx += sliceLen
                     if self._cppTokType in COMMENT_TYPES:
                         # Turn the comment into a single whitespace
                         myTok = PpToken.PpToken(COMMENT_REPLACEMENT,
                                               'whitespace',
-                                              myLine,
-                                              myCol)
+                                              lineIndex=theLineIndex,
+                                              ofs=theOfs + ofsIdx)
                     else:
-                        myTok = PpToken.PpToken(mySlice,
+                        myTok = PpToken.PpToken(theCharS[ofsIdx:ofsIdx+sliceLen],
                                               self._cppTokType,
-                                              myLine,
-                                              myCol)
+                                              lineIndex=theLineIndex,
+                                              ofs=theOfs + ofsIdx)
+                    if myItuTokS is not None:
+                        myItuTokS.append((theOfs + ofsIdx, sliceLen, self._cppTokType))
+                    ofsIdx += sliceLen
+                    self._fileLocator.offset = theOfs + ofsIdx
                     yield myTok
                 else:
                     break
         except IndexError:
             pass
+        if not isLast:
+            # Try again with more text
+            return ofsIdx
         # Poke input and report if incomplete
         try:
             theCharS[ofsIdx]
@@ -939,6 +1504,271 @@ class PpTokeniser(object):
                 self.fileLocator)
         except IndexError:
             pass
+        return ofsIdx
+
+    def _genSourceLineBatches(self, theChunkSize):
+        """Reads the file from the start and yields lists of lines of at least
+        theChunkSize characters, apart from the last list.
+
+        :param theChunkSize: Minimum number of characters in a batch.
+        :type theChunkSize: ``int``
+
+        :returns: ``list([str])`` -- Sequence of lines.
+        """
+        try:
+            self._rewindFile()
+            myBatch = []
+            mySize = 0
+            for aLine in self._file:
+                myBatch.append(aLine)
+                mySize += len(aLine)
+                if mySize >= theChunkSize:
+                    yield myBatch
+                    myBatch = []
+                    mySize = 0
+        except Exception as err:
+            raise ExceptionCpipTokeniser(str(err))
+        if len(myBatch):
+            yield myBatch
+
+    def genLexPptokenStream(self, theChunkSize=0):
+        """Generates the same sequence of PpToken objects as
+        ``genLexPptokenAndSeqWs(initLexPhase12())`` but reads the file and
+        performs translation phases 1, 2 and 3 a chunk at a time.
+
+        Chunks are whole lines and do not end part way through a line splice.
+        Any token that might continue into the next chunk, such as trailing
+        whitespace or an unclosed C comment, is carried over to it. So memory
+        use is bounded by the chunk size (plus the line index, one integer per
+        line) rather than the file size and the first tokens are available
+        as soon as the first chunk is read. This needs a file object that
+        reads the file as it goes, such as a
+        :py:class:`cpip.core.SourceBuffer.SourceStream`, rather than one that
+        holds the whole content.
+
+        .. note::
+
+            The tokens, and their line and column, are identical. The physical
+            position reported by the file locator can differ in a file with
+            several line splice groups. This is because :py:meth:`lexPhases_2`
+            records each splice group at a line number that lags by the
+            number of lines already spliced. When the whole file is processed
+            first those records can affect earlier lines. When streaming they
+            have not been recorded yet when those lines are tokenised.
+
+        :param theChunkSize: Approximate number of characters in a chunk,
+            zero for the value given to the constructor or, failing that,
+            :py:data:`STREAM_CHUNK_SIZE`.
+        :type theChunkSize: ``int``
+
+        :returns: :py:class:`cpip.core.PpToken.PpToken` -- Sequence of tokens.
+        """
+        myChunkSize = theChunkSize or self._chunkSize or STREAM_CHUNK_SIZE
+        myReader = self._genSourceLineBatches(myChunkSize)
+        # Set up the phases as initLexPhase12() would. Phase 0 is pushed when
+        # the reader starts, then one for trigraphs and one for line splicing.
+        # Substitutions in the first two are recorded as each batch is read.
+        myBatch = next(myReader, None)
+        self._fileLocator.startNewPhase()
+        self._fileLocator.startNewPhase()
+        myLineIndex = FileLocation.LineIndex('')
+        # Lines read and spliced
+        myLineCount = 0
+        # The file locator line number for splicing, this is carried from
+        # chunk to chunk exactly as lexPhases_2() would have it
+        mySpliceLineNum = FileLocation.START_LINE
+        # Lines after phase one waiting for the end of a splice group
+        myLineS = []
+        # Text after phase two waiting for the end of a C comment
+        myTextS = []
+        # Text carried over from the previous chunk and its offset
+        myCarry = ''
+        myCarryOfs = 0
+        # If the carry is an unclosed C comment then chunks are added to this
+        # until one of them closes it. Only each new chunk, and the character
+        # before it, is searched so this is linear in the comment length.
+        myCommentS = []
+        myCommentTail = ''
+        isLast = False
+        while not isLast:
+            if myBatch is None:
+                isLast = True
+            else:
+                if self._ituTokS is not None:
+                    myBatchText = ''.join(myBatch)
+                    if not _hasTrigraph(myBatchText):
+                        self._ituTextS.append(myBatchText)
+                    else:
+                        # Tokens can not be mapped to their original spelling
+                        self._ituTokS = None
+                myLineOffset = myLineCount + len(myLineS)
+                self._fileLocator.substStrings(
+                    self._convertLinesToLexCharset(myBatch, myLineOffset), -3
+                )
+                self._fileLocator.substStrings(
+                    self._translateLinesTrigraphs(myBatch, myLineOffset), -2
+                )
+                myLineS.extend(myBatch)
+                myBatch = next(myReader, None)
+                if myBatch is not None and myLineS[-1].endswith(self.CONT_STR):
+                    # Incomplete splice group
+                    continue
+            if len(myLineS):
+                self._fileLocator.lineNum = mySpliceLineNum
+                self._spliceLines(myLineS)
+                mySpliceLineNum = self._fileLocator.lineNum
+                myLineCount += len(myLineS)
+                myTextS.extend(myLineS)
+                myLineS = []
+            myText = ''.join(myTextS)
+            myTextS = []
+            myLineIndex.extend(myText)
+            if len(myCommentS):
+                myCommentS.append(myText)
+                if not isLast and (myCommentTail + myText).find('*/') < 0:
+                    myCommentTail = myText[-1:] or myCommentTail
+                    continue
+                myCarry = ''.join(myCommentS)
+                myCommentS = []
+            else:
+                myCarry += myText
+            self._fileLocator.setLineIndex(myLineIndex)
+            self._fileLocator.offset = myCarryOfs
+            myOfs = yield from self._genLexPptokens(myCarry, myLineIndex, myCarryOfs, isLast)
+            myCarryOfs += myOfs
+            myCarry = myCarry[myOfs:]
+            if myCarry.startswith('/*') and myCarry.find('*/', 2) < 0:
+                myCommentS.append(myCarry)
+                # The last character can start the '*/' but not the '*' of '/*'
+                myCommentTail = myCarry[2:][-1:]
+
+    def genLexPptokenParallel(self, theJobs=0, theChunkSize=0):
+        """Generates the same sequence of PpToken objects as
+        ``genLexPptokenAndSeqWs(initLexPhase12())`` but tokenises chunks of
+        the file in a pool of processes. This is worthwhile for very large
+        files, small ones are tokenised serially.
+
+        Translation phases 1 and 2 are done first, then the text is split at
+        the boundaries found by :py:func:`_retChunkBoundaries`. Each worker
+        tokenises its chunk up to the whitespace before the boundary. Chunks
+        are stitched in order and each boundary is checked, that whitespace
+        must end at the boundary. If it does not, or a worker fails, then the
+        rest of the file is tokenised serially so the result is always
+        identical to the serial tokeniser.
+
+        :param theJobs: Number of processes, zero for the value given to the
+            constructor or, failing that, the number of CPUs.
+        :type theJobs: ``int``
+
+        :param theChunkSize: Approximate number of characters in a chunk,
+            zero for :py:data:`PARALLEL_CHUNK_SIZE`.
+        :type theChunkSize: ``int``
+
+        :returns: :py:class:`cpip.core.PpToken.PpToken` -- Sequence of tokens.
+        """
+        myText = self.initLexPhase12()
+        self._fileLocator.startNewPhase()
+        myLineIndex = FileLocation.LineIndex(myText)
+        self._fileLocator.setLineIndex(myLineIndex)
+        myJobs = theJobs or (self._jobs if self._jobs > 1 else 0) \
+            or multiprocessing.cpu_count()
+        myBoundS = _retChunkBoundaries(myText, theChunkSize or PARALLEL_CHUNK_SIZE)
+        if myJobs < 2 or len(myBoundS) == 0:
+            yield from self._genLexPptokens(myText, myLineIndex)
+            return
+        myStartS = [0] + myBoundS
+        myEndS = myBoundS + [len(myText)]
+        with multiprocessing.Pool(processes=min(myJobs, len(myStartS))) as myPool:
+            myResultS = myPool.imap(
+                _lexChunk,
+                (myText[s:e] for s, e in zip(myStartS, myEndS)),
+            )
+            for myStart, myEnd, myResult in zip(myStartS, myEndS, myResultS):
+                # Where to continue serially if this chunk can not be used
+                myOfs = myStart
+                if myResult is not None:
+                    myStop, myLenS, myTypeS = myResult
+                    for aLen, aType in zip(myLenS, myTypeS):
+                        self._cppTokType = CHUNK_TOKEN_TYPES[aType]
+                        if self._cppTokType in COMMENT_TYPES:
+                            myTok = PpToken.PpToken(COMMENT_REPLACEMENT,
+                                                    'whitespace',
+                                                    lineIndex=myLineIndex,
+                                                    ofs=myOfs)
+                        else:
+                            myTok = PpToken.PpToken(myText[myOfs:myOfs+aLen],
+                                                    self._cppTokType,
+                                                    lineIndex=myLineIndex,
+                                                    ofs=myOfs)
+                        if self._ituTokS is not None:
+                            self._ituTokS.append((myOfs, aLen, self._cppTokType))
+                        myOfs += aLen
+                        self._fileLocator.offset = myOfs
+                        yield myTok
+                    assert myOfs == myStart + myStop
+                    if myEnd < len(myText) \
+                    and myOfs < myEnd \
+                    and myText[myOfs:myEnd].strip(WHITESPACE_CHARS) == '':
+                        # Whitespace up to a genuine boundary
+                        self._cppTokType = 'whitespace'
+                        myTok = PpToken.PpToken(myText[myOfs:myEnd],
+                                                self._cppTokType,
+                                                lineIndex=myLineIndex,
+                                                ofs=myOfs)
+                        if self._ituTokS is not None:
+                            self._ituTokS.append((myOfs, myEnd - myOfs, self._cppTokType))
+                        self._fileLocator.offset = myEnd
+                        yield myTok
+                        continue
+                # Last chunk or not a boundary so finish serially
+                self._fileLocator.offset = myOfs
+                yield from self._genLexPptokens(myText[myOfs:], myLineIndex, myOfs)
+                return
+
+    def tokenBuffer(self):
+        """Performs translation phases 1, 2 and 3 on the whole file and returns
+        all the tokens as a :py:class:`cpip.core.TokenBuffer.TokenBuffer`.
+
+        This has the same tokens as :py:meth:`next` but appends them to the
+        buffer directly rather than creating a
+        :py:class:`cpip.core.PpToken.PpToken` for each one.
+
+        :returns: :py:class:`cpip.core.TokenBuffer.TokenBuffer` -- The tokens.
+        """
+        myCharS = self.initLexPhase12()
+        self._fileLocator.startNewPhase()
+        myLineIndex = FileLocation.LineIndex(myCharS)
+        self._fileLocator.setLineIndex(myLineIndex)
+        retVal = TokenBuffer.TokenBuffer()
+        # Note this is similar to the code in self._genLexPptokens()
+        ofsIdx = 0
+        try:
+            while 1:
+                self._cppTokType = None
+                sliceLen = self._sliceWhitespace(myCharS, ofsIdx) \
+                    or self._sliceLexComment(myCharS, ofsIdx) \
+                    or self._sliceLexPptoken(myCharS, ofsIdx)
+                if sliceLen <= 0:
+                    break
+                myLine, myCol = myLineIndex.lineCol(ofsIdx)
+                if self._cppTokType in COMMENT_TYPES:
+                    # Turn the comment into a single whitespace
+                    retVal.append(COMMENT_REPLACEMENT, 'whitespace', myLine, myCol)
+                elif self._cppTokType == 'identifier':
+                    retVal.append(myCharS[ofsIdx:ofsIdx+sliceLen], self._cppTokType,
+                                  myLine, myCol, PpToken.PpToken.FLAG_CAN_REPLACE)
+                else:
+                    retVal.append(myCharS[ofsIdx:ofsIdx+sliceLen], self._cppTokType,
+                                  myLine, myCol)
+                ofsIdx += sliceLen
+                self._fileLocator.offset = ofsIdx
+        except IndexError:
+            pass
+        if ofsIdx < len(myCharS):
+            self._diagnostic.partialTokenStream(
+                'lex.pptoken has unparsed tokens %s' % myCharS[ofsIdx:],
+                self.fileLocator)
+        return retVal
 
     ###########################
     # End: Token generators
@@ -1150,27 +1980,28 @@ class PpTokeniser(object):
 
         :returns: ``int`` -- Length of matching characters found.
         """
-        retVal = self._sliceLexPptokenGeneral(
-                                theBuf,
-                                theOfs,
-                                (
-                                    # pp-number
-                                    self._sliceLexPpnumber,
-                                    # Moved to later because of #define complex
-                                    # See doc string.
-                                    ## preprocessing-op-or-punc
-                                    #self._sliceLexOperators,
-                                    # character-literal
-                                    self._sliceCharacterLiteral,
-                                    # string-literal
-                                    self._sliceStringLiteral,
-                                    # We don't do header-name, see note above.
-                                    # identifier
-                                    self._sliceLexName,
-                                    # preprocessing-op-or-punc
-                                    self._sliceLexOperators,
+        # Only try the functions that can match the first character, in the
+        # order: pp-number, character-literal, string-literal, identifier,
+        # preprocessing-op-or-punc. We don't do header-name, see note above.
+        try:
+            myNameS = PPTOKEN_DISPATCH_TABLE.get(theBuf[theOfs], ())
+        except IndexError:
+            myNameS = ()
+        if len(myNameS) == 1:
+            # No need to find the longest match and by contract _slice...()
+            # functions trap IndexError
+            myCottio = self._changeOfTokenTypeIsOk
+            self._changeOfTokenTypeIsOk = True
+            retVal = getattr(self, myNameS[0])(theBuf, theOfs)
+            self._changeOfTokenTypeIsOk = myCottio
+        elif len(myNameS):
+            retVal = self._sliceLexPptokenGeneral(
+                                    theBuf,
+                                    theOfs,
+                                    [getattr(self, n) for n in myNameS],
                                 )
-                            )
+        else:
+            retVal = 0
         if retVal == 0:
             # "each non-white-space character that cannot be one of the above"
             retVal = self._sliceNonWhitespaceSingleChar(theBuf, theOfs)
@@ -1829,8 +2660,25 @@ class PpTokeniser(object):
 
         :returns: ``int`` -- Length of matching characters found.
         """
-        # Note: StrTree.has() traps IndexError so we don't have to
-        i = CHAR_SET_STR_TREE_MAP['lex.op']['operators'].has(theBuf, theOfs) - theOfs
+        i = 0
+        try:
+            myOpS = OPERATOR_DISPATCH_TABLE.get(theBuf[theOfs], ())
+        except IndexError:
+            myOpS = ()
+        if isinstance(theBuf, str):
+            for anOp in myOpS:
+                if theBuf.startswith(anOp, theOfs):
+                    i = len(anOp)
+                    break
+        else:
+            # Buffer-like object so only access it with [i]
+            for anOp in myOpS:
+                try:
+                    if all(theBuf[theOfs+j] == c for j, c in enumerate(anOp)):
+                        i = len(anOp)
+                        break
+                except IndexError:
+                    pass
         if i > 0:
             assert(self._changeOfTokenTypeIsOk or self._cppTokType is None), '_cppTokType was %s now %s' \
                 % (self._cppTokType, 'preprocessing-op-or-punc')
@@ -0,0 +1,476 @@
+#!/usr/bin/env python
+# CPIP is a C/C++ Preprocessor implemented in Python.
+# Copyright (C) 2008-2017 Paul Ross
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Paul Ross: apaulross@gmail.com
+
+"""Reads source files for the tokeniser.
+
+A source file is memory mapped and decoded once, directly from the mapping,
+according to an :py:data:`EncodingPolicy`. The result is a read-only file like
+:py:class:`SourceBuffer` whose :py:meth:`SourceBuffer.read` returns the
+decoded string itself rather than a copy.
+
+Line endings are translated as Python's universal newlines do so the content
+is the same as reading the file in text mode.
+
+Example::
+
+    myPolicy = EncodingPolicy(('utf-8', 'latin-1'), 'strict')
+    myTokeniser = PpTokeniser.PpTokeniser(theFileObj=openSource('spam.h', myPolicy))
+
+For tokenising in chunks, see
+:py:meth:`cpip.core.PpTokeniser.PpTokeniser.genLexPptokenStream`, a file can
+instead be opened with :py:func:`openSourceStream`. This returns a
+:py:class:`SourceStream` that decodes the file a block at a time as lines are
+read from it so the decoded content is never held in memory all at once.
+"""
+
+__author__  = 'Paul Ross'
+__date__    = '2023-06-20'
+__rights__  = 'Copyright (c) 2008-2017 Paul Ross'
+
+import codecs
+import collections
+import io
+import locale
+import mmap
+import os
+
+from cpip import ExceptionCpip
+
+class ExceptionSourceBuffer(ExceptionCpip):
+    """Exception when reading a source file."""
+    pass
+
+#: An encoding policy is:
+#:
+#: * ``encodings`` - A sequence of codec names that are tried in order.
+#:   ``None`` means the locale's preferred encoding which is what ``open()``
+#:   uses in text mode.
+#: * ``errors`` - The error handler, for example ``'strict'`` or ``'replace'``,
+#:   used with the *last* encoding. Earlier encodings are always tried
+#:   strictly so that a later one gets a chance.
+EncodingPolicy = collections.namedtuple('EncodingPolicy', 'encodings errors')
+
+#: Number of bytes that a :py:class:`SourceStream` reads and decodes at a time.
+STREAM_READ_SIZE = 64 * 1024
+
+#: The default policy has the same behaviour as ``open()`` in text mode.
+DEFAULT_ENCODING_POLICY = EncodingPolicy((None,), 'strict')
+
+def retEncodingPolicy(theEncodingS=None, theErrors=None):
+    """Returns an EncodingPolicy from, say, command line arguments.
+
+    :param theEncodingS: Encodings to try in order, None or empty for the default.
+    :type theEncodingS: ``NoneType, list([str])``
+
+    :param theErrors: Error handler for the last encoding, None for the default.
+    :type theErrors: ``NoneType, str``
+
+    :returns: :py:data:`EncodingPolicy` -- The policy.
+    """
+    return EncodingPolicy(
+        tuple(theEncodingS or DEFAULT_ENCODING_POLICY.encodings),
+        theErrors or DEFAULT_ENCODING_POLICY.errors,
+    )
+
+def decode(theData, thePolicy=None):
+    """Decodes bytes, or any object supporting the buffer protocol such as
+    an ``mmap.mmap``, to a string with universal newline translation.
+
+    :param theData: The encoded content.
+    :type theData: ``bytes, mmap.mmap``
+
+    :param thePolicy: The encoding policy, None for the default.
+    :type thePolicy: ``NoneType``, :py:data:`EncodingPolicy`
+
+    :returns: ``str`` -- The decoded content.
+
+    :raises: ``ExceptionSourceBuffer`` if the content can not be decoded.
+    """
+    thePolicy = thePolicy or DEFAULT_ENCODING_POLICY
+    if len(thePolicy.encodings) == 0:
+        raise ExceptionSourceBuffer('Encoding policy has no encodings.')
+    retVal = None
+    myErrS = []
+    for i, anEnc in enumerate(thePolicy.encodings):
+        if anEnc is None:
+            anEnc = locale.getpreferredencoding(False)
+        if i == len(thePolicy.encodings) - 1:
+            myErrors = thePolicy.errors
+        else:
+            myErrors = 'strict'
+        try:
+            retVal = str(theData, anEnc, myErrors)
+            break
+        except (UnicodeDecodeError, LookupError) as err:
+            myErrS.append(str(err))
+    if retVal is None:
+        raise ExceptionSourceBuffer('Can not decode: %s' % '; '.join(myErrS))
+    if '\r' in retVal:
+        retVal = retVal.replace('\r\n', '\n').replace('\r', '\n')
+    return retVal
+
+def openSource(thePath, thePolicy=None):
+    """Reads a source file by memory mapping it and returns a
+    :py:class:`SourceBuffer`. The file is closed on return.
+
+    :param thePath: The file path.
+    :type thePath: ``str``
+
+    :param thePolicy: The encoding policy, None for the default.
+    :type thePolicy: ``NoneType``, :py:data:`EncodingPolicy`
+
+    :returns: :py:class:`SourceBuffer` -- The decoded file.
+
+    :raises: ``OSError`` if the file can not be read, ``ExceptionSourceBuffer``
+        if it can not be decoded.
+    """
+    with open(thePath, 'rb') as myFile:
+        try:
+            myMap = mmap.mmap(myFile.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # Empty file or not mappable, a pipe for example
+            myText = decode(myFile.read(), thePolicy)
+        else:
+            try:
+                myText = decode(myMap, thePolicy)
+            finally:
+                myMap.close()
+    return SourceBuffer(myText, thePath)
+
+def openSourceStream(thePath, thePolicy=None):
+    """Opens a source file for reading line by line and returns a
+    :py:class:`SourceStream` that decodes the file as it is read.
+
+    If the policy has more than one encoding then each one, apart from the
+    last, is tried by decoding the whole file a block at a time and discarding
+    the result. The first that succeeds is used. The last encoding is not
+    tried, so if it fails then :py:class:`ExceptionSourceBuffer` is raised when
+    the undecodable content is read rather than by this function.
+
+    :param thePath: The file path.
+    :type thePath: ``str``
+
+    :param thePolicy: The encoding policy, None for the default.
+    :type thePolicy: ``NoneType``, :py:data:`EncodingPolicy`
+
+    :returns: :py:class:`SourceStream` -- The file.
+
+    :raises: ``OSError`` if the file can not be read, ``ExceptionSourceBuffer``
+        if no encoding can be used.
+    """
+    thePolicy = thePolicy or DEFAULT_ENCODING_POLICY
+    if len(thePolicy.encodings) == 0:
+        raise ExceptionSourceBuffer('Encoding policy has no encodings.')
+    myErrS = []
+    for i, anEnc in enumerate(thePolicy.encodings):
+        if anEnc is None:
+            anEnc = locale.getpreferredencoding(False)
+        try:
+            codecs.getincrementaldecoder(anEnc)
+        except LookupError as err:
+            myErrS.append(str(err))
+            continue
+        if i == len(thePolicy.encodings) - 1:
+            return SourceStream(thePath, anEnc, thePolicy.errors)
+        # The file is closed at the end or on failure
+        myStream = SourceStream(thePath, anEnc, 'strict')
+        try:
+            while myStream._readBlock():
+                myStream._clear()
+        except ExceptionSourceBuffer as err:
+            myErrS.append(str(err))
+        else:
+            myStream.seek(0)
+            return myStream
+    raise ExceptionSourceBuffer('Can not decode: %s' % '; '.join(myErrS))
+
+class SourceStream(object):
+    """A read-only file like object that decodes a source file a block at a
+    time as it is read, with universal newline translation. It supports the
+    subset of the text file interface that the tokeniser uses when
+    streaming, it can only seek to the start.
+
+    The underlying file is opened on construction, and on seeking to the
+    start, and closed at the end of the file.
+
+    :param thePath: The file path.
+    :type thePath: ``str``
+
+    :param theEncoding: The encoding.
+    :type theEncoding: ``str``
+
+    :param theErrors: The error handler.
+    :type theErrors: ``str``
+
+    :returns: ``NoneType``
+    """
+    def __init__(self, thePath, theEncoding, theErrors):
+        self.name = thePath
+        self.encoding = theEncoding
+        self.errors = theErrors
+        self._file = None
+        self.seek(0)
+
+    def _clear(self):
+        """Discards the decoded text that has not been read."""
+        self._text = ''
+        self._ofs = 0
+
+    def _readBlock(self):
+        """Reads and decodes the next block. The decoded text that has been
+        read is discarded.
+
+        :returns: ``bool`` -- False if at the end of the file.
+        """
+        if self._isEof:
+            return False
+        myBytes = self._file.read(STREAM_READ_SIZE)
+        self._isEof = len(myBytes) == 0
+        try:
+            myText = self._decoder.decode(myBytes, final=self._isEof)
+        except UnicodeDecodeError as err:
+            self.close()
+            raise ExceptionSourceBuffer('Can not decode %s: %s' % (self.name, err))
+        if self._isEof:
+            self.close()
+        self._text = self._text[self._ofs:] + myText
+        self._ofs = 0
+        return True
+
+    def read(self, size=-1):
+        """Reads from the current position.
+
+        :param size: Maximum number of characters, negative for all.
+        :type size: ``int``
+
+        :returns: ``str`` -- The content.
+        """
+        while (size is None or size < 0 or len(self._text) - self._ofs < size) \
+        and self._readBlock():
+            pass
+        if size is None or size < 0:
+            myEnd = len(self._text)
+        else:
+            myEnd = min(len(self._text), self._ofs + size)
+        retVal = self._text[self._ofs:myEnd]
+        self._ofs = myEnd
+        return retVal
+
+    def readline(self):
+        """Reads a line including its newline, if any.
+
+        :returns: ``str`` -- The line, empty at end of file.
+        """
+        myEnd = self._text.find('\n', self._ofs)
+        while myEnd < 0:
+            # Search only the text that has been added
+            mySearch = len(self._text) - self._ofs
+            if not self._readBlock():
+                myEnd = len(self._text)
+                break
+            myEnd = self._text.find('\n', mySearch)
+        else:
+            myEnd += 1
+        retVal = self._text[self._ofs:myEnd]
+        self._ofs = myEnd
+        return retVal
+
+    def readlines(self):
+        """Reads the remaining lines, each including its newline.
+
+        :returns: ``list([str])`` -- The lines.
+        """
+        return list(self)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        retVal = self.readline()
+        if retVal == '':
+            raise StopIteration
+        return retVal
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        """Sets the position to the start of the file, no other position is
+        supported.
+
+        :param offset: The offset, must be zero.
+        :type offset: ``int``
+
+        :param whence: Must be ``os.SEEK_SET``.
+        :type whence: ``int``
+
+        :returns: ``int`` -- The new position, zero.
+        """
+        if offset != 0 or whence != os.SEEK_SET:
+            raise ValueError('SourceStream can only seek to the start.')
+        self.close()
+        self._file = open(self.name, 'rb')
+        self._decoder = io.IncrementalNewlineDecoder(
+            codecs.getincrementaldecoder(self.encoding)(self.errors),
+            translate=True,
+        )
+        self._isEof = False
+        self._clear()
+        return 0
+
+    def close(self):
+        """Closes the underlying file if it is open.
+
+        :returns: ``NoneType``
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        self.close()
+        return False
+
+class SourceBuffer(object):
+    """A read-only, in-memory, file like object holding decoded source code.
+    It supports the subset of the text file interface that CPIP uses.
+
+    :param theText: The decoded source code.
+    :type theText: ``str``
+
+    :param theName: The file name, if None then this has no ``name``
+        attribute, like an ``io.StringIO``.
+    :type theName: ``NoneType, str``
+
+    :returns: ``NoneType``
+    """
+    def __init__(self, theText, theName=None):
+        self._text = theText
+        self._pos = 0
+        if theName is not None:
+            self.name = theName
+
+    @property
+    def text(self):
+        """The entire decoded content.
+
+        :returns: ``str`` -- The content.
+        """
+        return self._text
+
+    def read(self, size=-1):
+        """Reads from the current position. If reading the whole content this
+        returns the content without copying it.
+
+        :param size: Maximum number of characters, negative for all.
+        :type size: ``int``
+
+        :returns: ``str`` -- The content.
+        """
+        if size is None or size < 0:
+            myEnd = len(self._text)
+        else:
+            myEnd = min(len(self._text), self._pos + size)
+        if self._pos == 0 and myEnd == len(self._text):
+            retVal = self._text
+        else:
+            retVal = self._text[self._pos:myEnd]
+        self._pos = myEnd
+        return retVal
+
+    def readline(self):
+        """Reads a line including its newline, if any.
+
+        :returns: ``str`` -- The line, empty at end of file.
+        """
+        myEnd = self._text.find('\n', self._pos)
+        if myEnd < 0:
+            myEnd = len(self._text)
+        else:
+            myEnd += 1
+        retVal = self._text[self._pos:myEnd]
+        self._pos = myEnd
+        return retVal
+
+    def readlines(self):
+        """Reads the remaining lines, each including its newline.
+
+        :returns: ``list([str])`` -- The lines.
+        """
+        retVal = self.read().split('\n')
+        if retVal[-1] == '':
+            retVal.pop()
+            return [aLine + '\n' for aLine in retVal]
+        myLast = retVal.pop()
+        retVal = [aLine + '\n' for aLine in retVal]
+        retVal.append(myLast)
+        return retVal
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        retVal = self.readline()
+        if retVal == '':
+            raise StopIteration
+        return retVal
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        """Sets the position in characters.
+
+        :param offset: The offset.
+        :type offset: ``int``
+
+        :param whence: ``os.SEEK_SET``, ``os.SEEK_CUR`` or ``os.SEEK_END``.
+        :type whence: ``int``
+
+        :returns: ``int`` -- The new position.
+        """
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += len(self._text)
+        elif whence != os.SEEK_SET:
+            raise ValueError('Invalid whence: %s' % whence)
+        if offset < 0:
+            raise ValueError('Negative seek position %d' % offset)
+        self._pos = offset
+        return self._pos
+
+    def tell(self):
+        """Returns the current position in characters.
+
+        :returns: ``int`` -- Position.
+        """
+        return self._pos
+
+    def close(self):
+        """Does nothing as the file has already been closed.
+
+        :returns: ``NoneType``
+        """
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        self.close()
+        return False
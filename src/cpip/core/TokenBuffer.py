@@ -0,0 +1,511 @@
+#!/usr/bin/env python
+# CPIP is a C/C++ Preprocessor implemented in Python.
+# Copyright (C) 2008-2017 Paul Ross
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Paul Ross: apaulross@gmail.com
+
+"""Holds a stream of tokens column-wise in typed arrays rather than as a
+sequence of :py:class:`cpip.core.PpToken.PpToken` objects.
+
+This is the bulk transport format between the tokeniser and the token cache.
+The lexer does not use it as macro replacement works on
+:py:class:`cpip.core.PpToken.PpToken` objects.
+
+The token text is held in one shared string with each token being a slice of
+it. Types, line and column numbers and flags are held in parallel arrays. A :py:class:`TokenBuffer` can be pickled cheaply or
+written with :py:meth:`TokenBuffer.toBytes` and read back with
+:py:meth:`TokenBuffer.fromBytes` which will accept a ``mmap.mmap`` object.
+
+Example::
+
+    from cpip.core import PpTokeniser
+
+    myBuf = PpTokeniser.PpTokeniser(myFile).tokenBuffer()
+    for aView in myBuf:
+        print(aView.t, aView.tt, aView.lineNum)
+"""
+
+__author__  = 'Paul Ross'
+__date__    = '2023-06-16'
+__rights__  = 'Copyright (c) 2008-2017 Paul Ross'
+
+import array
+import struct
+
+from cpip import ExceptionCpip
+from cpip.core import PpToken
+
+class ExceptionTokenBuffer(ExceptionCpip):
+    """Exception when handling a TokenBuffer."""
+    pass
+
+#: Header of the serialised form: magic, format version, option bits,
+#: token count, byte length of the text, byte length of the type names.
+#: Arrays are serialised in the native byte order so the serialised form is
+#: for sharing between processes on the same machine.
+HEADER = struct.Struct('=4sHHIII')
+#: Option bit: the line and column arrays are present. They are omitted if all
+#: zero, for example with tokens from :py:class:`cpip.core.ItuToTokens.ItuToTokens`.
+OPTION_LINE_COL = 0x1
+#: Magic bytes at the start of the serialised form.
+MAGIC = b'CPTB'
+#: Version of the serialised form, change this if the layout changes.
+FORMAT_VERSION = 1
+#: Array type code for the text offsets, line and column numbers.
+ARRAY_TYPE = 'i'
+#: Separator between type names in the serialised form.
+TYPE_NAME_SEP = '\n'
+
+class TokenView(object):
+    """A lightweight read only view of one token in a :py:class:`TokenBuffer`.
+    This has the same read only properties as a :py:class:`cpip.core.PpToken.PpToken`.
+
+    :param theBuffer: The buffer.
+    :type theBuffer: :py:class:`TokenBuffer`
+
+    :param theIndex: The index of the token.
+    :type theIndex: ``int``
+
+    :returns: ``NoneType``
+    """
+    __slots__ = ('_buf', '_idx')
+    def __init__(self, theBuffer, theIndex):
+        self._buf = theBuffer
+        self._idx = theIndex
+
+    @property
+    def index(self):
+        """The index of the token in the buffer.
+
+        :returns: ``int`` -- Index.
+        """
+        return self._idx
+
+    @property
+    def t(self):
+        """The token as a string.
+
+        :returns: ``str`` -- Token.
+        """
+        return self._buf.tokenText(self._idx)
+
+    @property
+    def tt(self):
+        """The token type as a string.
+
+        :returns: ``str`` -- Token type.
+        """
+        return self._buf.typeName(self._buf._typeS[self._idx])
+
+    @property
+    def lineNum(self):
+        """The line number of the start of the token.
+
+        :returns: ``int`` -- Line number.
+        """
+        return self._buf._lineS[self._idx]
+
+    @property
+    def colNum(self):
+        """The column number of the start of the token.
+
+        :returns: ``int`` -- Column number.
+        """
+        return self._buf._colS[self._idx]
+
+    @property
+    def flags(self):
+        """The packed flags, these are the ``PpToken.FLAG_...`` bits.
+
+        :returns: ``int`` -- Flags.
+        """
+        return self._buf._flagS[self._idx]
+
+    @property
+    def canReplace(self):
+        return bool(self.flags & PpToken.PpToken.FLAG_CAN_REPLACE)
+
+    @property
+    def prevWs(self):
+        return bool(self.flags & PpToken.PpToken.FLAG_PREV_WS)
+
+    @property
+    def isCond(self):
+        return bool(self.flags & PpToken.PpToken.FLAG_IS_COND)
+
+    @property
+    def isReplacement(self):
+        return bool(self.flags & PpToken.PpToken.FLAG_IS_REPLACEMENT)
+
+    def ppToken(self):
+        """Returns a new :py:class:`cpip.core.PpToken.PpToken` for this token.
+
+        :returns: :py:class:`cpip.core.PpToken.PpToken` -- The token.
+        """
+        return self._buf.ppToken(self._idx)
+
+    def __str__(self):
+        return 'TokenView(t="%s", tt=%s, line=%d, col=%d, flags=0x%x)' \
+            % (self.t.replace('\n', '\\n'), self.tt, self.lineNum, self.colNum, self.flags)
+
+class TokenBuffer(object):
+    """A stream of tokens held column-wise.
+
+    The type column is an index into a table of type names. The table starts
+    with :py:data:`cpip.core.PpToken.LEX_PPTOKEN_TYPES` so type values are the
+    same as the enumerated token types of :py:class:`cpip.core.PpToken.PpToken`.
+    Other type names, for example ``'keyword'`` from
+    :py:class:`cpip.core.ItuToTokens.ItuToTokens`, are added to the table as
+    they are seen.
+
+    Indexing or iterating gives :py:class:`TokenView` objects.
+    """
+    def __init__(self):
+        # While appending the text is held as a list of strings, this is
+        # joined on first use of self._text
+        self._textS = []
+        self._text = ''
+        # End offsets of each token in the text, the start is the previous end
+        self._endS = array.array(ARRAY_TYPE)
+        self._typeS = bytearray()
+        self._lineS = array.array(ARRAY_TYPE)
+        self._colS = array.array(ARRAY_TYPE)
+        self._flagS = bytearray()
+        # Type name table and reverse map
+        self._typeNameS = list(PpToken.LEX_PPTOKEN_TYPES)
+        self._typeIdxMap = {n : i for i, n in enumerate(self._typeNameS)}
+        self._textLen = 0
+
+    #######################################
+    # Section: Construction
+    #######################################
+    @classmethod
+    def fromPpTokens(cls, theTokS):
+        """Returns a new TokenBuffer from an iterable of
+        :py:class:`cpip.core.PpToken.PpToken`.
+
+        :param theTokS: The tokens.
+        :type theTokS: ``iterable([cpip.core.PpToken.PpToken])``
+
+        :returns: :py:class:`TokenBuffer` -- The buffer.
+        """
+        ret_val = cls()
+        ret_val.extendPpTokens(theTokS)
+        return ret_val
+
+    @classmethod
+    def fromTokToktypes(cls, theTokS):
+        """Returns a new TokenBuffer from an iterable of ``(token, token_type)``
+        where ``token_type`` is a string.
+
+        :param theTokS: The tokens.
+        :type theTokS: ``iterable([tuple([str, str])])``
+
+        :returns: :py:class:`TokenBuffer` -- The buffer.
+        """
+        ret_val = cls()
+        for t, tt in theTokS:
+            ret_val.append(t, tt)
+        return ret_val
+
+    def _typeIdx(self, theType):
+        """Returns the index in the type table of the type, adding a type
+        name if necessary.
+
+        :param theType: The type name or enumerated value.
+        :type theType: ``str, int``
+
+        :returns: ``int`` -- Index in the type table.
+
+        :raises: :py:class:`ExceptionTokenBuffer` if the type is unknown or
+            the table is full.
+        """
+        if isinstance(theType, int):
+            if 0 <= theType < len(self._typeNameS):
+                return theType
+            raise ExceptionTokenBuffer('Unknown token type %d' % theType)
+        try:
+            return self._typeIdxMap[theType]
+        except KeyError:
+            pass
+        if len(self._typeNameS) > 255:
+            raise ExceptionTokenBuffer('Too many token types adding "%s"' % theType)
+        self._typeIdxMap[theType] = len(self._typeNameS)
+        self._typeNameS.append(theType)
+        return self._typeIdxMap[theType]
+
+    def append(self, t, tt, lineNum=0, colNum=0, flags=0):
+        """Appends a token.
+
+        :param t: The token.
+        :type t: ``str``
+
+        :param tt: The token type, a name or the enumerated value.
+        :type tt: ``str, int``
+
+        :param lineNum: Line number.
+        :type lineNum: ``int``
+
+        :param colNum: Column number.
+        :type colNum: ``int``
+
+        :param flags: Packed flags, the ``PpToken.FLAG_...`` bits.
+        :type flags: ``int``
+
+        :returns: ``NoneType``
+        """
+        if isinstance(self._endS, memoryview):
+            self._copyViews()
+        self._typeS.append(self._typeIdx(tt))
+        self._textS.append(t)
+        self._textLen += len(t)
+        self._endS.append(self._textLen)
+        self._lineS.append(lineNum)
+        self._colS.append(colNum)
+        self._flagS.append(flags)
+
+    def _copyViews(self):
+        """Replaces the views of a serialised form made by :py:meth:`fromBytes`
+        by copies that can be appended to.
+
+        :returns: ``NoneType``
+        """
+        self._endS = array.array(ARRAY_TYPE, self._endS)
+        self._lineS = array.array(ARRAY_TYPE, self._lineS)
+        self._colS = array.array(ARRAY_TYPE, self._colS)
+        self._typeS = bytearray(self._typeS)
+        self._flagS = bytearray(self._flagS)
+
+    def appendPpToken(self, theTok):
+        """Appends a :py:class:`cpip.core.PpToken.PpToken`.
+
+        :param theTok: The token.
+        :type theTok: :py:class:`cpip.core.PpToken.PpToken`
+
+        :returns: ``NoneType``
+        """
+        t, tt = theTok.tokEnumToktype
+        self.append(t, tt, theTok.lineNum, theTok.colNum, theTok.flags)
+
+    def extendPpTokens(self, theTokS):
+        """Appends an iterable of :py:class:`cpip.core.PpToken.PpToken`.
+
+        :param theTokS: The tokens.
+        :type theTokS: ``iterable([cpip.core.PpToken.PpToken])``
+
+        :returns: ``NoneType``
+        """
+        for aTok in theTokS:
+            self.appendPpToken(aTok)
+    #######################################
+    # End: Construction
+    #######################################
+
+    #######################################
+    # Section: Access
+    #######################################
+    def __len__(self):
+        return len(self._typeS)
+
+    def __getitem__(self, theIndex):
+        if theIndex < 0:
+            theIndex += len(self)
+        if theIndex < 0 or theIndex >= len(self):
+            raise IndexError('TokenBuffer index %d out of range' % theIndex)
+        return TokenView(self, theIndex)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield TokenView(self, i)
+
+    @property
+    def text(self):
+        """The text of all the tokens.
+
+        :returns: ``str`` -- Text.
+        """
+        if self._textS:
+            self._textS.insert(0, self._text)
+            self._text = ''.join(self._textS)
+            self._textS = []
+        return self._text
+
+    @property
+    def typeNames(self):
+        """The type name table.
+
+        :returns: ``list([str])`` -- Type names.
+        """
+        return list(self._typeNameS)
+
+    def typeName(self, theTypeIdx):
+        """Returns the type name from an index in the type table.
+
+        :param theTypeIdx: Index in the type table.
+        :type theTypeIdx: ``int``
+
+        :returns: ``str`` -- Type name.
+        """
+        return self._typeNameS[theTypeIdx]
+
+    def tokenText(self, theIndex):
+        """Returns the text of a single token.
+
+        :param theIndex: The index of the token.
+        :type theIndex: ``int``
+
+        :returns: ``str`` -- Token.
+        """
+        myText = self.text
+        if theIndex == 0:
+            return myText[:self._endS[0]]
+        return myText[self._endS[theIndex - 1]:self._endS[theIndex]]
+
+    def ppToken(self, theIndex):
+        """Returns a new :py:class:`cpip.core.PpToken.PpToken` for a token.
+
+        :param theIndex: The index of the token.
+        :type theIndex: ``int``
+
+        :returns: :py:class:`cpip.core.PpToken.PpToken` -- The token.
+
+        :raises: :py:class:`cpip.core.PpToken.ExceptionCpipTokenUnknownType`
+            if the type is not a preprocessing token type.
+        """
+        ret_val = PpToken.PpToken(
+            self.tokenText(theIndex),
+            self._typeNameS[self._typeS[theIndex]],
+            self._lineS[theIndex],
+            self._colS[theIndex],
+        )
+        ret_val.flags = self._flagS[theIndex]
+        return ret_val
+
+    def genTokToktype(self):
+        """Generates ``(token, token_type)`` where ``token_type`` is a string.
+
+        :returns: ``tuple([str, str])`` -- Token and type.
+        """
+        myText = self.text
+        myNameS = self._typeNameS
+        myStart = 0
+        for myEnd, myType in zip(self._endS, self._typeS):
+            yield myText[myStart:myEnd], myNameS[myType]
+            myStart = myEnd
+
+    def genPpTokens(self):
+        """Generates new :py:class:`cpip.core.PpToken.PpToken` objects.
+
+        :returns: :py:class:`cpip.core.PpToken.PpToken` -- The tokens.
+        """
+        for i in range(len(self)):
+            yield self.ppToken(i)
+    #######################################
+    # End: Access
+    #######################################
+
+    #######################################
+    # Section: Serialisation
+    #######################################
+    def toBytes(self):
+        """Returns the serialised form.
+
+        :returns: ``bytes`` -- Serialised buffer.
+        """
+        myText = self.text.encode('utf-8', 'surrogatepass')
+        myNames = TYPE_NAME_SEP.join(self._typeNameS).encode('utf-8')
+        myOptions = 0
+        myArrayS = [self._endS]
+        if any(self._lineS) or any(self._colS):
+            myOptions |= OPTION_LINE_COL
+            myArrayS.extend([self._lineS, self._colS])
+        return b''.join(
+            [
+                HEADER.pack(MAGIC, FORMAT_VERSION, myOptions, len(self),
+                            len(myText), len(myNames)),
+                myText,
+                myNames,
+            ] \
+            + [a.tobytes() for a in myArrayS] \
+            + [bytes(self._typeS), bytes(self._flagS)]
+        )
+
+    @classmethod
+    def fromBytes(cls, theBuf):
+        """Returns a new TokenBuffer from the serialised form.
+
+        Only the text is copied, when it is decoded. The other columns are
+        views of theBuf so theBuf must not change while the TokenBuffer is in
+        use and, if it is a ``mmap.mmap``, it can not be closed until the
+        TokenBuffer is discarded. Appending to the TokenBuffer copies the
+        columns first.
+
+        :param theBuf: The serialised form as produced by :py:meth:`toBytes`.
+            This can be anything that supports the buffer protocol such as
+            ``bytes`` or ``mmap.mmap``.
+        :type theBuf: ``bytes, memoryview, mmap.mmap``
+
+        :returns: :py:class:`TokenBuffer` -- The buffer.
+
+        :raises: :py:class:`ExceptionTokenBuffer` if the serialised form is
+            not valid.
+        """
+        myView = memoryview(theBuf).cast('B')
+        try:
+            myMagic, myVersion, myOptions, myCount, myTextLen, myNamesLen \
+                = HEADER.unpack_from(myView)
+        except struct.error as err:
+            raise ExceptionTokenBuffer('Can not read header: %s' % err)
+        if myMagic != MAGIC or myVersion != FORMAT_VERSION:
+            raise ExceptionTokenBuffer(
+                'Unknown format %r version %d' % (myMagic, myVersion)
+            )
+        myItemSize = array.array(ARRAY_TYPE).itemsize
+        myNumArrays = 3 if myOptions & OPTION_LINE_COL else 1
+        myLen = HEADER.size + myTextLen + myNamesLen \
+            + myCount * (myNumArrays * myItemSize + 2)
+        if len(myView) < myLen:
+            raise ExceptionTokenBuffer(
+                'Serialised form too short, %d < %d' % (len(myView), myLen)
+            )
+        ret_val = cls()
+        ofs = HEADER.size
+        ret_val._text = str(myView[ofs:ofs + myTextLen], 'utf-8', 'surrogatepass')
+        ofs += myTextLen
+        ret_val._typeNameS = str(myView[ofs:ofs + myNamesLen], 'utf-8').split(TYPE_NAME_SEP)
+        ret_val._typeIdxMap = {n : i for i, n in enumerate(ret_val._typeNameS)}
+        ofs += myNamesLen
+        myArrayS = []
+        for i in range(myNumArrays):
+            myArrayS.append(myView[ofs:ofs + myCount * myItemSize].cast(ARRAY_TYPE))
+            ofs += myCount * myItemSize
+        if myNumArrays == 1:
+            # All zero
+            myArrayS.append(memoryview(bytes(myCount * myItemSize)).cast(ARRAY_TYPE))
+            myArrayS.append(myArrayS[-1])
+        ret_val._endS, ret_val._lineS, ret_val._colS = myArrayS
+        ret_val._typeS = myView[ofs:ofs + myCount]
+        ofs += myCount
+        ret_val._flagS = myView[ofs:ofs + myCount]
+        ret_val._textLen = len(ret_val._text)
+        return ret_val
+
+    def __reduce__(self):
+        return (self.fromBytes, (self.toBytes(),))
+    #######################################
+    # End: Serialisation
+    #######################################
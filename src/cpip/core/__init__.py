@@ -31,8 +31,11 @@ __all__ = [
 'CppDiagnostic',
 'FileIncludeGraph',
 'FileLocation',
+'FilePathTable',
 'IncludeHandler',
 'MacroEnv',
+'MacroProfiler',
+'MacroRefStore',
 'PpDefine',
 'PpLexer',
 'PpToken',
@@ -40,6 +43,8 @@ __all__ = [
 'PpTokeniser',
 'PpWhitespace',
 'PragmaHandler',
+'SourceBuffer',
+'TokenBuffer',
 ]
 
 
@@ -231,12 +231,14 @@ USAGE
         myIncH = IncludeHandler.CppIncludeStdin(
                     theUsrDirs=args.incUsr or [],
                     theSysDirs=args.incSys or [],
+                    theEncodingPolicy=Cpp.encodingPolicy(args),
         )
         ituName = 'stdin'
     else:
         myIncH = IncludeHandler.CppIncludeStdOs(
                     theUsrDirs=args.incUsr or [],
                     theSysDirs=args.incSys or [],
+                    theEncodingPolicy=Cpp.encodingPolicy(args),
         )
         ituName = args.path
     _processFile(ituName,
@@ -1,7 +1,10 @@
 import argparse
+import concurrent.futures
 import io
 import logging
+import multiprocessing
 import os
+import re
 import subprocess
 import sys
 import time
@@ -16,17 +19,34 @@ __date__ = '2023-06-12'
 
 logger = logging.getLogger(__file__)
 
+#: Maximum number of files given to a single clang-format invocation.
+CLANG_FORMAT_BATCH_SIZE = 64
+#: Names of the clang-format style file in the order that clang-format looks for them.
+CLANG_FORMAT_STYLE_FILES = ('.clang-format', '_clang-format')
+#: Style that clang-format uses if it finds no style file.
+CLANG_FORMAT_FALLBACK_STYLE = 'LLVM'
+#: First major version of clang-format that accepts --style=file:<path>.
+CLANG_FORMAT_STYLE_FILE_PATH_VERSION = 14
 
-def translate_phases_123_file(input_file: typing.TextIO, placeholder_comment: str) -> bytes:
+
+def translate_phases_123_file_to_stream(input_file: typing.TextIO, placeholder_comment: str,
+                                        output_stream: typing.BinaryIO) -> None:
+    """Write the input with comments removed (or replaced by the placeholder) to the binary output stream.
+    The words of the input file are held in memory, the output is not."""
     ith = ItuToTokens.ItuToTokens(input_file)
     ith.translatePhases123()
-    words = []
+    placeholder_bytes = bytes(placeholder_comment, 'ascii')
     for text, pp_type in ith.multiPassString.genWords():
         if pp_type not in PpTokeniser.COMMENT_TYPES:
-            words.append(bytes(text, 'ascii'))
-        elif placeholder_comment:
-            words.append(bytes(placeholder_comment, 'ascii'))
-    return b''.join(words)
+            output_stream.write(bytes(text, 'ascii'))
+        elif placeholder_bytes:
+            output_stream.write(placeholder_bytes)
+
+
+def translate_phases_123_file(input_file: typing.TextIO, placeholder_comment: str) -> bytes:
+    output_stream = io.BytesIO()
+    translate_phases_123_file_to_stream(input_file, placeholder_comment, output_stream)
+    return output_stream.getvalue()
 
 
 def translate_phases_123_path(input_str: str, placeholder_comment: str) -> bytes:
@@ -41,26 +61,61 @@ def write_bytes(out_path: str, out_bytes: bytes) -> None:
         output_file.write(out_bytes)
 
 
+def translate_phases_123_path_to_path(in_path: str, out_path: str, prefix_bytes: bytes,
+                                      placeholder_comment: str) -> str:
+    """Stream the input file with comments removed to the output file. Returns the output path.
+    On failure the partial output file is removed."""
+    logger.info('Writing %s', out_path)
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    try:
+        with open(in_path) as input_file, open(out_path, 'wb') as output_file:
+            output_file.write(prefix_bytes)
+            translate_phases_123_file_to_stream(input_file, placeholder_comment, output_file)
+    except Exception:
+        if os.path.exists(out_path):
+            os.remove(out_path)
+        raise
+    return out_path
+
+
+def _translate_phases_123_task(task: typing.Tuple[str, str, bytes, str]) -> str:
+    """Process pool entry point for translate_phases_123_path_to_path()."""
+    return translate_phases_123_path_to_path(*task)
+
+
 def process_dir_to_output(in_dir: str, out_dir: str, glob_match: str, recursive: bool, clang_format: bool,
-                          prefix_bytes: bytes, placeholder_comment: str) -> int:
-    """Process all the files in a directory. Returns a count of the files."""
+                          prefix_bytes: bytes, placeholder_comment: str, jobs: int = 1) -> int:
+    """Process all the files in a directory. Returns a count of the files.
+    If there is an output directory then jobs > 1 processes the files with a process pool, zero uses the number
+    of CPUs. clang-format, if requested, is run on batches of the output files once they are all written."""
     assert os.path.isdir(in_dir)
     logger.info('Processing %s to %s', in_dir, out_dir)
     time_start = time.process_time()
-    count = 0
-    path_out = os.path.abspath(out_dir) if out_dir else None
-    for t in DirWalk.dirWalk(in_dir, path_out, glob_match, recursive, bigFirst=False):
-        if out_dir:
-            output_bytes = prefix_bytes + translate_phases_123_path(t.filePathIn, placeholder_comment)
-            if clang_format:
-                output_bytes = run_clang_format(output_bytes)
-            logger.info('Writing %s', t.filePathOut)
-            write_bytes(t.filePathOut, output_bytes)
+    if jobs == 0:
+        jobs = multiprocessing.cpu_count()
+    if out_dir:
+        path_out = os.path.abspath(out_dir)
+        # Largest first gives the pool a better balance
+        tasks = [
+            (t.filePathIn, t.filePathOut, prefix_bytes, placeholder_comment)
+            for t in DirWalk.dirWalk(in_dir, path_out, glob_match, recursive, bigFirst=jobs > 1)
+        ]
+        if jobs > 1:
+            with multiprocessing.Pool(processes=jobs) as pool:
+                out_paths = list(pool.imap_unordered(_translate_phases_123_task, tasks))
         else:
-            output_bytes = prefix_bytes + translate_phases_123_path(t, placeholder_comment)
-            if clang_format:
-                output_bytes = run_clang_format(output_bytes)
-            print(output_bytes.decode('ascii'))
+            out_paths = [_translate_phases_123_task(task) for task in tasks]
+        if clang_format:
+            run_clang_format_batches(out_paths, jobs)
+        logger.info('Done. Time %.3f', time.process_time() - time_start)
+        return len(out_paths)
+    # Output to stdout is in order so is sequential
+    count = 0
+    for t in DirWalk.dirWalk(in_dir, None, glob_match, recursive, bigFirst=False):
+        output_bytes = prefix_bytes + translate_phases_123_path(t, placeholder_comment)
+        if clang_format:
+            output_bytes = run_clang_format(output_bytes)
+        print(output_bytes.decode('ascii'))
         count += 1
     logger.info('Done. Time %.3f', time.process_time() - time_start)
     return count
@@ -79,6 +134,81 @@ def run_clang_format(bytes_in: bytes, **kwargs) -> bytes:
     return result
 
 
+def run_clang_format_in_place(paths: typing.List[str], **kwargs) -> None:
+    """Run clang-format in place on a list of files with a single invocation."""
+    args = ['clang-format', '-i']
+    for k in kwargs:
+        args.append(f'{k}={kwargs[k]}')
+    args.extend(paths)
+    proc = subprocess.run(args)
+    if proc.returncode != 0:
+        raise IOError(f'clang-format failed with return code {proc.returncode}')
+
+
+def run_clang_format_path_in_place(path: str, **kwargs) -> None:
+    """Run clang-format on a file through stdin, as run_clang_format() does, and write the result back."""
+    with open(path, 'rb') as file:
+        bytes_in = file.read()
+    write_bytes(path, run_clang_format(bytes_in, **kwargs))
+
+
+def clang_format_version() -> typing.Optional[int]:
+    """Return the major version of clang-format or None if it can not be determined."""
+    try:
+        proc = subprocess.run(['clang-format', '--version'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    except OSError:
+        return None
+    match = re.search(rb'version (\d+)', proc.stdout)
+    if proc.returncode != 0 or match is None:
+        return None
+    return int(match.group(1))
+
+
+def find_clang_format_style(start_dir: str) -> typing.Optional[str]:
+    """Return the path of the style file that clang-format finds for input on stdin when run from start_dir,
+    that is the first in start_dir or its parents, or None."""
+    dir_path = os.path.abspath(start_dir)
+    while True:
+        for name in CLANG_FORMAT_STYLE_FILES:
+            path = os.path.join(dir_path, name)
+            if os.path.isfile(path):
+                return path
+        parent = os.path.dirname(dir_path)
+        if parent == dir_path:
+            return None
+        dir_path = parent
+
+
+def run_clang_format_batches(paths: typing.List[str], jobs: int, batch_size: int = CLANG_FORMAT_BATCH_SIZE,
+                             **kwargs) -> None:
+    """Run clang-format in place on the files in batches of batch_size with up to jobs invocations at once.
+    In place clang-format would find the style file from each file's directory so, unless a style is given,
+    the style is the one that run_clang_format() would find from the current working directory.
+    clang-format before version 14 can not be given the path of the style file so in that case each file is
+    formatted through stdin with run_clang_format()."""
+    if not any(k.lstrip('-') == 'style' for k in kwargs):
+        style_path = find_clang_format_style(os.getcwd())
+        if style_path is None:
+            style = kwargs.get('--fallback-style', CLANG_FORMAT_FALLBACK_STYLE)
+        else:
+            version = clang_format_version()
+            if version is None or version < CLANG_FORMAT_STYLE_FILE_PATH_VERSION:
+                logger.info('Running clang-format version %s on %d files through stdin', version, len(paths))
+                with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+                    futures = [executor.submit(run_clang_format_path_in_place, path, **kwargs) for path in paths]
+                    for future in futures:
+                        future.result()
+                return
+            style = f'file:{style_path}'
+        kwargs = dict(kwargs, **{'--style': style})
+    batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+    logger.info('Running clang-format on %d files in %d batches', len(paths), len(batches))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = [executor.submit(run_clang_format_in_place, batch, **kwargs) for batch in batches]
+        for future in futures:
+            future.result()
+
+
 def pack_lines(bytes_in: bytes) -> bytes:
     while bytes_in.find(b'\n\n') != -1:
         bytes_in = bytes_in.replace(b'\n\n', b'\n')
@@ -104,6 +234,15 @@ def main():
                              " [default: %(default)s]")
     parser.add_argument("-g", "--glob", action='append', default=[],
                         help="Pattern match to use when processing directories. [default: %(default)s] i.e. every file.")
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        dest="jobs",
+        default=1,
+        help="Max simultaneous processes when processing directories to an output directory."
+             f" Zero uses number of native CPUs [{multiprocessing.cpu_count()}]."
+             " [default: %(default)s]"
+    )
     parser.add_argument(
         "-l", "--loglevel",
         type=int,
@@ -141,7 +280,7 @@ def main():
     count_file = 0
     if os.path.isfile(in_path):
         # Single file
-        result = prefix_bytes + translate_phases_123_path(sys.argv[1], args.placeholder_comment)
+        result = prefix_bytes + translate_phases_123_path(in_path, args.placeholder_comment)
         if args.clang_format:
             # result = pack_lines(result)
             result = run_clang_format(result)
@@ -153,7 +292,7 @@ def main():
         count_file = 1
     elif os.path.isdir(in_path):
         count_file = process_dir_to_output(in_path, args.output, args.glob, args.recursive, args.clang_format,
-                                           prefix_bytes, args.placeholder_comment)
+                                           prefix_bytes, args.placeholder_comment, jobs=args.jobs)
     else:
         logger.error('Can not understand path %s', in_path)
     print(f'Processed {count_file} files in {time.perf_counter() - clk_start:.3} (s)')
@@ -11,6 +11,8 @@ import os
 import subprocess
 import sys
 
+from cpip.core import SourceBuffer
+
 def invokeCppForPlatformMacros(*args):
     """Invoke the pre-processor as a sub-process with \*args and return a list of macro
     definition strings.
@@ -67,6 +69,25 @@ initial translation unit. [default: %(default)s]""")
                       help="Add user include search path. [default: %(default)s]")
     parser.add_argument("-J", "--sys", action="append", dest="incSys", default=[],
                       help="Add system include search path. [default: %(default)s]")
+    # Source file decoding
+    parser.add_argument("--encoding", action="append", dest="encodings", default=[],
+                      help="""Encoding of source files, additive. Each is tried in
+turn until one succeeds. [default: %(default)s] i.e. the locale's
+preferred encoding.""")
+    parser.add_argument("--encoding-errors", type=str, dest="encoding_errors",
+                         default='strict',
+                      help="""Error handler for the last encoding, for example
+strict, replace or surrogateescape. [default: %(default)s]""")
+
+def encodingPolicy(args):
+    """Returns the policy for decoding source files specified on the command line.
+
+    :param args: Parsed arguments.
+    :type args: ``argparse.Namespace``
+
+    :returns: :py:data:`cpip.core.SourceBuffer.EncodingPolicy` -- The policy.
+    """
+    return SourceBuffer.retEncodingPolicy(args.encodings, args.encoding_errors)
 
 def macroDefinitionDict(cmdLineArgS):
     """Given a list of command line arguments of the form n<=d> where n is the
@@ -121,7 +142,7 @@ def predefinedFileObjects(args):
     :param args: Parsed arguments.
     :type args: ``argparse.Namespace``
 
-    :returns: ``list([_io.StringIO])`` -- List of file like objects.
+    :returns: ``list([_io.StringIO, cpip.core.SourceBuffer.SourceBuffer])`` -- List of file like objects.
     """
     retVal = []
     # First platform specific macros
@@ -132,5 +153,5 @@ def predefinedFileObjects(args):
     retVal.append(io.StringIO(macroDefinitionString(args.defines)))
     # Then pre-included files
     for preIncPath in args.preInc:
-        retVal.append(open(preIncPath))
+        retVal.append(SourceBuffer.openSource(preIncPath, encodingPolicy(args)))
     return retVal
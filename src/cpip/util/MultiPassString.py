@@ -25,8 +25,10 @@ __author__  = 'Paul Ross'
 __date__    = '2011-07-10'
 __rights__  = 'Copyright (c) 2008-2017 Paul Ross'
 
-import logging
+import array
 import collections
+import itertools
+import logging
 
 from cpip import ExceptionCpip
 
@@ -50,6 +52,16 @@ class MultiPassString(object):
                 i += 1
         except IndexError:
             pass
+
+    Alternatively a whole pass can be made over the string returned by
+    :py:meth:`currentText()` and words marked with :py:meth:`setWord()`,
+    :py:meth:`removeWord()` and :py:meth:`replaceWord()`. This avoids the
+    per-character cost of the generator.
+
+    Words are held as columns of start index, length and type in the original
+    string, the words are taken directly as slices of the original string.
+    If a word is marked more than once at the same index then the last one
+    wins.
     """
     UNKNOWN_TOKEN_TYPE = 'Unknown'
     EMPTY_TOKEN = ''
@@ -62,16 +74,23 @@ class MultiPassString(object):
 
         :returns: ``NoneType``
         """
-        # This is a map {int : class Word, ...}
-        # Where int is the index, len the word length and type the word type
-        self._idxTypeMap = {}
         self._origStr = theFileObj.read()
+        # Word columns, index and length in self._origStr and an index into
+        # self._typeNameS.
+        self._wordStartS = array.array('i')
+        self._wordLenS = array.array('i')
+        self._wordTypeS = bytearray()
+        # Word type names and the reverse map {name : index, ...}
+        self._typeNameS = []
+        self._typeIdxMap = {}
         # This is a list of char, string or None
         # empty string - char has been replaced by something smaller
         # one char string - normal.
         # longer string - char has been replaced by something bigger
         # The length of this is always the length of self._origStr 
         self._current = list(self._origStr)
+        # True if any member of self._current is longer than one character
+        self._hasLongRepl = False
         self._idxGenChar = self._retZeroIndex()
         self._idxMarker = self.MARKER_CLEAR
         # Helper API, this is the previously generated character
@@ -90,6 +109,46 @@ class MultiPassString(object):
             i += 1
         return i 
 
+    def _retTypeIdx(self, theType):
+        """Returns the index of the type name, adding it if necessary.
+
+        :param theType: The type.
+        :type theType: ``str``
+
+        :returns: ``int`` -- The index into self._typeNameS."""
+        try:
+            return self._typeIdxMap[theType]
+        except KeyError:
+            if len(self._typeNameS) > 255:
+                raise ExceptionMultiPass('Too many word types: %s' % theType)
+            self._typeIdxMap[theType] = len(self._typeNameS)
+            self._typeNameS.append(theType)
+            return self._typeIdxMap[theType]
+
+    def _addWord(self, theStart, theLen, theType):
+        """Appends a word to the columns.
+
+        :param theStart: Index of the start of the word in the original string.
+        :type theStart: ``int``
+
+        :param theLen: Length of the word in the original string.
+        :type theLen: ``int``
+
+        :param theType: The type.
+        :type theType: ``str``
+
+        :returns: ``NoneType``"""
+        self._wordStartS.append(theStart)
+        self._wordLenS.append(theLen)
+        self._wordTypeS.append(self._retTypeIdx(theType))
+
+    def _retStartColumnMap(self):
+        """Returns a map of ``{start : column_index, ...}``, where there is more
+        than one word at the same start the last one wins.
+
+        :returns: ``dict({int : [int]})`` -- The map."""
+        return dict(zip(self._wordStartS, range(len(self._wordStartS))))
+
     #==============================
     # Section: Read-only properties
     #==============================
@@ -104,10 +163,21 @@ class MultiPassString(object):
     @property
     def currentString(self):
         return self._current
+
+    @property
+    def originalString(self):
+        """The original string as read from the file."""
+        return self._origStr
     
     @property
     def idxTypeMap(self):
-        return self._idxTypeMap
+        """A map of ``{index : Word, ...}`` of the words in the original string.
+        This is constructed on each call."""
+        return {
+            k : Word(wordLen=self._wordLenS[i],
+                     wordType=self._typeNameS[self._wordTypeS[i]])
+            for k, i in self._retStartColumnMap().items()
+        }
     
     @property
     def prevChar(self):
@@ -126,7 +196,6 @@ class MultiPassString(object):
         """Sets a mark at this point in the input.
 
         :returns: ``NoneType``"""
-        logging.debug('MultiPassString.setMarker() at %d', self._idxGenChar)
         self._idxMarker = self._idxGenChar
 
     def clearMarker(self):
@@ -165,8 +234,6 @@ class MultiPassString(object):
         logging.debug('MultiPassString.setWordType() "%s", isTerm=%s', theType, isTerm)
         if self._idxMarker == self.MARKER_CLEAR:
             raise ExceptionMultiPass('setWordType(): when no marker present.')
-#        if self._idxMarker in self._idxTypeMap:
-#            raise ExceptionMultiPass('setWordType(): Duplicate key: %s' % self._idxMarker)
         myLen = self.wordLength
         if isTerm:
             myLen += 1
@@ -174,7 +241,7 @@ class MultiPassString(object):
             myLen = 1
             theType = 'Unknown'
 #            raise ExceptionMultiPass('Marking word with illegal length: %s' % myLen)
-        self._idxTypeMap[self._idxMarker] = Word(wordLen=myLen, wordType=theType)
+        self._addWord(self._idxMarker, myLen, theType)
 
     def removeMarkedWord(self, isTerm):
         """Remove the current marked word. isTerm is a boolean that is True
@@ -207,8 +274,12 @@ class MultiPassString(object):
             self._current[self._idxMarker:self._idxMarker+myLen],
             myLen,
         )
-        for l in range(myLen):
-            self.__set(self._idxMarker+l, self.EMPTY_TOKEN)
+        if self._idxMarker + myLen - 1 > self._idxGenChar:
+            raise ExceptionMultiPass(
+                'Marking word at %s when generator only at index=%s' \
+                    % (self._idxMarker + myLen - 1, self._idxGenChar)
+            )
+        self._clearRange(self._idxMarker, myLen)
     
     def setAtMarker(self, theRepl):
         """Sets the token at the current marker to be theRepl.
@@ -221,27 +292,34 @@ class MultiPassString(object):
         :raises: ``ExceptionMultiPass`` no marker present."""
         if self._idxMarker == self.MARKER_CLEAR:
             raise ExceptionMultiPass('setAtMarker(): when no marker present.')
-        self._current[self._idxMarker] = theRepl
-        
-    def __set(self, idx, repl):
-        """Sets a marker.
+        self._setAt(self._idxMarker, theRepl)
 
-        :param idx: Index of marker.
-        :type idx: ``int``
+    def _setAt(self, theIdx, theRepl):
+        """Sets the current string at theIdx to theRepl.
 
-        :param repl: The marker.
-        :type repl: ``str``
+        :param theIdx: Index in the original string.
+        :type theIdx: ``int``
 
-        :returns: ``NoneType``
+        :param theRepl: The repl.
+        :type theRepl: ``str``
+
+        :returns: ``NoneType``"""
+        if len(theRepl) > 1:
+            self._hasLongRepl = True
+        self._current[theIdx] = theRepl
+
+    def _clearRange(self, theStart, theLen):
+        """Removes a range from the current string.
+
+        :param theStart: Index in the original string.
+        :type theStart: ``int``
+
+        :param theLen: Length in the original string.
+        :type theLen: ``int``
 
-        :raises: ``ExceptionMultiPass`` in index error."""
+        :returns: ``NoneType``"""
         assert(len(self._origStr) == len(self._current))
-        if idx > self._idxGenChar:
-            raise ExceptionMultiPass(
-                'Marking word at %s when generator only at index=%s' \
-                    % (idx, self._idxGenChar)
-            )
-        self._current[idx] = repl
+        self._current[theStart:theStart+theLen] = [self.EMPTY_TOKEN] * theLen
     
     def removeSetReplaceClear(self, isTerm, theType, theRepl):
         """This provides a helper combination function for a common operation of:
@@ -269,6 +347,96 @@ class MultiPassString(object):
     # End: Markers and setting at marker.
     #==============================
 
+    #=============================================
+    # Section: Whole pass access to the current string.
+    #=============================================
+    def currentText(self):
+        """Returns the current string and a map from that back to the original
+        string. The map is an ``array('i')`` with the index in the original
+        string of each character in the current string and one extra entry
+        that is the length of the original string.
+
+        The indexes can be used with :py:meth:`setWord()`,
+        :py:meth:`removeWord()` and :py:meth:`replaceWord()` that do not use
+        the marker.
+
+        This counts as a complete pass of :py:meth:`genChars()` so
+        :py:attr:`idxChar` and :py:attr:`prevChar` are left at the end.
+
+        :returns: ``tuple([str, array.array])`` -- ``(current_string, index_map)``."""
+        myText = ''.join(self._current)
+        self._idxGenChar = len(self._current)
+        self._prevChar = myText[-1:]
+        if self._hasLongRepl:
+            myIdxS = array.array('i')
+            for i, v in enumerate(self._current):
+                myIdxS.extend([i] * len(v))
+        else:
+            # Only empty or single characters so the truthiness of each
+            # member selects the index.
+            myIdxS = array.array(
+                'i', itertools.compress(range(len(self._current)), self._current)
+            )
+        myIdxS.append(len(self._origStr))
+        assert len(myIdxS) == len(myText) + 1
+        return myText, myIdxS
+
+    def setWord(self, theStart, theLen, theType):
+        """Marks a word of type theType in the original string.
+
+        :param theStart: Index of the start of the word in the original string.
+        :type theStart: ``int``
+
+        :param theLen: Length of the word in the original string, must be > 0.
+        :type theLen: ``int``
+
+        :param theType: The type.
+        :type theType: ``str``
+
+        :returns: ``NoneType``"""
+        if theLen <= 0:
+            raise ExceptionMultiPass('setWord() with illegal length: %s' % theLen)
+        self._addWord(theStart, theLen, theType)
+
+    def removeWord(self, theStart, theLen):
+        """Removes a word in the original string from the current string.
+
+        :param theStart: Index of the start of the word in the original string.
+        :type theStart: ``int``
+
+        :param theLen: Length of the word in the original string, must be > 0.
+        :type theLen: ``int``
+
+        :returns: ``NoneType``"""
+        if theLen <= 0:
+            raise ExceptionMultiPass('removeWord() with illegal length: %s' % theLen)
+        self._clearRange(theStart, theLen)
+
+    def replaceWord(self, theStart, theLen, theType, theRepl):
+        """Marks a word of type theType in the original string and replaces it
+        in the current string with theRepl. This is the whole pass equivalent
+        of :py:meth:`removeSetReplaceClear()`.
+
+        :param theStart: Index of the start of the word in the original string.
+        :type theStart: ``int``
+
+        :param theLen: Length of the word in the original string, must be > 0.
+        :type theLen: ``int``
+
+        :param theType: The type.
+        :type theType: ``str``
+
+        :param theRepl: The replacement.
+        :type theRepl: ``str``
+
+        :returns: ``NoneType``"""
+        self.removeWord(theStart, theLen)
+        self._addWord(theStart, theLen, theType)
+        self._setAt(theStart, theRepl)
+    #=============================================
+    # End: Whole pass access to the current string.
+    #=============================================
+
     #==============================
     # Section: Generators
     #==============================
@@ -279,7 +447,8 @@ class MultiPassString(object):
         """
         assert(len(self._origStr) == len(self._current))
         self._prevChar = ''
-        self._idxGenChar = self._retZeroIndex()
+        # Leading empty tokens are counted by the loop
+        self._idxGenChar = 0
         for v in self._current:
             for c in v:
                 yield c
@@ -289,43 +458,28 @@ class MultiPassString(object):
     def genWords(self):
         """Generates pairs ``(word, type)`` from the original string.
 
-        TODO: Solve the overlap problem.
+        A word that is wholly inside the previous word, for example a trigraph
+        inside a comment, is not generated. A word that partially overlaps the
+        previous word raises.
 
         :returns: ``NoneType``, ``tuple([str, str])`` -- a pair of ``(word, type)``"""
+        myColMap = self._retStartColumnMap()
         idx = 0
         k = 0
-        for k in sorted(self._idxTypeMap.keys()):
+        for k in sorted(myColMap.keys()):
+            i = myColMap[k]
             if k > idx:
-                logging.debug(
-                    'MultiPassString.genWords() 0: k=%d, idx=%d, str="%s" type="%s"',
-                    k,
-                    idx,
-                    self._origStr[idx:k],
-                    self.UNKNOWN_TOKEN_TYPE,
-                )
                 yield self._origStr[idx:k], self.UNKNOWN_TOKEN_TYPE
             elif k < idx:
+                if k + self._wordLenS[i] <= idx:
+                    # Nested in the previous word
+                    continue
                 raise ExceptionMultiPass('Overlap: from %s to %s' % (k, idx))
-            w = self._idxTypeMap[k]
-            assert(w.wordLen > 0)
-            idx = k + w.wordLen
-            logging.debug(
-                'MultiPassString.genWords() 1: k=%d, idx=%d, str="%s" type="%s"',
-                k,
-                idx,
-                self._origStr[k:idx],
-                w.wordType,
-            )
-            yield self._origStr[k:idx], w.wordType
+            assert(self._wordLenS[i] > 0)
+            idx = k + self._wordLenS[i]
+            yield self._origStr[k:idx], self._typeNameS[self._wordTypeS[i]]
         # Finally the tail
         if k+idx < len(self._origStr):
-            logging.debug(
-                'MultiPassString.genWords() 2: k=%d, idx=%d, str="%s" type="%s"',
-                k,
-                idx,
-                self._origStr[k+idx:],
-                self.UNKNOWN_TOKEN_TYPE,
-            )
             yield self._origStr[k+idx:], self.UNKNOWN_TOKEN_TYPE
 
     #==============================
@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+# CPIP is a C/C++ Preprocessor implemented in Python.
+# Copyright (C) 2008-2017 Paul Ross
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Paul Ross: apaulross@gmail.com
+
+"""A copy-on-write map that can be forked in constant time.
+
+An :py:class:`OverlayMap` is a mutable dictionary of its own on top of a chain
+of frozen dictionaries. Forking freezes the dictionary of the map being forked
+and gives both the original and the fork an empty dictionary on top of that.
+Deletion of a key that is in a frozen dictionary is recorded with a tombstone.
+
+Lookups that miss the top dictionary walk the chain so the map flattens itself
+into a single dictionary once the chain is longer than :py:data:`MAX_DEPTH` or
+after :py:data:`FLATTEN_AFTER` lookups have had to walk it.
+
+Values are shared between forks so the map also keeps track of which values
+are owned by it. :py:meth:`OverlayMap.retOwned()` copies a shared value into
+the map before the caller changes it.
+
+Example::
+
+    myMap = OverlayMap({'A' : 1})
+    myFork = myMap.fork()
+    del myFork['A']
+    assert 'A' in myMap and 'A' not in myFork
+"""
+
+__author__  = 'Paul Ross'
+__date__    = '2023-07-25'
+__rights__  = 'Copyright (c) 2008-2017 Paul Ross'
+
+from cpip import ExceptionCpip
+
+class ExceptionOverlayMap(ExceptionCpip):
+    """Exception when handling an OverlayMap."""
+    pass
+
+#: The maximum number of frozen dictionaries under a map before it is flattened.
+MAX_DEPTH = 8
+
+#: The number of lookups that walk the frozen dictionaries before the map is
+#: flattened.
+FLATTEN_AFTER = 256
+
+class _Tombstone(object):
+    """Marks a deleted key."""
+    def __repr__(self):
+        return '<deleted>'
+
+#: Value that marks a key as deleted
+TOMBSTONE = _Tombstone()
+
+class Layer(object):
+    """A frozen dictionary in the chain of an :py:class:`OverlayMap`.
+
+    :param theMap: The dictionary, this must not be changed.
+    :type theMap: ``dict``
+
+    :param theParent: The layer beneath this one.
+    :type theParent: ``NoneType``, :py:class:`Layer`
+
+    :returns: ``NoneType``
+    """
+    __slots__ = ('map', 'parent', 'depth')
+    def __init__(self, theMap, theParent):
+        self.map = theMap
+        self.parent = theParent
+        self.depth = 1 if theParent is None else theParent.depth + 1
+
+class OverlayMap(object):
+    """A copy-on-write dictionary.
+
+    :param theMap: Initial contents, this is copied.
+    :type theMap: ``NoneType``, ``dict``
+
+    :returns: ``NoneType``
+    """
+    def __init__(self, theMap=None):
+        # The mutable dictionary on top of the chain, may contain TOMBSTONE
+        self._local = dict(theMap) if theMap else {}
+        # The chain of frozen dictionaries
+        self._parent = None
+        # Keys in self._local whose values are shared with another map
+        self._shared = set()
+        # Number of visible keys
+        self._len = len(self._local)
+        # Lookups that have walked the chain since it was last flattened
+        self._misses = 0
+
+    def __len__(self):
+        return self._len
+
+    def __contains__(self, theKey):
+        if theKey in self._local:
+            return self._local[theKey] is not TOMBSTONE
+        if self._parent is None:
+            return False
+        return self._chainGet(theKey) is not TOMBSTONE
+
+    def __getitem__(self, theKey):
+        try:
+            retVal = self._local[theKey]
+        except KeyError:
+            if self._parent is None:
+                raise
+            retVal = self._chainGet(theKey)
+        if retVal is TOMBSTONE:
+            raise KeyError(theKey)
+        return retVal
+
+    def __setitem__(self, theKey, theValue):
+        if theKey not in self:
+            self._len += 1
+        self._local[theKey] = theValue
+        self._shared.discard(theKey)
+
+    def __delitem__(self, theKey):
+        if theKey not in self:
+            raise KeyError(theKey)
+        if self._parent is None:
+            del self._local[theKey]
+        else:
+            self._local[theKey] = TOMBSTONE
+        self._shared.discard(theKey)
+        self._len -= 1
+
+    def __iter__(self):
+        """Yields each key, in no particular order."""
+        if self._parent is None:
+            for k in list(self._local.keys()):
+                yield k
+        else:
+            for k, v in list(self._retFlat().items()):
+                if v is not TOMBSTONE:
+                    yield k
+
+    def __getstate__(self):
+        # Pickles as a single dictionary, the unpickled values are not shared
+        return {k : self[k] for k in self}
+
+    def __setstate__(self, theState):
+        self.__init__(theState)
+
+    def _chainGet(self, theKey):
+        """Returns the value for a key from the frozen dictionaries, TOMBSTONE
+        if it is not there. May flatten the map."""
+        self._misses += 1
+        if self._misses > FLATTEN_AFTER:
+            self.flatten()
+            return self._local.get(theKey, TOMBSTONE)
+        myLayer = self._parent
+        while myLayer is not None:
+            if theKey in myLayer.map:
+                return myLayer.map[theKey]
+            myLayer = myLayer.parent
+        return TOMBSTONE
+
+    def _retFlat(self):
+        """Returns a new dictionary of the chain and my dictionary, this
+        includes tombstones."""
+        myLayerS = []
+        myLayer = self._parent
+        while myLayer is not None:
+            myLayerS.append(myLayer.map)
+            myLayer = myLayer.parent
+        retVal = {}
+        for aMap in reversed(myLayerS):
+            retVal.update(aMap)
+        retVal.update(self._local)
+        return retVal
+
+    @property
+    def depth(self):
+        """The number of frozen dictionaries beneath me.
+
+        :returns: ``int`` -- The depth.
+        """
+        return 0 if self._parent is None else self._parent.depth
+
+    def get(self, theKey, theDefault=None):
+        """Returns the value for the key or theDefault if absent."""
+        try:
+            return self[theKey]
+        except KeyError:
+            return theDefault
+
+    def keys(self):
+        """Returns a list of the keys, in no particular order.
+
+        :returns: ``list([object])`` -- The keys.
+        """
+        return list(self)
+
+    def pop(self, theKey, *args):
+        """Removes the key and returns its value. If the key is absent returns
+        the default if given otherwise raises a ``KeyError``."""
+        if len(args) > 1:
+            raise ExceptionOverlayMap(
+                'pop() takes at most 2 arguments not %d' % (len(args) + 1))
+        try:
+            retVal = self[theKey]
+        except KeyError:
+            if args:
+                return args[0]
+            raise
+        del self[theKey]
+        return retVal
+
+    def retDict(self):
+        """Returns my dictionary if it is the whole of the map and all of its
+        values are owned by me, None otherwise. This is for callers that need
+        lookups at the speed of a dictionary, the dictionary must not be
+        changed by the caller.
+
+        :returns: ``NoneType, dict`` -- The dictionary.
+        """
+        if self._parent is None and not self._shared:
+            return self._local
+        return None
+
+    def isOwned(self, theKey):
+        """Returns True if the value of the key belongs to me alone.
+
+        :param theKey: The key.
+        :type theKey: ``object``
+
+        :returns: ``bool`` -- True if the value is not shared with another map.
+        """
+        return theKey in self._local \
+            and self._local[theKey] is not TOMBSTONE \
+            and theKey not in self._shared
+
+    def retOwned(self, theKey, theCopy):
+        """Returns the value of the key that belongs to me alone. If the value
+        is shared with another map it is copied with theCopy and the copy
+        replaces it in me. Raises a ``KeyError`` if the key is absent.
+
+        :param theKey: The key.
+        :type theKey: ``object``
+
+        :param theCopy: A function that takes the value and returns a copy.
+        :type theCopy: ``function``
+
+        :returns: ``object`` -- The value.
+        """
+        if self._parent is None and not self._shared:
+            return self._local[theKey]
+        if self.isOwned(theKey):
+            return self._local[theKey]
+        retVal = theCopy(self[theKey])
+        self._local[theKey] = retVal
+        self._shared.discard(theKey)
+        return retVal
+
+    def fork(self):
+        """Returns a new map with the same contents as me in constant time.
+        Changes to either map are not seen by the other. Values are shared
+        until :py:meth:`retOwned()` is called for them.
+
+        :returns: :py:class:`OverlayMap` -- The new map.
+        """
+        if self._local:
+            # My values are now below my dictionary so are detected as shared
+            self._parent = Layer(self._local, self._parent)
+            self._local = {}
+            self._shared = set()
+        retVal = OverlayMap()
+        retVal._parent = self._parent
+        retVal._len = self._len
+        if self.depth > MAX_DEPTH:
+            self.flatten()
+            retVal.flatten()
+        return retVal
+
+    def flatten(self):
+        """Merges the frozen dictionaries into mine so that lookups are
+        constant time. The frozen dictionaries are not changed.
+
+        :returns: ``NoneType``
+        """
+        self._misses = 0
+        if self._parent is None:
+            return
+        myLocalKeyS = set(self._local.keys())
+        self._local = {
+            k : v for k, v in self._retFlat().items() if v is not TOMBSTONE
+        }
+        # Values from the frozen dictionaries are still shared
+        self._shared |= set(self._local.keys()) - myLocalKeyS
+        self._parent = None
@@ -39,6 +39,11 @@ from cpip import ExceptionCpip
 #: will be written. These will not mask other Exceptions. 
 RAISE_ON_ERROR = True
 
+#: Buffer size in bytes for files that a stream opens from a path.
+#: Token dense pages make a very large number of small writes so a large
+#: buffer reduces the number of system calls.
+FILE_BUFFER_SIZE = 1024 * 1024
+
 class ExceptionXml(ExceptionCpip):
     """Exception specialisation for the XML writer."""
     pass
@@ -179,7 +184,7 @@ class XmlStream(object):
         :returns: ``NoneType``
         """
         if isinstance(theFout, str):
-            self._file = open(theFout, 'w')
+            self._file = open(theFout, 'w', buffering=FILE_BUFFER_SIZE)
             self._fileClose = True
         else:
             self._file = theFout
@@ -193,6 +198,8 @@ class XmlStream(object):
         # An integer that represents a unique ID
         self._intId = theId
         self._mustIndent = mustIndent
+        # Cache of {css_class : '<span class="css_class">', ...} for writeSpanRun()
+        self._spanTagCache = {}
     
     @property
     def id(self):
@@ -282,6 +289,94 @@ class XmlStream(object):
         # mixed content - don't indent
         self._flipIndent(False)
 
+    def _spanTag(self, theCssClass):
+        """Returns the, cached, opening span tag for a CSS class.
+
+        :param theCssClass: The CSS class.
+        :type theCssClass: ``str``
+
+        :returns: ``str`` -- The opening tag.
+        """
+        try:
+            return self._spanTagCache[theCssClass]
+        except KeyError:
+            myTag = u'<span class="%s">' % self._encode(theCssClass)
+            self._spanTagCache[theCssClass] = myTag
+            return myTag
+
+    def writeSpanRun(self, theRun):
+        """Writes a run of ``(text, cssClass)`` pairs. Each pair is written as
+        ``<span class="cssClass">text</span>`` or, if ``cssClass`` is None,
+        as just the text. The text is encoded.
+
+        This is a fast alternative to creating an :py:class:`Element` for every
+        span in token dense pages. The whole run is formatted with precomputed
+        tag strings and written with a single call. The output is identical to
+        using an :py:class:`Element` for each span and :py:meth:`characters`
+        for the text without a span.
+
+        :param theRun: Sequence of ``(text, cssClass)`` pairs.
+        :type theRun: ``list([tuple([str, str]), tuple([str, NoneType])])``
+
+        :returns: ``NoneType``
+        """
+        if len(theRun) == 0:
+            return
+        self._closeElemIfOpen()
+        myCanIndent = self._canIndent
+        myEntityMap = self.ENTITY_MAP
+        myTagCache = self._spanTagCache
+        myL = []
+        for myText, myClass in theRun:
+            if myClass is None:
+                myL.append(myText.translate(myEntityMap))
+                # mixed content - don't indent
+                myCanIndent = False
+            else:
+                if myCanIndent:
+                    myL.append(u'\n')
+                    myL.append(self.INDENT_STR*len(self._elemStk))
+                try:
+                    myL.append(myTagCache[myClass])
+                except KeyError:
+                    myL.append(self._spanTag(myClass))
+                myL.append(myText.translate(myEntityMap))
+                myL.append(u'</span>')
+        self._file.write(u''.join(myL))
+        if not myCanIndent:
+            self._flipIndent(False)
+
+    def writeLinkedSpan(self, theText, theCssClass, theHref):
+        """Writes ``<a href="theHref"><span class="theCssClass">theText</span></a>``
+        in the same manner as :py:meth:`writeSpanRun`.
+
+        :param theText: The text.
+        :type theText: ``str``
+
+        :param theCssClass: The CSS class.
+        :type theCssClass: ``str``
+
+        :param theHref: The link.
+        :type theHref: ``str``
+
+        :returns: ``NoneType``
+        """
+        if self._canIndent:
+            # Rare, so let the elements work out the indentation
+            with Element(self, 'a', {'href' : theHref}):
+                with Element(self, 'span', {'class' : theCssClass}):
+                    self.characters(theText)
+            return
+        self._closeElemIfOpen()
+        self._file.write(u'<a href="%s">%s%s</span></a>' % (
+                self._encode(theHref),
+                self._spanTag(theCssClass),
+                self._encode(theText),
+            )
+        )
+        # mixed content - don't indent
+        self._flipIndent(False)
+
     def comment(self, theS, newLine=False):
         """Writes a comment to the output stream.
 
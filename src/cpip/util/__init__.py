@@ -26,4 +26,4 @@ __date__    = '2011-07-10'
 __rights__  = 'Copyright (c) 2008-2017 Paul Ross'
 
 __all__ = ['BufGen', 'DirWalk', 'DictTree', 'ListGen', 'MatrixRep',
-           'MaxMunchGen', 'StrTree', 'XmlWrite',]
+           'MaxMunchGen', 'OverlayMap', 'StrTree', 'XmlWrite',]
@@ -66,9 +66,12 @@ def unitTest(theVerbosity=0):
     #print dir()
     #print globals()
     myModules = (
+            'test_CPIPMain',
             'test_IncGraphSVG',
             'test_ItuToHTML',
             'test_MacroHistoryHTML',
+            'test_Tu2Html',
+            'test_strip_comments',
         )
     #myModules = retPyModuleList()
     #print 'myModules:'
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# CPIP is a C/C++ Preprocessor implemented in Python.
+# Copyright (C) 2008-2017 Paul Ross
+# 
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+# 
+# Paul Ross: apaulross@gmail.com
+
+"""Tests for CPIPMain.
+"""
+
+__author__  = 'Paul Ross'
+__date__    = '2023-07-24'
+__rights__  = 'Copyright (c) 2008-2017 Paul Ross'
+
+import unittest
+
+from cpip import CPIPMain
+from cpip.core import PpLexer
+from cpip.core.IncludeHandler import CppIncludeStringIO
+
+#######################################
+# Section: Unit tests
+########################################
+class TestMacroDependencies(unittest.TestCase):
+    """Tests the macro dependencies written as DOT."""
+    def _retLexer(self, theContent):
+        retVal = PpLexer.PpLexer('spam.c', CppIncludeStringIO([], [], theContent, {}))
+        for t in retVal.ppTokens():
+            pass
+        return retVal
+
+    def test_00(self):
+        """TestMacroDependencies.test_00(): no dependencies."""
+        myLexer = self._retLexer('#define A 1\nA\n')
+        self.assertFalse(CPIPMain._hasMacroDependencies(myLexer))
+        self.assertEqual(
+            'digraph MacroDependencyDot {\n}\n',
+            CPIPMain._macroDependenciesAsDot(myLexer),
+        )
+
+    def test_01(self):
+        """TestMacroDependencies.test_01(): edges are distinct and sorted for in and out of scope macros."""
+        myLexer = self._retLexer(
+            '#define C 2\n'
+            '#define B 1\n'
+            '#define A C B B C\n'
+            'A\n'
+            '#undef A\n'
+            '#define D C B C\n'
+            '#define A B\n'
+            'D A\n'
+        )
+        self.assertTrue(CPIPMain._hasMacroDependencies(myLexer))
+        self.assertEqual(
+            [('A', 'B'), ('A', 'C'), ('D', 'B'), ('D', 'C')],
+            list(CPIPMain._genMacroDependencies(myLexer.macroEnvironment)),
+        )
+        self.assertEqual(
+            'digraph MacroDependencyDot {\n'
+            '"A" -> "B";\n'
+            '"A" -> "C";\n'
+            '"D" -> "B";\n'
+            '"D" -> "C";\n'
+            '}\n',
+            CPIPMain._macroDependenciesAsDot(myLexer),
+        )
+
+class TestOutputPlan(unittest.TestCase):
+    """Tests retOutputPlan()."""
+    def test_00(self):
+        """TestOutputPlan.test_00(): an empty list selects all outputs."""
+        myPlan = CPIPMain.retOutputPlan([])
+        self.assertEqual(list(CPIPMain.OUTPUT_NAMES.keys()), list(myPlan._fields))
+        self.assertTrue(all(myPlan))
+
+    def test_01(self):
+        """TestOutputPlan.test_01(): 'all' selects all outputs."""
+        self.assertTrue(all(CPIPMain.retOutputPlan(['all'])))
+        self.assertTrue(all(CPIPMain.retOutputPlan(['tu', 'ALL'])))
+
+    def test_02(self):
+        """TestOutputPlan.test_02(): comma separated lists are additive."""
+        myPlan = CPIPMain.retOutputPlan(['tu, index', 'macros'])
+        self.assertEqual(
+            CPIPMain.OutputPlan(tu=True, itu=False, macros=True, svg=False,
+                                text=False, ccg=False, index=True),
+            myPlan,
+        )
+        self.assertEqual(myPlan, CPIPMain.retOutputPlan(['index,,macros,tu,tu']))
+
+    def test_03(self):
+        """TestOutputPlan.test_03(): an unknown name raises a ValueError."""
+        self.assertRaises(ValueError, CPIPMain.retOutputPlan, ['tu,spam'])
+        self.assertRaises(ValueError, CPIPMain.retOutputPlan, ['spam'])
+
+class TestLexerTracksMacroRefs(unittest.TestCase):
+    """Tests that the lexer only records macro references when they are used."""
+    def _retJobSpec(self, theOutputs, theDumpList):
+        retVal = CPIPMain.MainJobSpec(*[None] * len(CPIPMain.MainJobSpec._fields))
+        return retVal._replace(outputPlan=CPIPMain.retOutputPlan(theOutputs),
+                               dumpList=theDumpList)
+
+    def _retMacro(self, theJobSpec):
+        myLexer = PpLexer.PpLexer(
+            'spam.c',
+            CppIncludeStringIO([], [], '#define SPAM 1\nSPAM\nSPAM\n', {}),
+            trackMacroRefs=CPIPMain._lexerTracksMacroRefs(theJobSpec),
+        )
+        for t in myLexer.ppTokens():
+            pass
+        return myLexer.macroEnvironment.macro('SPAM')
+
+    def test_00(self):
+        """TestLexerTracksMacroRefs.test_00(): references are not recorded without the macro history or dump."""
+        myJobSpec = self._retJobSpec(['tu,itu,svg,text,ccg,index'], ['C', 'F', 'I', 'T'])
+        self.assertFalse(CPIPMain._lexerTracksMacroRefs(myJobSpec))
+        myMacro = self._retMacro(myJobSpec)
+        self.assertEqual(2, myMacro.refCount)
+        self.assertEqual([], myMacro.refFileLineColS)
+
+    def test_01(self):
+        """TestLexerTracksMacroRefs.test_01(): references are recorded for the macro history."""
+        myJobSpec = self._retJobSpec(['macros'], [])
+        self.assertTrue(CPIPMain._lexerTracksMacroRefs(myJobSpec))
+        myMacro = self._retMacro(myJobSpec)
+        self.assertEqual(2, myMacro.refCount)
+        self.assertEqual(
+            [('spam.c', 2, 1), ('spam.c', 3, 1)],
+            [(f.fileId, f.lineNum, f.colNum) for f in myMacro.refFileLineColS],
+        )
+
+    def test_02(self):
+        """TestLexerTracksMacroRefs.test_02(): references are recorded for the macro dump."""
+        myJobSpec = self._retJobSpec(['tu'], ['M'])
+        self.assertTrue(CPIPMain._lexerTracksMacroRefs(myJobSpec))
+        self.assertEqual(2, len(self._retMacro(myJobSpec).refFileLineColS))
+
+class Special(unittest.TestCase):
+    pass
+
+def unitTest(theVerbosity=2):
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestMacroDependencies)
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestOutputPlan))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestLexerTracksMacroRefs))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(Special))
+    myResult = unittest.TextTestRunner(verbosity=theVerbosity).run(suite)
+    return (myResult.testsRun, len(myResult.errors), len(myResult.failures))
+
+#################
+# End: Unit tests
+#################
+
+if __name__ == "__main__":
+    unitTest()
@@ -410,10 +410,43 @@ ITU.h [140, 70]:  True "" "CP=."
         print()
         print(mySvg.getvalue())
 
+class TestIncGraphSVGTime(unittest.TestCase):
+    """Tests the time histogram of the IncGraphSVG class."""
+    def _retSvg(self, theClass):
+        myLexer = PpLexer.PpLexer(
+            'src/spam.c',
+            CppIncludeStringIO(
+                ['usr'],
+                [],
+                u'#include "spam.h"\nint i;\n',
+                {os.path.join('usr', 'spam.h') : u'int j;\n'},
+            ),
+        )
+        for t in myLexer.ppTokens():
+            pass
+        myLexer.finalise()
+        myVis = FileIncludeGraph.FigVisitorTree(theClass)
+        myLexer.fileIncludeGraphRoot.acceptVisitor(myVis)
+        myIgs = myVis.tree()
+        myTpt = TreePlotTransform.TreePlotTransform(myIgs.plotCanvas, 'left', '+')
+        mySvg = io.StringIO()
+        myIgs.plotToFileObj(mySvg, myTpt)
+        return mySvg.getvalue()
+
+    def test_00(self):
+        """TestIncGraphSVGTime.test_00(): no time histogram by default."""
+        self.assertFalse('crimson' in self._retSvg(IncGraphSVG.SVGTreeNodeMain))
+
+    def test_01(self):
+        """TestIncGraphSVGTime.test_01(): time histogram and its pop-up text."""
+        mySvg = self._retSvg(IncGraphSVG.SVGTreeNodeMainTime)
+        self.assertTrue('crimson' in mySvg)
+        self.assertTrue('100.0%' in mySvg)
 
 def unitTest(theVerbosity=2):
     """Execute unit tests."""
     suite = unittest.TestLoader().loadTestsFromTestCase(TestIncGraphSVGVisitor)
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestIncGraphSVGTime))
     #suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestPhase_1))
     myResult = unittest.TextTestRunner(verbosity=theVerbosity).run(suite)
     return (myResult.testsRun, len(myResult.errors), len(myResult.failures))
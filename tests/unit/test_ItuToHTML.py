@@ -27,11 +27,15 @@ __rights__  = 'Copyright (c) 2008-2017 Paul Ross'
 
 import io
 import logging
+import os
+import shutil
 import sys
+import tempfile
 import time
 import unittest
 
 from cpip import ItuToHtml
+from cpip.core import ItuToTokens
 
 #######################################
 # Section: Unit tests
@@ -268,6 +272,32 @@ the macro page.</p>
 """
         self.assertEqual(myOutput.getvalue(), expVal)
 
+class TestItuToHtmlTokenCache(unittest.TestCase):
+    """Test the ItuToHtml with a token cache."""
+    def setUp(self):
+        self._tmpDir = tempfile.mkdtemp()
+        self._srcPath = os.path.join(self._tmpDir, 'spam.h')
+        with open(self._srcPath, 'w') as f:
+            f.write(u"""#define SPAM ??= /* a
+comment */ \\
+more
+int x; // C++ comment
+""")
+
+    def tearDown(self):
+        shutil.rmtree(self._tmpDir)
+
+    def test_01(self):
+        """TestItuToHtmlTokenCache.test_01(): Cached tokens give the same HTML."""
+        myExpOutput = io.StringIO()
+        ItuToHtml.ItuToHtml(self._srcPath, myExpOutput)
+        myCache = ItuToTokens.ItuTokenCache()
+        for i in range(2):
+            myOutput = io.StringIO()
+            ItuToHtml.ItuToHtml(self._srcPath, myOutput, tokenCache=myCache)
+            self.assertEqual(myExpOutput.getvalue(), myOutput.getvalue())
+        self.assertEqual((1, 1), (myCache.hits, myCache.misses))
+
 class NullClass(unittest.TestCase):
     pass
 
@@ -276,6 +306,7 @@ def unitTest(theVerbosity=2):
     suite = unittest.TestLoader().loadTestsFromTestCase(NullClass)
     suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestItuToHtmlPhase3))
     suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestItuToHtmlTokenGen))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestItuToHtmlTokenCache))
     myResult = unittest.TextTestRunner(verbosity=theVerbosity).run(suite)
     return (myResult.testsRun, len(myResult.errors), len(myResult.failures))
 
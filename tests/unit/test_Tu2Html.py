@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# CPIP is a C/C++ Preprocessor implemented in Python.
+# Copyright (C) 2008-2017 Paul Ross
+# 
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+# 
+# Paul Ross: apaulross@gmail.com
+
+"""Tests for Tu2Html and TuIndexer.
+"""
+
+__author__  = 'Paul Ross'
+__date__    = '2011-07-10'
+__rights__  = 'Copyright (c) 2008-2017 Paul Ross'
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from cpip import Tu2Html
+from cpip import TuIndexer
+from cpip.core import PpLexer
+from cpip.core.IncludeHandler import CppIncludeStringIO
+
+#######################################
+# Section: Unit tests
+########################################
+class TestTuIndexer(unittest.TestCase):
+    """Tests the TuIndexer."""
+    def test_00(self):
+        """TestTuIndexer.test_00(): Single page href."""
+        myTuI = TuIndexer.TuIndexer('spam.c.html')
+        self.assertEqual('_tu0', myTuI.add(0))
+        self.assertEqual('_tu10', myTuI.add(10))
+        self.assertEqual('spam.c.html#_tu0', myTuI.href(5, True))
+        self.assertEqual('spam.c.html#_tu10', myTuI.href(5, False))
+        self.assertEqual('spam.c.html', myTuI.page(5))
+
+    def test_01(self):
+        """TestTuIndexer.test_01(): Paged href and page."""
+        myTuI = TuIndexer.TuIndexer('spam.c.html')
+        myTuI.add(0, 'spam.c_page_1.html')
+        myTuI.add(10, 'spam.c_page_2.html')
+        self.assertEqual('spam.c_page_1.html', myTuI.page(9))
+        self.assertEqual('spam.c_page_2.html', myTuI.page(10))
+        self.assertEqual('spam.c_page_2.html', myTuI.page(100))
+        self.assertEqual('spam.c_page_2.html#_tu10', myTuI.href(5, False))
+
+    def test_02(self):
+        """TestTuIndexer.test_02(): Out of sequence and out of range raise."""
+        myTuI = TuIndexer.TuIndexer('spam.c.html')
+        myTuI.add(10, 'spam.c_page_1.html')
+        self.assertRaises(TuIndexer.ExceptionTuIndexer, myTuI.add, 5)
+        self.assertRaises(TuIndexer.ExceptionTuIndexer, myTuI.page, 5)
+
+class FailingLexer(object):
+    """Wraps a PpLexer so that ppTokens() fails part way through."""
+    def __init__(self, theLexer):
+        self._lexer = theLexer
+    def __getattr__(self, theName):
+        return getattr(self._lexer, theName)
+    def ppTokens(self, **kwargs):
+        for i, t in enumerate(self._lexer.ppTokens(**kwargs)):
+            if i > 20:
+                raise ValueError('Lexer failure.')
+            yield t
+
+class TestTu2HtmlPaged(unittest.TestCase):
+    """Tests writing the TU as HTML pages."""
+    ITU = u"""int x;
+#include "a.h"
+int y;
+int z;
+#include "b.h"
+int w;
+"""
+    INCLUDES = {
+        'a.h' : u"""int a1;\nint a2;\n""",
+        'b.h' : u"""int b1;\nint b2;\n""",
+    }
+    def setUp(self):
+        self._tmpDir = tempfile.mkdtemp()
+        self._htmlPath = os.path.join(self._tmpDir, 'spam.c.html')
+
+    def tearDown(self):
+        shutil.rmtree(self._tmpDir)
+
+    def _retLexer(self):
+        return PpLexer.PpLexer(
+            'spam.c',
+            CppIncludeStringIO([], [], self.ITU, self.INCLUDES),
+        )
+
+    def _readPage(self, thePageName):
+        with open(os.path.join(self._tmpDir, thePageName)) as f:
+            return f.read()
+
+    def test_00(self):
+        """TestTu2HtmlPaged.test_00(): retPageFileName()."""
+        self.assertEqual('spam.c_page_1.html',
+                         Tu2Html.retPageFileName('out/spam.c.html', 1))
+        self.assertEqual('spam.c_page_12.html',
+                         Tu2Html.retPageFileName('spam.c.html', 12))
+
+    def test_01(self):
+        """TestTu2HtmlPaged.test_01(): Single page, the ITU line set."""
+        myTokCntr, mySetItuLines = Tu2Html.processTuToHtml(
+            self._retLexer(), self._htmlPath, 'Title', 0, 'index.html')
+        self.assertEqual(set([3, 4, 6, 7]), mySetItuLines)
+        self.assertTrue(os.path.isfile(self._htmlPath))
+        self.assertFalse(os.path.exists(os.path.join(self._tmpDir,
+                                                     'spam.c_page_1.html')))
+        # The TuIndexer anchors are only written when paged
+        self.assertFalse('name="_tu' in self._readPage('spam.c.html'))
+
+    def test_02(self):
+        """TestTu2HtmlPaged.test_02(): Pages by line count."""
+        myTokCntr, myItuLineMap, myTuI = Tu2Html.processTuToHtmlPaged(
+            self._retLexer(), self._htmlPath, 'Title', 0, 'index.html',
+            linesPerPage=3)
+        self.assertEqual(
+            {
+                3 : 'spam.c_page_1.html',
+                4 : 'spam.c_page_2.html',
+                6 : 'spam.c_page_3.html',
+                7 : 'spam.c_page_3.html',
+            },
+            myItuLineMap
+        )
+        # Index and three pages
+        self.assertEqual(
+            ['spam.c.html', 'spam.c_page_1.html',
+             'spam.c_page_2.html', 'spam.c_page_3.html'],
+            sorted([f for f in os.listdir(self._tmpDir) if f.startswith('spam.c')])
+        )
+        myIndex = self._readPage('spam.c.html')
+        self.assertTrue('written as 3 page(s)' in myIndex)
+        for i in range(1, 4):
+            self.assertTrue('href="spam.c_page_%d.html"' % i in myIndex)
+        # Last page has no link to a next page
+        self.assertFalse('spam.c_page_4.html' in self._readPage('spam.c_page_3.html'))
+        self.assertEqual('spam.c_page_1.html', myTuI.page(0))
+
+    def test_03(self):
+        """TestTu2HtmlPaged.test_03(): Pages split at includes, forward links cross pages."""
+        myTokCntr, myItuLineMap, myTuI = Tu2Html.processTuToHtmlPaged(
+            self._retLexer(), self._htmlPath, 'Title', 0, 'index.html',
+            splitAtIncludes=True)
+        self.assertEqual(
+            {
+                3 : 'spam.c_page_3.html',
+                4 : 'spam.c_page_3.html',
+                6 : 'spam.c_page_5.html',
+                7 : 'spam.c_page_5.html',
+            },
+            myItuLineMap
+        )
+        myPage = self._readPage('spam.c_page_2.html')
+        self.assertTrue('# Starting FILE: a.h' in myPage)
+        self.assertFalse('# Starting FILE: b.h' in myPage)
+        # The forward link to the next page
+        self.assertTrue('<a name="_2" />' in myPage)
+        self.assertTrue('href="spam.c_page_3.html#_2"' in myPage)
+        self.assertTrue('<a name="_2" />' in self._readPage('spam.c_page_3.html'))
+
+    def test_04(self):
+        """TestTu2HtmlPaged.test_04(): TuIndexer hrefs link to anchors that are written."""
+        myLexer = self._retLexer()
+        myTokCntr, myItuLineMap, myTuI = Tu2Html.processTuToHtmlPaged(
+            myLexer, self._htmlPath, 'Title', 0, 'index.html',
+            linesPerPage=3)
+        for aTuIndex in (0, myLexer.tuIndex):
+            myPage, myAnchor = myTuI.href(aTuIndex, True).split('#')
+            self.assertTrue('<a name="%s" />' % myAnchor in self._readPage(myPage))
+
+    def test_05(self):
+        """TestTu2HtmlPaged.test_05(): No pages are left if the lexer fails."""
+        self.assertRaises(
+            ValueError,
+            Tu2Html.processTuToHtmlPaged,
+            FailingLexer(self._retLexer()), self._htmlPath, 'Title', 0,
+            'index.html', linesPerPage=3,
+        )
+        self.assertEqual(
+            [],
+            [f for f in os.listdir(self._tmpDir) if f.startswith('spam.c')]
+        )
+
+    def test_06(self):
+        """TestTu2HtmlPaged.test_06(): No links to the index or source HTML when they are not generated."""
+        Tu2Html.processTuToHtml(self._retLexer(), self._htmlPath, 'Title', 0,
+                                None, incItuLinks=False)
+        myPage = self._readPage('spam.c.html')
+        self.assertFalse('Return to' in myPage)
+        self.assertFalse('spam.c_' in myPage)
+        self.assertFalse('a.h_' in myPage)
+        # Line numbers are still written
+        self.assertTrue(']: ' in myPage)
+
+    def test_07(self):
+        """TestTu2HtmlPaged.test_07(): A single page is left if the lexer fails."""
+        self.assertRaises(
+            ValueError,
+            Tu2Html.processTuToHtml,
+            FailingLexer(self._retLexer()), self._htmlPath, 'Title', 0,
+            'index.html',
+        )
+        self.assertEqual(
+            ['spam.c.html'],
+            [f for f in os.listdir(self._tmpDir) if f.startswith('spam.c')]
+        )
+        myPage = self._readPage('spam.c.html')
+        self.assertTrue('Translation Unit: spam.c' in myPage)
+        self.assertTrue('# Starting FILE: a.h' in myPage)
+
+class Special(unittest.TestCase):
+    pass
+
+def unitTest(theVerbosity=2):
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestTuIndexer)
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestTu2HtmlPaged))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(Special))
+    myResult = unittest.TextTestRunner(verbosity=theVerbosity).run(suite)
+    return (myResult.testsRun, len(myResult.errors), len(myResult.failures))
+
+#################
+# End: Unit tests
+#################
+
+if __name__ == "__main__":
+    unitTest()
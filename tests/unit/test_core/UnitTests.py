@@ -71,10 +71,14 @@ def unitTest(theVerbosity=0):
             'test_CppDiagnostic',
             'test_ExceptionCpip',
             'test_FileIncludeGraph',
+            'test_FileIncludeStack',
             'test_FileLocation',
+            'test_FilePathTable',
             'test_IncludeHandler',
             'test_ItuToTokens',
             'test_MacroEnv',
+            'test_MacroProfiler',
+            'test_MacroRefStore',
             'test_PpDefine',
             'test_PpLexer',
             'test_PpToken',
@@ -82,6 +86,8 @@ def unitTest(theVerbosity=0):
             'test_PpTokeniser',
             'test_PpWhitespace',
             'test_PragmaHandler',
+            'test_SourceBuffer',
+            'test_TokenBuffer',
             'test_UngetGen',
             ## Performance testing...
             'test_PpLexerLimits',
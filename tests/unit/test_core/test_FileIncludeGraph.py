@@ -154,6 +154,36 @@ class TestFileIncludeGraph(unittest.TestCase):
                           '',
                           '')
 
+    def testAddChild(self):
+        """FileIncludeGraph - addChild() is the same as addBranch()."""
+        myObj = FileIncludeGraph.FileIncludeGraph('a.h', True, '', '')
+        self.assertIsNone(myObj.latestChild)
+        myB = myObj.addChild(1, 'b.h', True, '', '')
+        self.assertIs(myB, myObj.latestChild)
+        myC = myB.addChild(3, 'c.h', True, '', '')
+        myC.addChild(2, 'd.h', False, '', '')
+        myB.addChild(7, 't.h', True, '', '')
+        self.assertIs(myC, myB.genChildNodes().__next__())
+        myObj.addChild(5, 'x.h', True, '', '')
+        myExp = FileIncludeGraph.FileIncludeGraph('a.h', True, '', '')
+        myExp.addBranch(['a.h',], 1, 'b.h', True, '', '')
+        myExp.addBranch(['a.h', 'b.h'], 3, 'c.h', True, '', '')
+        myExp.addBranch(['a.h', 'b.h', 'c.h'], 2, 'd.h', False, '', '')
+        myExp.addBranch(['a.h', 'b.h'], 7, 't.h', True, '', '')
+        myExp.addBranch(['a.h',], 5, 'x.h', True, '', '')
+        self.assertEqual(myExp.retBranches(), myObj.retBranches())
+        self.assertEqual(str(myExp), str(myObj))
+        self.assertEqual(['a.h#5', 'x.h'], myObj.retLatestBranch())
+        self.assertEqual(2, myObj.retLatestBranchDepth())
+        # Duplicate line
+        self.assertRaises(FileIncludeGraph.ExceptionFileIncludeGraph,
+                          myObj.addChild,
+                          5,
+                          'y.h',
+                          True,
+                          '',
+                          '')
+
 class TestFileIncludeGraphPlot(unittest.TestCase):
     """Tests the class FileIncludeGraph result."""
 
@@ -564,6 +594,21 @@ class TestFileIncludeGraphAttributeSetGet(unittest.TestCase):
         self.assertEqual(31, myObj.numTokens)
         self.assertEqual(10, myObj.numTokensSig)
 
+    def testCtor_SetTime(self):
+        """FileIncludeGraph - ctor, setTime() self and inclusive time."""
+        myObj = FileIncludeGraph.FileIncludeGraph('a.h', True, '', '')
+        self.assertEqual(None, myObj.time)
+        self.assertEqual(None, myObj.timeIncChildren)
+        myChild = myObj.addChild(1, 'b.h', True, '', '')
+        myObj.setTime(4.0)
+        self.assertEqual(4.0, myObj.timeIncChildren)
+        # Child time not set
+        self.assertRaises(FileIncludeGraph.ExceptionFileIncludeGraph, getattr, myObj, 'time')
+        myChild.setTime(1.5)
+        self.assertEqual(2.5, myObj.time)
+        self.assertEqual(1.5, myChild.time)
+        self.assertRaises(FileIncludeGraph.ExceptionFileIncludeGraph, myObj.setTime, 1.0)
+
 class TestFileIncludeGraphDummyRoot(unittest.TestCase):
     """Tests the class FileIncludeGraph where None is the root of the branch."""
 
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# CPIP is a C/C++ Preprocessor implemented in Python.
+# Copyright (C) 2008-2017 Paul Ross
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Paul Ross: apaulross@gmail.com
+
+"""Tests the timing of files by FileIncludeStack."""
+
+__author__  = 'Paul Ross'
+__date__    = '2023-08-03'
+__rights__  = 'Copyright (c) 2008-2017 Paul Ross'
+
+import io
+import json
+import unittest
+
+from cpip.core import CppDiagnostic
+from cpip.core import FileIncludeStack
+from cpip.core import IncludeHandler
+from cpip.core import PpLexer
+from cpip.core import PpToken
+
+class Clock(object):
+    """A timer that advances by one second each time it is read."""
+    def __init__(self):
+        self.now = -1.0
+
+    def __call__(self):
+        self.now += 1.0
+        return self.now
+
+#######################################
+# Section: Unit tests
+########################################
+class TestFileIncludeStackTime(unittest.TestCase):
+    """Tests the IncludeEvent objects of a FileIncludeStack."""
+    def _retFpo(self, thePath):
+        return IncludeHandler.FilePathOrigin(io.StringIO(u'\n'), thePath, None, 'usr')
+
+    def test_00(self):
+        """TestFileIncludeStackTime.test_00(): nested files with a fake timer."""
+        myObj = FileIncludeStack.FileIncludeStack(
+            CppDiagnostic.PreprocessDiagnosticStd(),
+            theTimer=Clock(),
+        )
+        self.assertEqual([], myObj.includeEvents)
+        myObj.includeStart(self._retFpo('a.c'), None, True, '', '')   # t=0
+        myObj.tokenCountInc(PpToken.PpToken('x', 'identifier'), True, 3)
+        myObj.includeStart(self._retFpo('b.h'), 1, True, '', '')      # t=1
+        myObj.tokenCountInc(PpToken.PpToken('y', 'identifier'), True, 2)
+        self.assertEqual('b.h', myObj.includeFinish())                 # t=2
+        self.assertEqual('a.c', myObj.includeFinish())                 # t=3
+        myObj.finalise()
+        self.assertEqual(
+            [
+                FileIncludeStack.IncludeEvent('b.h', 2, 1.0, 1.0, 1.0, 2, 2),
+                FileIncludeStack.IncludeEvent('a.c', 1, 0.0, 3.0, 2.0, 3, 5),
+            ],
+            myObj.includeEvents,
+        )
+        myGraph = myObj.fileIncludeGraphRoot.graph
+        self.assertEqual(3.0, myGraph.timeIncChildren)
+        self.assertEqual(2.0, myGraph.time)
+
+    def test_01(self):
+        """TestFileIncludeStackTime.test_01(): Chrome trace events."""
+        myEventS = [
+            FileIncludeStack.IncludeEvent('b.h', 2, 1.0, 1.0, 1.0, 2, 2),
+            FileIncludeStack.IncludeEvent('a.c', 1, 0.0, 3.0, 2.0, 3, 5),
+        ]
+        myStream = io.StringIO()
+        FileIncludeStack.writeTraceEvents(myStream, myEventS)
+        myTrace = json.loads(myStream.getvalue())
+        self.assertEqual('ms', myTrace['displayTimeUnit'])
+        myTraceEventS = myTrace['traceEvents']
+        # In order of start
+        self.assertEqual(['a.c', 'b.h'], [e['name'] for e in myTraceEventS])
+        self.assertEqual(
+            {
+                'name'  : 'b.h',
+                'cat'   : 'include',
+                'ph'    : 'X',
+                'ts'    : 1e6,
+                'dur'   : 1e6,
+                'pid'   : 1,
+                'tid'   : 1,
+                'args'  : {
+                    'depth'                 : 2,
+                    'selfTime(us)'          : 1e6,
+                    'numTokens'             : 2,
+                    'numTokensIncChildren'  : 2,
+                },
+            },
+            myTraceEventS[1],
+        )
+
+    def test_02(self):
+        """TestFileIncludeStackTime.test_02(): PpLexer.includeEvents."""
+        myLexer = PpLexer.PpLexer(
+            'src/spam.c',
+            IncludeHandler.CppIncludeStringIO(
+                ['usr'],
+                [],
+                '#include "a.h"\nx\n',
+                {
+                    'usr/a.h' : '#include "b.h"\ny y\n',
+                    'usr/b.h' : 'z\n',
+                },
+            ),
+        )
+        for t in myLexer.ppTokens():
+            pass
+        myLexer.finalise()
+        myEventS = myLexer.includeEvents
+        self.assertEqual(['usr/b.h', 'usr/a.h', 'src/spam.c'], [e.fileName for e in myEventS])
+        self.assertEqual([3, 2, 1], [e.depth for e in myEventS])
+        self.assertEqual([2, 6, 8], [e.numTokensIncChildren for e in myEventS])
+        for anEvent in myEventS:
+            self.assertTrue(anEvent.time >= anEvent.timeSelf >= 0.0)
+        self.assertEqual(0.0, myEventS[-1].start)
+
+class Special(unittest.TestCase):
+    pass
+
+def unitTest(theVerbosity=2):
+    """Execute unit tests."""
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestFileIncludeStackTime)
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(Special))
+    myResult = unittest.TextTestRunner(verbosity=theVerbosity).run(suite)
+    return (myResult.testsRun, len(myResult.errors), len(myResult.failures))
+
+#################
+# End: Unit tests
+#################
+
+if __name__ == "__main__":
+    unitTest()
@@ -2062,6 +2062,116 @@ class TestFileLineColPod(unittest.TestCase):
         except AttributeError:
             pass
 
+class TestLineIndex(unittest.TestCase):
+    """Tests LineIndex and FileLocation with a LineIndex."""
+    TEXT = 'ab\n\ncde\nf'
+
+    def _retLineColS(self, theText):
+        """Returns the line and column of each offset by counting."""
+        retVal = []
+        myFl = FileLocation.FileLocation('spam.h')
+        for c in theText + ' ':
+            retVal.append(myFl.lineCol)
+            myFl.update(c)
+        return retVal
+
+    def test_00(self):
+        """TestLineIndex.test_00(): lineCol() is the same as counting."""
+        for aText in ('', '\n', 'a', self.TEXT, self.TEXT + '\n'):
+            myIdx = FileLocation.LineIndex(aText)
+            self.assertEqual(aText.count('\n') + 1, len(myIdx))
+            self.assertEqual(
+                self._retLineColS(aText),
+                [myIdx.lineCol(i) for i in range(len(aText) + 1)],
+            )
+
+    def test_01(self):
+        """TestLineIndex.test_01(): FileLocation tracks the offset with a LineIndex."""
+        myFl = FileLocation.FileLocation('spam.h')
+        myFl.startNewPhase()
+        myFl.setLineIndex(FileLocation.LineIndex(self.TEXT))
+        self.assertEqual((1, 1), myFl.lineCol)
+        myFl.update('ab\n\nc')
+        self.assertEqual(5, myFl.offset)
+        self.assertEqual((3, 2), myFl.lineCol)
+        self.assertEqual((3, 2), (myFl.lineNum, myFl.colNum))
+        self.assertEqual(FileLocation.FileLineCol('spam.h', 3, 2), myFl.fileLineCol())
+        myPos = myFl.position
+        myFl.offset = 8
+        self.assertEqual((4, 1), myFl.lineCol)
+        self.assertEqual(FileLocation.FileLineCol('spam.h', 3, 2), myFl.fileLineColAt(myPos))
+
+    def test_03(self):
+        """TestLineIndex.test_03(): extend() is the same as indexing all the text."""
+        for aSplit in range(len(self.TEXT) + 1):
+            myIdx = FileLocation.LineIndex(self.TEXT[:aSplit])
+            myIdx.extend(self.TEXT[aSplit:])
+            myExp = FileLocation.LineIndex(self.TEXT)
+            self.assertEqual(len(myExp), len(myIdx))
+            self.assertEqual(
+                [myExp.lineCol(i) for i in range(len(self.TEXT) + 1)],
+                [myIdx.lineCol(i) for i in range(len(self.TEXT) + 1)],
+            )
+
+    def test_02(self):
+        """TestLineIndex.test_02(): FileLocation stops using a LineIndex when the line or column is changed."""
+        myFl = FileLocation.FileLocation('spam.h')
+        myFl.setLineIndex(FileLocation.LineIndex(self.TEXT))
+        myFl.update('ab\n')
+        myFl.incCol(3)
+        self.assertEqual((2, 4), myFl.lineCol)
+        myFl.update('\nx')
+        self.assertEqual((3, 2), myFl.lineCol)
+        myPos = myFl.position
+        self.assertEqual(FileLocation.FileLineCol('spam.h', 3, 2), myPos)
+        self.assertEqual(myPos, myFl.fileLineColAt(myPos))
+
+class TestLogicalPhysicalLineMapBulk(unittest.TestCase):
+    """Tests LogicalPhysicalLineMap.substStrings()."""
+    SUBST_S = [
+        (1, 3, 3, 1),
+        (1, 6, 3, 1),
+        (1, 12, 1, 6),
+        (4, 2, 1, 8),
+        (4, 20, 3, 1),
+    ]
+
+    def _retPLineColS(self, theMap):
+        return [theMap.pLineCol(l, c) for l in range(1, 6) for c in range(1, 40)]
+
+    def test_00(self):
+        """TestLogicalPhysicalLineMapBulk.test_00(): substStrings() is the same as substString()."""
+        myMap = FileLocation.LogicalPhysicalLineMap()
+        for aSubst in self.SUBST_S:
+            myMap.substString(*aSubst)
+        myBulk = FileLocation.LogicalPhysicalLineMap()
+        myBulk.substStrings(self.SUBST_S)
+        self.assertEqual(str(myMap), str(myBulk))
+        self.assertEqual(self._retPLineColS(myMap), self._retPLineColS(myBulk))
+
+    def test_01(self):
+        """TestLogicalPhysicalLineMapBulk.test_01(): order of recording does not matter."""
+        myMap = FileLocation.LogicalPhysicalLineMap()
+        myMap.substStrings(self.SUBST_S)
+        myExp = self._retPLineColS(myMap)
+        myMap = FileLocation.LogicalPhysicalLineMap()
+        myMap.substStrings(reversed(self.SUBST_S))
+        self.assertEqual(myExp, self._retPLineColS(myMap))
+        # Interleave lookups and recording
+        myMap = FileLocation.LogicalPhysicalLineMap()
+        for aSubst in reversed(self.SUBST_S):
+            myMap.substStrings([aSubst])
+            myMap.pLineCol(aSubst[0], aSubst[1] + 1)
+        self.assertEqual(myExp, self._retPLineColS(myMap))
+
+    def test_02(self):
+        """TestLogicalPhysicalLineMapBulk.test_02(): repeated substitutions at one column accumulate."""
+        myMap = FileLocation.LogicalPhysicalLineMap()
+        myMap.substStrings([(2, 5, 3, 1), (2, 5, 3, 1)])
+        self.assertEqual((2, 4), myMap.pLineCol(2, 4))
+        self.assertEqual((2, 9), myMap.pLineCol(2, 5))
+        self.assertEqual((3, 5), myMap.pLineCol(3, 5))
+
 class TestSpecial(unittest.TestCase):
     """Special tests."""
 
@@ -2113,6 +2223,8 @@ def unitTest(theVerbosity=2):
     suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestFileLocationLineContinuation))
     suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestFileLocationMultiPhase))
     suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestFileLineColPod))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestLineIndex))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestLogicalPhysicalLineMapBulk))
     myResult = unittest.TextTestRunner(verbosity=theVerbosity).run(suite)
     return (myResult.testsRun, len(myResult.errors), len(myResult.failures))
 ##################
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# CPIP is a C/C++ Preprocessor implemented in Python.
+# Copyright (C) 2008-2017 Paul Ross
+# 
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+# 
+# Paul Ross: apaulross@gmail.com
+
+"""Tests FilePathTable."""
+
+__author__  = 'Paul Ross'
+__date__    = '2023-07-04'
+__rights__  = 'Copyright (c) 2008-2017 Paul Ross'
+
+import pickle
+import unittest
+
+from cpip.core import FilePathTable
+from cpip.core import IncludeHandler
+from cpip.core import PpLexer
+
+#######################################
+# Section: Unit tests
+########################################
+class TestFilePathTable(unittest.TestCase):
+    """Tests FilePathTable."""
+    def test_00(self):
+        """TestFilePathTable.test_00(): IDs are allocated in order."""
+        myObj = FilePathTable.FilePathTable()
+        self.assertEqual(0, len(myObj))
+        self.assertEqual(0, myObj.fileId('a.h'))
+        self.assertEqual(1, myObj.fileId('b.h'))
+        self.assertEqual(0, myObj.fileId('a.h'))
+        self.assertEqual(2, len(myObj))
+        self.assertTrue('a.h' in myObj)
+        self.assertFalse('c.h' in myObj)
+        self.assertEqual(['a.h', 'b.h'], list(myObj))
+        self.assertEqual('b.h', myObj.path(1))
+        self.assertRaises(FilePathTable.ExceptionFilePathTable, myObj.path, 2)
+        self.assertRaises(FilePathTable.ExceptionFilePathTable, myObj.path, -1)
+
+    def test_01(self):
+        """TestFilePathTable.test_01(): intern() returns the first string seen."""
+        myObj = FilePathTable.FilePathTable()
+        myPath = ''.join(['spam/', 'eggs.h'])
+        self.assertIs(myPath, myObj.intern(myPath))
+        myOther = ''.join(['spam/', 'eggs.h'])
+        self.assertIsNot(myPath, myOther)
+        self.assertIs(myPath, myObj.intern(myOther))
+        self.assertIs(myPath, myObj.path(myObj.fileId(myOther)))
+        self.assertIsNone(myObj.intern(None))
+        self.assertEqual(1, len(myObj))
+
+    def test_02(self):
+        """TestFilePathTable.test_02(): pickles with its IDs."""
+        myObj = FilePathTable.FilePathTable()
+        for aPath in ('a.h', 'b.h', 'c.h'):
+            myObj.fileId(aPath)
+        myCopy = pickle.loads(pickle.dumps(myObj))
+        self.assertEqual(list(myObj), list(myCopy))
+        self.assertEqual(2, myCopy.fileId('c.h'))
+        self.assertEqual(3, myCopy.fileId('d.h'))
+
+class TestFilePathTableLexer(unittest.TestCase):
+    """Tests FilePathTable with a PpLexer."""
+    def test_00(self):
+        """TestFilePathTableLexer.test_00(): a file included several times shares one path string."""
+        myLexer = PpLexer.PpLexer(
+            'src/spam.c',
+            IncludeHandler.CppIncludeStringIO(
+                ['usr'],
+                [],
+                '#include "eggs.h"\n#include "eggs.h"\n#if X\n#endif\n',
+                {'usr/eggs.h' : '#undef X\n#define X 1\nX\n'},
+            ),
+        )
+        myToks = list(myLexer.ppTokens())
+        self.assertEqual(['src/spam.c', 'usr/eggs.h'], list(myLexer.filePathTable))
+        myPath = myLexer.filePathTable.path(1)
+        myNodeS = list(myLexer.fileIncludeGraphRoot.graph.genChildNodes())
+        self.assertEqual(2, len(myNodeS))
+        for aNode in myNodeS:
+            self.assertIs(myPath, aNode.fileName)
+        myRefS = myLexer.macroEnvironment.macro('X').refFileLineColS
+        self.assertTrue(len(myRefS) > 0)
+        for aRef in myRefS:
+            if aRef.fileId == myPath:
+                self.assertIs(myPath, aRef.fileId)
+        # The analysis structures pickle, sharing the path
+        myCopy = pickle.loads(pickle.dumps(
+            (myLexer.fileIncludeGraphRoot, myLexer.condCompGraph)
+        ))
+        self.assertEqual(str(myLexer.condCompGraph), str(myCopy[1]))
+
+class Special(unittest.TestCase):
+    pass
+
+def unitTest(theVerbosity=2):
+    """Execute unit tests."""
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestFilePathTable)
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestFilePathTableLexer))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(Special))
+    myResult = unittest.TextTestRunner(verbosity=theVerbosity).run(suite)
+    return (myResult.testsRun, len(myResult.errors), len(myResult.failures))
+
+#################
+# End: Unit tests
+#################
+
+if __name__ == "__main__":
+    unitTest()
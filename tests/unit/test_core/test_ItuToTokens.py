@@ -24,11 +24,18 @@ __rights__  = 'Copyright (c) 2008-2017 Paul Ross'
 
 import io
 import logging
+import os
+import shutil
 import sys
+import tempfile
 import time
 import unittest
 
+from cpip.core import CppDiagnostic
+from cpip.core import IncludeHandler
 from cpip.core import ItuToTokens
+from cpip.core import PpLexer
+from cpip.core import PpTokeniser
 
 #######################################
 # Section: Unit tests
@@ -895,6 +902,40 @@ class TestItuToHtmlTokenGenSpecial(unittest.TestCase):
             ]
         self.assertEqual(expTokS, myTokS)
 
+class TestItuToHtmlTokenGenSplice(unittest.TestCase):
+    """Test the ItuToHtml token generator with line continuations and trigraphs
+    at the start of the file."""
+    def test_01(self):
+        """TestItuToHtmlTokenGenSplice.test_01(): Line continuation at the start of the file."""
+        myIth = ItuToTokens.ItuToTokens(io.StringIO(u'\\\nint x;\n'))
+        self.assertEqual(
+            [
+                ('\\\n', 'Unknown'),
+                ('int', 'keyword'),
+                (' ', 'whitespace'),
+                ('x', 'identifier'),
+                (';', 'preprocessing-op-or-punc'),
+                ('\n', 'whitespace'),
+            ],
+            list(myIth.genTokensKeywordPpDirective())
+        )
+
+    def test_02(self):
+        """TestItuToHtmlTokenGenSplice.test_02(): Trigraph line continuation at the start of the file."""
+        myIth = ItuToTokens.ItuToTokens(io.StringIO(u'??/\nint x;\n'))
+        myTokS = list(myIth.genTokensKeywordPpDirective())
+        self.assertEqual(
+            [('??/', 'trigraph'), ('\n', 'Unknown'), ('int', 'keyword')],
+            myTokS[:3]
+        )
+        self.assertEqual(u'??/\nint x;\n', ''.join([t for t, tt in myTokS]))
+
+    def test_03(self):
+        """TestItuToHtmlTokenGenSplice.test_03(): Trigraph after a '?'."""
+        myIth = ItuToTokens.ItuToTokens(io.StringIO(u'a???=b\n'))
+        myIth.translatePhases123()
+        self.assertEqual(u'a?#b\n', ''.join(myIth.multiPassString.currentString))
+
 class TestItuToHtmlTokenGenLinux(unittest.TestCase):
     """Test the ItuToHtml token genreator for special cases from processing Linux."""
     def setUp(self):
@@ -926,13 +967,174 @@ class TestItuToHtmlTokenGenLinux(unittest.TestCase):
             ('(', 'preprocessing-op-or-punc'),
             ('.', 'preprocessing-op-or-punc'),
             ('data', 'identifier'),
-            ('..', 'preprocessing-op-or-punc'),
+            ('.', 'preprocessing-op-or-punc'),
+            ('.', 'preprocessing-op-or-punc'),
             ('nosave', 'identifier'),
             (')', 'preprocessing-op-or-punc'),
             ('\n', 'whitespace'),
         ]
         self.assertEqual(expTokS, myTokS)
 
+class TestItuTokenCache(unittest.TestCase):
+    """Tests the ItuTokenCache."""
+    SOURCE = u"""#define SPAM ??= /* comment */
+int x; // C++ comment
+"""
+    def setUp(self):
+        self._tmpDir = tempfile.mkdtemp()
+        self._srcPath = os.path.join(self._tmpDir, 'spam.h')
+        with open(self._srcPath, 'w') as f:
+            f.write(self.SOURCE)
+
+    def tearDown(self):
+        shutil.rmtree(self._tmpDir)
+
+    def _expTokens(self):
+        myItt = ItuToTokens.ItuToTokens(io.StringIO(self.SOURCE))
+        return tuple(myItt.genTokensKeywordPpDirective())
+
+    def test_00(self):
+        """TestItuTokenCache.test_00(): Tokens are the same as ItuToTokens and are cached in memory."""
+        myCache = ItuToTokens.ItuTokenCache()
+        self.assertEqual(self._expTokens(), tuple(myCache.tokenBuffer(self._srcPath).genTokToktype()))
+        self.assertEqual((0, 1), (myCache.hits, myCache.misses))
+        self.assertEqual(self._expTokens(), tuple(myCache.tokenBuffer(self._srcPath).genTokToktype()))
+        self.assertEqual((1, 1), (myCache.hits, myCache.misses))
+        self.assertEqual(1, len(myCache))
+
+    def test_01(self):
+        """TestItuTokenCache.test_01(): Changed file is re-tokenised."""
+        myCache = ItuToTokens.ItuTokenCache()
+        tuple(myCache.tokenBuffer(self._srcPath).genTokToktype())
+        with open(self._srcPath, 'w') as f:
+            f.write(u'int y;\n')
+        myTokS = tuple(myCache.tokenBuffer(self._srcPath).genTokToktype())
+        self.assertEqual((0, 2), (myCache.hits, myCache.misses))
+        self.assertEqual(('int', 'keyword'), myTokS[0])
+
+    def test_02(self):
+        """TestItuTokenCache.test_02(): On-disk cache is shared between cache objects."""
+        myCacheDir = os.path.join(self._tmpDir, 'cache')
+        myCache = ItuToTokens.ItuTokenCache(myCacheDir)
+        tuple(myCache.tokenBuffer(self._srcPath).genTokToktype())
+        self.assertEqual(1, len(os.listdir(myCacheDir)))
+        myCache = ItuToTokens.ItuTokenCache(myCacheDir)
+        self.assertEqual(self._expTokens(), tuple(myCache.tokenBuffer(self._srcPath).genTokToktype()))
+        self.assertEqual((1, 0), (myCache.hits, myCache.misses))
+
+    def test_03(self):
+        """TestItuTokenCache.test_03(): Least recently used files are discarded."""
+        myCache = ItuToTokens.ItuTokenCache(maxFiles=1)
+        myOtherPath = os.path.join(self._tmpDir, 'eggs.h')
+        with open(myOtherPath, 'w') as f:
+            f.write(u'int y;\n')
+        tuple(myCache.tokenBuffer(self._srcPath).genTokToktype())
+        tuple(myCache.tokenBuffer(myOtherPath).genTokToktype())
+        self.assertEqual(1, len(myCache))
+        tuple(myCache.tokenBuffer(self._srcPath).genTokToktype())
+        self.assertEqual((0, 3), (myCache.hits, myCache.misses))
+
+class TestItuTokensFromLexer(unittest.TestCase):
+    """Tests the tokens recorded by the PpTokeniser and PpLexer for the ITU."""
+    SOURCES = (
+        u'#define SPAM 1 /* comment */\nint x; // C++ comment\n',
+        u'#define A 1 + \\\n  2\nint x; /* a \\\n b\n c */ y\n',
+        u'\\\nint x;\n',
+        u'x \\\n\\\n\\\ny\n',
+        u'char c = \'a\'\\\n;\n',
+        u'// \u00a9 2023 \\\n more\nint $x;\n',
+    )
+    def _retItuTokens(self, theSource, **kwargs):
+        myObj = PpTokeniser.PpTokeniser(
+            io.StringIO(theSource),
+            theDiagnostic=CppDiagnostic.PreprocessDiagnosticKeepGoing(),
+            **kwargs
+        )
+        myObj.recordItuTokens()
+        self.assertEqual(None, myObj.retItuTokens())
+        for t in myObj.next():
+            pass
+        return myObj.retItuTokens()
+
+    def test_00(self):
+        """TestItuTokensFromLexer.test_00(): Recorded tokens are the same as ItuToTokens."""
+        for aSrc in self.SOURCES:
+            myItt = ItuToTokens.ItuToTokens(io.StringIO(aSrc))
+            myTokS = self._retItuTokens(aSrc)
+            self.assertEqual(aSrc, ''.join([t for t, tt in myTokS]))
+            self.assertEqual(
+                list(myItt.genTokensKeywordPpDirective()),
+                list(ItuToTokens.genKeywordPpDirective(myTokS)),
+            )
+
+    def test_01(self):
+        """TestItuTokensFromLexer.test_01(): Streamed tokens are the same."""
+        for aSrc in self.SOURCES:
+            self.assertEqual(
+                self._retItuTokens(aSrc),
+                self._retItuTokens(aSrc, theChunkSize=8),
+            )
+
+    def test_02(self):
+        """TestItuTokensFromLexer.test_02(): Not recorded if not asked for or with trigraphs."""
+        myObj = PpTokeniser.PpTokeniser(io.StringIO(u'int x;\n'))
+        for t in myObj.next():
+            pass
+        self.assertEqual(None, myObj.retItuTokens())
+        self.assertEqual(None, self._retItuTokens(u'a ??= b\n'))
+        # Not a trigraph
+        self.assertNotEqual(None, self._retItuTokens(u'a ??? b\n'))
+
+class TestItuTokenCacheLexer(unittest.TestCase):
+    """Tests the ItuTokenCache being filled by the PpLexer."""
+    def setUp(self):
+        self._tmpDir = tempfile.mkdtemp()
+        self._srcPath = os.path.join(self._tmpDir, 'spam.c')
+        self._incPath = os.path.join(self._tmpDir, 'eggs.h')
+        self._triPath = os.path.join(self._tmpDir, 'chips.h')
+        with open(self._srcPath, 'w') as f:
+            f.write(u'#include "eggs.h"\n#include "chips.h"\nint x = EGGS; /* done */\n')
+        with open(self._incPath, 'w') as f:
+            f.write(u'#define EGGS 1 + \\\n    2 // two\n')
+        with open(self._triPath, 'w') as f:
+            f.write(u'??=define CHIPS 3\n')
+
+    def tearDown(self):
+        shutil.rmtree(self._tmpDir)
+
+    def _expTokens(self, thePath):
+        with open(thePath) as f:
+            myItt = ItuToTokens.ItuToTokens(io.StringIO(f.read()))
+        return tuple(myItt.genTokensKeywordPpDirective())
+
+    def test_00(self):
+        """TestItuTokenCacheLexer.test_00(): Files processed by the lexer are not tokenised again."""
+        myCache = ItuToTokens.ItuTokenCache()
+        myLexer = PpLexer.PpLexer(
+            self._srcPath,
+            IncludeHandler.CppIncludeStdOs([self._tmpDir], []),
+            ituTokenCache=myCache,
+        )
+        for t in myLexer.ppTokens():
+            pass
+        # Not the file with trigraphs
+        self.assertEqual(2, len(myCache))
+        self.assertFalse(myCache.needsTokens(self._srcPath))
+        self.assertTrue(myCache.needsTokens(self._triPath))
+        self.assertEqual(self._expTokens(self._srcPath), tuple(myCache.tokenBuffer(self._srcPath).genTokToktype()))
+        self.assertEqual(self._expTokens(self._incPath), tuple(myCache.tokenBuffer(self._incPath).genTokToktype()))
+        self.assertEqual((2, 0), (myCache.hits, myCache.misses))
+        self.assertEqual(self._expTokens(self._triPath), tuple(myCache.tokenBuffer(self._triPath).genTokToktype()))
+        self.assertEqual((2, 1), (myCache.hits, myCache.misses))
+
+    def test_01(self):
+        """TestItuTokenCacheLexer.test_01(): Files that do not exist are not added."""
+        myCache = ItuToTokens.ItuTokenCache()
+        myPath = os.path.join(self._tmpDir, 'none.h')
+        self.assertFalse(myCache.needsTokens(myPath))
+        myCache.addTokens(myPath, [('int', 'identifier')])
+        self.assertEqual(0, len(myCache))
+
 class TestNullClass(unittest.TestCase):
     pass
 
@@ -943,7 +1145,11 @@ def unitTest(theVerbosity=2):
     suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestItuToHtmlPhase3))
     suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestItuToHtmlTokenGen))
     suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestItuToHtmlTokenGenSpecial))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestItuToHtmlTokenGenSplice))
     suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestItuToHtmlTokenGenLinux))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestItuTokenCache))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestItuTokensFromLexer))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestItuTokenCacheLexer))
     myResult = unittest.TextTestRunner(verbosity=theVerbosity).run(suite)
     return (myResult.testsRun, len(myResult.errors), len(myResult.failures))
 
@@ -3339,6 +3339,61 @@ t(a) a
             #    % (tIn, tRes, tExp, tRes==tExp)
             self.assertEqual(tRes, tExp)
 
+    def testDefineFunction_02(self):
+        """TestMacroEnvFuncReexamine.testDefineFunction_02 - function like macro name ending a replacement is not invoked."""
+        myMap = MacroEnv.MacroEnv()
+        myStr = u"""t(a) a
+X t
+"""
+        myCpp = PpTokeniser.PpTokeniser(
+            theFileObj=io.StringIO(myStr)
+            )
+        myGen = myCpp.next()
+        myMap.define(myGen, '', 1)
+        myMap.define(myGen, '', 1)
+        self._checkMacroEnv(myGen, myMap, ['t', 'X',])
+        myResultPairs = (
+            (u'X + 1',      't + 1'),
+            (u'X\n+1',      't\n+1'),
+            (u'X (1) + 1',  '1 + 1'),
+            (u'X X',        't t'),
+        )
+        for tIn, tExp in myResultPairs:
+            myCpp = PpTokeniser.PpTokeniser(
+                theFileObj=io.StringIO(tIn)
+                )
+            repList = []
+            myGen = myCpp.next()
+            for ttt in myGen:
+                repList += myMap.replace(ttt, myGen)
+            self.assertEqual(PpToken.tokensStr(repList), tExp)
+
+    def testDefineFunction_03(self):
+        """TestMacroEnvFuncReexamine.testDefineFunction_03 - nesting deeper than the Python recursion limit."""
+        myDepth = sys.getrecursionlimit() + 100
+        myStrS = [u'M0(x) x\n']
+        for i in range(1, myDepth):
+            myStrS.append(u'M%d(x) M%d(x)+%d\n' % (i, i - 1, i))
+        myMap = MacroEnv.MacroEnv()
+        myCpp = PpTokeniser.PpTokeniser(
+            theFileObj=io.StringIO(u''.join(myStrS))
+            )
+        myGen = myCpp.next()
+        for i in range(myDepth):
+            myMap.define(myGen, '', 1)
+        myCpp = PpTokeniser.PpTokeniser(
+            theFileObj=io.StringIO(u'M%d(0);' % (myDepth - 1))
+            )
+        repList = []
+        myGen = myCpp.next()
+        for ttt in myGen:
+            repList += myMap.replace(ttt, myGen)
+        self.assertEqual(
+            PpToken.tokensStr(repList),
+            '0' + ''.join(['+%d' % i for i in range(1, myDepth)]) + ';',
+        )
+        self.assertEqual(1, myMap.macro('M0').refCount)
+
 
 class TestExample3(TestMacroEnv):
     """Tests example in ISO/IEC 9899:1999(E) 6.10.3.5-5 EXAMPLE 3"""
@@ -4530,6 +4585,53 @@ class TestPredefinedRedefinition(TestMacroEnv):
             1,
             )
 
+class TestPredefinedMacroLoader(TestMacroEnv):
+    """Tests loading predefined macros in bulk."""
+    PREDEF = {
+        'SPAM'      : '1\n',
+        'F(a,b)'    : 'a+b\n',
+        'EGGS'      : '/* eggs\n */ 2\n',
+        'CHIPS'     : '3 \\\n 4\n',
+        'BEANS'     : '\n',
+    }
+
+    def test_00(self):
+        """TestPredefinedMacroLoader.test_00 - bulk loading is the same as one at a time."""
+        myLoader = MacroEnv.PredefinedMacroLoader()
+        myMacroS = myLoader.retMacros(self.PREDEF)
+        self.assertEqual(5, len(myLoader))
+        self.assertEqual(
+            ['SPAM', 'F', 'EGGS', 'CHIPS', 'BEANS'],
+            [m.identifier for m in myMacroS],
+        )
+        for aPair, aMacro in zip(self.PREDEF.items(), myMacroS):
+            myGen = PpTokeniser.PpTokeniser(
+                theFileObj=io.StringIO(u'%s %s' % aPair)).next()
+            self.assertEqual(str(PpDefine.PpDefine(myGen, '', 1)), str(aMacro))
+
+    def test_01(self):
+        """TestPredefinedMacroLoader.test_01 - macros are cached and copied by each environment."""
+        myLoader = MacroEnv.PredefinedMacroLoader()
+        myEnvS = [
+            MacroEnv.MacroEnv(stdPredefMacros=self.PREDEF, predefLoader=myLoader)
+            for i in range(2)
+        ]
+        self.assertEqual(5, len(myLoader))
+        self.assertEqual(str(myEnvS[0]), str(myEnvS[1]))
+        myTtt = PpToken.PpToken('SPAM', 'identifier')
+        self.assertTrue(myEnvS[0].isDefined(myTtt))
+        self.assertEqual(1, myEnvS[0].macro('SPAM').refCount)
+        self.assertEqual(0, myEnvS[1].macro('SPAM').refCount)
+        self.assertEqual(0, myLoader.retMacros({'SPAM' : '1\n'})[0].refCount)
+        # Another value is a new cache entry
+        myEnv = MacroEnv.MacroEnv(stdPredefMacros={'SPAM' : '2\n'},
+                                  predefLoader=myLoader)
+        self.assertEqual(6, len(myLoader))
+        self.assertEqual(
+            '2',
+            self.tokensToString(myEnv.macro('SPAM').replacementTokens),
+        )
+
 class TestPredefined__FILE__(TestMacroEnv):
     """Tests __FILE__ setting."""
     def setUp(self):
@@ -4602,6 +4704,123 @@ class TestPredefined__LINE__(TestMacroEnv):
                 PpToken.PpToken(self._macroName, 'identifier'), None)
             )
 
+class TestMacroEnvExpansionCache(TestMacroEnv):
+    """Tests memoisation of object-like macro expansions."""
+    def _define(self, theEnv, theStr):
+        myGen = PpTokeniser.PpTokeniser(theFileObj=io.StringIO(theStr)).next()
+        for aLine in theStr.splitlines():
+            theEnv.define(myGen, 'spam.h', 1)
+
+    def _undef(self, theEnv, theStr):
+        myGen = PpTokeniser.PpTokeniser(theFileObj=io.StringIO(theStr)).next()
+        theEnv.undef(myGen, 'spam.h', 1)
+
+    def _replace(self, theEnv, theStr):
+        repList = []
+        myGen = PpTokeniser.PpTokeniser(theFileObj=io.StringIO(theStr)).next()
+        for ttt in myGen:
+            repList += theEnv.replace(ttt, myGen)
+        return PpToken.tokensStr(repList)
+
+    def test_00(self):
+        """TestMacroEnvExpansionCache.test_00() - repeated expansion is memoised and counts references."""
+        myMap = MacroEnv.MacroEnv()
+        self._define(myMap, u'A 1\nB 2\nFLAGS (A|B|C)\n')
+        self.assertEqual('(1|2|C)', self._replace(myMap, u'FLAGS'))
+        self.assertEqual(['A', 'B', 'FLAGS'], sorted(myMap._expansionCache.keys()))
+        self.assertEqual('(1|2|C) (1|2|C)', self._replace(myMap, u'FLAGS FLAGS'))
+        for aName in ('A', 'B', 'FLAGS'):
+            self.assertEqual(3, myMap.macro(aName).refCount)
+        # Tokens are copies
+        myTokS = myMap.replace(PpToken.PpToken('FLAGS', 'identifier'), None)
+        for aTtt, aCached in zip(myTokS, myMap._expansionCache['FLAGS'].tokens):
+            self.assertIsNot(aCached, aTtt)
+
+    def test_01(self):
+        """TestMacroEnvExpansionCache.test_01() - #define and #undef invalidate dependent expansions."""
+        myMap = MacroEnv.MacroEnv()
+        self._define(myMap, u'A 1\nB 2\nFLAGS (A|B|C)\nOTHER B\n')
+        self.assertEqual('(1|2|C) 2', self._replace(myMap, u'FLAGS OTHER'))
+        self._define(myMap, u'C 3\n')
+        self.assertEqual(['A', 'B', 'OTHER'], sorted(myMap._expansionCache.keys()))
+        self.assertEqual('(1|2|3)', self._replace(myMap, u'FLAGS'))
+        self._undef(myMap, u'A\n')
+        self.assertEqual('(A|2|3)', self._replace(myMap, u'FLAGS'))
+        self._undef(myMap, u'B\n')
+        self.assertEqual(['C'], list(myMap._expansionCache.keys()))
+        self.assertEqual('(A|B|3) B', self._replace(myMap, u'FLAGS OTHER'))
+
+    def test_02(self):
+        """TestMacroEnvExpansionCache.test_02() - function-like macros and __LINE__ are not memoised."""
+        myMap = MacroEnv.MacroEnv()
+        myMap.set__LINE__(u'42\n')
+        self._define(myMap, u'f(a) a\nF f\nL __LINE__\nX (L+1)\nY 1\n')
+        self.assertEqual('f + 1 42 (42+1) 1', self._replace(myMap, u'F + 1 L X Y'))
+        self.assertEqual(['Y'], list(myMap._expansionCache.keys()))
+        self.assertEqual('1', self._replace(myMap, u'F(1)'))
+
+    def test_03(self):
+        """TestMacroEnvExpansionCache.test_03() - memoised expansion respects the hide-set."""
+        myMap = MacroEnv.MacroEnv()
+        self._define(myMap, u'M N x\nN M\nP Q\nQ P P\n')
+        self.assertEqual('M x', self._replace(myMap, u'M'))
+        self.assertEqual('N x', self._replace(myMap, u'N'))
+        self.assertEqual('M x', self._replace(myMap, u'M'))
+        self.assertEqual('P P', self._replace(myMap, u'P'))
+        self.assertEqual('Q Q', self._replace(myMap, u'Q'))
+        self.assertEqual('P P', self._replace(myMap, u'P'))
+
+class TestMacroEnvFork(TestMacroEnv):
+    """Tests forking a macro environment."""
+    _define = TestMacroEnvExpansionCache._define
+    _undef = TestMacroEnvExpansionCache._undef
+    _replace = TestMacroEnvExpansionCache._replace
+
+    def test_00(self):
+        """TestMacroEnvFork.test_00() - #define and #undef are not seen by the other environment."""
+        myMap = MacroEnv.MacroEnv()
+        self._define(myMap, u'A 1\nB 2\n')
+        myFork = myMap.fork()
+        self._define(myFork, u'C 3\n')
+        self._undef(myFork, u'A\n')
+        self._define(myMap, u'D 4\n')
+        self.assertEqual(['A', 'B', 'D'], sorted(myMap.macros()))
+        self.assertEqual(['B', 'C'], sorted(myFork.macros()))
+        self.assertEqual('1 2 C 4', self._replace(myMap, u'A B C D'))
+        self.assertEqual('A 2 3 D', self._replace(myFork, u'A B C D'))
+        self.assertEqual(0, len(list(myMap.genMacrosOutOfScope())))
+        self.assertEqual(['A'], [m.identifier for m in myFork.genMacrosOutOfScope()])
+        self.assertTrue(myMap.macro('A').isCurrentlyDefined)
+
+    def test_01(self):
+        """TestMacroEnvFork.test_01() - references are counted separately."""
+        myMap = MacroEnv.MacroEnv()
+        self._define(myMap, u'A 1\nB A\n')
+        self.assertEqual('1', self._replace(myMap, u'B'))
+        myFork = myMap.fork()
+        self.assertEqual('1 1', self._replace(myFork, u'B B'))
+        self.assertTrue(myFork.isDefined(PpToken.PpToken('A', 'identifier')))
+        self.assertEqual(1, myMap.macro('A').refCount)
+        self.assertEqual(1, myMap.macro('B').refCount)
+        self.assertEqual(4, myFork.macro('A').refCount)
+        self.assertEqual(3, myFork.macro('B').refCount)
+        self.assertIsNot(myMap.macro('A'), myFork.macro('A'))
+        self.assertEqual('1', self._replace(myMap, u'B'))
+        self.assertEqual(2, myMap.macro('A').refCount)
+        self.assertEqual(4, myFork.macro('A').refCount)
+
+    def test_02(self):
+        """TestMacroEnvFork.test_02() - #undef of a shared macro leaves the other environment unchanged."""
+        myMap = MacroEnv.MacroEnv()
+        self._define(myMap, u'A 1\n')
+        myFork = myMap.fork()
+        self._undef(myMap, u'A\n')
+        self.assertFalse(myMap.hasMacro('A'))
+        self.assertTrue(myFork.hasMacro('A'))
+        self.assertTrue(myFork.macro('A').isCurrentlyDefined)
+        self.assertFalse(myMap.getUndefMacro(0).isCurrentlyDefined)
+        self.assertEqual('1', self._replace(myFork, u'A'))
+
 class TestMacroEnvIncRefCount(TestMacroEnv):
     """Tests that the reference count of a macro is appropriatly incremented."""
 
@@ -5837,6 +6056,59 @@ EGGS 2
         except MacroEnv.ExceptionMacroEnvNoMacroDefined:
             pass
 
+    def test_05(self):
+        """TestMacroDependencies.test_05(): - Dependencies follow #define and #undef."""
+        myEnv = MacroEnv.MacroEnv()
+        myCpp = PpTokeniser.PpTokeniser(
+            theFileObj=io.StringIO(u"""SPAM EGGS CHIPS EGGS
+CHIPS 1
+BEANS CHIPS
+CHIPS
+EGGS 2
+""")
+            )
+        myGen = myCpp.next()
+        myEnv.define(myGen, 'f.h', 1)
+        self.assertEqual([], myEnv.macroDependencies('SPAM'))
+        self.assertEqual(['SPAM'], myEnv.macroDependents('EGGS'))
+        myEnv.define(myGen, 'f.h', 2)
+        myEnv.define(myGen, 'f.h', 3)
+        self.assertEqual(['CHIPS'], myEnv.macroDependencies('SPAM'))
+        self.assertEqual(['SPAM', 'BEANS'], myEnv.macroDependents('CHIPS'))
+        myEnv.undef(myGen, 'f.h', 4)
+        self.assertEqual([], myEnv.macroDependencies('SPAM'))
+        self.assertEqual([], myEnv.macroDependencies('BEANS'))
+        self.assertEqual(['SPAM', 'BEANS'], myEnv.macroDependents('CHIPS'))
+        myEnv.define(myGen, 'f.h', 5)
+        self.assertEqual(['EGGS'], myEnv.macroDependencies('SPAM'))
+        self.assertEqual([], myEnv.macroDependents('SPAM'))
+        myAdjList = myEnv.allStaticMacroDependencies()
+        self.assertEqual(['EGGS',], myAdjList.children('SPAM'))
+        self.assertFalse(myAdjList.hasParent('BEANS'))
+
+    def test_06(self):
+        """TestMacroDependencies.test_06(): - Dependencies of a forked environment."""
+        myEnv = MacroEnv.MacroEnv()
+        myCpp = PpTokeniser.PpTokeniser(
+            theFileObj=io.StringIO(u"""SPAM EGGS
+EGGS
+EGGS
+EGGS 2
+""")
+            )
+        myGen = myCpp.next()
+        myEnv.define(myGen, 'f.h', 1)
+        myFork = myEnv.fork()
+        myFork.define(myGen, 'f.h', 2)
+        self.assertEqual([], myEnv.macroDependencies('SPAM'))
+        self.assertEqual(['EGGS'], myFork.macroDependencies('SPAM'))
+        myFork.undef(myGen, 'f.h', 3)
+        myEnv.define(myGen, 'f.h', 4)
+        self.assertEqual(['EGGS'], myEnv.macroDependencies('SPAM'))
+        self.assertEqual([], myFork.macroDependencies('SPAM'))
+        self.assertEqual(['SPAM'], myEnv.macroDependents('EGGS'))
+        self.assertEqual(['SPAM'], myFork.macroDependents('EGGS'))
+
 
 class TestLibCello(TestMacroEnv):
     """Tests that resulted in processing libCello."""
@@ -5927,11 +6199,14 @@ def unitTest(theVerbosity=2):
     suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestStringise))
     # - OK
     suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestPredefinedRedefinition))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestPredefinedMacroLoader))
     # - OK
     suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestPredefined__FILE__))
     # - OK
     suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestPredefined__LINE__))
     # - OK
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestMacroEnvExpansionCache))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestMacroEnvFork))
     suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestMacroEnvIncRefCount))
     # - OK
     suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestMacroEnvAccess))
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# CPIP is a C/C++ Preprocessor implemented in Python.
+# Copyright (C) 2008-2017 Paul Ross
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Paul Ross: apaulross@gmail.com
+
+"""Tests MacroProfiler."""
+
+__author__  = 'Paul Ross'
+__date__    = '2023-08-01'
+__rights__  = 'Copyright (c) 2008-2017 Paul Ross'
+
+import io
+import json
+import unittest
+
+from cpip.core import IncludeHandler
+from cpip.core import MacroProfiler
+from cpip.core import PpLexer
+
+class Clock(object):
+    """A timer that advances by one second each time it is read."""
+    def __init__(self):
+        self.now = -1.0
+
+    def __call__(self):
+        self.now += 1.0
+        return self.now
+
+#######################################
+# Section: Unit tests
+########################################
+class TestMacroProfiler(unittest.TestCase):
+    """Tests MacroProfiler with a fake timer."""
+    def test_00(self):
+        """TestMacroProfiler.test_00(): construction."""
+        myObj = MacroProfiler.MacroProfiler(Clock())
+        self.assertEqual(0, len(myObj))
+        self.assertEqual(0, myObj.depth)
+        self.assertEqual(0, myObj.maxDepth)
+        self.assertEqual([], list(myObj.genProfiles()))
+        self.assertRaises(KeyError, myObj.profile, 'A')
+
+    def test_01(self):
+        """TestMacroProfiler.test_01(): nested expansion, self and cumulative time."""
+        myObj = MacroProfiler.MacroProfiler(Clock())
+        myOut = []
+        myObj.start('A', myOut)         # t=0
+        myObj.start('B', myOut, 3)      # t=1
+        myOut.extend(['x', 'y'])
+        myObj.finish('B')               # t=2
+        myOut.append('z')
+        myObj.finish('A')               # t=3
+        self.assertEqual(2, len(myObj))
+        self.assertEqual(0, myObj.depth)
+        self.assertEqual(2, myObj.maxDepth)
+        myA = myObj.profile('A')
+        self.assertEqual(1, myA.expansions)
+        self.assertEqual(3.0, myA.cumulativeTime)
+        self.assertEqual(2.0, myA.selfTime)
+        self.assertEqual(1, myA.tokensIn)
+        self.assertEqual(3, myA.tokensOut)
+        self.assertEqual(3.0, myA.amplification)
+        self.assertEqual(1, myA.maxNesting)
+        myB = myObj.profile('B')
+        self.assertEqual(1.0, myB.cumulativeTime)
+        self.assertEqual(1.0, myB.selfTime)
+        self.assertEqual(3, myB.tokensIn)
+        self.assertEqual(2, myB.tokensOut)
+        self.assertEqual(0, myB.maxNesting)
+
+    def test_02(self):
+        """TestMacroProfiler.test_02(): recursive cumulative time is counted once."""
+        myObj = MacroProfiler.MacroProfiler(Clock())
+        myObj.start('A', [])            # t=0
+        myObj.start('A', [])            # t=1
+        myObj.finish('A')               # t=2
+        myObj.finish('A')               # t=3
+        myA = myObj.profile('A')
+        self.assertEqual(2, myA.expansions)
+        self.assertEqual(3.0, myA.cumulativeTime)
+        self.assertEqual(3.0, myA.selfTime)
+
+    def test_03(self):
+        """TestMacroProfiler.test_03(): finish() must be the innermost expansion."""
+        myObj = MacroProfiler.MacroProfiler(Clock())
+        self.assertRaises(MacroProfiler.ExceptionMacroProfiler, myObj.finish, 'A')
+        myObj.start('A', [])
+        myObj.start('B', [])
+        self.assertRaises(MacroProfiler.ExceptionMacroProfiler, myObj.finish, 'A')
+        myObj.clearFrames()
+        self.assertEqual(0, myObj.depth)
+        self.assertEqual(0, len(myObj))
+
+    def test_04(self):
+        """TestMacroProfiler.test_04(): memoised expansions."""
+        myObj = MacroProfiler.MacroProfiler(Clock())
+        myObj.start('A', [])
+        myObj.finishCacheHit('A', ['B', 'B'])
+        self.assertEqual((1, 1), (myObj.profile('A').expansions, myObj.profile('A').cacheHits))
+        self.assertEqual((2, 2), (myObj.profile('B').expansions, myObj.profile('B').cacheHits))
+        self.assertEqual(0.0, myObj.profile('B').cumulativeTime)
+
+    def test_05(self):
+        """TestMacroProfiler.test_05(): sorting and JSON."""
+        myObj = MacroProfiler.MacroProfiler(Clock())
+        for anId in ('B', 'A', 'B', 'C'):
+            myObj.start(anId, [])
+            myObj.finish(anId)
+        self.assertEqual(['A', 'B', 'C'], [p.identifier for p in myObj.genProfiles()])
+        self.assertEqual(['B', 'A', 'C'],
+                         [p.identifier for p in myObj.genProfiles('expansions')])
+        self.assertEqual(['C', 'B', 'A'],
+                         [p.identifier for p in myObj.genProfiles('identifier', True)])
+        self.assertRaises(MacroProfiler.ExceptionMacroProfiler,
+                          list, myObj.genProfiles('spam'))
+        myStream = io.StringIO()
+        myObj.writeJson(myStream, 'expansions')
+        myJson = json.loads(myStream.getvalue())
+        self.assertEqual(1, myJson['maxDepth'])
+        self.assertEqual(['B', 'A', 'C'], [m['identifier'] for m in myJson['macros']])
+        self.assertEqual(sorted(MacroProfiler.SORT_KEYS), sorted(myJson['macros'][0].keys()))
+
+class TestMacroProfilerLexer(unittest.TestCase):
+    """Tests MacroProfiler when used by a PpLexer."""
+    def _retLexer(self, theProfiler):
+        return PpLexer.PpLexer(
+            'src/spam.c',
+            IncludeHandler.CppIncludeStringIO(
+                [],
+                [],
+                '#define A B B\n#define B 1\n#define F(x) x+x\nA\nA\nF(A)\nF(2)\n',
+                {},
+            ),
+            macroProfiler=theProfiler,
+        )
+
+    def test_00(self):
+        """TestMacroProfilerLexer.test_00(): profiling does not change the output."""
+        myObj = MacroProfiler.MacroProfiler()
+        myLexer = self._retLexer(myObj)
+        self.assertIs(myObj, myLexer.macroEnvironment.profiler)
+        self.assertEqual(
+            '\n\n\n1 1\n1 1\n1 1+1 1\n2+2\n',
+            ''.join([t.t for t in myLexer.ppTokens()]),
+        )
+        self.assertIs(None, self._retLexer(None).macroEnvironment.profiler)
+
+    def test_01(self):
+        """TestMacroProfilerLexer.test_01(): profiles of a translation unit."""
+        myObj = MacroProfiler.MacroProfiler()
+        for t in self._retLexer(myObj).ppTokens():
+            pass
+        self.assertEqual(0, myObj.depth)
+        self.assertEqual(2, myObj.maxDepth)
+        self.assertEqual(['A', 'B', 'F'], [p.identifier for p in myObj.genProfiles()])
+        # Twice in the text and once in the argument of F
+        myA = myObj.profile('A')
+        self.assertEqual(3, myA.expansions)
+        self.assertEqual(3, myA.tokensIn)
+        self.assertEqual(1, myA.maxNesting)
+        # Macro name and the argument
+        myF = myObj.profile('F')
+        self.assertEqual(2, myF.expansions)
+        self.assertEqual(0, myF.cacheHits)
+        self.assertEqual(4, myF.tokensIn)
+        self.assertTrue(myF.cumulativeTime >= myF.selfTime >= 0.0)
+        self.assertEqual(6, myObj.profile('B').expansions)
+
+class Special(unittest.TestCase):
+    pass
+
+def unitTest(theVerbosity=2):
+    """Execute unit tests."""
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestMacroProfiler)
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestMacroProfilerLexer))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(Special))
+    myResult = unittest.TextTestRunner(verbosity=theVerbosity).run(suite)
+    return (myResult.testsRun, len(myResult.errors), len(myResult.failures))
+
+#################
+# End: Unit tests
+#################
+
+if __name__ == "__main__":
+    unitTest()
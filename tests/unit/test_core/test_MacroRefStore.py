@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# CPIP is a C/C++ Preprocessor implemented in Python.
+# Copyright (C) 2008-2017 Paul Ross
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Paul Ross: apaulross@gmail.com
+
+"""Tests MacroRefStore."""
+
+__author__  = 'Paul Ross'
+__date__    = '2023-07-11'
+__rights__  = 'Copyright (c) 2008-2017 Paul Ross'
+
+import pickle
+import unittest
+
+from cpip.core import FileLocation
+from cpip.core import FilePathTable
+from cpip.core import IncludeHandler
+from cpip.core import MacroRefStore
+from cpip.core import PpLexer
+
+#######################################
+# Section: Unit tests
+########################################
+class TestMacroRefStore(unittest.TestCase):
+    """Tests MacroRefStore."""
+    REFS = (
+        FileLocation.FileLineCol('a.h', 1, 1),
+        FileLocation.FileLineCol('a.h', 1, 9),
+        FileLocation.FileLineCol('b.h', 4, 2),
+        FileLocation.FileLineCol('a.h', 1, 1),
+        FileLocation.FileLineCol('b.h', 5, 2),
+    )
+
+    def _retStore(self, thePolicy=None):
+        myObj = MacroRefStore.MacroRefStore(thePolicy=thePolicy)
+        for aFlc in self.REFS:
+            myObj.add(aFlc)
+        return myObj
+
+    def test_00(self):
+        """TestMacroRefStore.test_00(): default policy records everything in order."""
+        myObj = self._retStore()
+        self.assertEqual(5, len(myObj))
+        self.assertEqual(5, myObj.numRefs)
+        self.assertEqual(0, myObj.numNotRecorded)
+        self.assertEqual(list(self.REFS), list(myObj))
+        self.assertEqual(self.REFS[2], myObj[2])
+        self.assertEqual(['a.h', 'b.h'], list(myObj.filePathTable))
+
+    def test_01(self):
+        """TestMacroRefStore.test_01(): genUniqueRefs() removes duplicates."""
+        myObj = self._retStore()
+        self.assertEqual(
+            [('a.h', 1, 1), ('a.h', 1, 9), ('b.h', 4, 2), ('b.h', 5, 2)],
+            list(myObj.genUniqueRefs()),
+        )
+
+    def test_02(self):
+        """TestMacroRefStore.test_02(): uniqueLines records the first reference on each line."""
+        myObj = self._retStore(MacroRefStore.RefPolicy(True, 0, 1))
+        self.assertEqual(
+            [self.REFS[0], self.REFS[2], self.REFS[4]],
+            list(myObj),
+        )
+        self.assertEqual(5, myObj.numRefs)
+        self.assertEqual(2, myObj.numNotRecorded)
+
+    def test_03(self):
+        """TestMacroRefStore.test_03(): maxRefs limits the references recorded."""
+        myObj = self._retStore(MacroRefStore.RefPolicy(False, 2, 1))
+        self.assertEqual(list(self.REFS[:2]), list(myObj))
+        self.assertEqual(5, myObj.numRefs)
+        self.assertEqual(3, myObj.numNotRecorded)
+
+    def test_04(self):
+        """TestMacroRefStore.test_04(): sampleEvery records every Nth reference."""
+        myObj = self._retStore(MacroRefStore.RefPolicy(False, 0, 2))
+        self.assertEqual(
+            [self.REFS[0], self.REFS[2], self.REFS[4]],
+            list(myObj),
+        )
+        myObj = self._retStore(MacroRefStore.RefPolicy(False, 2, 2))
+        self.assertEqual([self.REFS[0], self.REFS[2]], list(myObj))
+
+    def test_05(self):
+        """TestMacroRefStore.test_05(): shares a FilePathTable."""
+        myTable = FilePathTable.FilePathTable()
+        myTable.fileId('b.h')
+        myObj = MacroRefStore.MacroRefStore(myTable)
+        myObj.add(self.REFS[0])
+        self.assertIs(myTable, myObj.filePathTable)
+        self.assertEqual(['b.h', 'a.h'], list(myTable))
+        self.assertEqual([self.REFS[0]], list(myObj))
+
+    def test_06(self):
+        """TestMacroRefStore.test_06(): pickles and continues to apply the policy."""
+        myObj = self._retStore(MacroRefStore.RefPolicy(True, 0, 1))
+        myCopy = pickle.loads(pickle.dumps(myObj))
+        self.assertEqual(list(myObj), list(myCopy))
+        self.assertEqual(myObj.policy, myCopy.policy)
+        self.assertFalse(myCopy.add(FileLocation.FileLineCol('b.h', 4, 7)))
+        self.assertTrue(myCopy.add(FileLocation.FileLineCol('b.h', 6, 7)))
+
+    def test_07(self):
+        """TestMacroRefStore.test_07(): retRefPolicy()."""
+        self.assertEqual(MacroRefStore.DEFAULT_REF_POLICY, MacroRefStore.retRefPolicy())
+        self.assertEqual(
+            MacroRefStore.RefPolicy(True, 10, 3),
+            MacroRefStore.retRefPolicy(1, 10, 3),
+        )
+        self.assertRaises(MacroRefStore.ExceptionMacroRefStore,
+                          MacroRefStore.retRefPolicy, False, -1, 1)
+        self.assertRaises(MacroRefStore.ExceptionMacroRefStore,
+                          MacroRefStore.retRefPolicy, False, 0, 0)
+
+class TestMacroRefStoreLexer(unittest.TestCase):
+    """Tests MacroRefStore with a PpLexer."""
+    def _retLexer(self, thePolicy):
+        return PpLexer.PpLexer(
+            'src/spam.c',
+            IncludeHandler.CppIncludeStringIO(
+                ['usr'],
+                [],
+                '#include "eggs.h"\n#include "eggs.h"\nX X\nX\n',
+                {'usr/eggs.h' : '#undef X\n#define X 1\nX\n'},
+            ),
+            macroRefPolicy=thePolicy,
+        )
+
+    def test_00(self):
+        """TestMacroRefStoreLexer.test_00(): macros share the lexer's FilePathTable."""
+        myLexer = self._retLexer(None)
+        myToks = list(myLexer.ppTokens())
+        myStore = myLexer.macroEnvironment.macro('X').refStore
+        self.assertIs(myLexer.filePathTable, myStore.filePathTable)
+        self.assertEqual(
+            [
+                ('usr/eggs.h', 3, 1),
+                ('src/spam.c', 3, 1),
+                ('src/spam.c', 3, 3),
+                ('src/spam.c', 4, 1),
+            ],
+            [tuple(f) for f in myStore],
+        )
+        self.assertEqual(4, myLexer.macroEnvironment.macro('X').refCount)
+
+    def test_01(self):
+        """TestMacroRefStoreLexer.test_01(): the lexer applies the policy."""
+        myLexer = self._retLexer(MacroRefStore.RefPolicy(True, 2, 1))
+        myToks = list(myLexer.ppTokens())
+        myMacro = myLexer.macroEnvironment.macro('X')
+        self.assertEqual(
+            [('usr/eggs.h', 3, 1), ('src/spam.c', 3, 1)],
+            [tuple(f) for f in myMacro.refFileLineColS],
+        )
+        self.assertEqual(4, myMacro.refCount)
+        self.assertEqual(2, myMacro.refStore.numNotRecorded)
+
+class Special(unittest.TestCase):
+    pass
+
+def unitTest(theVerbosity=2):
+    """Execute unit tests."""
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestMacroRefStore)
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestMacroRefStoreLexer))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(Special))
+    myResult = unittest.TextTestRunner(verbosity=theVerbosity).run(suite)
+    return (myResult.testsRun, len(myResult.errors), len(myResult.failures))
+
+#################
+# End: Unit tests
+#################
+
+if __name__ == "__main__":
+    unitTest()
@@ -151,6 +151,18 @@ class TestPpDefineInit(TestPpDefine):
         self.assertRaises(StopIteration, next, myGen)
         self.assertFalse(myCppDef.expandArguments)
 
+    def testInitObject_00_LineIndex(self):
+        """PpDefine.__init__(): stored tokens do not keep the tokeniser's line index."""
+        myCpp = PpTokeniser.PpTokeniser(
+            theFileObj=io.StringIO(u'FOO a  b\n')
+            )
+        myCppDef = PpDefine.PpDefine(myCpp.next(), '', 1)
+        self.assertEqual(['a', '  ', 'b'], myCppDef.replacements)
+        for aTok in [myCppDef._identifier] + myCppDef._replaceTokTypesS:
+            self.assertIs(None, aTok._lineIndex)
+        self.assertEqual((1, 5), (myCppDef._replaceTokTypesS[0].lineNum,
+                                  myCppDef._replaceTokTypesS[0].colNum))
+
     def testInitObject_00_00(self):
         """PpDefine.__init__(): OK from object type macro: <#define> 'FOO  \\n'."""
         myCpp = PpTokeniser.PpTokeniser(
@@ -809,6 +809,58 @@ SPAM
                 ' identifier "# DefINE" at line=1, col=2 of file "define.h"'
             )
 
+    def test_02(self):
+        """Simple #define and expansion with macro reference locations tracked."""
+        myLexer = PpLexer.PpLexer(
+                 'define.h',
+                 CppIncludeStringIO(
+                    [],
+                    [],
+                    u"""#define SPAM 5
+SPAM
+#ifdef SPAM
+#endif
+""",
+                    {}),
+                 )
+        result = u''.join([t.t for t in myLexer.ppTokens()])
+        self.assertEqual(result, """
+5
+
+
+""")
+        myMacro = myLexer.macroEnvironment.macro('SPAM')
+        self.assertEqual(2, myMacro.refCount)
+        self.assertEqual(
+            [('define.h', 2, 1), ('define.h', 4, 1)],
+            [tuple(f) for f in myMacro.refFileLineColS],
+        )
+
+    def test_03(self):
+        """Simple #define and expansion without macro reference locations tracked."""
+        myLexer = PpLexer.PpLexer(
+                 'define.h',
+                 CppIncludeStringIO(
+                    [],
+                    [],
+                    u"""#define SPAM 5
+SPAM
+#ifdef SPAM
+#endif
+""",
+                    {}),
+                 trackMacroRefs=False,
+                 )
+        result = u''.join([t.t for t in myLexer.ppTokens()])
+        self.assertEqual(result, """
+5
+
+
+""")
+        myMacro = myLexer.macroEnvironment.macro('SPAM')
+        self.assertEqual(2, myMacro.refCount)
+        self.assertEqual([], myMacro.refFileLineColS)
+
 class TestPpLexerDefineFromStandard(TestPpLexer):
     """Tests some examples from the C standard ISO/IEC 9899:1999 (E)."""
     def test_00(self):
@@ -24,10 +24,12 @@ __rights__  = 'Copyright (c) 2008-2017 Paul Ross'
 
 import logging
 import os
+import pickle
 import sys
 import time
 import unittest
 
+from cpip.core import FileLocation
 from cpip.core import PpToken
 
 #######################################
@@ -445,6 +447,30 @@ class TestPpTokenLineColumn(unittest.TestCase):
         myTok = PpToken.PpToken('f', 'identifier', 1, 2)
         self.assertEqual(1, myTok.lineNum)
         self.assertEqual(2, myTok.colNum)
+
+    def test_01(self):
+        """TestPpTokenLineColumn.test_01(): Line and column computed lazily from an offset."""
+        myIdx = FileLocation.LineIndex('ab\ncd\n')
+        myTok = PpToken.PpToken('d', 'identifier', lineIndex=myIdx, ofs=4)
+        myCopy = myTok.copy()
+        self.assertEqual(2, myTok.lineNum)
+        self.assertEqual(2, myTok.colNum)
+        self.assertEqual((2, 2), (myCopy.colNum, myCopy.lineNum))
+
+    def test_02(self):
+        """TestPpTokenLineColumn.test_02(): Resolving and pickling release the line index."""
+        myIdx = FileLocation.LineIndex('ab\ncd\n')
+        myTok = PpToken.PpToken('d', 'identifier', lineIndex=myIdx, ofs=4)
+        myTok.resolveLineCol()
+        self.assertIs(None, myTok._lineIndex)
+        self.assertEqual((2, 2), (myTok.lineNum, myTok.colNum))
+        myTok = PpToken.PpToken('d', 'identifier', lineIndex=myIdx, ofs=4)
+        myBytes = pickle.dumps(myTok)
+        self.assertNotIn(b'LineIndex', myBytes)
+        myNew = pickle.loads(myBytes)
+        self.assertEqual((2, 2), (myNew.lineNum, myNew.colNum))
+        self.assertEqual(myTok, myNew)
+        self.assertTrue(myNew.canReplace)
         
 class TestPpTokenEvalConstExpr(unittest.TestCase):
     """Tests evalConstExpr() correctly prepares tokens for Python's eval() function."""
@@ -609,6 +635,52 @@ class TestPpTokenEscapeCodes(unittest.TestCase):
         self.assertEqual(p.t, r'object\x92s')
 
 
+class TestPpTokenCompact(unittest.TestCase):
+    """Tests the compact representation of PpToken."""
+    def test_00(self):
+        """PpToken has no instance dictionary."""
+        myObj = PpToken.PpToken('spam', 'identifier')
+        self.assertFalse(hasattr(myObj, '__dict__'))
+        self.assertRaises(AttributeError, setattr, myObj, 'eggs', 1)
+
+    def test_01(self):
+        """PpToken flags are independent of each other."""
+        myObj = PpToken.PpToken('spam', 'identifier', isReplacement=True)
+        self.assertEqual((True, False, False, True),
+                         (myObj.canReplace, myObj.prevWs, myObj.isCond, myObj.isReplacement))
+        myObj.prevWs = True
+        myObj.setIsCond()
+        myObj.canReplace = False
+        self.assertEqual((False, True, True, True),
+                         (myObj.canReplace, myObj.prevWs, myObj.isCond, myObj.isReplacement))
+        myObj.isReplacement = False
+        myObj.prevWs = False
+        self.assertEqual((False, False, True, False),
+                         (myObj.canReplace, myObj.prevWs, myObj.isCond, myObj.isReplacement))
+
+    def test_02(self):
+        """PpToken.copy() copies flags and the copy is independent."""
+        myObj = PpToken.PpToken('spam', 'identifier', 3, 7)
+        myObj.prevWs = True
+        myCopy = myObj.copy()
+        self.assertEqual((3, 7, True, True), (myCopy.lineNum, myCopy.colNum, myCopy.prevWs, myCopy.canReplace))
+        myCopy.merge(PpToken.PpToken('eggs', 'identifier'))
+        myCopy.canReplace = False
+        self.assertEqual('spam', myObj.t)
+        self.assertEqual('identifier', myObj.tt)
+        self.assertTrue(myObj.canReplace)
+
+    def test_03(self):
+        """PpToken interns identifiers and punctuators but not other types."""
+        myStr = ''.join(['sp', 'am'])
+        self.assertTrue(PpToken.PpToken(myStr, 'identifier').t is PpToken.PpToken('spam', 'identifier').t)
+        myStr = ''.join(['<', '<='])
+        self.assertTrue(PpToken.PpToken(myStr, 'preprocessing-op-or-punc').t \
+                        is PpToken.PpToken('<<=', 'preprocessing-op-or-punc').t)
+        myStr = ''.join(['"sp', 'am"'])
+        self.assertTrue(PpToken.PpToken(myStr, 'string-literal').t is myStr)
+
+
 def unitTest(theVerbosity=2):
     """Execute unit tests."""
     suite = unittest.TestLoader().loadTestsFromTestCase(TestGlobals)
@@ -623,6 +695,7 @@ def unitTest(theVerbosity=2):
     suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestPpTokenLineColumn))
     suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestPpTokenEvalConstExpr))
     suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestPpTokenEscapeCodes))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestPpTokenCompact))
     myResult = unittest.TextTestRunner(verbosity=theVerbosity).run(suite)
     return (myResult.testsRun, len(myResult.errors), len(myResult.failures))
 
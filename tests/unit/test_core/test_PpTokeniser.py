@@ -33,7 +33,8 @@ import unittest
 
 import pytest
 
-from cpip.core import PpTokeniser, FileLocation, CppDiagnostic, PpToken  
+from cpip.core import PpTokeniser, FileLocation, CppDiagnostic, PpToken
+from cpip.core import PpLexer, IncludeHandler  
 try:
     from tests.unit.test_core import TestBase
 except ImportError:
@@ -850,6 +851,32 @@ class TestExpressionLexOperators(TestPpTokeniserBase):
         myObj.resetTokType()
         self.assertEqual(0, myObj._sliceLexOperators(list(' ab')))
 
+    def testLexOperatorsDispatchTable(self):
+        """OPERATOR_DISPATCH_TABLE has every operator, longest first."""
+        myOpS = []
+        for k, v in PpTokeniser.OPERATOR_DISPATCH_TABLE.items():
+            self.assertTrue(all(o.startswith(k) for o in v))
+            self.assertEqual(sorted(v, key=len, reverse=True), list(v))
+            myOpS.extend(v)
+        self.assertEqual(
+            sorted(PpTokeniser.CHAR_SET_MAP['lex.op']['operators']),
+            sorted(myOpS),
+        )
+
+    def testLexOperatorsStrTree(self):
+        """_sliceLexOperators() is the same as the StrTree for strings and buffers."""
+        myObj = PpTokeniser.PpTokeniser()
+        myTree = PpTokeniser.CHAR_SET_STR_TREE_MAP['lex.op']['operators']
+        for anOp in PpTokeniser.CHAR_SET_MAP['lex.op']['operators']:
+            for aStr in (anOp, anOp + '=', anOp + anOp, ' ' + anOp, anOp[:-1]):
+                for aBuf in (aStr, list(aStr)):
+                    myObj.resetTokType()
+                    self.assertEqual(
+                        myTree.has(aBuf, 0),
+                        myObj._sliceLexOperators(aBuf),
+                        'Operator "%s" in %r' % (anOp, aBuf),
+                    )
+
 class TestExpressionLexCharset(TestPpTokeniserBase):
     def setUp(self):
         pass
@@ -2082,6 +2109,28 @@ class TestLexPptoken(TestPpTokeniserBase):
         self.assertEqual(0, myObj._sliceLexPptoken(list(' ab'), 0))
         self.assertEqual(myObj.cppTokType, None)
 
+    def testLexDispatchTable(self):
+        """ISO/IEC 14882:1998(E) 2.4 Preprocessing tokens [lex.pptoken] - PPTOKEN_DISPATCH_TABLE is the same as trying every slice function."""
+        myObj = PpTokeniser.PpTokeniser()
+        myFnS = (
+            myObj._sliceLexPpnumber,
+            myObj._sliceCharacterLiteral,
+            myObj._sliceStringLiteral,
+            myObj._sliceLexName,
+            myObj._sliceLexOperators,
+        )
+        mySuffixS = ('', '1', '.', 'x', "x'", 'x"', '=', '<', ':', '%:', 'u00e9', 'U0001F600')
+        for i in range(32, 127):
+            for aSuffix in mySuffixS:
+                myStr = chr(i) + aSuffix + ' '
+                myObj.resetTokType()
+                myExp = myObj._sliceLexPptokenGeneral(myStr, 0, myFnS) \
+                    or myObj._sliceNonWhitespaceSingleChar(myStr, 0)
+                myExpType = myObj.cppTokType
+                myObj.resetTokType()
+                self.assertEqual(myExp, myObj._sliceLexPptoken(myStr, 0), myStr)
+                self.assertEqual(myExpType, myObj.cppTokType, myStr)
+
     def testLexNonWhitespace(self):
         """ISO/IEC 14882:1998(E) 2.4 Preprocessing tokens [lex.pptoken] - single character."""
         myObj = PpTokeniser.PpTokeniser()
@@ -4217,6 +4266,227 @@ void ftrace_likely_update(struct ftrace_branch_data *f, int val, int expect);
             myLines,
         )
 
+class TestPpTokeniserPhases_1_2Mixed(TestPpTokeniserBase):
+    """Tests phases one and two on a line with trigraphs, UCNs and splices."""
+    def test_00(self):
+        """TestPpTokeniserPhases_1_2Mixed.test_00(): logical and physical positions."""
+        myStr = u"a??=b ??( \u00e9x ??! y\\\nzz??/\n\\\n\\\nq \U0001F600w ??) \u00e9\u00e9 ??< c\n"
+        myObj = PpTokeniser.PpTokeniser(theFileObj=io.StringIO(myStr))
+        myToks = list(myObj.next())
+        self.assertEqual(
+            [
+                (1, 1, 'a'), (1, 2, '#'), (1, 3, 'b'), (1, 4, ' '), (1, 5, '['),
+                (1, 6, ' '), (1, 7, '\\u00E9x'), (1, 14, ' '), (1, 15, '|'),
+                (1, 16, ' '), (1, 17, 'yzzq'), (1, 21, ' '), (1, 22, '\\U0001F600w'),
+                (1, 33, ' '), (1, 34, ']'), (1, 35, ' '), (1, 36, '\\u00E9\\u00E9'),
+                (1, 48, ' '), (1, 49, '{'), (1, 50, ' '), (1, 51, 'c'),
+                (1, 52, '\n\n\n\n\n'),
+            ],
+            [(t.lineNum, t.colNum, t.t) for t in myToks],
+        )
+        self.assertEqual(
+            [
+                (1, 1), (1, 2), (1, 5), (1, 6), (1, 7), (1, 10), (1, 11), (1, 13),
+                (1, 14), (1, 17), (1, 18), (5, 2), (5, 3), (5, 5), (5, 6), (5, 9),
+                (5, 10), (5, 12), (5, 13), (5, 16), (5, 17), (5, 18),
+            ],
+            [myObj.fileLocator.logicalToPhysical(t.lineNum, t.colNum) for t in myToks],
+        )
+
+class TestLexPhasesBulk(TestPpTokeniserBase):
+    """Tests the whole buffer searches used by phases one and two."""
+    def test_00(self):
+        """TestLexPhasesBulk.test_00(): _retLineIndexes() finds the lines of offsets."""
+        myLineS = ['ab\n', '\n', 'c??d??e\n', 'f']
+        self.assertEqual([], PpTokeniser._retLineIndexes(myLineS, []))
+        self.assertEqual(
+            [0, 2, 3],
+            PpTokeniser._retLineIndexes(myLineS, [0, 1, 4, 9, 12]),
+        )
+        self.assertEqual(
+            [2],
+            PpTokeniser._retLineIndexes(
+                myLineS,
+                PpTokeniser._genFind(''.join(myLineS), PpTokeniser.TRIGRAPH_START),
+            ),
+        )
+
+    def test_01(self):
+        """TestLexPhasesBulk.test_01(): plain text passes through unchanged."""
+        myStr = u'#define A 1\nint a = A;\n'
+        myObj = PpTokeniser.PpTokeniser(theFileObj=io.StringIO(myStr))
+        self.assertEqual(myStr, myObj.initLexPhase12())
+        self.assertEqual((2, 5), myObj.fileLocator.logicalToPhysical(2, 5))
+
+    def test_02(self):
+        """TestLexPhasesBulk.test_02(): a trigraph can create a line continuation."""
+        myStr = u'#define A ??/\n1\nint a = A;\n'
+        myObj = PpTokeniser.PpTokeniser(theFileObj=io.StringIO(myStr))
+        self.assertEqual(u'#define A 1\n\nint a = A;\n', myObj.initLexPhase12())
+        self.assertEqual((3, 1), myObj.fileLocator.logicalToPhysical(3, 1))
+
+class TestPpTokeniserStream(TestPpTokeniserBase):
+    """Tests genLexPptokenStream() gives the same tokens as the whole file."""
+    SOURCES = (
+        u'',
+        u'x',
+        u'  \n\n  \n',
+        u'#define A \\\n  1 \\\n  + 2\nint a = A;\n"str /* x" \'c\' 1.2e+3\n',
+        u'/* multi\n line\n comment */ x\n\n\n  y /* a */ /* b\n */ z // c /* d\n w\n',
+        u"a??=b ??( \u00e9x ??! y\\\nzz??/\n\\\n\\\nq \U0001F600w ??) \u00e9\u00e9 ??< c\n",
+    )
+    def _retTokens(self, theStr, theChunkSize):
+        myObj = PpTokeniser.PpTokeniser(
+            theFileObj=io.StringIO(theStr),
+            theChunkSize=theChunkSize,
+        )
+        return [(t.t, t.tt, t.lineNum, t.colNum) for t in myObj.next()]
+
+    def test_00(self):
+        """TestPpTokeniserStream.test_00(): same tokens for various chunk sizes."""
+        for aStr in self.SOURCES:
+            myExp = self._retTokens(aStr, 0)
+            for aSize in (1, 2, 7, 64):
+                self.assertEqual(myExp, self._retTokens(aStr, aSize), 'Size %d' % aSize)
+
+    def test_01(self):
+        """TestPpTokeniserStream.test_01(): tokens are generated before the file is read."""
+        myObj = PpTokeniser.PpTokeniser(
+            theFileObj=io.StringIO(u'a\n' + u'b c\n' * 1000),
+            theChunkSize=8,
+        )
+        myGen = myObj.genLexPptokenStream()
+        self.assertEqual('a', next(myGen).t)
+        self.assertTrue(myObj._file.tell() < 100)
+
+    def test_02(self):
+        """TestPpTokeniserStream.test_02(): an unclosed comment is reported at the end of the file."""
+        for aSize in (0, 1):
+            myObj = PpTokeniser.PpTokeniser(
+                theFileObj=io.StringIO(u'a /* b\nc\n'),
+                theChunkSize=aSize,
+            )
+            self.assertRaises(
+                CppDiagnostic.ExceptionCppDiagnosticPartialTokenStream,
+                list,
+                myObj.next(),
+            )
+
+    def test_03(self):
+        """TestPpTokeniserStream.test_03(): PpLexer with streamChunkSize."""
+        mySource = u'''#define F(x) \\
+    ((x) + 1)
+/* A comment
+ that is long */
+int a = F(2);
+'''
+        myResultS = []
+        for aSize in (0, 1, 16):
+            myLexer = PpLexer.PpLexer(
+                'mt.h',
+                IncludeHandler.CppIncludeStringIO([], [], mySource, {}),
+                streamChunkSize=aSize,
+            )
+            myResultS.append(
+                [(t.t, t.tt) for t in myLexer.ppTokens()]
+            )
+        self.assertEqual(myResultS[0], myResultS[1])
+        self.assertEqual(myResultS[0], myResultS[2])
+        self.assertTrue(('1', 'pp-number') in myResultS[0])
+
+    def test_04(self):
+        """TestPpTokeniserStream.test_04(): a comment over many chunks."""
+        for aStr in (
+                u'a /*' + u'x\n' * 100 + u'*/ b\n',
+                u'a /*' + u'x*\n' * 100 + u'\n/ b\n*/c\n',
+                u'a /*\n*\n/\n*/ b\n',
+                u'a /*/\n*/ b\n',
+                u'a /*\n*/',
+            ):
+            myExp = [
+                (t.t, t.tt, t.lineNum, t.colNum)
+                for t in PpTokeniser.PpTokeniser(theFileObj=io.StringIO(aStr)).next()
+            ]
+            for aSize in (1, 2, 7):
+                myObj = PpTokeniser.PpTokeniser(theFileObj=io.StringIO(aStr))
+                self.assertEqual(
+                    myExp,
+                    [
+                        (t.t, t.tt, t.lineNum, t.colNum)
+                        for t in myObj.genLexPptokenStream(aSize)
+                    ],
+                )
+
+class TestPpTokeniserParallel(TestPpTokeniserBase):
+    """Tests genLexPptokenParallel() gives the same tokens as the serial tokeniser."""
+    SOURCES = TestPpTokeniserStream.SOURCES + (
+        u'a /* x\n y */ b\n"s/*"\nc\n\' /* \nd */\ne\n',
+        u'"abc\n/*\n*/x\n// /*\ny\n',
+    )
+    def _retTokens(self, theStr, theJobs, theChunkSize):
+        myObj = PpTokeniser.PpTokeniser(theFileObj=io.StringIO(theStr))
+        if theJobs == 1:
+            myGen = myObj.next()
+        else:
+            myGen = myObj.genLexPptokenParallel(theJobs, theChunkSize)
+        return [(t.t, t.tt, t.lineNum, t.colNum) for t in myGen]
+
+    def test_00(self):
+        """TestPpTokeniserParallel.test_00(): _retChunkBoundaries()."""
+        self.assertEqual([], PpTokeniser._retChunkBoundaries('', 1))
+        self.assertEqual([2, 4], PpTokeniser._retChunkBoundaries('a\nb\nc\n', 1))
+        self.assertEqual([4], PpTokeniser._retChunkBoundaries('a\nb\nc\n', 3))
+        # Not followed by whitespace
+        self.assertEqual([3], PpTokeniser._retChunkBoundaries('a\n\nb\n', 1))
+        # Not in a C comment
+        self.assertEqual([10], PpTokeniser._retChunkBoundaries('/* a\nb */\nc\n', 1))
+        self.assertEqual([], PpTokeniser._retChunkBoundaries('/* a\nb\nc\n', 1))
+        # Comment start in a literal or C++ comment
+        self.assertEqual([5, 7], PpTokeniser._retChunkBoundaries('"/*"\nb\nc', 1))
+        self.assertEqual([5, 7], PpTokeniser._retChunkBoundaries('//*x\nb\nc', 1))
+
+    def test_01(self):
+        """TestPpTokeniserParallel.test_01(): _lexChunk() stops before trailing whitespace."""
+        myStop, myLenS, myTypeS = PpTokeniser._lexChunk(u'a /* b */ 12\n')
+        self.assertEqual(12, myStop)
+        self.assertEqual([1, 1, 7, 1, 2], list(myLenS))
+        self.assertEqual(
+            ['identifier', 'whitespace', 'C comment', 'whitespace', 'pp-number'],
+            [PpTokeniser.CHUNK_TOKEN_TYPES[t] for t in myTypeS],
+        )
+        myStop, myLenS, myTypeS = PpTokeniser._lexChunk(u'a /* b\n')
+        self.assertEqual(2, myStop)
+
+    def test_02(self):
+        """TestPpTokeniserParallel.test_02(): same tokens for various chunk sizes."""
+        for aStr in self.SOURCES:
+            myExp = self._retTokens(aStr, 1, 0)
+            for aSize in (1, 7, 64):
+                self.assertEqual(myExp, self._retTokens(aStr, 2, aSize), 'Size %d' % aSize)
+
+    def test_03(self):
+        """TestPpTokeniserParallel.test_03(): next() with theJobs."""
+        myStr = u'int a; /* x\n */\n' * 100
+        myObj = PpTokeniser.PpTokeniser(
+            theFileObj=io.StringIO(myStr),
+            theJobs=2,
+        )
+        self.assertEqual(
+            self._retTokens(myStr, 1, 0),
+            [(t.t, t.tt, t.lineNum, t.colNum) for t in myObj.next()],
+        )
+
+    def test_04(self):
+        """TestPpTokeniserParallel.test_04(): an unclosed comment is reported."""
+        myObj = PpTokeniser.PpTokeniser(
+            theFileObj=io.StringIO(u'a\nb\nc /* b\nc\n'),
+        )
+        self.assertRaises(
+            CppDiagnostic.ExceptionCppDiagnosticPartialTokenStream,
+            list,
+            myObj.genLexPptokenParallel(2, 1),
+        )
+
 class TestSpecial(TestPpTokeniserBase):
     def test_00(self):
         """Special.test_00(): """
@@ -4372,6 +4642,10 @@ def unitTest(theVerbosity=2):
     suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestPpTokeniserPartialTokenStream))
     suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestPpTokeniserLinux))
     suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestLexPhases_2_Linux))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestPpTokeniserPhases_1_2Mixed))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestLexPhasesBulk))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestPpTokeniserStream))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestPpTokeniserParallel))
     suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestSpecial))
     myResult = unittest.TextTestRunner(verbosity=theVerbosity).run(suite)
     return (myResult.testsRun, len(myResult.errors), len(myResult.failures))
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# CPIP is a C/C++ Preprocessor implemented in Python.
+# Copyright (C) 2008-2017 Paul Ross
+# 
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+# 
+# Paul Ross: apaulross@gmail.com
+
+"""Tests SourceBuffer."""
+
+__author__  = 'Paul Ross'
+__date__    = '2023-06-20'
+__rights__  = 'Copyright (c) 2008-2017 Paul Ross'
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from cpip import CPIPMain
+from cpip.core import IncludeHandler
+from cpip.core import PpLexer
+from cpip.core import PpTokeniser
+from cpip.core import SourceBuffer
+
+#######################################
+# Section: Unit tests
+########################################
+class TestSourceBufferBase(unittest.TestCase):
+    """Writes temporary files."""
+    def setUp(self):
+        self._tmpDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._tmpDir)
+
+    def _writeFile(self, theName, theBytes):
+        retVal = os.path.join(self._tmpDir, theName)
+        with open(retVal, 'wb') as f:
+            f.write(theBytes)
+        return retVal
+
+class TestSourceBuffer(TestSourceBufferBase):
+    """Tests SourceBuffer and openSource()."""
+    def test_00(self):
+        """TestSourceBuffer.test_00(): read(), readline() and readlines() are as io.StringIO."""
+        for aText in ('', '\n', 'a', 'ab\n\ncd', 'ab\n\ncd\n'):
+            myBuf = SourceBuffer.SourceBuffer(aText)
+            self.assertEqual(io.StringIO(aText).readlines(), myBuf.readlines())
+            myBuf.seek(0)
+            self.assertEqual(list(io.StringIO(aText)), list(myBuf))
+            myBuf.seek(1)
+            self.assertEqual(aText[1:], myBuf.read())
+            self.assertEqual(len(aText), myBuf.tell())
+            self.assertEqual('', myBuf.read())
+        self.assertFalse(hasattr(SourceBuffer.SourceBuffer(''), 'name'))
+
+    def test_01(self):
+        """TestSourceBuffer.test_01(): read() of everything does not copy."""
+        myText = 'int i;\n' * 8
+        myBuf = SourceBuffer.SourceBuffer(myText, 'spam.h')
+        self.assertIs(myText, myBuf.read())
+        myBuf.seek(0)
+        self.assertIs(myText, myBuf.read())
+        self.assertEqual('spam.h', myBuf.name)
+
+    def test_02(self):
+        """TestSourceBuffer.test_02(): openSource() is the same as reading in text mode."""
+        for aBytes in (b'', b'a\nb\n', b'a\r\nb\rc\n', b'x' * 10000):
+            myPath = self._writeFile('spam.h', aBytes)
+            with open(myPath) as f:
+                myExp = f.read()
+            myBuf = SourceBuffer.openSource(myPath)
+            self.assertEqual(myExp, myBuf.read())
+            self.assertEqual(myPath, myBuf.name)
+
+    def test_03(self):
+        """TestSourceBuffer.test_03(): encoding policy."""
+        myPath = self._writeFile('spam.h', u'char *s = "café";\n'.encode('latin-1'))
+        myPolicy = SourceBuffer.EncodingPolicy(('utf-8',), 'strict')
+        self.assertRaises(
+            SourceBuffer.ExceptionSourceBuffer,
+            SourceBuffer.openSource,
+            myPath,
+            myPolicy,
+        )
+        # Fall back
+        myPolicy = SourceBuffer.retEncodingPolicy(['utf-8', 'latin-1'])
+        self.assertEqual(
+            u'char *s = "café";\n',
+            SourceBuffer.openSource(myPath, myPolicy).read(),
+        )
+        # Error handler of the last encoding
+        myPolicy = SourceBuffer.retEncodingPolicy(['ascii'], 'replace')
+        self.assertEqual(
+            u'char *s = "caf�";\n',
+            SourceBuffer.openSource(myPath, myPolicy).read(),
+        )
+        self.assertRaises(
+            SourceBuffer.ExceptionSourceBuffer,
+            SourceBuffer.decode,
+            b'',
+            SourceBuffer.EncodingPolicy((), 'strict'),
+        )
+        self.assertEqual(SourceBuffer.DEFAULT_ENCODING_POLICY, SourceBuffer.retEncodingPolicy())
+
+class TestSourceStream(TestSourceBufferBase):
+    """Tests SourceStream and openSourceStream()."""
+    def setUp(self):
+        super(TestSourceStream, self).setUp()
+        # Small blocks so that characters and line endings span them
+        self._readSize = SourceBuffer.STREAM_READ_SIZE
+        SourceBuffer.STREAM_READ_SIZE = 3
+
+    def tearDown(self):
+        SourceBuffer.STREAM_READ_SIZE = self._readSize
+        super(TestSourceStream, self).tearDown()
+
+    def test_00(self):
+        """TestSourceStream.test_00(): lines are the same as openSource()."""
+        for aText in (u'', u'a', u'ab\r\n\ncd', u'a\rb\r\nc\n', u'é€\U0001F600\r\né\n' * 3):
+            for anEnc in ('utf-8', 'utf-16'):
+                myPath = self._writeFile('spam.h', aText.encode(anEnc))
+                myPolicy = SourceBuffer.EncodingPolicy((anEnc,), 'strict')
+                myExp = SourceBuffer.openSource(myPath, myPolicy)
+                myStream = SourceBuffer.openSourceStream(myPath, myPolicy)
+                self.assertEqual(myExp.readlines(), list(myStream))
+                self.assertEqual(u'', myStream.readline())
+                self.assertEqual(0, myStream.seek(0))
+                self.assertEqual(myExp.text, myStream.read())
+                myStream.seek(0)
+                self.assertEqual(myExp.text[:4], myStream.read(4))
+                self.assertEqual(myPath, myStream.name)
+                myStream.close()
+        self.assertRaises(ValueError, myStream.seek, 1)
+
+    def test_01(self):
+        """TestSourceStream.test_01(): encoding policy."""
+        myPath = self._writeFile('spam.h', u'x\n"café"\n'.encode('latin-1'))
+        myStream = SourceBuffer.openSourceStream(
+            myPath, SourceBuffer.retEncodingPolicy(['utf-8', 'latin-1']),
+        )
+        self.assertEqual(('latin-1', 'strict'), (myStream.encoding, myStream.errors))
+        self.assertEqual([u'x\n', u'"café"\n'], myStream.readlines())
+        # The last encoding fails when the content is read
+        myStream = SourceBuffer.openSourceStream(
+            myPath, SourceBuffer.retEncodingPolicy(['utf-8']),
+        )
+        self.assertEqual(u'x\n', myStream.readline())
+        self.assertRaises(SourceBuffer.ExceptionSourceBuffer, myStream.readlines)
+        self.assertRaises(
+            SourceBuffer.ExceptionSourceBuffer,
+            SourceBuffer.openSourceStream,
+            myPath,
+            SourceBuffer.retEncodingPolicy(['utf-8', 'spam']),
+        )
+        self.assertRaises(OSError, SourceBuffer.openSourceStream, myPath + 'x')
+
+    def test_02(self):
+        """TestSourceStream.test_02(): PpLexer with streamChunkSize reads files as streams."""
+        myPath = self._writeFile('spam.h', u'#define A "é"\n/* x\n */A\n'.encode('latin-1'))
+        myIncH = IncludeHandler.CppIncludeStdOs(
+            [], [],
+            theEncodingPolicy=SourceBuffer.retEncodingPolicy(['utf-8', 'latin-1']),
+        )
+        myExp = ''.join(t.t for t in PpLexer.PpLexer(myPath, myIncH).ppTokens())
+        self.assertFalse(myIncH.streamSources)
+        myLexer = PpLexer.PpLexer(myPath, myIncH, streamChunkSize=4)
+        self.assertTrue(myIncH.streamSources)
+        self.assertEqual(myExp, ''.join(t.t for t in myLexer.ppTokens()))
+        with myIncH.initialTu(myPath).fileObj as myStream:
+            self.assertIsInstance(myStream, SourceBuffer.SourceStream)
+
+class TestSourceBufferTokeniser(TestSourceBufferBase):
+    """Tests SourceBuffer with the tokeniser and the lexer."""
+    def test_00(self):
+        """TestSourceBufferTokeniser.test_00(): PpTokeniser gives the same tokens as io.StringIO."""
+        for aText in (
+                u'#define A 1\nint a = A;\n',
+                u'#define A ??/\n1\nint a = A;\n',
+                u'char *s = "café";\n',
+            ):
+            myExp = [
+                (t.t, t.tt, t.lineNum, t.colNum)
+                for t in PpTokeniser.PpTokeniser(theFileObj=io.StringIO(aText)).next()
+            ]
+            myAct = [
+                (t.t, t.tt, t.lineNum, t.colNum)
+                for t in PpTokeniser.PpTokeniser(
+                    theFileObj=SourceBuffer.SourceBuffer(aText)
+                ).next()
+            ]
+            self.assertEqual(myExp, myAct)
+
+    def test_01(self):
+        """TestSourceBufferTokeniser.test_01(): CppIncludeStdOs decodes with its encoding policy."""
+        myPath = self._writeFile('spam.h', u'"café"\n'.encode('latin-1'))
+        myIncH = IncludeHandler.CppIncludeStdOs(
+            [], [],
+            theEncodingPolicy=SourceBuffer.EncodingPolicy(('latin-1',), 'strict'),
+        )
+        myLexer = PpLexer.PpLexer(myPath, myIncH)
+        self.assertEqual(
+            u'"caf\\u00E9"\n',
+            ''.join(t.t for t in myLexer.ppTokens()),
+        )
+        myIncH = IncludeHandler.CppIncludeStdOs(
+            [], [],
+            theEncodingPolicy=SourceBuffer.EncodingPolicy(('utf-8',), 'strict'),
+        )
+        self.assertRaises(
+            SourceBuffer.ExceptionSourceBuffer,
+            myIncH.initialTu,
+            myPath,
+        )
+
+class TestSourceBufferReaders(TestSourceBufferBase):
+    """Tests that re-reading source files uses the encoding policy."""
+    def setUp(self):
+        super(TestSourceBufferReaders, self).setUp()
+        self._policy = SourceBuffer.retEncodingPolicy(['utf-8', 'latin-1'])
+        self._path = self._writeFile('spam.h', u'"café"\n"ça"\n'.encode('latin-1'))
+
+    def test_00(self):
+        """TestSourceBufferReaders.test_00(): CPIPMain.retFileCountMap()."""
+        myIncH = IncludeHandler.CppIncludeStdOs([], [], theEncodingPolicy=self._policy)
+        myLexer = PpLexer.PpLexer(self._path, myIncH)
+        for t in myLexer.ppTokens():
+            pass
+        self.assertEqual(
+            {self._path : (1, 2, 12)},
+            CPIPMain.retFileCountMap(myLexer, self._policy),
+        )
+
+class Special(unittest.TestCase):
+    pass
+
+def unitTest(theVerbosity=2):
+    """Execute unit tests."""
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestSourceBuffer)
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestSourceStream))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestSourceBufferTokeniser))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestSourceBufferReaders))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(Special))
+    myResult = unittest.TextTestRunner(verbosity=theVerbosity).run(suite)
+    return (myResult.testsRun, len(myResult.errors), len(myResult.failures))
+
+#################
+# End: Unit tests
+#################
+
+if __name__ == "__main__":
+    unitTest()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# CPIP is a C/C++ Preprocessor implemented in Python.
+# Copyright (C) 2008-2017 Paul Ross
+# 
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+# 
+# Paul Ross: apaulross@gmail.com
+
+"""Tests TokenBuffer."""
+
+__author__  = 'Paul Ross'
+__date__    = '2023-06-12'
+__rights__  = 'Copyright (c) 2008-2017 Paul Ross'
+
+import io
+import mmap
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from cpip.core import PpLexer
+from cpip.core import PpToken
+from cpip.core import PpTokeniser
+from cpip.core import IncludeHandler
+from cpip.core import TokenBuffer
+
+#######################################
+# Section: Unit tests
+########################################
+class TestTokenBuffer(unittest.TestCase):
+    """Tests TokenBuffer."""
+    SOURCE = u"""#define SPAM 1 /* C */
+int é = SPAM;
+"""
+    def _retPpTokens(self):
+        myTokeniser = PpTokeniser.PpTokeniser(io.StringIO(self.SOURCE))
+        return list(myTokeniser.next())
+
+    def test_00(self):
+        """TestTokenBuffer.test_00(): Empty buffer."""
+        myBuf = TokenBuffer.TokenBuffer()
+        self.assertEqual(0, len(myBuf))
+        self.assertEqual('', myBuf.text)
+        self.assertEqual([], list(myBuf))
+        self.assertRaises(IndexError, myBuf.__getitem__, 0)
+
+    def test_01(self):
+        """TestTokenBuffer.test_01(): From PpTokens, views have the same properties."""
+        myTokS = self._retPpTokens()
+        myTokS[3].prevWs = True
+        myTokS[3].setIsCond()
+        myBuf = TokenBuffer.TokenBuffer.fromPpTokens(myTokS)
+        self.assertEqual(len(myTokS), len(myBuf))
+        self.assertEqual(PpToken.tokensStr(myTokS), myBuf.text)
+        for aTok, aView in zip(myTokS, myBuf):
+            self.assertEqual(
+                (aTok.t, aTok.tt, aTok.lineNum, aTok.colNum, aTok.canReplace,
+                 aTok.prevWs, aTok.isCond, aTok.isReplacement),
+                (aView.t, aView.tt, aView.lineNum, aView.colNum, aView.canReplace,
+                 aView.prevWs, aView.isCond, aView.isReplacement),
+            )
+        self.assertEqual('SPAM', myBuf[-3].t)
+
+    def test_02(self):
+        """TestTokenBuffer.test_02(): Round trip to PpTokens."""
+        myTokS = self._retPpTokens()
+        myTokS[0].prevWs = True
+        myBuf = TokenBuffer.TokenBuffer.fromPpTokens(myTokS)
+        for aTok, aNewTok in zip(myTokS, myBuf.genPpTokens()):
+            self.assertEqual(aTok, aNewTok)
+            self.assertEqual(aTok.flags, aNewTok.flags)
+            self.assertEqual((aTok.lineNum, aTok.colNum), (aNewTok.lineNum, aNewTok.colNum))
+
+    def test_03(self):
+        """TestTokenBuffer.test_03(): Extra token types are added to the type table."""
+        myBuf = TokenBuffer.TokenBuffer.fromTokToktypes(
+            [('int', 'keyword'), (' ', 'whitespace'), ('x', 'identifier'), ('char', 'keyword')]
+        )
+        self.assertEqual(PpToken.LEX_PPTOKEN_TYPES + ['keyword'], myBuf.typeNames)
+        self.assertEqual(
+            [('int', 'keyword'), (' ', 'whitespace'), ('x', 'identifier'), ('char', 'keyword')],
+            list(myBuf.genTokToktype())
+        )
+        self.assertRaises(PpToken.ExceptionCpipTokenUnknownType, myBuf.ppToken, 0)
+        # No line and column numbers so these are omitted from the serialised form
+        myNewBuf = TokenBuffer.TokenBuffer.fromBytes(myBuf.toBytes())
+        self.assertEqual(list(myBuf.genTokToktype()), list(myNewBuf.genTokToktype()))
+        self.assertEqual([(0, 0)] * 4, [(v.lineNum, v.colNum) for v in myNewBuf])
+        self.assertRaises(TokenBuffer.ExceptionTokenBuffer, myBuf.append, 'x', 99)
+
+    def test_04(self):
+        """TestTokenBuffer.test_04(): Serialised form and pickle round trip."""
+        myBuf = TokenBuffer.TokenBuffer.fromPpTokens(self._retPpTokens())
+        myBuf.append('if', 'keyword', 3, 1)
+        for myNewBuf in (
+                TokenBuffer.TokenBuffer.fromBytes(myBuf.toBytes()),
+                pickle.loads(pickle.dumps(myBuf, pickle.HIGHEST_PROTOCOL)),
+            ):
+            self.assertEqual(myBuf.text, myNewBuf.text)
+            self.assertEqual(myBuf.typeNames, myNewBuf.typeNames)
+            self.assertEqual([str(v) for v in myBuf], [str(v) for v in myNewBuf])
+        # Can still append
+        myNewBuf.append(';', 'preprocessing-op-or-punc')
+        self.assertEqual(myBuf.text + ';', myNewBuf.text)
+
+    def test_05(self):
+        """TestTokenBuffer.test_05(): Read from a memory mapped file."""
+        myBuf = TokenBuffer.TokenBuffer.fromPpTokens(self._retPpTokens())
+        myTmpDir = tempfile.mkdtemp()
+        try:
+            myPath = os.path.join(myTmpDir, 'toks.bin')
+            with open(myPath, 'wb') as f:
+                f.write(myBuf.toBytes())
+            with open(myPath, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as myMap:
+                    myNewBuf = TokenBuffer.TokenBuffer.fromBytes(myMap)
+                    self.assertEqual(list(myBuf.genTokToktype()), list(myNewBuf.genTokToktype()))
+                    self.assertEqual(
+                        [(v.lineNum, v.colNum, v.flags) for v in myBuf],
+                        [(v.lineNum, v.colNum, v.flags) for v in myNewBuf],
+                    )
+                    # Views of the map are released with the buffer
+                    del myNewBuf
+        finally:
+            shutil.rmtree(myTmpDir)
+
+    def test_06(self):
+        """TestTokenBuffer.test_06(): Bad serialised forms raise."""
+        myBytes = TokenBuffer.TokenBuffer.fromPpTokens(self._retPpTokens()).toBytes()
+        self.assertRaises(TokenBuffer.ExceptionTokenBuffer, TokenBuffer.TokenBuffer.fromBytes, b'')
+        self.assertRaises(TokenBuffer.ExceptionTokenBuffer, TokenBuffer.TokenBuffer.fromBytes,
+                          b'XXXX' + myBytes[4:])
+        self.assertRaises(TokenBuffer.ExceptionTokenBuffer, TokenBuffer.TokenBuffer.fromBytes,
+                          myBytes[:-1])
+
+    def test_07(self):
+        """TestTokenBuffer.test_07(): Columns are views of the serialised form until appended to."""
+        myBytes = bytearray(TokenBuffer.TokenBuffer.fromPpTokens(self._retPpTokens()).toBytes())
+        myBuf = TokenBuffer.TokenBuffer.fromBytes(myBytes)
+        self.assertRaises(BufferError, myBytes.extend, b'x')
+        myLen = len(myBuf)
+        myBuf.append(';', 'preprocessing-op-or-punc', 3, 1)
+        self.assertEqual(myLen + 1, len(myBuf))
+        self.assertEqual((';', 3), (myBuf[-1].t, myBuf[-1].lineNum))
+        # No longer a view
+        myBytes.extend(b'x')
+
+class TestTokenBufferProducers(unittest.TestCase):
+    """Tests the APIs that produce a TokenBuffer."""
+    def test_00(self):
+        """TestTokenBufferProducers.test_00(): PpTokeniser.tokenBuffer()."""
+        mySource = u'#define X 1\nX + 2\n'
+        myBuf = PpTokeniser.PpTokeniser(io.StringIO(mySource)).tokenBuffer()
+        myTokS = list(PpTokeniser.PpTokeniser(io.StringIO(mySource)).next())
+        self.assertEqual(myTokS, list(myBuf.genPpTokens()))
+        self.assertEqual(
+            [(t.lineNum, t.colNum, t.flags) for t in myTokS],
+            [(v.lineNum, v.colNum, v.flags) for v in myBuf],
+        )
+        self.assertEqual(mySource, myBuf.text)
+
+class Special(unittest.TestCase):
+    pass
+
+def unitTest(theVerbosity=2):
+    """Execute unit tests."""
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestTokenBuffer)
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestTokenBufferProducers))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(Special))
+    myResult = unittest.TextTestRunner(verbosity=theVerbosity).run(suite)
+    return (myResult.testsRun, len(myResult.errors), len(myResult.failures))
+
+#################
+# End: Unit tests
+#################
+
+if __name__ == "__main__":
+    unitTest()
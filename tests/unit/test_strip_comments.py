@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# CPIP is a C/C++ Preprocessor implemented in Python.
+# Copyright (C) 2008-2017 Paul Ross
+# 
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+# 
+# Paul Ross: apaulross@gmail.com
+
+"""Tests for strip_comments.
+"""
+
+__author__  = 'Paul Ross'
+__date__    = '2023-06-12'
+__rights__  = 'Copyright (c) 2008-2017 Paul Ross'
+
+import io
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+
+from cpip import strip_comments
+
+#######################################
+# Section: Unit tests
+########################################
+class TestStripCommentsFile(unittest.TestCase):
+    """Tests stripping comments from a file."""
+    SOURCE = u"""int a; /* C */
+// C++
+#define X 1 /* (??) */
+"""
+    def test_01(self):
+        """TestStripCommentsFile.test_01(): Comments removed."""
+        self.assertEqual(
+            b'int a; \n\n#define X 1 \n',
+            strip_comments.translate_phases_123_file(io.StringIO(self.SOURCE), ''),
+        )
+
+    def test_02(self):
+        """TestStripCommentsFile.test_02(): Comments replaced by a placeholder."""
+        self.assertEqual(
+            b'int a; /* */\n/* */\n#define X 1 /* */\n',
+            strip_comments.translate_phases_123_file(io.StringIO(self.SOURCE), '/* */'),
+        )
+
+    def test_03(self):
+        """TestStripCommentsFile.test_03(): Streamed to a binary stream."""
+        myOutput = io.BytesIO()
+        strip_comments.translate_phases_123_file_to_stream(io.StringIO(self.SOURCE), '', myOutput)
+        self.assertEqual(
+            strip_comments.translate_phases_123_file(io.StringIO(self.SOURCE), ''),
+            myOutput.getvalue(),
+        )
+
+class TestStripCommentsDir(unittest.TestCase):
+    """Tests stripping comments from a directory."""
+    def setUp(self):
+        self._tmpDir = tempfile.mkdtemp()
+        self._inDir = os.path.join(self._tmpDir, 'in')
+        os.makedirs(os.path.join(self._inDir, 'sub'))
+        for i in range(5):
+            with open(os.path.join(self._inDir, 'f%d.h' % i), 'w') as f:
+                f.write(u'int f%d; /* %d */\n' % (i, i))
+        with open(os.path.join(self._inDir, 'sub', 'g.h'), 'w') as f:
+            f.write(u'int g; // g\n')
+
+    def tearDown(self):
+        shutil.rmtree(self._tmpDir)
+
+    def _retOutput(self, theOutDir):
+        myResult = {}
+        for root, dirs, files in os.walk(theOutDir):
+            for aName in files:
+                myPath = os.path.join(root, aName)
+                with open(myPath, 'rb') as f:
+                    myResult[os.path.relpath(myPath, theOutDir)] = f.read()
+        return myResult
+
+    def test_01(self):
+        """TestStripCommentsDir.test_01(): Sequential, with prefix."""
+        myOutDir = os.path.join(self._tmpDir, 'out')
+        self.assertEqual(6, strip_comments.process_dir_to_output(
+            self._inDir, myOutDir, [], True, False, b'// P\n', ''))
+        myResult = self._retOutput(myOutDir)
+        self.assertEqual(b'// P\nint f0; \n', myResult['f0.h'])
+        self.assertEqual(b'// P\nint g; \n', myResult[os.path.join('sub', 'g.h')])
+
+    def test_02(self):
+        """TestStripCommentsDir.test_02(): Process pool gives the same result."""
+        myOutDir = os.path.join(self._tmpDir, 'out')
+        strip_comments.process_dir_to_output(self._inDir, myOutDir, [], True, False, b'', '')
+        myOutDirJobs = os.path.join(self._tmpDir, 'out_jobs')
+        self.assertEqual(6, strip_comments.process_dir_to_output(
+            self._inDir, myOutDirJobs, [], True, False, b'', '', jobs=2))
+        self.assertEqual(self._retOutput(myOutDir), self._retOutput(myOutDirJobs))
+
+    @unittest.skipIf(sys.platform.startswith('win'), 'Needs an executable script.')
+    def test_03(self):
+        """TestStripCommentsDir.test_03(): clang-format is run in place on batches of files."""
+        # A fake clang-format that records its arguments
+        myBinDir = os.path.join(self._tmpDir, 'bin')
+        os.makedirs(myBinDir)
+        myLogPath = os.path.join(self._tmpDir, 'clang-format.log')
+        myExe = os.path.join(myBinDir, 'clang-format')
+        with open(myExe, 'w') as f:
+            f.write(
+                '#!/bin/sh\n'
+                'if [ "$1" = "--version" ]; then echo "clang-format version 14.0.0"; exit 0; fi\n'
+                'echo "$#" >> %s\n' % myLogPath
+            )
+        os.chmod(myExe, os.stat(myExe).st_mode | stat.S_IEXEC)
+        myPath = os.environ['PATH']
+        os.environ['PATH'] = myBinDir + os.pathsep + myPath
+        try:
+            myOutDir = os.path.join(self._tmpDir, 'out')
+            myPaths = [os.path.join(myOutDir, 'f%d.h' % i) for i in range(5)]
+            strip_comments.run_clang_format_batches(myPaths, 2, batch_size=2)
+        finally:
+            os.environ['PATH'] = myPath
+        with open(myLogPath) as f:
+            # '-i', '--style=...' and up to 2 files per call
+            self.assertEqual(['3', '4', '4'], sorted(f.read().split()))
+
+    @unittest.skipIf(sys.platform.startswith('win'), 'Needs an executable script.')
+    def test_04(self):
+        """TestStripCommentsDir.test_04(): clang-format in place uses the style file of the working directory."""
+        # A fake clang-format that records its second argument
+        myBinDir = os.path.join(self._tmpDir, 'bin')
+        os.makedirs(myBinDir)
+        myLogPath = os.path.join(self._tmpDir, 'clang-format.log')
+        myExe = os.path.join(myBinDir, 'clang-format')
+        with open(myExe, 'w') as f:
+            f.write(
+                '#!/bin/sh\n'
+                'if [ "$1" = "--version" ]; then echo "clang-format version 14.0.0"; exit 0; fi\n'
+                'echo "$2" >> %s\n' % myLogPath
+            )
+        os.chmod(myExe, os.stat(myExe).st_mode | stat.S_IEXEC)
+        myOutDir = os.path.join(self._tmpDir, 'out')
+        os.makedirs(myOutDir)
+        # Not this one
+        with open(os.path.join(myOutDir, '.clang-format'), 'w') as f:
+            f.write(u'BasedOnStyle: Google\n')
+        myStylePath = os.path.join(self._inDir, '.clang-format')
+        with open(myStylePath, 'w') as f:
+            f.write(u'BasedOnStyle: LLVM\n')
+        self.assertEqual(myStylePath, strip_comments.find_clang_format_style(os.path.join(self._inDir, 'sub')))
+        myPath = os.environ['PATH']
+        myCwd = os.getcwd()
+        os.environ['PATH'] = myBinDir + os.pathsep + myPath
+        try:
+            os.chdir(os.path.join(self._inDir, 'sub'))
+            myPaths = [os.path.join(myOutDir, 'f%d.h' % i) for i in range(2)]
+            strip_comments.run_clang_format_batches(myPaths, 1)
+            strip_comments.run_clang_format_batches(myPaths, 1, **{'--style': 'Mozilla'})
+        finally:
+            os.chdir(myCwd)
+            os.environ['PATH'] = myPath
+        with open(myLogPath) as f:
+            self.assertEqual(['--style=file:%s' % os.path.realpath(myStylePath), '--style=Mozilla'],
+                             f.read().split())
+
+    @unittest.skipIf(sys.platform.startswith('win'), 'Needs an executable script.')
+    def test_05(self):
+        """TestStripCommentsDir.test_05(): clang-format before 14 formats each file through stdin."""
+        # A fake clang-format that records its arguments and marks its output
+        myBinDir = os.path.join(self._tmpDir, 'bin')
+        os.makedirs(myBinDir)
+        myLogPath = os.path.join(self._tmpDir, 'clang-format.log')
+        myExe = os.path.join(myBinDir, 'clang-format')
+        with open(myExe, 'w') as f:
+            f.write(
+                '#!/bin/sh\n'
+                'if [ "$1" = "--version" ]; then echo "Ubuntu clang-format version 10.0.0-4ubuntu1"; exit 0; fi\n'
+                'echo "[$@]" >> %s\n'
+                'echo "// formatted"\n'
+                'cat\n' % myLogPath
+            )
+        os.chmod(myExe, os.stat(myExe).st_mode | stat.S_IEXEC)
+        with open(os.path.join(self._inDir, '.clang-format'), 'w') as f:
+            f.write(u'BasedOnStyle: LLVM\n')
+        myOutDir = os.path.join(self._tmpDir, 'out')
+        strip_comments.process_dir_to_output(self._inDir, myOutDir, ['*.h'], False, False, b'', '')
+        myPaths = [os.path.join(myOutDir, 'f%d.h' % i) for i in range(5)]
+        myPath = os.environ['PATH']
+        myCwd = os.getcwd()
+        os.environ['PATH'] = myBinDir + os.pathsep + myPath
+        try:
+            os.chdir(self._inDir)
+            self.assertEqual(10, strip_comments.clang_format_version())
+            strip_comments.run_clang_format_batches(myPaths, 2)
+        finally:
+            os.chdir(myCwd)
+            os.environ['PATH'] = myPath
+        with open(myLogPath) as f:
+            # No arguments, the style is found from the working directory
+            self.assertEqual(['[]'] * 5, f.read().split())
+        myResult = self._retOutput(myOutDir)
+        self.assertEqual(b'// formatted\nint f0; \n', myResult['f0.h'])
+
+class Special(unittest.TestCase):
+    pass
+
+def unitTest(theVerbosity=2):
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestStripCommentsFile)
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestStripCommentsDir))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(Special))
+    myResult = unittest.TextTestRunner(verbosity=theVerbosity).run(suite)
+    return (myResult.testsRun, len(myResult.errors), len(myResult.failures))
+
+#################
+# End: Unit tests
+#################
+
+if __name__ == "__main__":
+    unitTest()
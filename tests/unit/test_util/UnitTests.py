@@ -73,6 +73,7 @@ def unitTest(theVerbosity=0):
             'test_ListGen',
             'test_MatrixRep',
             'test_MaxMunchGen',            
+            'test_OverlayMap',
             'test_StrTree',            
             'test_XmlWrite',            
             'test_MultiPassString',            
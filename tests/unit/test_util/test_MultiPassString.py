@@ -414,6 +414,72 @@ the rest
         )
 
 
+class TestMultiPassStringWholePass(TestBase):
+    """Test the whole pass API of MultiPassString."""
+    def test_01(self):
+        """TestMultiPassStringWholePass.test_01(): currentText() of an unchanged string."""
+        myMps = MultiPassString.MultiPassString(io.StringIO(u'ab\n'))
+        myText, myIdxS = myMps.currentText()
+        self.assertEqual(u'ab\n', myText)
+        self.assertEqual([0, 1, 2, 3], list(myIdxS))
+        self.assertEqual(3, myMps.idxChar)
+        self.assertEqual('\n', myMps.prevChar)
+
+    def test_02(self):
+        """TestMultiPassStringWholePass.test_02(): removeWord() and replaceWord() change currentText()."""
+        myMps = MultiPassString.MultiPassString(io.StringIO(u'a\\\nb/* c */d'))
+        myMps.removeWord(1, 2)
+        myMps.replaceWord(4, 7, 'C comment', ' ')
+        myText, myIdxS = myMps.currentText()
+        self.assertEqual(u'ab d', myText)
+        self.assertEqual([0, 3, 4, 11, 12], list(myIdxS))
+        self.assertEqual({4 : MultiPassString.Word(7, 'C comment')},
+                         myMps.idxTypeMap)
+
+    def test_03(self):
+        """TestMultiPassStringWholePass.test_03(): setWord() at the same index, last one wins."""
+        myMps = MultiPassString.MultiPassString(io.StringIO(u'ab cd'))
+        myMps.setWord(0, 1, 'first')
+        myMps.setWord(0, 2, 'identifier')
+        myMps.setWord(2, 1, 'whitespace')
+        myMps.setWord(3, 2, 'identifier')
+        self.assertEqual(
+            [('ab', 'identifier'), (' ', 'whitespace'), ('cd', 'identifier')],
+            list(myMps.genWords())
+        )
+
+    def test_04(self):
+        """TestMultiPassStringWholePass.test_04(): Replacement longer than one character."""
+        myMps = MultiPassString.MultiPassString(io.StringIO(u'a?b'))
+        myMps.replaceWord(1, 1, 'other', u'XY')
+        myText, myIdxS = myMps.currentText()
+        self.assertEqual(u'aXYb', myText)
+        self.assertEqual([0, 1, 1, 2, 3], list(myIdxS))
+
+    def test_05(self):
+        """TestMultiPassStringWholePass.test_05(): Illegal lengths raise."""
+        myMps = MultiPassString.MultiPassString(io.StringIO(u'ab'))
+        self.assertRaises(MultiPassString.ExceptionMultiPass, myMps.setWord, 0, 0, 'x')
+        self.assertRaises(MultiPassString.ExceptionMultiPass, myMps.removeWord, 0, 0)
+
+    def test_06(self):
+        """TestMultiPassStringWholePass.test_06(): genWords() skips a word nested inside another, e.g. a trigraph in a comment."""
+        myMps = MultiPassString.MultiPassString(io.StringIO(u'/*??)*/x'))
+        myMps.setWord(2, 3, 'trigraph')
+        myMps.setWord(0, 7, 'C comment')
+        myMps.setWord(7, 1, 'identifier')
+        self.assertEqual(
+            [('/*??)*/', 'C comment'), ('x', 'identifier')],
+            list(myMps.genWords())
+        )
+
+    def test_07(self):
+        """TestMultiPassStringWholePass.test_07(): genWords() raises on partially overlapping words."""
+        myMps = MultiPassString.MultiPassString(io.StringIO(u'abcd'))
+        myMps.setWord(0, 3, 'identifier')
+        myMps.setWord(2, 2, 'identifier')
+        self.assertRaises(MultiPassString.ExceptionMultiPass, list, myMps.genWords())
+
 class NullClass(unittest.TestCase):
     pass
 
@@ -421,6 +487,7 @@ def unitTest(theVerbosity=2):
     """Execute unit tests."""
     suite = unittest.TestLoader().loadTestsFromTestCase(NullClass)
     suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestMultiPassStringMarker))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestMultiPassStringWholePass))
     myResult = unittest.TextTestRunner(verbosity=theVerbosity).run(suite)
     return (myResult.testsRun, len(myResult.errors), len(myResult.failures))
 
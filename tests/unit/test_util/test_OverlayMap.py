@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# CPIP is a C/C++ Preprocessor implemented in Python.
+# Copyright (C) 2008-2017 Paul Ross
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Paul Ross: apaulross@gmail.com
+
+"""Tests OverlayMap."""
+
+__author__  = 'Paul Ross'
+__date__    = '2023-07-25'
+__rights__  = 'Copyright (c) 2008-2017 Paul Ross'
+
+import pickle
+import unittest
+
+from cpip.util import OverlayMap
+
+#######################################
+# Section: Unit tests
+########################################
+class TestOverlayMap(unittest.TestCase):
+    """Tests OverlayMap without forking."""
+    def test_00(self):
+        """TestOverlayMap.test_00(): behaves like a dictionary."""
+        myObj = OverlayMap.OverlayMap({'A' : 1})
+        myObj['B'] = 2
+        self.assertEqual(2, len(myObj))
+        self.assertTrue('A' in myObj)
+        self.assertFalse('C' in myObj)
+        self.assertEqual(2, myObj['B'])
+        self.assertEqual(None, myObj.get('C'))
+        self.assertRaises(KeyError, myObj.__getitem__, 'C')
+        self.assertEqual(['A', 'B'], sorted(myObj.keys()))
+        self.assertEqual(1, myObj.pop('A'))
+        self.assertEqual(7, myObj.pop('A', 7))
+        self.assertRaises(KeyError, myObj.pop, 'A')
+        self.assertEqual(['B'], list(myObj))
+        self.assertEqual(0, myObj.depth)
+
+    def test_01(self):
+        """TestOverlayMap.test_01(): values of an unforked map are owned."""
+        myObj = OverlayMap.OverlayMap({'A' : [1]})
+        self.assertTrue(myObj.isOwned('A'))
+        self.assertIs(myObj['A'], myObj.retOwned('A', list))
+        self.assertRaises(KeyError, myObj.retOwned, 'B', list)
+
+    def test_02(self):
+        """TestOverlayMap.test_02(): pickles."""
+        myObj = OverlayMap.OverlayMap({'A' : 1, 'B' : 2})
+        myFork = myObj.fork()
+        del myFork['A']
+        myFork['C'] = 3
+        myCopy = pickle.loads(pickle.dumps(myFork))
+        self.assertEqual(0, myCopy.depth)
+        self.assertEqual({'B' : 2, 'C' : 3}, {k : myCopy[k] for k in myCopy})
+
+class TestOverlayMapFork(unittest.TestCase):
+    """Tests forking an OverlayMap."""
+    def test_00(self):
+        """TestOverlayMapFork.test_00(): changes are not seen by the other map."""
+        myObj = OverlayMap.OverlayMap({'A' : 1, 'B' : 2})
+        myFork = myObj.fork()
+        self.assertEqual(1, myObj.depth)
+        self.assertEqual(1, myFork.depth)
+        myFork['C'] = 3
+        del myFork['A']
+        myObj['B'] = 20
+        self.assertEqual(['A', 'B'], sorted(myObj.keys()))
+        self.assertEqual(['B', 'C'], sorted(myFork.keys()))
+        self.assertEqual(2, len(myObj))
+        self.assertEqual(2, len(myFork))
+        self.assertEqual(20, myObj['B'])
+        self.assertEqual(2, myFork['B'])
+        self.assertRaises(KeyError, myFork.__getitem__, 'A')
+        self.assertFalse('A' in myFork)
+        # Can be redefined after deletion
+        myFork['A'] = 10
+        self.assertEqual(10, myFork['A'])
+        self.assertEqual(1, myObj['A'])
+
+    def test_01(self):
+        """TestOverlayMapFork.test_01(): retOwned() copies shared values."""
+        myObj = OverlayMap.OverlayMap({'A' : [1], 'B' : [2]})
+        myFork = myObj.fork()
+        self.assertFalse(myObj.isOwned('A'))
+        self.assertFalse(myFork.isOwned('A'))
+        myFork.retOwned('A', list).append(3)
+        self.assertEqual([1, 3], myFork['A'])
+        self.assertEqual([1], myObj['A'])
+        self.assertTrue(myFork.isOwned('A'))
+        # Copied once only
+        self.assertIs(myFork['A'], myFork.retOwned('A', list))
+        myObj.retOwned('A', list).append(4)
+        self.assertEqual([1, 4], myObj['A'])
+        self.assertEqual([1, 3], myFork['A'])
+
+    def test_02(self):
+        """TestOverlayMapFork.test_02(): forking an unchanged map does not deepen it."""
+        myObj = OverlayMap.OverlayMap({'A' : 1})
+        myForkS = [myObj.fork() for i in range(4)]
+        self.assertEqual(1, myObj.depth)
+        self.assertEqual([1, 1, 1, 1], [f.depth for f in myForkS])
+
+    def test_03(self):
+        """TestOverlayMapFork.test_03(): deep chains are flattened."""
+        myObj = OverlayMap.OverlayMap()
+        for i in range(OverlayMap.MAX_DEPTH + 1):
+            myObj[i] = i
+            myFork = myObj.fork()
+        self.assertEqual(0, myObj.depth)
+        self.assertEqual(0, myFork.depth)
+        self.assertEqual(list(range(OverlayMap.MAX_DEPTH + 1)), sorted(myFork))
+        # Flattening keeps track of shared values
+        self.assertFalse(myObj.isOwned(0))
+        myObj.retOwned(0, int)
+        self.assertTrue(myObj.isOwned(0))
+
+    def test_04(self):
+        """TestOverlayMapFork.test_04(): flattened after many lookups of the chain."""
+        myObj = OverlayMap.OverlayMap({'A' : 1})
+        myFork = myObj.fork()
+        for i in range(OverlayMap.FLATTEN_AFTER):
+            self.assertFalse('B' in myFork)
+        self.assertEqual(1, myFork.depth)
+        self.assertTrue('A' in myFork)
+        self.assertEqual(0, myFork.depth)
+        self.assertEqual(1, myFork['A'])
+        self.assertFalse(myFork.isOwned('A'))
+
+class Special(unittest.TestCase):
+    pass
+
+def unitTest(theVerbosity=2):
+    """Execute unit tests."""
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestOverlayMap)
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestOverlayMapFork))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(Special))
+    myResult = unittest.TextTestRunner(verbosity=theVerbosity).run(suite)
+    return (myResult.testsRun, len(myResult.errors), len(myResult.failures))
+
+#################
+# End: Unit tests
+#################
+
+if __name__ == "__main__":
+    unitTest()
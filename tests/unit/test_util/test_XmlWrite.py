@@ -291,6 +291,84 @@ this line.""")
 </html>
 """)
         
+    def test_writeSpanRun_00(self):
+        """TestXhtmlWrite.test_writeSpanRun_00(): run of spans is the same as Element()."""
+        myRun = [
+            (u'int', u'k'),
+            (u' ', None),
+            (u'a<b', u'i'),
+            (u'', None),
+            (u'&', u'o'),
+            (u'', u'o'),
+        ]
+        myF = io.StringIO()
+        with XmlWrite.XhtmlStream(myF) as xS:
+            with XmlWrite.Element(xS, 'body'):
+                with XmlWrite.Element(xS, 'pre'):
+                    for t, c in myRun:
+                        if c is None:
+                            xS.characters(t)
+                        else:
+                            with XmlWrite.Element(xS, 'span', {'class' : c}):
+                                xS.characters(t)
+        myFRun = io.StringIO()
+        with XmlWrite.XhtmlStream(myFRun) as xS:
+            with XmlWrite.Element(xS, 'body'):
+                with XmlWrite.Element(xS, 'pre'):
+                    xS.writeSpanRun(myRun[:3])
+                    xS.writeSpanRun([])
+                    xS.writeSpanRun(myRun[3:])
+        self.assertEqual(myF.getvalue(), myFRun.getvalue())
+        self.assertTrue(
+            '<span class="k">int</span> <span class="i">a&lt;b</span><span class="o">&amp;</span><span class="o"></span></pre>' \
+            in myFRun.getvalue()
+        )
+
+    def test_writeSpanRun_01(self):
+        """TestXhtmlWrite.test_writeSpanRun_01(): run of only spans is the same as Element()."""
+        myRun = [(u'int', u'k'), (u'x', u'i'),]
+        myF = io.StringIO()
+        with XmlWrite.XhtmlStream(myF) as xS:
+            with XmlWrite.Element(xS, 'body'):
+                for t, c in myRun:
+                    with XmlWrite.Element(xS, 'span', {'class' : c}):
+                        xS.characters(t)
+        myFRun = io.StringIO()
+        with XmlWrite.XhtmlStream(myFRun) as xS:
+            with XmlWrite.Element(xS, 'body'):
+                xS.writeSpanRun(myRun)
+        self.assertEqual(myF.getvalue(), myFRun.getvalue())
+
+    def test_writeLinkedSpan_00(self):
+        """TestXhtmlWrite.test_writeLinkedSpan_00(): linked span is the same as Element()."""
+        myF = io.StringIO()
+        with XmlWrite.XhtmlStream(myF) as xS:
+            with XmlWrite.Element(xS, 'pre'):
+                xS.characters(u' ')
+                with XmlWrite.Element(xS, 'a', {'href' : 'macros.html#_X'}):
+                    with XmlWrite.Element(xS, 'span', {'class' : 'i'}):
+                        xS.characters(u'X')
+        myFRun = io.StringIO()
+        with XmlWrite.XhtmlStream(myFRun) as xS:
+            with XmlWrite.Element(xS, 'pre'):
+                xS.characters(u' ')
+                xS.writeLinkedSpan(u'X', u'i', 'macros.html#_X')
+        self.assertEqual(myF.getvalue(), myFRun.getvalue())
+
+    def test_writeLinkedSpan_01(self):
+        """TestXhtmlWrite.test_writeLinkedSpan_01(): linked span with indentation is the same as Element()."""
+        myF = io.StringIO()
+        with XmlWrite.XhtmlStream(myF) as xS:
+            with XmlWrite.Element(xS, 'p'):
+                with XmlWrite.Element(xS, 'a', {'href' : 'macros.html#_X'}):
+                    with XmlWrite.Element(xS, 'span', {'class' : 'i'}):
+                        xS.characters(u'X')
+        myFRun = io.StringIO()
+        with XmlWrite.XhtmlStream(myFRun) as xS:
+            with XmlWrite.Element(xS, 'p'):
+                xS.writeLinkedSpan(u'X', u'i', 'macros.html#_X')
+        self.assertEqual(myF.getvalue(), myFRun.getvalue())
+
 class NullClass(unittest.TestCase):
     pass
 